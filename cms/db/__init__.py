@@ -66,6 +66,8 @@ __all__ = [
     # usertest
     "UserTest", "UserTestFile", "UserTestManager", "UserTestResult",
     "UserTestExecutable",
+    # taskscore
+    "ParticipationTaskScore",
     # printjob
     "PrintJob",
     # init
@@ -81,7 +83,7 @@ __all__ = [
 
 # Instantiate or import these objects.
 
-version = 42
+version = 43
 
 engine = create_engine(config.database, echo=config.database_debug,
                        pool_timeout=60, pool_recycle=120)
@@ -103,6 +105,7 @@ from .submission import Submission, File, Token, SubmissionResult, \
     Executable, Evaluation
 from .usertest import UserTest, UserTestFile, UserTestManager, \
     UserTestResult, UserTestExecutable
+from .taskscore import ParticipationTaskScore
 from .printjob import PrintJob
 
 from .init import init_db
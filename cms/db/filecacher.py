@@ -25,11 +25,13 @@
 """
 
 import atexit
+import fcntl
 import io
 import logging
 import os
 import tempfile
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
 
 import gevent
 from sqlalchemy.exc import IntegrityError
@@ -484,6 +486,23 @@ class FileCacher:
     # CHUNK_SIZE should be a multiple of these values.
     CHUNK_SIZE = 16 * 1024  # 16 KiB
 
+    # Name of the file, inside file_dir, holding the total size of the
+    # cached files. Its lock also serializes evictions among all the
+    # processes sharing the same file_dir.
+    USAGE_FILENAME = "_usage"
+
+    # When evicting, we make room until the cache is at most this
+    # fraction of the maximum size, to avoid evicting at every load.
+    EVICTION_TARGET_FRACTION = 0.9
+
+    # Name of the cache directory shared by all services on the host,
+    # when file_cacher_shared is set.
+    SHARED_DIRNAME = "fs-cache-shared"
+
+    # How often we retry to take the lock on a digest that another
+    # process is downloading, in seconds.
+    LOCK_POLL_INTERVAL = 0.05
+
     def __init__(self, service=None, path=None, null=False):
         """Initialize.
 
@@ -522,10 +541,15 @@ class FileCacher:
             # Delete this directory on exit since it has a random name and
             # won't be used again.
             atexit.register(lambda: rmtree(self.file_dir))
+            self.shared = False
+        elif config.file_cacher_shared:
+            self.file_dir = os.path.join(config.cache_dir, self.SHARED_DIRNAME)
+            self.shared = True
         else:
             self.file_dir = os.path.join(
                 config.cache_dir,
                 "fs-cache-%s-%d" % (service.name, service.shard))
+            self.shared = False
         self._create_directory_or_die(self.file_dir)
 
         # Temp dir must be a subdirectory of file_dir to avoid cross-filesystem
@@ -535,6 +559,17 @@ class FileCacher:
         # Just to make sure it was created.
         self._create_directory_or_die(self.file_dir)
 
+        # Maximum size of the local cache in bytes, or None if
+        # unbounded.
+        self.max_size = None
+        if config.file_cacher_max_size_mib is not None:
+            self.max_size = config.file_cacher_max_size_mib * 1024 * 1024
+        self._usage_path = os.path.join(self.file_dir, self.USAGE_FILENAME)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
     @staticmethod
     def _create_directory_or_die(directory):
         """Create directory and ensure it exists, or raise a RuntimeError."""
@@ -561,17 +596,84 @@ class FileCacher:
             raise TombstoneError()
         cache_file_path = os.path.join(self.file_dir, digest)
         if if_needed and os.path.exists(cache_file_path):
+            self.hits += 1
+            self._touch(cache_file_path)
+            return
+
+        if not self.shared:
+            self._fetch(digest, cache_file_path)
             return
 
+        # In a shared cache, only one process at a time downloads a
+        # given digest; the others wait for it and then reuse its copy.
+        with self._digest_lock(digest):
+            if os.path.exists(cache_file_path):
+                logger.debug("File %s loaded by another process.", digest)
+                self.hits += 1
+                self._touch(cache_file_path)
+                return
+            self._fetch(digest, cache_file_path)
+
+    def _fetch(self, digest, cache_file_path):
+        """Download a file from the backend into the cache.
+
+        digest (unicode): the digest of the file to download.
+        cache_file_path (str): the destination path in the cache.
+
+        raise (KeyError): if the backend cannot find the file.
+
+        """
+        self.misses += 1
         ftmp_handle, temp_file_path = tempfile.mkstemp(dir=self.temp_dir,
                                                        text=False)
         with open(ftmp_handle, 'wb') as ftmp, \
                 self.backend.get_file(digest) as fobj:
             copyfileobj(fobj, ftmp, self.CHUNK_SIZE)
 
-        # Then move it to its real location (this operation is atomic
-        # by POSIX requirement)
-        os.rename(temp_file_path, cache_file_path)
+        self._move_into_cache(temp_file_path, cache_file_path)
+
+    @contextmanager
+    def _digest_lock(self, digest):
+        """Hold an exclusive lock, shared among processes, on a digest.
+
+        The lock is a file in file_dir, removed on release. Waiting
+        is done by polling, to avoid blocking the other greenlets.
+
+        digest (unicode): the digest to lock.
+
+        """
+        lock_path = os.path.join(self.file_dir, "_lock-%s" % digest)
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        gevent.sleep(self.LOCK_POLL_INTERVAL)
+                # The previous holder might have removed the lock file
+                # after we opened it; in that case our lock is on a
+                # stale file and we need to start over.
+                try:
+                    valid = os.stat(lock_path).st_ino == os.fstat(fd).st_ino
+                except FileNotFoundError:
+                    valid = False
+            except BaseException:
+                os.close(fd)
+                raise
+            if valid:
+                break
+            os.close(fd)
+
+        try:
+            yield
+        finally:
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+            os.close(fd)
 
     def get_file(self, digest):
         """Retrieve a file from the storage.
@@ -599,15 +701,26 @@ class FileCacher:
 
         logger.debug("Getting file %s.", digest)
 
-        if not os.path.exists(cache_file_path):
-            logger.debug("File %s not in cache, downloading "
-                         "from database.", digest)
-
-            self.load(digest)
+        while True:
+            if not os.path.exists(cache_file_path):
+                logger.debug("File %s not in cache, downloading "
+                             "from database.", digest)
 
-            logger.debug("File %s downloaded.", digest)
+                self.load(digest)
 
-        return open(cache_file_path, 'rb')
+                logger.debug("File %s downloaded.", digest)
+            else:
+                self.hits += 1
+                self._touch(cache_file_path)
+
+            try:
+                fobj = open(cache_file_path, 'rb')
+            except FileNotFoundError:
+                # Evicted in the meantime by another process.
+                continue
+            if self._pin(fobj):
+                return fobj
+            fobj.close()
 
     def get_file_content(self, digest):
         """Retrieve a file from the storage.
@@ -742,7 +855,7 @@ class FileCacher:
             cache_file_path = os.path.join(self.file_dir, digest)
 
             if not os.path.exists(cache_file_path):
-                os.rename(dst.name, cache_file_path)
+                self._move_into_cache(dst.name, cache_file_path)
             else:
                 os.unlink(dst.name)
 
@@ -839,9 +952,174 @@ class FileCacher:
         cache_file_path = os.path.join(self.file_dir, digest)
 
         try:
+            size = os.stat(cache_file_path).st_size
             os.unlink(cache_file_path)
         except OSError:
             pass
+        else:
+            if self.max_size is not None:
+                self._update_usage(-size)
+
+    def _move_into_cache(self, temp_file_path, cache_file_path):
+        """Move a complete file from the temp dir into the cache.
+
+        The move is atomic, and the size of the file is accounted
+        only if the file was not already in the cache. If the cache is
+        bounded, this might trigger an eviction.
+
+        temp_file_path (str): the path of the file in the temp dir.
+        cache_file_path (str): the destination path in the cache.
+
+        """
+        if self.max_size is None:
+            # This operation is atomic by POSIX requirement.
+            os.rename(temp_file_path, cache_file_path)
+            return
+
+        # Linking instead of renaming lets us know whether we are the
+        # ones that added the file, so that each file is accounted
+        # exactly once even with many processes sharing the cache.
+        size = os.stat(temp_file_path).st_size
+        try:
+            os.link(temp_file_path, cache_file_path)
+        except FileExistsError:
+            size = 0
+        finally:
+            os.unlink(temp_file_path)
+        if self._update_usage(size) > self.max_size:
+            self._evict()
+
+    def _touch(self, cache_file_path):
+        """Mark a cached file as recently used.
+
+        The modification time of the files is the LRU order used for
+        eviction; being on disk, it is shared among the processes.
+
+        cache_file_path (str): the path of the file in the cache.
+
+        """
+        if self.max_size is None:
+            return
+        try:
+            os.utime(cache_file_path)
+        except OSError:
+            pass
+
+    def _pin(self, fobj):
+        """Prevent a cached file from being evicted while open.
+
+        A shared lock is held on the file until fobj is closed; the
+        eviction skips the files it cannot lock exclusively.
+
+        fobj (fileobj): a file object opened on a cached file.
+
+        return (bool): False if the file was evicted before we could
+            pin it (and therefore must be loaded again).
+
+        """
+        if self.max_size is None:
+            return True
+        fcntl.flock(fobj.fileno(), fcntl.LOCK_SH)
+        return os.fstat(fobj.fileno()).st_nlink > 0
+
+    def _open_usage(self):
+        """Open and exclusively lock the usage file.
+
+        return (fileobj): the usage file, locked until closed.
+
+        """
+        fd = os.open(self._usage_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fobj = open(fd, 'r+b')
+        fcntl.flock(fobj.fileno(), fcntl.LOCK_EX)
+        return fobj
+
+    @staticmethod
+    def _write_usage(fobj, usage):
+        fobj.seek(0)
+        fobj.truncate()
+        fobj.write(b"%d" % usage)
+
+    def _update_usage(self, delta):
+        """Atomically add delta to the size of the cache.
+
+        delta (int): the number of bytes added (or removed, if
+            negative) to the cache.
+
+        return (int): the new size of the cache, in bytes.
+
+        """
+        with self._open_usage() as fobj:
+            try:
+                usage = int(fobj.read() or 0)
+            except ValueError:
+                usage = 0
+            usage = max(usage + delta, 0)
+            self._write_usage(fobj, usage)
+        return usage
+
+    def _evict(self):
+        """Remove the least recently used files from the cache.
+
+        The cache directory is scanned to recompute its real size
+        (fixing any drift in the accounting), then files are removed
+        in LRU order, skipping the pinned ones, until the size is
+        below the eviction target.
+
+        """
+        target = int(self.max_size * self.EVICTION_TARGET_FRACTION)
+        with self._open_usage() as usage_fobj:
+            entries = []
+            usage = 0
+            with os.scandir(self.file_dir) as it:
+                for entry in it:
+                    # Skip the temp dirs and the usage file.
+                    if entry.name.startswith("_") or \
+                            not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    usage += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if usage <= target:
+                    break
+                try:
+                    with open(path, 'rb') as fobj:
+                        fcntl.flock(fobj.fileno(),
+                                    fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.unlink(path)
+                except BlockingIOError:
+                    logger.debug("Not evicting pinned file %s.", path)
+                    continue
+                except FileNotFoundError:
+                    pass
+                usage -= size
+                self.evictions += 1
+
+            self._write_usage(usage_fobj, usage)
+
+        if usage > target:
+            logger.warning("File cache is %d bytes after eviction, over "
+                           "the target of %d bytes.", usage, target)
+
+    def get_status(self):
+        """Return statistics on the usage of the local cache.
+
+        return (dict): whether the cache is shared, maximum size (None
+            if unbounded), counters of hits, misses and evictions.
+
+        """
+        return {
+            "shared": self.shared,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
 
     def purge_cache(self):
         """Empty the local cache.
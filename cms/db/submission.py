@@ -583,6 +583,25 @@ class SubmissionResult(Base):
         self.public_score_details = None
         self.ranking_score_details = None
 
+    def invalidate_skipped_evaluations(self):
+        """Remove the evaluations without outcome (skipped since they
+        could not change the score) so that they are done, blanking the
+        evaluation outcome and the score if there were any.
+
+        return (bool): whether there were evaluations to remove.
+
+        """
+        skipped = [evaluation for evaluation in self.evaluations
+                   if evaluation.outcome is None]
+        if len(skipped) == 0:
+            return False
+        self.invalidate_score()
+        self.evaluation_outcome = None
+        self.evaluation_tries = 0
+        for evaluation in skipped:
+            self.evaluations.remove(evaluation)
+        return True
+
     def set_compilation_outcome(self, success):
         """Set the compilation outcome based on the success.
 
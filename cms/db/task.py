@@ -463,24 +463,17 @@ class Dataset(Base):
     def score_type_object(self):
         public_testcases = {k: tc.public
                             for k, tc in self.testcases.items()}
-        if not hasattr(self, "_cached_score_type_object") \
-                or self.score_type != self._cached_score_type \
-                or (self.score_type_parameters
-                    != self._cached_score_type_parameters) \
-                or public_testcases != self._cached_public_testcases:
-            # Import late to avoid a circular dependency.
-            from cms.grading.scoretypes import get_score_type
-            # This can raise.
-            self._cached_score_type_object = get_score_type(
+        # Import late to avoid a circular dependency.
+        from cms.grading.scoretypes import get_cached_score_type, \
+            get_score_type
+        # This can raise.
+        if self.id is None:
+            # Not flushed yet, so it cannot be shared.
+            return get_score_type(
                 self.score_type, self.score_type_parameters, public_testcases)
-            # If an exception is raised these updates don't take place:
-            # that way, next time this property is accessed, we get a
-            # cache miss again and the same exception is raised again.
-            self._cached_score_type = self.score_type
-            self._cached_score_type_parameters = \
-                copy.deepcopy(self.score_type_parameters)
-            self._cached_public_testcases = public_testcases
-        return self._cached_score_type_object
+        return get_cached_score_type(
+            self.id, self.score_type, self.score_type_parameters,
+            public_testcases)
 
     def clone_from(self, old_dataset, clone_managers=True,
                    clone_testcases=True, clone_results=False):
@@ -528,6 +521,13 @@ class Dataset(Base):
                     new_e.submission_result = new_sr
                     new_e.testcase = new_testcases[old_e.codename]
 
+                # The testcases skipped for the old score type might be
+                # needed for the new one.
+                if (self.score_type, self.score_type_parameters) != \
+                        (old_dataset.score_type,
+                         old_dataset.score_type_parameters):
+                    new_sr.invalidate_skipped_evaluations()
+
         self.sa_session.flush()
 
 
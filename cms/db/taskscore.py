@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Task score-related database interface for SQLAlchemy.
+
+"""
+
+from sqlalchemy.orm import relationship
+from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.types import Boolean, Float, Integer
+
+from . import Base, Participation, Task, Dataset
+
+
+class ParticipationTaskScore(Base):
+    """Class to store the score of a participation on a task.
+
+    These are derived data, computed from the submissions, the tokens
+    and the submission results on the active dataset (see
+    cms.grading.scoring.compute_task_score) and kept up to date by the
+    services that change them, so that rankings do not need to load
+    all the submissions. A missing row means that the scores must be
+    computed from the submissions; a row for a dataset that is not the
+    active one anymore is stale. They are not exported in dumps.
+
+    """
+    __tablename__ = 'participation_task_scores'
+
+    # Primary key is (participation_id, task_id).
+    participation_id = Column(
+        Integer,
+        ForeignKey(Participation.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True)
+    participation = relationship(
+        Participation)
+
+    task_id = Column(
+        Integer,
+        ForeignKey(Task.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True,
+        index=True)
+    task = relationship(
+        Task)
+
+    # The dataset whose submission results the scores were computed
+    # from.
+    dataset_id = Column(
+        Integer,
+        ForeignKey(Dataset.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        nullable=False,
+        index=True)
+    dataset = relationship(
+        Dataset)
+
+    # The score, the public score, and the score restricted to tokened
+    # submissions (see task_score), not rounded.
+    score = Column(
+        Float,
+        nullable=False)
+    public_score = Column(
+        Float,
+        nullable=False)
+    tokened_score = Column(
+        Float,
+        nullable=False)
+
+    # Whether some official submissions have not been scored yet.
+    partial = Column(
+        Boolean,
+        nullable=False)
@@ -35,8 +35,10 @@ testcase".
 
 import logging
 
+from sqlalchemy.orm import joinedload, subqueryload
+
 from cms.db import Dataset, Evaluation, Executable, File, Manager, Submission, \
-    UserTest, UserTestExecutable
+    SubmissionResult, Task, UserTest, UserTestExecutable, UserTestResult
 from cms.grading.languagemanager import get_language
 from cms.service.esoperations import ESOperation
 
@@ -157,12 +159,13 @@ class Job:
         return res
 
     @staticmethod
-    def import_from_dict_with_type(data):
+    def import_from_dict_with_type(data, imported=()):
         """Create a Job from a dict having a type information.
 
         data (dict): a dict with all the items required for a job, and
             in addition a 'type' key with associated value
             'compilation' or 'evaluation'.
+        imported ([str]): see import_from_dict.
 
         return (Job): either a CompilationJob or an EvaluationJob.
 
@@ -170,24 +173,48 @@ class Job:
         type_ = data['type']
         del data['type']
         if type_ == 'compilation':
-            return CompilationJob.import_from_dict(data)
+            return CompilationJob.import_from_dict(data, imported)
         elif type_ == 'evaluation':
-            return EvaluationJob.import_from_dict(data)
+            return EvaluationJob.import_from_dict(data, imported)
         else:
             raise Exception("Couldn't import dictionary with type %s" %
                             (type_))
 
+    @staticmethod
+    def import_files_from_dict(data, fields):
+        """Convert the digests of files, managers or executables.
+
+        data (dict): an exported job, or a part of it.
+        fields ([str]): the fields to convert, among 'files',
+            'managers' and 'executables'.
+
+        return ({str: {str: File|Manager|Executable}}): for each of
+            the fields in data, the objects for its digests, by
+            filename.
+
+        """
+        classes = {'files': File,
+                   'managers': Manager,
+                   'executables': Executable}
+        return {field: dict((k, classes[field](k, v))
+                            for k, v in data[field].items())
+                for field in fields if field in data}
+
     @classmethod
-    def import_from_dict(cls, data):
-        """Create a Job from the output of export_to_dict."""
+    def import_from_dict(cls, data, imported=()):
+        """Create a Job from the output of export_to_dict.
+
+        data (dict): the exported job.
+        imported ([str]): the fields among 'files', 'managers' and
+            'executables' that have already been converted to objects
+            (the others contain digests).
+
+        """
         if data['operation'] is not None:
             data['operation'] = ESOperation.from_dict(data['operation'])
-        data['files'] = dict(
-            (k, File(k, v)) for k, v in data['files'].items())
-        data['managers'] = dict(
-            (k, Manager(k, v)) for k, v in data['managers'].items())
-        data['executables'] = dict(
-            (k, Executable(k, v)) for k, v in data['executables'].items())
+        data.update(Job.import_files_from_dict(
+            data, [field for field in ['files', 'managers', 'executables']
+                   if field not in imported]))
         return cls(**data)
 
     @staticmethod
@@ -549,15 +576,42 @@ class EvaluationJob(Job):
         # only if it is True.
 
         sr.evaluations += [Evaluation(
-            text=self.text,
-            outcome=self.outcome,
-            execution_time=self.plus.get('execution_time'),
-            execution_wall_clock_time=self.plus.get(
+            testcase=sr.dataset.testcases[self.operation.testcase_codename],
+            **self._evaluation_values())]
+
+    def to_evaluation_mapping(self, sr):
+        """Return the evaluation for the job as a mapping of columns.
+
+        This is an alternative to to_submission suitable for bulk
+        inserts; the submission result is not modified.
+
+        sr (SubmissionResult): the DB object the evaluation belongs to.
+
+        return ({str: object}): the values of the columns of the
+            Evaluation to insert.
+
+        """
+        values = self._evaluation_values()
+        values.update({
+            "submission_id": sr.submission_id,
+            "dataset_id": sr.dataset_id,
+            "testcase_id":
+                sr.dataset.testcases[self.operation.testcase_codename].id,
+        })
+        return values
+
+    def _evaluation_values(self):
+        """Return the values of the evaluation filled by the worker."""
+        return {
+            "text": self.text,
+            "outcome": self.outcome,
+            "execution_time": self.plus.get('execution_time'),
+            "execution_wall_clock_time": self.plus.get(
                 'execution_wall_clock_time'),
-            execution_memory=self.plus.get('execution_memory'),
-            evaluation_shard=self.shard,
-            evaluation_sandbox=":".join(self.sandboxes),
-            testcase=sr.dataset.testcases[self.operation.testcase_codename])]
+            "execution_memory": self.plus.get('execution_memory'),
+            "evaluation_shard": self.shard,
+            "evaluation_sandbox": ":".join(self.sandboxes),
+        }
 
     @staticmethod
     def from_user_test(operation, user_test, dataset):
@@ -644,25 +698,169 @@ class EvaluationJob(Job):
 
 
 class JobGroup:
-    """A simple collection of jobs."""
+    """A simple collection of jobs.
+
+    The jobs of a group usually have most of their data in common (for
+    example, the evaluations of a submission share task type, language,
+    files, managers, executables and limits, and differ only in the
+    testcase). When exported, the values of these fields are stored
+    once for all the jobs having them, in a list of shared blocks, and
+    each job only has its other fields and the index of its block.
+
+    """
+
+    # Fields of the exported jobs whose objects are shared by the jobs
+    # of a block when importing. Executables are not, as ES adds those
+    # of compilations to the submission results (and an object can be
+    # added to one only).
+    SHARED_FILE_FIELDS = ["files", "managers"]
+
+    # Fields of the exported jobs stored in the shared blocks.
+    SHARED_FIELDS = [
+        "type", "task_type", "task_type_parameters", "language",
+        "multithreaded_sandbox", "shard", "keep_sandbox", "files",
+        "managers", "executables", "time_limit", "memory_limit",
+        "only_execution", "get_output",
+    ]
 
     def __init__(self, jobs=None):
         self.jobs = jobs if jobs is not None else []
 
     def export_to_dict(self):
+        """Return a dict representing the job group.
+
+        return (dict): the shared blocks (under "shared") and the jobs
+            (under "jobs"), each without the fields in its block and
+            with its index (under "shared").
+
+        """
+        blocks = []
+        jobs = []
+        for job in self.jobs:
+            data = job.export_to_dict()
+            block = {field: data.pop(field)
+                     for field in JobGroup.SHARED_FIELDS if field in data}
+            try:
+                data["shared"] = blocks.index(block)
+            except ValueError:
+                data["shared"] = len(blocks)
+                blocks.append(block)
+            jobs.append(data)
         return {
-            "jobs": [job.export_to_dict() for job in self.jobs],
+            "shared": blocks,
+            "jobs": jobs,
         }
 
     @classmethod
     def import_from_dict(cls, data):
+        """Create a JobGroup from the output of export_to_dict.
+
+        The files and managers of each shared block are converted to
+        objects once, and the jobs of the block share them (but not the
+        dicts containing them, which are copied for each job). Groups
+        exported by older versions, with all the fields in each job,
+        are accepted too.
+
+        data (dict): the exported job group.
+
+        return (JobGroup): the job group.
+
+        """
+        if "shared" not in data:
+            return cls([Job.import_from_dict_with_type(job)
+                        for job in data["jobs"]])
+
+        blocks = []
+        for block in data["shared"]:
+            block = dict(block)
+            block.update(Job.import_files_from_dict(
+                block, JobGroup.SHARED_FILE_FIELDS))
+            blocks.append(block)
+
         jobs = []
         for job in data["jobs"]:
-            jobs.append(Job.import_from_dict_with_type(job))
+            job.update(blocks[job.pop("shared")])
+            for field in JobGroup.SHARED_FILE_FIELDS:
+                if field in job:
+                    job[field] = dict(job[field])
+            jobs.append(Job.import_from_dict_with_type(
+                job, imported=JobGroup.SHARED_FILE_FIELDS))
         return cls(jobs)
 
+    @staticmethod
+    def _load_objects(operations, session):
+        """Load from the database the objects needed by some jobs.
+
+        Load, with a few queries, the submissions and user tests of the
+        operations, with their files, results and executables, and the
+        datasets with their managers (and testcases, if needed), so
+        that building the jobs does not need a query for each of them.
+
+        operations ([ESOperation]): the operations.
+        session (Session): the session to load the objects into.
+
+        return ([Base]): the loaded objects; the caller needs to keep
+            a reference to them for them to stay in the identity map.
+
+        """
+        submission_ids = set()
+        user_test_ids = set()
+        dataset_ids = set()
+        need_testcases = False
+        for operation in operations:
+            if operation.for_submission():
+                submission_ids.add(operation.object_id)
+                if operation.type_ == ESOperation.EVALUATION:
+                    need_testcases = True
+            else:
+                user_test_ids.add(operation.object_id)
+            dataset_ids.add(operation.dataset_id)
+
+        query = session.query(Dataset)\
+            .filter(Dataset.id.in_(dataset_ids))\
+            .options(joinedload(Dataset.managers))
+        if need_testcases:
+            query = query.options(subqueryload(Dataset.testcases))
+        objects = query.all()
+
+        if len(submission_ids) > 0:
+            objects += session.query(Submission)\
+                .filter(Submission.id.in_(submission_ids))\
+                .options(joinedload(Submission.files))\
+                .options(joinedload(Submission.task)
+                         .joinedload(Task.contest)).all()
+            objects += session.query(SubmissionResult)\
+                .filter(SubmissionResult.submission_id.in_(submission_ids))\
+                .filter(SubmissionResult.dataset_id.in_(dataset_ids))\
+                .options(joinedload(SubmissionResult.executables)).all()
+
+        if len(user_test_ids) > 0:
+            objects += session.query(UserTest)\
+                .filter(UserTest.id.in_(user_test_ids))\
+                .options(joinedload(UserTest.files))\
+                .options(joinedload(UserTest.managers))\
+                .options(joinedload(UserTest.task)
+                         .joinedload(Task.contest)).all()
+            objects += session.query(UserTestResult)\
+                .filter(UserTestResult.user_test_id.in_(user_test_ids))\
+                .filter(UserTestResult.dataset_id.in_(dataset_ids))\
+                .options(joinedload(UserTestResult.executables)).all()
+
+        return objects
+
     @staticmethod
     def from_operations(operations, session):
+        """Create the jobs for some operations.
+
+        operations ([ESOperation]): the operations.
+        session (Session): the session to use.
+
+        return (JobGroup): a job group with the job of each operation.
+
+        """
+        # The objects stay in the identity map, where get_from_id finds
+        # them, only as long as we keep a reference to them.
+        prefetched = JobGroup._load_objects(operations, session)  # noqa
         jobs = []
         for operation in operations:
             # The get_from_id method loads from the instance map (if the
@@ -19,6 +19,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import errno
+import fcntl
 import io
 import logging
 import os
@@ -26,10 +28,13 @@ import resource
 import select
 import stat
 import tempfile
+import weakref
 from abc import ABCMeta, abstractmethod
 from functools import wraps, partial
+from shutil import copyfileobj
 
 import gevent
+import gevent.local
 from gevent import subprocess
 
 from cms import config, rmtree
@@ -44,6 +49,60 @@ class SandboxInterfaceException(Exception):
     pass
 
 
+# ioctl request to share the extents of a file with another (a
+# "reflink"), from linux/fs.h.
+FICLONE = 0x40049409
+
+
+class ExecutionSlot:
+    """One of the execution slots of a Worker running several jobs at
+    the same time.
+
+    Each slot uses its own range of isolate box ids (among the
+    config.max_worker_slots ranges of the Worker's shard), and its
+    sandboxes can be pinned to a CPU core.
+
+    """
+
+    def __init__(self, index, num_slots, cpu=None):
+        """Initialization.
+
+        index (int): the index of the slot in the Worker.
+        num_slots (int): the number of slots of the Worker.
+        cpu (int|None): the CPU core to run the sandboxed processes on,
+            or None not to pin them.
+
+        """
+        self.index = index
+        self.num_slots = num_slots
+        self.cpu = cpu
+        # Counter for the box ids of the sandboxes of this slot.
+        self.next_id = 0
+
+
+# The execution slot of the current greenlet, if any.
+_execution_slot = gevent.local.local()
+
+
+def set_execution_slot(slot):
+    """Set the execution slot for the sandboxes created from now on by
+    the current greenlet.
+
+    slot (ExecutionSlot|None): the slot, or None for none.
+
+    """
+    _execution_slot.slot = slot
+
+
+def get_execution_slot():
+    """Return the execution slot of the current greenlet.
+
+    return (ExecutionSlot|None): the slot, or None if not set.
+
+    """
+    return getattr(_execution_slot, "slot", None)
+
+
 def with_log(func):
     """Decorator for presuming that the logs are present.
 
@@ -203,6 +262,10 @@ class SandboxBase(metaclass=ABCMeta):
 
         self.cmd_file = "commands.log"
 
+        # Relative paths of the files hardlinked to the cache of the
+        # file cacher, whose permissions must never change.
+        self._linked_files = set()
+
         # These are not necessarily used, but are here for API compatibility
         # TODO: move all other common properties here.
         self.box_id = 0
@@ -360,13 +423,128 @@ class SandboxBase(metaclass=ABCMeta):
     def create_file_from_storage(self, path, digest, executable=False):
         """Write a file taken from FS in the sandbox.
 
+        Depending on config.sandbox_file_staging, the file is copied
+        from the cache of the file cacher, or hardlinked or reflinked
+        to it, falling back to a copy when that is not possible (for
+        example, when the sandbox is on another filesystem).
+
         path (string): relative path of the file inside the sandbox.
         digest (string): digest of the file in FS.
         executable (bool): to set permissions.
 
         """
-        with self.create_file(path, executable) as dest_fobj:
-            self.file_cacher.get_file_to_fobj(digest, dest_fobj)
+        staging = config.sandbox_file_staging
+        if staging == "copy":
+            with self.create_file(path, executable) as dest_fobj:
+                self.file_cacher.get_file_to_fobj(digest, dest_fobj)
+            return
+
+        with self.file_cacher.get_file(digest) as src_fobj:
+            if staging == "hardlink" and \
+                    self._link_from_cache(path, digest, executable):
+                return
+            with self.create_file(path, executable) as dest_fobj:
+                self._clone_or_copy(src_fobj, dest_fobj)
+
+    def _link_from_cache(self, path, digest, executable):
+        """Hardlink a file of the cache of the file cacher in the
+        sandbox.
+
+        The file (shared with the cache) is made read-only, so that
+        nothing running in the sandbox can change the cached copy, and
+        it is remembered, so that its permissions are not changed later.
+
+        path (string): relative path of the file inside the sandbox.
+        digest (string): digest of the file, which must be in the
+            cache (and pinned there by the caller).
+        executable (bool): to set permissions.
+
+        return (bool): whether the file was linked.
+
+        raise (OSError): if the path in the sandbox already exists.
+
+        """
+        real_path = self.relative_path(path)
+        try:
+            os.link(os.path.join(self.file_cacher.file_dir, digest),
+                    real_path)
+        except FileExistsError:
+            logger.error("Failed create file %s in sandbox. Unable to "
+                         "evalulate this submission. This may be due to "
+                         "cheating.", real_path, exc_info=True)
+            raise
+        except OSError as error:
+            logger.debug("Cannot hardlink %s in sandbox (%s), copying it.",
+                         path, os.strerror(error.errno))
+            return False
+        mod = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+        # The same file might be linked elsewhere as an executable.
+        mod |= stat.S_IMODE(os.stat(real_path).st_mode) & (
+            stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        if executable:
+            mod |= stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+        os.chmod(real_path, mod)
+        self._linked_files.add(path)
+        logger.debug("Hardlinked file %s in sandbox.", path)
+        return True
+
+    def _unlink_from_cache(self, path):
+        """Replace a file hardlinked to the cache with a copy of it,
+        which can be changed without changing the cached one.
+
+        path (string): relative path of the file inside the sandbox.
+
+        """
+        real_path = self.relative_path(path)
+        executable = os.stat(real_path).st_mode & stat.S_IXUSR != 0
+        with open(real_path, "rb") as src_fobj:
+            os.remove(real_path)
+            self._linked_files.discard(path)
+            with self.create_file(path, executable) as dest_fobj:
+                self._clone_or_copy(src_fobj, dest_fobj)
+
+    @staticmethod
+    def _clone_or_copy(src_fobj, dest_fobj):
+        """Copy the content of a file into another, sharing their
+        extents if the filesystem supports it.
+
+        Tries a reflink (FICLONE), then an in-kernel copy
+        (copy_file_range) and finally a regular copy.
+
+        src_fobj (fileobj): the file to copy, at its beginning.
+        dest_fobj (fileobj): the empty destination file.
+
+        """
+        src_fd = src_fobj.fileno()
+        dest_fd = dest_fobj.fileno()
+        try:
+            fcntl.ioctl(dest_fd, FICLONE, src_fd)
+            return
+        except OSError:
+            pass
+
+        size = os.fstat(src_fd).st_size
+        copied = 0
+        try:
+            while copied < size:
+                written = os.copy_file_range(src_fd, dest_fd, size - copied)
+                if written == 0:
+                    break
+                copied += written
+            if copied == size:
+                return
+        except (AttributeError, OSError) as error:
+            # Unavailable, or across filesystems on older kernels.
+            if isinstance(error, OSError) and error.errno not in (
+                    errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP,
+                    errno.EINVAL):
+                raise
+
+        # Start again from scratch.
+        src_fobj.seek(0)
+        dest_fobj.seek(0)
+        dest_fobj.truncate()
+        copyfileobj(src_fobj, dest_fobj)
 
     def create_file_from_string(self, path, content, executable=False):
         """Write some data to a file in the sandbox.
@@ -473,6 +651,37 @@ class SandboxBase(metaclass=ABCMeta):
 
         """
         os.remove(self.relative_path(path))
+        self._linked_files.discard(path)
+
+    def remove_files(self, keep=()):
+        """Remove all the files and directories in the sandbox, except
+        some files.
+
+        keep ([str]): relative paths of the files to keep.
+
+        """
+        keep = set(keep)
+        keep.add(self.cmd_file)
+        home = self.relative_path("")
+        for filename in os.listdir(home):
+            if filename in keep:
+                continue
+            path = os.path.join(home, filename)
+            if os.path.isdir(path) and not os.path.islink(path):
+                rmtree(path)
+            else:
+                os.remove(path)
+        self._linked_files &= keep
+
+    def reset(self, keep=()):
+        """Bring the sandbox back to the state of a new one, with just
+        some of its files, to run something else in it.
+
+        keep ([str]): relative paths of the files to keep; all the
+            other files and directories in the sandbox are removed.
+
+        """
+        self.remove_files(keep)
 
     @abstractmethod
     def execute_without_std(self, command, wait=False):
@@ -845,6 +1054,12 @@ class IsolateSandbox(SandboxBase):
     """
     next_id = 0
 
+    # The sandboxes holding each box id, from their creation to their
+    # cleanup, so that new sandboxes don't take the box of a sandbox
+    # still in use (e.g., the checker sandbox of a whole job group).
+    # Type: {int: IsolateSandbox}
+    _boxes_in_use = weakref.WeakValueDictionary()
+
     # If the command line starts with this command name, we are just
     # going to execute it without sandboxing, and with all permissions
     # on the current directory.
@@ -862,15 +1077,35 @@ class IsolateSandbox(SandboxBase):
         # the range [(shard+1)*10, (shard+2)*10) to each Worker and keep the
         # range [0, 10) for other uses (command-line scripts like cmsMake or
         # direct console users of isolate). Inside each range ids are assigned
-        # sequentially, with a wrap-around.
+        # sequentially, with a wrap-around, skipping those still in use.
+        # If config.max_worker_slots is more than 1, each Worker gets that
+        # many consecutive ranges, whatever its own number of slots, and
+        # gives one to each of its execution slots; this way, Workers with
+        # different numbers of slots on the same host never share ids.
         # FIXME This is the only use of FileCacher.service, and it's an
         # improper use! Avoid it!
+        slot = get_execution_slot()
+        counter = slot if slot is not None else IsolateSandbox
         if file_cacher is not None and file_cacher.service is not None:
-            box_id = ((file_cacher.service.shard + 1) * 10
-                      + (IsolateSandbox.next_id % 10)) % 1000
+            range_index = file_cacher.service.shard * config.max_worker_slots
+            if slot is not None:
+                range_index += slot.index
+            first_id = ((range_index + 1) * 10) % 1000
+        else:
+            first_id = 0
+        for skipped in range(10):
+            box_id = first_id + (counter.next_id + skipped) % 10
+            if box_id not in IsolateSandbox._boxes_in_use:
+                break
         else:
-            box_id = IsolateSandbox.next_id % 10
-        IsolateSandbox.next_id += 1
+            skipped = 0
+            box_id = first_id + counter.next_id % 10
+            logger.warning("All the box ids from %d to %d are in use, "
+                           "sharing box %d.", first_id, first_id + 9, box_id)
+        counter.next_id += skipped + 1
+        IsolateSandbox._boxes_in_use[box_id] = self
+        # The CPU core to pin the sandboxed processes to, if any.
+        self.cpu = slot.cpu if slot is not None else None
 
         # We create a directory "home" inside the outer temporary directory,
         # that will be bind-mounted to "/tmp" inside the sandbox (some
@@ -894,6 +1129,9 @@ class IsolateSandbox(SandboxBase):
         self.log = None
         self.exec_num = -1
         self.cmd_file = os.path.join(self._outer_dir, "commands.log")
+        # Directory of isolate's box where the sandboxed processes can
+        # write, besides the home; known after initialize_isolate.
+        self._box_dir = None
         logger.debug("Sandbox in `%s' created, using box `%s'.",
                      self._home, self.box_exec)
 
@@ -932,7 +1170,7 @@ class IsolateSandbox(SandboxBase):
         # after ourselves, but we might have missed something if a previous
         # worker was interrupted in the middle of an execution, so we issue an
         # idempotent cleanup.
-        self.cleanup()
+        self._cleanup_isolate()
         self.initialize_isolate()
 
     def add_mapped_directory(self, src, dest=None, options=None,
@@ -964,7 +1202,9 @@ class IsolateSandbox(SandboxBase):
         """
         os.chmod(self._home, 0o777)
         for filename in os.listdir(self._home):
-            os.chmod(os.path.join(self._home, filename), 0o777)
+            # Files linked to the cache stay read-only.
+            if filename not in self._linked_files:
+                os.chmod(os.path.join(self._home, filename), 0o777)
 
     def allow_writing_none(self):
         """Set permissions in such a way that the user cannot write anything.
@@ -972,7 +1212,9 @@ class IsolateSandbox(SandboxBase):
         """
         os.chmod(self._home, 0o755)
         for filename in os.listdir(self._home):
-            os.chmod(os.path.join(self._home, filename), 0o755)
+            # Files linked to the cache keep their permissions.
+            if filename not in self._linked_files:
+                os.chmod(os.path.join(self._home, filename), 0o755)
 
     def allow_writing_only(self, inner_paths):
         """Set permissions in so that the user can write only some paths.
@@ -999,6 +1241,10 @@ class IsolateSandbox(SandboxBase):
             if not abs_inner_path.startswith(self._home_dest + "/"):
                 continue
             rel_inner_path = os.path.relpath(abs_inner_path, self._home_dest)
+            # The user can write a file linked to the cache only after
+            # it has been replaced with a copy.
+            if rel_inner_path in self._linked_files:
+                self._unlink_from_cache(rel_inner_path)
             outer_path = os.path.join(self._home, rel_inner_path)
             outer_paths.append(outer_path)
 
@@ -1329,10 +1575,13 @@ class IsolateSandbox(SandboxBase):
         with open(self.cmd_file, 'at', encoding="utf-8") as commands:
             commands.write("%s\n" % (pretty_print_cmdline(args)))
         os.chmod(self._home, prev_permissions)
+        preexec_fn = None
+        if self.cpu is not None:
+            preexec_fn = partial(os.sched_setaffinity, 0, {self.cpu})
         try:
             p = subprocess.Popen(args,
                                  stdin=stdin, stdout=stdout, stderr=stderr,
-                                 close_fds=close_fds)
+                                 preexec_fn=preexec_fn, close_fds=close_fds)
         except OSError:
             logger.critical("Failed to execute program in sandbox "
                             "with command: %s", pretty_print_cmdline(args),
@@ -1407,11 +1656,87 @@ class IsolateSandbox(SandboxBase):
             [self.box_exec]
             + (["--cg"] if self.cgroup else [])
             + ["--box-id=%d" % self.box_id, "--init"])
-        ret = subprocess.call(init_cmd)
+        process = subprocess.Popen(init_cmd, stdout=subprocess.PIPE)
+        output, _ = process.communicate()
+        ret = process.returncode
         if ret != 0:
             raise SandboxInterfaceException(
                 "Failed to initialize sandbox with command: %s "
                 "(error %d)" % (pretty_print_cmdline(init_cmd), ret))
+        # Isolate prints the path of the box, whose "box" subdirectory
+        # is the (otherwise unused) working directory it gives to the
+        # sandboxed processes.
+        self._box_dir = os.path.join(
+            output.decode("utf-8", errors="replace").strip(), "box")
+
+    def _clear_box_dir(self):
+        """Remove the files the sandboxed processes wrote in isolate's
+        box, outside the home directory.
+
+        return (bool): whether they were all removed (which might not
+            be possible, for example if the processes changed their
+            permissions).
+
+        """
+        if self._box_dir is None:
+            return False
+        try:
+            for filename in os.listdir(self._box_dir):
+                path = os.path.join(self._box_dir, filename)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    rmtree(path)
+                else:
+                    os.remove(path)
+        except OSError as error:
+            logger.debug("Cannot clear box %d (%s), initializing it again.",
+                         self.box_id, error)
+            return False
+        return True
+
+    def _cleanup_isolate(self):
+        """Tell isolate to cleanup its box."""
+        subprocess.call(
+            [self.box_exec]
+            + (["--cg"] if self.cgroup else [])
+            + ["--box-id=%d" % self.box_id, "--cleanup"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+    def _allow_deleting_home(self):
+        """Make everything the sandboxed processes created in the home
+        directory deletable by us.
+
+        """
+        subprocess.call(
+            [self.box_exec]
+            + (["--cg"] if self.cgroup else [])
+            + ["--box-id=%d" % self.box_id,
+               "--dir=%s=%s:rw" % (self._home_dest, self._home),
+               "--run", "--",
+               "/bin/chmod", "777", "-R", self._home_dest],
+            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+    def remove_files(self, keep=()):
+        """See SandboxBase.remove_files()."""
+        keep = set(keep)
+        if any(os.path.isdir(os.path.join(self._home, filename))
+               for filename in os.listdir(self._home)
+               if filename not in keep):
+            self._allow_deleting_home()
+        super().remove_files(keep)
+
+    def reset(self, keep=()):
+        """See SandboxBase.reset().
+
+        The files the sandboxed processes wrote in isolate's box,
+        outside the home directory, are removed too; only if this is
+        not possible, the box is cleaned up and initialized again.
+
+        """
+        super().reset(keep)
+        if not self._clear_box_dir():
+            self._cleanup_isolate()
+            self.initialize_isolate()
+        self.allow_writing_all()
 
     def cleanup(self, delete=False):
         """See Sandbox.cleanup()."""
@@ -1422,21 +1747,13 @@ class IsolateSandbox(SandboxBase):
         # will be able to delete everything. If not, we leave the files as they
         # are to avoid masking possible problems the admin wanted to debug.
 
-        exe = [self.box_exec] \
-            + (["--cg"] if self.cgroup else []) \
-            + ["--box-id=%d" % self.box_id]
-
         if delete:
-            subprocess.call(
-                exe + [
-                    "--dir=%s=%s:rw" % (self._home_dest, self._home),
-                    "--run", "--",
-                    "/bin/chmod", "777", "-R", self._home_dest],
-                stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-
-        # Tell isolate to cleanup the sandbox.
-        subprocess.call(exe + ["--cleanup"],
-                        stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            self._allow_deleting_home()
+
+        self._cleanup_isolate()
+        # The box can now be given to a new sandbox.
+        if IsolateSandbox._boxes_in_use.get(self.box_id) is self:
+            del IsolateSandbox._boxes_in_use[self.box_id]
 
         if delete:
             logger.debug("Deleting sandbox in %s.", self._outer_dir)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A cache of compilation results, used by the workers to avoid
+compiling again the same sources (for example, identical resubmissions,
+or the same submission for another dataset).
+
+"""
+
+import logging
+from collections import OrderedDict
+
+from cms.db import Executable
+from cms.grading.Sandbox import Sandbox
+
+
+logger = logging.getLogger(__name__)
+
+
+class CompilationCache:
+    """A bounded LRU cache from compilation inputs to their results.
+
+    The key of an entry is built from everything that can influence
+    the result of a compilation: the language, the compilation
+    commands and the name and digest of each file put in the sandbox
+    (sources, and managers relevant for compilation, such as graders
+    and headers). Hence a changed manager just results in a different
+    key, and the old entries are eventually evicted.
+
+    Only compilations that succeeded, or failed with a non-zero exit
+    code, are stored: timeouts and signals may depend on the load of
+    the worker. The compilers are not part of the key, so the cache
+    (which lives in the memory of the worker) must be discarded by
+    restarting the worker when they change.
+
+    """
+
+    def __init__(self, max_size=10000):
+        """Create the cache.
+
+        max_size (int): maximum number of entries; when the cache is
+            full, the least recently used entry is evicted.
+
+        """
+        self.max_size = max_size
+
+        # Type: {tuple: (bool, [str], dict, {str: str})}
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(language, commands, files):
+        """Return the cache key for a compilation.
+
+        language (str): the name of the language.
+        commands ([[str]]): the compilation commands.
+        files ({str: str}): the digest of each file in the sandbox, by
+            filename.
+
+        return (tuple): a hashable key.
+
+        """
+        return (
+            language,
+            tuple(tuple(command) for command in commands),
+            tuple(sorted(files.items())),
+        )
+
+    @staticmethod
+    def _is_cacheable(job):
+        """Return whether the result in the job can be stored.
+
+        job (CompilationJob): a job filled by a task type.
+
+        return (bool): whether the result does not depend on the worker.
+
+        """
+        if not job.success or job.compilation_success is None:
+            return False
+        if job.compilation_success:
+            return True
+        plus = job.plus or {}
+        return plus.get("exit_status") == Sandbox.EXIT_NONZERO_RETURN
+
+    def store(self, key, job):
+        """Store the result of a compilation, if allowed.
+
+        key (tuple): the key of the compilation.
+        job (CompilationJob): the job, filled by the task type.
+
+        return (bool): whether the result was stored.
+
+        """
+        if self.max_size <= 0 or not CompilationCache._is_cacheable(job):
+            return False
+        executables = dict((filename, executable.digest)
+                           for filename, executable
+                           in job.executables.items())
+        self._entries[key] = (job.compilation_success, job.text, job.plus,
+                              executables)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return True
+
+    def fill(self, key, job):
+        """Fill a compilation job with a cached result, if present.
+
+        key (tuple): the key of the compilation.
+        job (CompilationJob): the job to fill.
+
+        return (bool): whether the job was filled from the cache.
+
+        """
+        try:
+            compilation_success, text, plus, executables = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return False
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        job.success = True
+        job.compilation_success = compilation_success
+        job.text = list(text)
+        job.plus = dict(plus) if plus is not None else None
+        for filename, digest in executables.items():
+            job.executables[filename] = Executable(filename, digest)
+        logger.info("Compilation result taken from the cache.",
+                    extra={"operation": job.info})
+        return True
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        self._entries.clear()
+
+    def get_status(self):
+        """Return statistics on the cache usage.
+
+        return (dict): size and counters of the cache.
+
+        """
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
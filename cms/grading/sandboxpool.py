@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A pool of sandboxes ready to be used.
+
+Creating a sandbox requires two invocations of isolate (cleanup and
+init) and deleting it one or two more; for short evaluations this
+dominates the running time. A Worker can keep a few sandboxes already
+initialized, handing them out in create_sandbox, and clean up the
+used ones in the background.
+
+"""
+
+import logging
+from collections import deque
+
+import gevent
+from gevent.event import Event
+
+from cms.grading.Sandbox import Sandbox, get_execution_slot, \
+    set_execution_slot
+
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxPool:
+    """Sandboxes initialized in advance, for each execution slot.
+
+    All the isolate invocations for creating and deleting the
+    sandboxes of the pool happen in a single background greenlet, one
+    at a time, so that a box is never initialized while the cleanup of
+    the previous one with the same id is still pending.
+
+    """
+
+    # Name of the sandboxes created in advance (it appears in their
+    # path, as the actual name is not known yet).
+    SANDBOX_NAME = "pooled"
+
+    def __init__(self, file_cacher, size, slots=None):
+        """Initialization.
+
+        file_cacher (FileCacher): the file cacher of the sandboxes.
+        size (int): number of ready sandboxes to keep for each slot.
+        slots ([ExecutionSlot|None]|None): the execution slots of the
+            Worker (None for a single-slot Worker).
+
+        """
+        self.file_cacher = file_cacher
+        self.size = size
+        if slots is None:
+            slots = [None]
+        # Type: {ExecutionSlot|None: deque([Sandbox])}
+        self._ready = dict((slot, deque()) for slot in slots)
+        # Sandboxes to clean up, and whether to delete them.
+        # Type: deque([(Sandbox, bool)])
+        self._released = deque()
+        self._wakeup = Event()
+        self._greenlet = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        """Start filling the pool in the background."""
+        if self._greenlet is None:
+            self._wakeup.set()
+            self._greenlet = gevent.spawn(self._run)
+
+    def stop(self):
+        """Stop the background greenlet and delete the ready sandboxes.
+
+        The sandboxes released but not yet cleaned up are cleaned up
+        now.
+
+        """
+        if self._greenlet is not None:
+            self._greenlet.kill()
+            self._greenlet = None
+        self._cleanup_released()
+        for ready in self._ready.values():
+            while len(ready) > 0:
+                self._cleanup(ready.popleft(), delete=True)
+
+    def acquire(self, name):
+        """Take a ready sandbox for the current execution slot.
+
+        name (str): the name of the sandbox.
+
+        return (Sandbox|None): a sandbox, or None if none is ready.
+
+        """
+        ready = self._ready.get(get_execution_slot())
+        if ready is None or len(ready) == 0:
+            self.misses += 1
+            self._wakeup.set()
+            return None
+        self.hits += 1
+        sandbox = ready.popleft()
+        sandbox.name = name
+        self._wakeup.set()
+        return sandbox
+
+    def release(self, sandbox, delete):
+        """Give back a used sandbox, to be cleaned up in the background.
+
+        sandbox (Sandbox): the sandbox.
+        delete (bool): whether to also delete its directory.
+
+        """
+        self._released.append((sandbox, delete))
+        self._wakeup.set()
+
+    def get_status(self):
+        """Return the statistics of the pool.
+
+        return (dict): the number of ready sandboxes, of sandboxes
+            still to clean up, and of hits and misses in acquire.
+
+        """
+        return {
+            "size": self.size,
+            "ready": sum(len(ready) for ready in self._ready.values()),
+            "to_cleanup": len(self._released),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _run(self):
+        """Clean up the released sandboxes and refill the pool, forever.
+
+        """
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._cleanup_released()
+            for slot, ready in self._ready.items():
+                set_execution_slot(slot)
+                while len(ready) < self.size:
+                    # Released sandboxes come first: cleaning them up
+                    # frees the box ids we are going to use.
+                    self._cleanup_released()
+                    try:
+                        ready.append(Sandbox(self.file_cacher,
+                                             name=SandboxPool.SANDBOX_NAME))
+                    except Exception:
+                        logger.error("Couldn't create sandbox for the pool.",
+                                     exc_info=True)
+                        break
+
+    def _cleanup_released(self):
+        """Clean up all the released sandboxes."""
+        while len(self._released) > 0:
+            sandbox, delete = self._released.popleft()
+            self._cleanup(sandbox, delete)
+
+    @staticmethod
+    def _cleanup(sandbox, delete):
+        """Clean up a sandbox, logging errors.
+
+        sandbox (Sandbox): the sandbox.
+        delete (bool): whether to also delete its directory.
+
+        """
+        try:
+            sandbox.cleanup(delete=delete)
+        except OSError:
+            logger.warning("Couldn't delete sandbox.", exc_info=True)
@@ -43,6 +43,10 @@ class GroupMin(ScoreTypeGroup):
         else:
             return N_("Partially correct")
 
+    def fails_subtask(self, outcome, unused_parameter):
+        """See ScoreTypeGroup."""
+        return outcome <= 0.0
+
     def reduce(self, outcomes, unused_parameter):
         """See ScoreTypeGroup."""
         return min(outcomes)
@@ -45,6 +45,10 @@ class GroupMul(ScoreTypeGroup):
         else:
             return N_("Partially correct")
 
+    def fails_subtask(self, outcome, unused_parameter):
+        """See ScoreTypeGroup."""
+        return outcome <= 0.0
+
     def reduce(self, outcomes, unused_parameter):
         """See ScoreTypeGroup."""
         return reduce(lambda x, y: x * y, outcomes)
@@ -46,6 +46,11 @@ class GroupThreshold(ScoreTypeGroup):
         else:
             return N_("Not correct")
 
+    def fails_subtask(self, outcome, parameter):
+        """See ScoreTypeGroup."""
+        threshold = parameter[2]
+        return not 0.0 < outcome <= threshold
+
     def reduce(self, outcomes, parameter):
         """See ScoreTypeGroup."""
         threshold = parameter[2]
@@ -127,6 +127,12 @@ class Sum(ScoreTypeAlone):
         public_score = 0.0
 
         for idx in indices:
+            if evaluations[idx].outcome is None:
+                # Not evaluated (see ScoreTypeGroup.compute_score),
+                # worth no points.
+                testcases.append({"idx": idx})
+                public_testcases.append({"idx": idx})
+                continue
             this_score = float(evaluations[idx].outcome) * self.parameters
             tc_outcome = self.get_public_outcome(this_score)
             score += this_score
@@ -20,6 +20,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import logging
 
 from cms import plugin_list
@@ -30,7 +31,8 @@ logger = logging.getLogger(__name__)
 
 
 __all__ = [
-    "SCORE_TYPES", "get_score_type", "get_score_type_class",
+    "SCORE_TYPES", "get_cached_score_type", "get_score_type",
+    "get_score_type_class", "invalidate_score_type_cache",
     # abc
     "ScoreType", "ScoreTypeAlone", "ScoreTypeGroup",
 ]
@@ -62,3 +64,71 @@ def get_score_type(name, parameters, public_testcases):
     """
     class_ = get_score_type_class(name)
     return class_(parameters, public_testcases)
+
+
+# The score type objects of the datasets, shared by all the sessions
+# of the process. Type: {int: (tuple, ScoreType)}, the key (see
+# _score_type_key) and the object, by dataset id.
+_score_type_cache = dict()
+
+
+def _score_type_key(name, parameters, public_testcases):
+    """Return what identifies the score type object of a dataset.
+
+    name (str): the name of the ScoreType class.
+    parameters (object): the parameters.
+    public_testcases ({str: bool}): the public flag of each testcase.
+
+    return (tuple): a hashable key, that changes when any of the
+        arguments does.
+
+    """
+    return (name,
+            json.dumps(parameters, sort_keys=True),
+            frozenset(public_testcases.items()))
+
+
+def get_cached_score_type(dataset_id, name, parameters, public_testcases):
+    """Return the ScoreType of a dataset, constructing it if needed.
+
+    Constructing a score type compiles its template and precomputes
+    its maximum scores (and, for group score types, the testcases of
+    each subtask): the objects are then kept for the life of the
+    process, one per dataset, and reused as long as the score type,
+    its parameters and the testcases of the dataset do not change.
+
+    dataset_id (int): the id of the dataset.
+    name (str): the name of the ScoreType class.
+    parameters (object): the parameters.
+    public_testcases ({str: bool}): for each testcase (identified by
+        its codename) a flag telling whether it's public or not.
+
+    return (ScoreType): an instance of the correct ScoreType class.
+
+    raise (KeyError|ValueError): if the score type or its parameters
+        are not valid; the error is not cached.
+
+    """
+    key = _score_type_key(name, parameters, public_testcases)
+    entry = _score_type_cache.get(dataset_id)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    score_type = get_score_type(name, parameters, public_testcases)
+    _score_type_cache[dataset_id] = (key, score_type)
+    return score_type
+
+
+def invalidate_score_type_cache(dataset_id=None):
+    """Forget the cached ScoreType of a dataset, or of all of them.
+
+    This is not needed for correctness (an object is not reused if the
+    dataset changed), but frees the memory of datasets that have been
+    edited or deleted.
+
+    dataset_id (int|None): the id of the dataset, or None for all.
+
+    """
+    if dataset_id is None:
+        _score_type_cache.clear()
+    else:
+        _score_type_cache.pop(dataset_id, None)
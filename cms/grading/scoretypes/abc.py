@@ -308,6 +308,11 @@ class ScoreTypeGroup(ScoreTypeAlone):
 </div>
 {% endfor %}"""
 
+    # The target testcases of each subtask, computed the first time
+    # they are needed; parameters and testcases never change during the
+    # life of a score type object.
+    _target_testcases = None
+
     def retrieve_target_testcases(self):
         """Return the list of the target testcases for each subtask.
 
@@ -316,10 +321,20 @@ class ScoreTypeGroup(ScoreTypeAlone):
         to the corresponding subtask.
         The order of the list is the same as 'parameters'.
 
-        return ([[unicode]]): the list of the target testcases for each task.
+        return ([[unicode]]): the list of the target testcases for each
+            task; it must not be modified.
 
         """
+        if self._target_testcases is None:
+            self._target_testcases = self._compute_target_testcases()
+        return self._target_testcases
+
+    def _compute_target_testcases(self):
+        """Compute the target testcases, see retrieve_target_testcases.
 
+        return ([[unicode]]): the list of the target testcases for each task.
+
+        """
         t_params = [p[1] for p in self.parameters]
 
         if all(isinstance(t, int) for t in t_params):
@@ -355,6 +370,32 @@ class ScoreTypeGroup(ScoreTypeAlone):
             "In the score type parameters, the second value of each element "
             "must have the same type (int or unicode)")
 
+    def testcases_to_skip(self, outcomes):
+        """Return the testcases whose evaluation cannot change the score.
+
+        A testcase can be skipped when every subtask containing it
+        already has an outcome that alone fails it (see
+        fails_subtask).
+
+        outcomes ({str: float}): the outcomes of the testcases
+            evaluated so far, by codename.
+
+        return ({str}): the codenames of the testcases, not in
+            outcomes, that do not need to be evaluated.
+
+        """
+        targets = self.retrieve_target_testcases()
+        needed = set()
+        settled = set()
+        for target, parameter in zip(targets, self.parameters):
+            if any(self.fails_subtask(outcomes[tc_idx], parameter)
+                   for tc_idx in target if tc_idx in outcomes):
+                settled.update(target)
+            else:
+                needed.update(target)
+        return set(tc_idx for tc_idx in settled - needed
+                   if tc_idx not in outcomes)
+
     def max_scores(self):
         """See ScoreType.max_score."""
         score = 0.0
@@ -394,6 +435,19 @@ class ScoreTypeGroup(ScoreTypeAlone):
             public_testcases = []
             previous_tc_all_correct = True
             for tc_idx in target:
+                if evaluations[tc_idx].outcome is None:
+                    # Skipped, as the subtasks containing it were
+                    # already failed: shown as not available.
+                    testcases.append({
+                        "idx": tc_idx,
+                        "text": evaluations[tc_idx].text,
+                        "show_in_restricted_feedback": False})
+                    if self.public_testcases[tc_idx]:
+                        public_testcases.append(testcases[-1])
+                    else:
+                        public_testcases.append({"idx": tc_idx})
+                    continue
+
                 tc_outcome = self.get_public_outcome(
                     float(evaluations[tc_idx].outcome), parameter)
 
@@ -414,9 +468,14 @@ class ScoreTypeGroup(ScoreTypeAlone):
                 else:
                     public_testcases.append({"idx": tc_idx})
 
-            st_score_fraction = self.reduce(
-                [float(evaluations[tc_idx].outcome) for tc_idx in target],
-                parameter)
+            # A testcase not evaluated fails the subtask: it was
+            # skipped because it could not change the score, but the
+            # subtasks might have changed since then.
+            outcomes = [float(evaluations[tc_idx].outcome)
+                        if evaluations[tc_idx].outcome is not None else 0.0
+                        for tc_idx in target]
+            st_score_fraction = self.reduce(outcomes, parameter) \
+                if len(outcomes) > 0 else 0.0
             st_score = st_score_fraction * parameter[0]
 
             score += st_score
@@ -456,6 +515,24 @@ class ScoreTypeGroup(ScoreTypeAlone):
         """
         pass
 
+    def fails_subtask(self, unused_outcome, unused_parameter):
+        """Return whether an outcome alone gives no points to a group.
+
+        If so, the score of the group does not depend on the outcomes
+        of its other testcases, which ES can then skip (see the
+        evaluation_subtask_policy configuration). By default, no
+        outcome is considered to fail a group.
+
+        unused_outcome (float): the outcome of the submission in a
+            testcase of the group.
+        unused_parameter (list): the parameters of the group.
+
+        return (bool): whether the group scores zero regardless of
+            the other outcomes.
+
+        """
+        return False
+
     @abstractmethod
     def reduce(self, unused_outcomes, unused_parameter):
         """Return the score of a subtask given the outcomes.
@@ -23,20 +23,37 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import joinedload
 
-from cms.db import Submission
+from cms.db import Participation, ParticipationTaskScore, Submission, Task
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 
 
 __all__ = [
     "compute_changes_for_dataset", "task_score",
+    "TaskScore", "compute_task_score", "compute_task_scores",
+    "get_task_score", "get_task_scores", "update_task_scores",
+    "invalidate_task_scores", "check_task_scores",
+    "TASK_SCORES_CHANNEL", "parse_task_scores_notification",
 ]
 
 
+# PostgreSQL channel on which the changes of the stored scores of the
+# participations on the tasks are notified. The payload is a space
+# separated list of "participation_id:task_id", or empty if all the
+# scores may have changed.
+TASK_SCORES_CHANNEL = "task_scores"
+
+# Notifications with more pairs than this are sent with an empty
+# payload instead (the payload is limited to 8000 bytes).
+MAX_NOTIFIED_PAIRS = 400
+
+
 SubmissionScoreDelta = namedtuple(
     'SubmissionScoreDelta',
     ['submission', 'old_score', 'new_score',
@@ -161,17 +178,30 @@ def task_score(participation, task,
             score, score_details = sr.score, sr.score_details
         score_details_tokened.append((score, score_details, s.tokened()))
 
+    score = _task_score_by_mode(task, score_details_tokened)
+    if rounded:
+        score = round(score, task.score_precision)
+    return score, partial
+
+
+def _task_score_by_mode(task, score_details_tokened):
+    """Compute a score using the score mode of the task.
+
+    task (Task): the task.
+    score_details_tokened ([(float|None, object|None, bool)]): a tuple for each
+        submission of the user in the task, see _task_score_max.
+
+    return (float): the score.
+
+    """
     if task.score_mode == SCORE_MODE_MAX:
-        score = _task_score_max(score_details_tokened)
+        return _task_score_max(score_details_tokened)
     elif task.score_mode == SCORE_MODE_MAX_SUBTASK:
-        score = _task_score_max_subtask(score_details_tokened)
+        return _task_score_max_subtask(score_details_tokened)
     elif task.score_mode == SCORE_MODE_MAX_TOKENED_LAST:
-        score = _task_score_max_tokened_last(score_details_tokened)
+        return _task_score_max_tokened_last(score_details_tokened)
     else:
         raise ValueError("Unknown score mode '%s'" % task.score_mode)
-    if rounded:
-        score = round(score, task.score_precision)
-    return score, partial
 
 
 def _task_score_max_tokened_last(score_details_tokened):
@@ -275,3 +305,379 @@ def _task_score_max(score_details_tokened):
             max_score = max(max_score, score)
 
     return max_score
+
+
+# Materialized task scores (see ParticipationTaskScore).
+
+TaskScore = namedtuple(
+    'TaskScore',
+    ['score', 'partial', 'public_score', 'tokened_score'])
+
+
+def compute_task_score(submissions, task):
+    """Compute all the scores of a contest's user on a task.
+
+    The result is the same as calling task_score (without rounding)
+    for the score, the public score and the score restricted to tokened
+    submissions, but the submissions are sorted only once.
+
+    submissions ([Submission]): the official submissions of the
+        participation on the task, with their token and results
+        loaded.
+    task (Task): the task.
+
+    return (TaskScore): the scores of the user on the task, and
+        whether some submissions have not been scored yet.
+
+    """
+    if len(submissions) == 0:
+        return TaskScore(0.0, False, 0.0, 0.0)
+
+    dataset_id = task.active_dataset_id
+    score_details_tokened = []
+    public_score_details_tokened = []
+    tokened_score_details_tokened = []
+    partial = False
+    for s in sorted(submissions, key=lambda s: s.timestamp):
+        tokened = s.tokened()
+        # Look for the result among the loaded ones, as get_result
+        # would issue a query if it is missing.
+        sr = next((sr for sr in s.results if sr.dataset_id == dataset_id),
+                  None)
+        if sr is None or not sr.scored():
+            partial = True
+            score_details_tokened.append((None, None, tokened))
+            public_score_details_tokened.append((None, None, tokened))
+            tokened_score_details_tokened.append((None, None, tokened))
+            continue
+        score_details_tokened.append((sr.score, sr.score_details, tokened))
+        public_score_details_tokened.append(
+            (sr.public_score, sr.public_score_details, tokened))
+        tokened_score_details_tokened.append(
+            score_details_tokened[-1] if tokened else (None, None, tokened))
+
+    return TaskScore(
+        _task_score_by_mode(task, score_details_tokened),
+        partial,
+        _task_score_by_mode(task, public_score_details_tokened),
+        _task_score_by_mode(task, tokened_score_details_tokened))
+
+
+def _load_task_submissions(session, pairs):
+    """Load the official submissions of some participations on some tasks.
+
+    session (Session): the session to use.
+    pairs ({(int, int)}): the participation and task ids.
+
+    return (({int: Task}, {(int, int): [Submission]})): the tasks, by
+        id, and the submissions (with their token and results) of
+        each pair.
+
+    """
+    task_ids = set(task_id for _, task_id in pairs)
+    tasks = dict((task.id, task) for task in session.query(Task)
+                 .filter(Task.id.in_(task_ids)).all())
+
+    submissions = defaultdict(list)
+    for submission in session.query(Submission)\
+            .filter(Submission.participation_id.in_(
+                set(participation_id for participation_id, _ in pairs)))\
+            .filter(Submission.task_id.in_(task_ids))\
+            .filter(Submission.official.is_(True))\
+            .options(joinedload(Submission.token))\
+            .options(joinedload(Submission.results))\
+            .all():
+        submissions[(submission.participation_id, submission.task_id)]\
+            .append(submission)
+
+    return tasks, submissions
+
+
+def compute_task_scores(session, pairs):
+    """Compute the scores of some participations on some tasks.
+
+    All the submissions needed are loaded with a single query.
+
+    session (Session): the session to use.
+    pairs ({(int, int)}): the participation and task ids.
+
+    return ({(int, int): TaskScore}): the scores of each pair (whose
+        task exists).
+
+    """
+    pairs = set(pairs)
+    if len(pairs) == 0:
+        return dict()
+    tasks, submissions = _load_task_submissions(session, pairs)
+    return dict(((participation_id, task_id),
+                 compute_task_score(submissions[(participation_id, task_id)],
+                                    tasks[task_id]))
+                for participation_id, task_id in pairs
+                if task_id in tasks)
+
+
+def _stored_task_scores(query, tasks):
+    """Return the stored scores that are up to date.
+
+    query (Query): a query on ParticipationTaskScore.
+    tasks ([Task]): the tasks of the scores.
+
+    return ({(int, int): TaskScore}): the scores computed on the active
+        dataset of the task, by participation and task id.
+
+    """
+    active_dataset_ids = dict((task.id, task.active_dataset_id)
+                              for task in tasks)
+    scores = dict()
+    for row in query.with_entities(
+            ParticipationTaskScore.participation_id,
+            ParticipationTaskScore.task_id,
+            ParticipationTaskScore.dataset_id,
+            ParticipationTaskScore.score,
+            ParticipationTaskScore.partial,
+            ParticipationTaskScore.public_score,
+            ParticipationTaskScore.tokened_score):
+        if row.dataset_id == active_dataset_ids.get(row.task_id):
+            scores[(row.participation_id, row.task_id)] = TaskScore(
+                row.score, row.partial, row.public_score, row.tokened_score)
+    return scores
+
+
+def get_task_score(session, participation, task):
+    """Return the scores of a contest's user on a task.
+
+    session (Session): the session to use.
+    participation (Participation): the user and contest.
+    task (Task): the task.
+
+    return (TaskScore): the stored scores, if up to date, or the ones
+        computed from the submissions (not rounded).
+
+    """
+    scores = _stored_task_scores(
+        session.query(ParticipationTaskScore)
+        .filter(ParticipationTaskScore.participation_id == participation.id)
+        .filter(ParticipationTaskScore.task_id == task.id),
+        [task])
+    if len(scores) == 0:
+        scores = compute_task_scores(session, [(participation.id, task.id)])
+    return scores[(participation.id, task.id)]
+
+
+def get_task_scores(session, contest):
+    """Return the scores of all the users of a contest on all its tasks.
+
+    The stored scores are used when they are up to date: only the
+    submissions of the other users and tasks are loaded to compute
+    them.
+
+    session (Session): the session to use.
+    contest (Contest): the contest.
+
+    return ({(int, int): TaskScore}): the scores (not rounded), by
+        participation and task id.
+
+    """
+    scores = _stored_task_scores(
+        session.query(ParticipationTaskScore)
+        .join(Participation,
+              ParticipationTaskScore.participation_id == Participation.id)
+        .filter(Participation.contest_id == contest.id),
+        contest.tasks)
+    missing = set((participation.id, task.id)
+                  for participation in contest.participations
+                  for task in contest.tasks) - scores.keys()
+    scores.update(compute_task_scores(session, missing))
+    return scores
+
+
+def _notify_task_scores(session, pairs):
+    """Notify that the scores of some participations have changed.
+
+    The notification is delivered to the listeners on
+    TASK_SCORES_CHANNEL when (and if) the transaction is committed.
+
+    session (Session): the session to use.
+    pairs ({(int, int)}|None): the participation and task ids, or None
+        if all the scores may have changed.
+
+    """
+    if pairs is not None and len(pairs) == 0:
+        return
+    if pairs is None or len(pairs) > MAX_NOTIFIED_PAIRS:
+        payload = ""
+    else:
+        payload = " ".join("%d:%d" % pair for pair in sorted(pairs))
+    session.execute(select([func.pg_notify(TASK_SCORES_CHANNEL, payload)]))
+
+
+def parse_task_scores_notification(payload):
+    """Return the scores that changed according to a notification.
+
+    payload (str): the payload of a notification on
+        TASK_SCORES_CHANNEL.
+
+    return ({(int, int)}|None): the participation and task ids, or None
+        if all the scores may have changed.
+
+    raise (ValueError): if the payload is malformed.
+
+    """
+    if payload == "":
+        return None
+    pairs = set()
+    for item in payload.split(" "):
+        participation_id, task_id = item.split(":")
+        pairs.add((int(participation_id), int(task_id)))
+    return pairs
+
+
+def _store_task_scores(session, scores, tasks):
+    """Store the scores of some participations on some tasks.
+
+    session (Session): the session to use.
+    scores ({(int, int): TaskScore}): the scores, by participation and
+        task id.
+    tasks ({int: Task}): the tasks, by id.
+
+    """
+    values = list()
+    for (participation_id, task_id), score in scores.items():
+        dataset_id = tasks[task_id].active_dataset_id
+        if dataset_id is None:
+            continue
+        values.append(dict(score._asdict(),
+                           participation_id=participation_id,
+                           task_id=task_id,
+                           dataset_id=dataset_id))
+    if len(values) == 0:
+        return
+
+    statement = insert(ParticipationTaskScore.__table__).values(values)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[ParticipationTaskScore.participation_id,
+                        ParticipationTaskScore.task_id],
+        set_=dict((key, statement.excluded[key])
+                  for key in ["dataset_id"] + list(TaskScore._fields))))
+    _notify_task_scores(session, set(scores.keys()))
+
+
+def _lock_task_scores(session, participation_ids):
+    """Serialize the changes to the stored scores of some participations.
+
+    The stored scores might not exist yet, so the participations are
+    locked instead, in a fixed order to avoid deadlocks. The lock (FOR
+    NO KEY UPDATE) doesn't block the insertion of rows referencing the
+    participations, like submissions.
+
+    session (Session): the session to use.
+    participation_ids ({int}): the participation ids.
+
+    """
+    session.query(Participation.id)\
+        .filter(Participation.id.in_(participation_ids))\
+        .order_by(Participation.id)\
+        .with_for_update(key_share=True)\
+        .all()
+
+
+def update_task_scores(session, pairs):
+    """Compute and store the scores of some participations on some tasks.
+
+    This must be called, in the same transaction, by whoever changes
+    the data the scores depend on: the submission results on the active
+    dataset, the official submissions and their tokens. The
+    participations are locked before loading the submissions, so that
+    concurrent updates of the same scores are serialized and the last
+    one stored is computed from the latest data.
+
+    session (Session): the session to use.
+    pairs ({(int, int)}): the participation and task ids.
+
+    """
+    pairs = set(pairs)
+    if len(pairs) == 0:
+        return
+    _lock_task_scores(session, set(pair[0] for pair in pairs))
+
+    tasks, submissions = _load_task_submissions(session, pairs)
+    _store_task_scores(
+        session,
+        dict((pair, compute_task_score(submissions[pair], tasks[pair[1]]))
+             for pair in pairs if pair[1] in tasks),
+        tasks)
+
+
+def invalidate_task_scores(session, pairs):
+    """Delete the stored scores of some participations on some tasks.
+
+    They will be computed from the submissions when needed, until they
+    are stored again.
+
+    session (Session): the session to use.
+    pairs ({(int, int)}): the participation and task ids.
+
+    """
+    pairs = set(pairs)
+    if len(pairs) == 0:
+        return
+    # Wait for the updates in progress, which could otherwise store
+    # scores computed before the change that is invalidating them.
+    _lock_task_scores(session, set(pair[0] for pair in pairs))
+    session.query(ParticipationTaskScore)\
+        .filter(tuple_(ParticipationTaskScore.participation_id,
+                       ParticipationTaskScore.task_id).in_(pairs))\
+        .delete(synchronize_session=False)
+    _notify_task_scores(session, pairs)
+
+
+def check_task_scores(session, contest, task=None, fix=False):
+    """Compare the stored scores of a contest with the computed ones.
+
+    session (Session): the session to use.
+    contest (Contest): the contest.
+    task (Task|None): the only task to check, or None for all.
+    fix (bool): whether to delete all the stored scores and store
+        them again, computed from scratch.
+
+    return ([(int, int)], [(int, int)]): the participation and task ids
+        of the scores that are stored but wrong (or stale), and of the
+        ones that are not stored although the user has submissions.
+
+    """
+    tasks = contest.tasks if task is None else [task]
+    if fix:
+        _lock_task_scores(session, set(participation.id for participation
+                                       in contest.participations))
+    query = session.query(ParticipationTaskScore)\
+        .filter(ParticipationTaskScore.participation_id.in_(
+            session.query(Participation.id)
+            .filter(Participation.contest_id == contest.id)))\
+        .filter(ParticipationTaskScore.task_id.in_(
+            [task.id for task in tasks]))
+    stored = _stored_task_scores(query, tasks)
+    stale = set((row.participation_id, row.task_id)
+                for row in query.with_entities(
+                    ParticipationTaskScore.participation_id,
+                    ParticipationTaskScore.task_id)) - stored.keys()
+
+    tasks_by_id, submissions = _load_task_submissions(
+        session, set((participation.id, task.id)
+                     for participation in contest.participations
+                     for task in tasks))
+    # Only users with some submissions need a stored score.
+    computed = dict((pair, compute_task_score(submissions[pair],
+                                              tasks_by_id[pair[1]]))
+                    for pair in list(submissions.keys()))
+
+    wrong = sorted(stale | set(pair for pair, score in stored.items()
+                               if computed.get(pair) != score))
+    missing = sorted(pair for pair in computed
+                     if pair not in stored and pair not in stale)
+
+    if fix:
+        query.delete(synchronize_session=False)
+        _store_task_scores(session, computed, tasks_by_id)
+        _notify_task_scores(session, set(wrong))
+
+    return wrong, missing
@@ -182,7 +182,7 @@ def trusted_step(sandbox, commands):
 
 
 def checker_step(sandbox, checker_digest, input_digest, correct_output_digest,
-                 output_filename):
+                 output_filename, staged=None):
     """Run the explicit checker given by the admins
 
     sandbox (Sandbox): the sandbox to run the checker in; should already
@@ -196,6 +196,11 @@ def checker_step(sandbox, checker_digest, input_digest, correct_output_digest,
         as "correct_output.txt".
     output_filename (str): inner filename of the user output (already in the
         sandbox).
+    staged ({str: str}|None): if the sandbox was already used by a checker,
+        the digests of the files for the checker already in it, by
+        filename; they are replaced only if they changed, and the
+        dictionary is updated accordingly. If None, the sandbox must not
+        contain them.
 
     return (bool, float|None, [str]|None): success (true if the checker was
         able to check the solution successfully), outcome and text (both None
@@ -204,25 +209,36 @@ def checker_step(sandbox, checker_digest, input_digest, correct_output_digest,
     """
     # Check that the file we are going to inject in the sandbox are not already
     # present (if so, it is due to a programming error in the task type).
-    for filename in [CHECKER_INPUT_FILENAME,
-                     CHECKER_CORRECT_OUTPUT_FILENAME,
-                     CHECKER_FILENAME]:
-        if sandbox.file_exists(filename):
-            logger.error("File %s already in the sandbox for the checker.",
-                         filename)
-            return False, None, None
-
-    # Copy the checker in the sandbox, after making sure it was provided.
+    if staged is None:
+        for filename in [CHECKER_INPUT_FILENAME,
+                         CHECKER_CORRECT_OUTPUT_FILENAME,
+                         CHECKER_FILENAME]:
+            if sandbox.file_exists(filename):
+                logger.error("File %s already in the sandbox for the checker.",
+                             filename)
+                return False, None, None
+
+    # Make sure the checker was provided.
     if checker_digest is None:
         logger.error("Configuration error: missing checker in task managers.")
         return False, None, None
-    sandbox.create_file_from_storage(CHECKER_FILENAME, checker_digest,
-                                     executable=True)
 
-    # Copy input and correct output in the sandbox.
-    sandbox.create_file_from_storage(CHECKER_INPUT_FILENAME, input_digest)
-    sandbox.create_file_from_storage(CHECKER_CORRECT_OUTPUT_FILENAME,
-                                     correct_output_digest)
+    # Copy the checker, input and correct output in the sandbox, unless
+    # they are already there.
+    for filename, digest, executable in [
+            (CHECKER_FILENAME, checker_digest, True),
+            (CHECKER_INPUT_FILENAME, input_digest, False),
+            (CHECKER_CORRECT_OUTPUT_FILENAME, correct_output_digest, False)]:
+        if staged is not None:
+            if staged.get(filename) == digest:
+                continue
+            if filename in staged:
+                del staged[filename]
+                sandbox.remove_file(filename)
+        sandbox.create_file_from_storage(filename, digest,
+                                         executable=executable)
+        if staged is not None:
+            staged[filename] = digest
 
     # Execute the checker and ensure success, or log an error.
     command = ["./%s" % CHECKER_FILENAME,
@@ -25,7 +25,9 @@
 
 """High level functions to perform standardized white-diff comparison."""
 
+import io
 import logging
+import os
 
 from .evaluation import EVALUATION_MESSAGES
 
@@ -39,37 +41,107 @@ logger = logging.getLogger(__name__)
 _WHITES = [b' ', b'\t', b'\n', b'\x0b', b'\x0c', b'\r']
 
 
-def _white_diff_canonicalize(string):
-    """Convert the input string to a canonical form for the white diff
-    algorithm; that is, the strings a and b are mapped to the same
-    string by _white_diff_canonicalize() if and only if they have to be
-    considered equivalent for the purposes of the white-diff
+# Size of the blocks in which files are read.
+_CHUNK_SIZE = 256 * 1024
+
+
+def _white_diff_canonical_chunks(fobj, chunk_size=_CHUNK_SIZE):
+    """Read a file and yield its canonical form for the white diff
+    algorithm, in pieces; that is, two files have the same canonical
+    form (once the pieces are concatenated) if and only if they have
+    to be considered equivalent for the purposes of the white-diff
     algorithm.
 
-    More specifically, this function strips all the leading and
-    trailing whitespaces from s and collapse all the runs of
-    consecutive whitespaces into just one copy of one specific
-    whitespace.
+    More specifically, the canonical form has the tokens (maximal runs
+    of non-whitespaces) of each line separated by one space, and the
+    lines separated by newlines, without the trailing empty lines.
+
+    The file is read in blocks of chunk_size bytes, and the pieces are
+    not much longer than that, regardless of the length of lines and
+    tokens.
 
-    string (str): the string to canonicalize.
-    return (str): the canonicalized string.
+    fobj (file): the file to read, opened in binary mode.
+    chunk_size (int): the size of the blocks to read.
+
+    yield (bytes): the pieces of the canonical form.
 
     """
-    # Replace all the whitespaces with copies of " ", making the rest
-    # of the algorithm simpler
-    for char in _WHITES[1:]:
-        string = string.replace(char, _WHITES[0])
+    # Whether the current line has some token, whether the last byte
+    # read was part of a token, and the number of newlines read after
+    # the last token.
+    line_has_token = False
+    in_token = False
+    pending_newlines = 0
 
-    # Split the string according to " ", filter out empty tokens and
-    # join again the string using just one copy of the first
-    # whitespace; this way, runs of more than one whitespaces are
-    # collapsed into just one copy.
-    string = _WHITES[0].join([x for x in string.split(_WHITES[0])
-                              if len(x) > 0])
-    return string
+    while True:
+        chunk = fobj.read(chunk_size)
+        if len(chunk) == 0:
+            return
+        parts = []
+        for index, segment in enumerate(chunk.split(b"\n")):
+            if index > 0:
+                pending_newlines += 1
+                line_has_token = False
+                in_token = False
+            tokens = segment.split()
+            if len(tokens) == 0:
+                in_token = in_token and len(segment) == 0
+                continue
+            if in_token and segment[:1] not in _WHITES:
+                # The first token continues the one of the last block.
+                parts.append(tokens[0])
+                tokens = tokens[1:]
+            if len(tokens) > 0:
+                if pending_newlines > 0:
+                    while pending_newlines > 0:
+                        newlines = min(pending_newlines, chunk_size)
+                        parts.append(b"\n" * newlines)
+                        pending_newlines -= newlines
+                elif line_has_token:
+                    parts.append(_WHITES[0])
+                parts.append(_WHITES[0].join(tokens))
+            line_has_token = True
+            in_token = segment[-1:] not in _WHITES
+        if len(parts) > 0:
+            yield b"".join(parts)
+
+
+def _same_content(output, res, chunk_size=_CHUNK_SIZE):
+    """Check whether two files are byte-for-byte identical, if that
+    is cheap to know.
+
+    The check is done only if the files are regular files with the
+    same size; afterwards, both are rewound.
 
+    output (file): the first file to compare.
+    res (file): the second file to compare.
+    chunk_size (int): the size of the blocks to read.
 
-def _white_diff(output, res):
+    return (bool): True if the files are surely identical.
+
+    """
+    try:
+        if os.fstat(output.fileno()).st_size \
+                != os.fstat(res.fileno()).st_size:
+            return False
+        start_output = output.tell()
+        start_res = res.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return False
+    while True:
+        chunk_output = output.read(chunk_size)
+        chunk_res = res.read(chunk_size)
+        if chunk_output != chunk_res:
+            output.seek(start_output)
+            res.seek(start_res)
+            return False
+        if len(chunk_output) == 0:
+            output.seek(start_output)
+            res.seek(start_res)
+            return True
+
+
+def _white_diff(output, res, chunk_size=_CHUNK_SIZE):
     """Compare the two output files. Two files are equal if for every
     integer i, line i of first file is equal to line i of second
     file. Two lines are equal if they differ only by number or type of
@@ -80,34 +152,35 @@ def _white_diff(output, res):
     'sequence of characters ending with \n or EOF and beginning right
     after BOF or \n'. In particular, every line has *at most* one \n.
 
+    The files are compared in blocks, with bounded memory. Identical
+    files of the same size are recognized without tokenizing them.
+
     output (file): the first file to compare.
     res (file): the second file to compare.
+    chunk_size (int): the size of the blocks to read.
     return (bool): True if the two file are equal as explained above.
 
     """
+    if _same_content(output, res, chunk_size):
+        return True
 
+    pieces_output = _white_diff_canonical_chunks(output, chunk_size)
+    pieces_res = _white_diff_canonical_chunks(res, chunk_size)
+    buffer_output = b""
+    buffer_res = b""
     while True:
-        lout = output.readline()
-        lres = res.readline()
-
-        # Both files finished: comparison succeded
-        if len(lres) == 0 and len(lout) == 0:
-            return True
-
-        # Only one file finished: ok if the other contains only blanks
-        elif len(lres) == 0 or len(lout) == 0:
-            lout = lout.strip(b''.join(_WHITES))
-            lres = lres.strip(b''.join(_WHITES))
-            if len(lout) > 0 or len(lres) > 0:
-                return False
-
-        # Both file still have lines to go: ok if they agree except
-        # for the number of whitespaces
-        else:
-            lout = _white_diff_canonicalize(lout)
-            lres = _white_diff_canonicalize(lres)
-            if lout != lres:
-                return False
+        if len(buffer_output) == 0:
+            buffer_output = next(pieces_output, None)
+        if len(buffer_res) == 0:
+            buffer_res = next(pieces_res, None)
+        if buffer_output is None or buffer_res is None:
+            # Equal only if both canonical forms ended.
+            return buffer_output is None and buffer_res is None
+        length = min(len(buffer_output), len(buffer_res))
+        if buffer_output[:length] != buffer_res[:length]:
+            return False
+        buffer_output = buffer_output[length:]
+        buffer_res = buffer_res[length:]
 
 
 def white_diff_fobj_step(output_fobj, correct_output_fobj):
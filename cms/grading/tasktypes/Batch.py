@@ -30,7 +30,8 @@ from cms.grading.steps import compilation_step, evaluation_step, \
     human_evaluation_message
 from . import TaskType, \
     check_executables_number, check_files_number, check_manager_present, \
-    create_sandbox, delete_sandbox, eval_output, is_manager_for_compilation
+    create_sandbox, delete_sandbox, eval_output, is_manager_for_compilation, \
+    fill_from_compilation_cache, store_in_compilation_cache
 
 
 logger = logging.getLogger(__name__)
@@ -218,6 +219,12 @@ class Batch(TaskType):
         commands = language.get_compilation_commands(
             filenames_to_compile, executable_filename)
 
+        # Reuse the result of an identical compilation, if known.
+        cached, cache_key = fill_from_compilation_cache(
+            job, commands, filenames_and_digests_to_get)
+        if cached:
+            return
+
         # Create the sandbox.
         sandbox = create_sandbox(file_cacher, name="compile")
         job.sandboxes.append(sandbox.get_root_path())
@@ -242,6 +249,8 @@ class Batch(TaskType):
             job.executables[executable_filename] = \
                 Executable(executable_filename, digest)
 
+        store_in_compilation_cache(cache_key, job)
+
         # Cleanup.
         delete_sandbox(sandbox, job.success, job.keep_sandbox)
 
@@ -250,6 +259,74 @@ class Batch(TaskType):
         if not check_executables_number(job, 1):
             return
 
+        # Create the sandbox
+        sandbox = create_sandbox(file_cacher, name="evaluate")
+        job.sandboxes.append(sandbox.get_root_path())
+
+        self._evaluate_in_sandbox(sandbox, job, file_cacher)
+
+        delete_sandbox(sandbox, job.success, job.keep_sandbox)
+
+    def evaluate_many(self, jobs, file_cacher):
+        """See TaskType.evaluate_many.
+
+        The jobs are run one after the other in the same sandbox, where
+        the executable is put only once: between two runs, the sandbox
+        is reset, removing everything else (including what the previous
+        run wrote). Time and memory limits are still applied to each
+        run. A new sandbox is created after a failed run, or when the
+        executable changes.
+
+        """
+        sandbox = None
+        executable = None
+        keep_sandbox = False
+        success = True
+        try:
+            for job in jobs:
+                if not check_executables_number(job, 1):
+                    continue
+                job_executable = next(iter(job.executables.values()))
+                job_executable = (job_executable.filename,
+                                  job_executable.digest)
+
+                if sandbox is not None and executable != job_executable:
+                    delete_sandbox(sandbox, True, keep_sandbox)
+                    sandbox = None
+                stage_executable = sandbox is None
+                if sandbox is None:
+                    sandbox = create_sandbox(file_cacher, name="evaluate")
+                    executable = job_executable
+                    keep_sandbox = False
+                else:
+                    sandbox.reset(keep=[executable[0]])
+                job.sandboxes.append(sandbox.get_root_path())
+
+                # Until the job is done, a failure keeps the sandbox.
+                success = False
+                self._evaluate_in_sandbox(sandbox, job, file_cacher,
+                                          stage_executable=stage_executable)
+                success = job.success
+
+                keep_sandbox = keep_sandbox or job.keep_sandbox
+                if not success:
+                    delete_sandbox(sandbox, False, keep_sandbox)
+                    sandbox = None
+        finally:
+            if sandbox is not None:
+                delete_sandbox(sandbox, success, keep_sandbox)
+
+    def _evaluate_in_sandbox(self, sandbox, job, file_cacher,
+                             stage_executable=True):
+        """Run the executable on the input of the job, and check it.
+
+        sandbox (Sandbox): the sandbox where to run.
+        job (EvaluationJob): the job, to fill with the results.
+        file_cacher (FileCacher): the file cacher to use.
+        stage_executable (bool): whether to put the executable in the
+            sandbox (False if it is already there).
+
+        """
         # Prepare the execution
         executable_filename = next(iter(job.executables.keys()))
         language = get_language(job.language)
@@ -277,13 +354,11 @@ class Batch(TaskType):
         else:
             files_allowing_write.append(self._actual_output)
 
-        # Create the sandbox
-        sandbox = create_sandbox(file_cacher, name="evaluate")
-        job.sandboxes.append(sandbox.get_root_path())
-
         # Put the required files into the sandbox
-        for filename, digest in executables_to_get.items():
-            sandbox.create_file_from_storage(filename, digest, executable=True)
+        if stage_executable:
+            for filename, digest in executables_to_get.items():
+                sandbox.create_file_from_storage(
+                    filename, digest, executable=True)
         for filename, digest in files_to_get.items():
             sandbox.create_file_from_storage(filename, digest)
 
@@ -351,5 +426,3 @@ class Batch(TaskType):
         job.outcome = str(outcome) if outcome is not None else None
         job.text = text
         job.plus = stats
-
-        delete_sandbox(sandbox, job.success, job.keep_sandbox)
@@ -35,7 +35,8 @@ from cms.grading.steps import compilation_step, evaluation_step_before_run, \
     human_evaluation_message, merge_execution_stats, trusted_step
 from cms.grading.tasktypes import check_files_number
 from . import TaskType, check_executables_number, check_manager_present, \
-    create_sandbox, delete_sandbox, is_manager_for_compilation
+    create_sandbox, delete_sandbox, is_manager_for_compilation, \
+    fill_from_compilation_cache, store_in_compilation_cache
 
 
 logger = logging.getLogger(__name__)
@@ -209,6 +210,12 @@ class Communication(TaskType):
         commands = language.get_compilation_commands(
             filenames_to_compile, executable_filename)
 
+        # Reuse the result of an identical compilation, if known.
+        cached, cache_key = fill_from_compilation_cache(
+            job, commands, filenames_and_digests_to_get)
+        if cached:
+            return
+
         # Create the sandbox.
         sandbox = create_sandbox(file_cacher, name="compile")
         job.sandboxes.append(sandbox.get_root_path())
@@ -233,6 +240,8 @@ class Communication(TaskType):
             job.executables[executable_filename] = \
                 Executable(executable_filename, digest)
 
+        store_in_compilation_cache(cache_key, job)
+
         # Cleanup.
         delete_sandbox(sandbox, job.success, job.keep_sandbox)
 
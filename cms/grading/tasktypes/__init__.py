@@ -27,7 +27,7 @@ from .abc import TaskType
 from .util import create_sandbox, delete_sandbox, \
     is_manager_for_compilation, set_configuration_error, \
     check_executables_number, check_files_number, check_manager_present, \
-    eval_output
+    eval_output, fill_from_compilation_cache, store_in_compilation_cache
 
 
 logger = logging.getLogger(__name__)
@@ -41,7 +41,7 @@ __all__ = [
     "create_sandbox", "delete_sandbox",
     "is_manager_for_compilation", "set_configuration_error",
     "check_executables_number", "check_files_number", "check_manager_present",
-    "eval_output",
+    "eval_output", "fill_from_compilation_cache", "store_in_compilation_cache",
 ]
 
 
@@ -217,6 +217,24 @@ class TaskType(metaclass=ABCMeta):
         """
         pass
 
+    def evaluate_many(self, jobs, file_cacher):
+        """Evaluate several EvaluationJobs of the same submission.
+
+        The Worker calls this (when configured to) on consecutive jobs
+        of a job group with the same task type and executables. By
+        default the jobs are evaluated one after the other, but task
+        types can override this to share work among them, for example
+        their sandbox. Each job must still be filled as by evaluate().
+
+        jobs ([EvaluationJob]): the jobs to evaluate.
+        file_cacher (FileCacher): the file cacher to use to obtain the
+                                  required files and to store the ones
+                                  that are produced.
+
+        """
+        for job in jobs:
+            self.evaluate(job, file_cacher)
+
     def execute_job(self, job, file_cacher):
         """Call compile() or execute() depending on the job passed
         when constructing the TaskType.
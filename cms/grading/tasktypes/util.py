@@ -32,11 +32,12 @@ compilation and the evaluation are contained in the task type class.
 import logging
 import os
 import shutil
+import time
 
 from cms import config
 from cms.grading import JobException
 from cms.grading.Job import CompilationJob, EvaluationJob
-from cms.grading.Sandbox import Sandbox
+from cms.grading.Sandbox import Sandbox, get_execution_slot
 from cms.grading.steps import EVALUATION_MESSAGES, checker_step, \
     white_diff_fobj_step
 
@@ -47,9 +48,33 @@ logger = logging.getLogger(__name__)
 EVAL_USER_OUTPUT_FILENAME = "user_output.txt"
 
 
+# The pool of ready sandboxes of this process, if any.
+_sandbox_pool = None
+
+# The checker sandboxes of the job group being executed, if any.
+_checker_sandboxes = None
+
+# The cache of compilation results of this process, if any.
+_compilation_cache = None
+
+
+def set_sandbox_pool(pool):
+    """Set the pool create_sandbox and delete_sandbox use.
+
+    pool (SandboxPool|None): the pool, or None to create and delete
+        sandboxes directly.
+
+    """
+    global _sandbox_pool
+    _sandbox_pool = pool
+
+
 def create_sandbox(file_cacher, name=None):
     """Create a sandbox, and return it.
 
+    If a pool of sandboxes was set for file_cacher, a ready sandbox is
+    taken from it when available.
+
     file_cacher (FileCacher): a file cacher instance.
     name (str): name to include in the path of the sandbox.
 
@@ -58,6 +83,10 @@ def create_sandbox(file_cacher, name=None):
     raise (JobException): if the sandbox cannot be created.
 
     """
+    if _sandbox_pool is not None and _sandbox_pool.file_cacher is file_cacher:
+        sandbox = _sandbox_pool.acquire(name)
+        if sandbox is not None:
+            return sandbox
     try:
         sandbox = Sandbox(file_cacher, name=name)
     except OSError:
@@ -82,6 +111,11 @@ def delete_sandbox(sandbox, success=True, keep_sandbox=False):
                        sandbox.get_root_path())
 
     delete = success and not config.keep_sandbox and not keep_sandbox
+    if _sandbox_pool is not None \
+            and _sandbox_pool.file_cacher is sandbox.file_cacher:
+        # The pool cleans it up in the background.
+        _sandbox_pool.release(sandbox, delete)
+        return
     try:
         sandbox.cleanup(delete=delete)
     except OSError:
@@ -89,6 +123,148 @@ def delete_sandbox(sandbox, success=True, keep_sandbox=False):
         logger.warning(err_msg, exc_info=True)
 
 
+def set_compilation_cache(cache):
+    """Set the cache the compilations use.
+
+    cache (CompilationCache|None): the cache, or None to always compile.
+
+    """
+    global _compilation_cache
+    _compilation_cache = cache
+
+
+def fill_from_compilation_cache(job, commands, files_to_get):
+    """Fill a compilation job with the result of an identical
+    compilation, if known.
+
+    job (CompilationJob): the job to fill.
+    commands ([[str]]): the compilation commands.
+    files_to_get ({str: str}): the digest of each file to put in the
+        compilation sandbox, by filename.
+
+    return ((bool, tuple|None)): whether the job was filled, and the
+        key of the compilation in the cache (None if there is no cache),
+        to pass to store_in_compilation_cache after compiling.
+
+    """
+    if _compilation_cache is None:
+        return False, None
+    key = _compilation_cache.key(job.language, commands, files_to_get)
+    return _compilation_cache.fill(key, job), key
+
+
+def store_in_compilation_cache(key, job):
+    """Store the result of a compilation job, if it can be reused.
+
+    key (tuple|None): the key from fill_from_compilation_cache.
+    job (CompilationJob): the job, filled with its result.
+
+    """
+    if key is not None and _compilation_cache is not None:
+        _compilation_cache.store(key, job)
+
+
+def set_checker_sandboxes(checker_sandboxes):
+    """Set the checker sandboxes eval_output uses.
+
+    checker_sandboxes (CheckerSandboxes|None): the sandboxes, or None
+        to create a new sandbox for each checker run.
+
+    """
+    global _checker_sandboxes
+    _checker_sandboxes = checker_sandboxes
+
+
+class CheckerSandboxes:
+    """The sandboxes where the checkers of a job group are run.
+
+    Instead of creating a sandbox for each checker run, and copying the
+    checker in it each time, a sandbox is created for each execution
+    slot the first time it is needed, and reused by the next checker
+    runs in that slot. The files for the checker are replaced only when
+    they change; all other files (e.g., those written by the previous
+    checker) are removed.
+
+    """
+
+    def __init__(self, file_cacher):
+        """Initialization.
+
+        file_cacher (FileCacher): the file cacher of the sandboxes.
+
+        """
+        self.file_cacher = file_cacher
+        # The sandbox of each slot, with the digests of the files for
+        # the checker it contains.
+        # Type: {ExecutionSlot|None: (Sandbox, {str: str})}
+        self._sandboxes = {}
+        # The files of each slot before the current checker run.
+        # Type: {ExecutionSlot|None: {str: str}}
+        self._staged_before = {}
+
+        self.checks = 0
+        self.sandboxes_created = 0
+        self.files_reused = 0
+        # Time spent creating and deleting sandboxes.
+        self._setup_time = 0.0
+
+    def acquire(self):
+        """Return the sandbox of the current execution slot.
+
+        return ((Sandbox, {str: str})): the sandbox and the files for
+            the checker already in it, to pass to checker_step.
+
+        raise (JobException): if the sandbox cannot be created.
+
+        """
+        slot = get_execution_slot()
+        if slot not in self._sandboxes:
+            start_time = time.monotonic()
+            sandbox = create_sandbox(self.file_cacher, name="check")
+            self._setup_time += time.monotonic() - start_time
+            self.sandboxes_created += 1
+            self._sandboxes[slot] = (sandbox, {})
+        sandbox, staged = self._sandboxes[slot]
+        sandbox.remove_files(keep=list(staged))
+        self._staged_before[slot] = dict(staged)
+        self.checks += 1
+        return sandbox, staged
+
+    def release(self, sandbox, success):
+        """Give back the sandbox after a checker run.
+
+        If the run failed, the sandbox is not reused, and it is kept.
+
+        sandbox (Sandbox): the sandbox returned by acquire.
+        success (bool): whether the checker run succeeded.
+
+        """
+        slot = get_execution_slot()
+        staged = self._sandboxes[slot][1]
+        self.files_reused += sum(
+            1 for filename, digest in self._staged_before.pop(slot).items()
+            if staged.get(filename) == digest)
+        if not success:
+            del self._sandboxes[slot]
+            delete_sandbox(sandbox, success)
+
+    def close(self):
+        """Delete the sandboxes and log how much work was saved."""
+        for sandbox, _ in self._sandboxes.values():
+            start_time = time.monotonic()
+            delete_sandbox(sandbox, True)
+            self._setup_time += time.monotonic() - start_time
+        self._sandboxes.clear()
+
+        if self.sandboxes_created > 0:
+            setup_time = self._setup_time / self.sandboxes_created
+            saved = (self.checks - self.sandboxes_created) * setup_time
+            logger.info("Ran %d checkers in %d sandboxes, reusing %d files; "
+                        "saved about %.1f ms of sandbox setup per testcase.",
+                        self.checks, self.sandboxes_created,
+                        self.files_reused, 1000 * saved / self.checks)
+
+
 def is_manager_for_compilation(filename, language):
     """Return whether a manager should be copied in the compilation sandbox.
 
@@ -240,9 +416,19 @@ def eval_output(file_cacher, job, checker_codename,
         if not check_manager_present(job, checker_codename):
             return False, None, None
 
-        # Create a brand-new sandbox just for checking.
-        sandbox = create_sandbox(file_cacher, name="check")
-        job.sandboxes.append(sandbox.get_root_path())
+        if _checker_sandboxes is not None \
+                and _checker_sandboxes.file_cacher is file_cacher \
+                and not job.keep_sandbox:
+            # Reuse the sandbox of the previous checker runs; it is
+            # recorded in the job only if kept as it is, after a
+            # failure, since the next runs would change it.
+            checker_sandboxes = _checker_sandboxes
+            sandbox, staged = checker_sandboxes.acquire()
+        else:
+            # Create a brand-new sandbox just for checking.
+            checker_sandboxes = None
+            sandbox, staged = create_sandbox(file_cacher, name="check"), None
+            job.sandboxes.append(sandbox.get_root_path())
 
         # Put user output in the sandbox.
         if user_output_path is not None:
@@ -256,9 +442,14 @@ def eval_output(file_cacher, job, checker_codename,
             if checker_codename in job.managers else None
         success, outcome, text = checker_step(
             sandbox, checker_digest, job.input, job.output,
-            EVAL_USER_OUTPUT_FILENAME)
+            EVAL_USER_OUTPUT_FILENAME, staged)
 
-        delete_sandbox(sandbox, success, job.keep_sandbox)
+        if checker_sandboxes is not None:
+            if not success:
+                job.sandboxes.append(sandbox.get_root_path())
+            checker_sandboxes.release(sandbox, success)
+        else:
+            delete_sandbox(sandbox, success, job.keep_sandbox)
         return success, outcome, text
 
     else:
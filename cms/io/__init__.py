@@ -27,7 +27,8 @@ __all__ = [
     # triggeredservice
     "Executor", "TriggeredService",
     # priorityqueue
-    "FakeQueueItem", "PriorityQueue", "QueueEntry", "QueueItem",
+    "FakeQueueItem", "FairPriorityQueue", "PriorityQueue", "QueueEntry",
+    "QueueItem",
     # web_rpc
     "RPCMiddleware",
     # web_service
@@ -38,7 +39,8 @@ __all__ = [
 # Instantiate or import these objects.
 
 from .PsycoGevent import make_psycopg_green
-from .priorityqueue import FakeQueueItem, PriorityQueue, QueueEntry, QueueItem
+from .priorityqueue import FakeQueueItem, FairPriorityQueue, \
+    PriorityQueue, QueueEntry, QueueItem
 from .rpc import RPCError, rpc_method, RemoteServiceServer, RemoteServiceClient
 from .service import Service
 from .triggeredservice import Executor, TriggeredService
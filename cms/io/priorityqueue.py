@@ -38,21 +38,27 @@ together the three data point: item, priority, and timestamp.
 
 """
 
+import heapq
+from collections import OrderedDict
 from functools import total_ordering
 
 from gevent.event import Event
 
-from cmscommon.datetime import make_datetime, make_timestamp
+from cmscommon.datetime import make_datetime, make_timestamp, \
+    monotonic_time
 
 
 class QueueItem:
 
     """Payload of an item in the queue.
 
-    Must be hashable.
+    Must be hashable. Subclasses can define __slots__ to save memory,
+    in which case they must also override to_dict.
 
     """
 
+    __slots__ = ()
+
     def to_dict(self):
         """Return a dict() representation of the object."""
         return self.__dict__
@@ -65,6 +71,8 @@ class QueueEntry:
 
     """
 
+    __slots__ = ("item", "priority", "timestamp", "index")
+
     def __init__(self, item, priority, timestamp, index):
         """Create a QueueEntry object.
 
@@ -88,8 +96,12 @@ class QueueEntry:
 
     def __lt__(self, other):
         """Return whether self has higher priority than other."""
-        return (self.priority, self.timestamp, self.index) \
-               < (other.priority, other.timestamp, other.index)
+        # Equivalent to comparing the tuples, without building them.
+        if self.priority != other.priority:
+            return self.priority < other.priority
+        if self.timestamp != other.timestamp:
+            return self.timestamp < other.timestamp
+        return self.index < other.index
 
 
 class PriorityQueue:
@@ -181,13 +193,21 @@ class PriorityQueue:
         return (int): the new index of the element.
 
         """
+        # Instead of swapping at each level, move the parents down
+        # into the hole and put the element in place at the end.
+        queue = self._queue
+        reverse = self._reverse
+        entry = queue[idx]
         while idx > 0:
             parent = (idx - 1) // 2
-            if self._queue[idx] < self._queue[parent]:
-                self._swap(parent, idx)
+            if entry < queue[parent]:
+                queue[idx] = queue[parent]
+                reverse[queue[idx].item] = idx
                 idx = parent
             else:
                 break
+        queue[idx] = entry
+        reverse[entry.item] = idx
         return idx
 
     def _down_heap(self, idx):
@@ -199,17 +219,23 @@ class PriorityQueue:
         return (int): the new index of the element.
 
         """
-        last = len(self._queue) - 1
+        # As in _up_heap, move the children up into the hole.
+        queue = self._queue
+        reverse = self._reverse
+        entry = queue[idx]
+        last = len(queue) - 1
         while 2 * idx + 1 <= last:
             child = 2 * idx + 1
-            if 2 * idx + 2 <= last and \
-                    self._queue[2 * idx + 2] < self._queue[child]:
-                child = 2 * idx + 2
-            if self._queue[child] < self._queue[idx]:
-                self._swap(child, idx)
+            if child < last and queue[child + 1] < queue[child]:
+                child += 1
+            if queue[child] < entry:
+                queue[idx] = queue[child]
+                reverse[queue[idx].item] = idx
                 idx = child
             else:
                 break
+        queue[idx] = entry
+        reverse[entry.item] = idx
         return idx
 
     def _updown_heap(self, idx):
@@ -259,6 +285,62 @@ class PriorityQueue:
 
         return True
 
+    def push_many(self, entries):
+        """Push several items in the queue.
+
+        Equivalent to calling push on each of them, but if the items
+        are many with respect to the size of the queue, the heap is
+        rebuilt in linear time instead.
+
+        entries ([(QueueItem, int|None, datetime|None)]): the items to
+            push, with their priority and timestamp (see push).
+
+        return (int): the number of items pushed (that is, not already
+            in the queue).
+
+        """
+        queue = self._queue
+        reverse = self._reverse
+        start = len(queue)
+        index = self._next_index
+        now = None
+        for item, priority, timestamp in entries:
+            if item in reverse:
+                continue
+            if priority is None:
+                priority = PriorityQueue.PRIORITY_MEDIUM
+            if timestamp is None:
+                if now is None:
+                    now = make_datetime()
+                timestamp = now
+            reverse[item] = len(queue)
+            queue.append(QueueEntry(item, priority, timestamp, index))
+            index += 1
+        self._next_index = index
+
+        pushed = len(queue) - start
+        if pushed == 0:
+            return 0
+        if pushed > start:
+            self._heapify()
+        else:
+            for idx in range(start, len(self._queue)):
+                self._up_heap(idx)
+
+        # Signal to listener greenlets that there might be something.
+        self._event.set()
+
+        return pushed
+
+    def _heapify(self):
+        """Restore the heap property on the whole queue, and rebuild
+        the reverse lookup, in linear time.
+
+        """
+        heapq.heapify(self._queue)
+        self._reverse = dict((entry.item, idx)
+                             for idx, entry in enumerate(self._queue))
+
     def top(self, wait=False):
         """Return the first element in the queue without extracting it.
 
@@ -306,6 +388,28 @@ class PriorityQueue:
             self._event.clear()
         return top
 
+    def pop_many(self, limit=None, wait=False):
+        """Extract (and return) the first elements in the queue.
+
+        limit (int|None): the maximum number of elements to extract,
+            or None to extract all of them.
+        wait (bool): if True, block until an element is present.
+
+        return ([QueueEntry]): the first elements in the queue, in
+            order; empty if the queue is empty and wait was false.
+
+        """
+        if wait:
+            self.top(wait=True)
+        if limit is None or limit >= len(self._queue):
+            # Taking everything: sorting is cheaper than popping.
+            entries = sorted(self._queue)
+            self._queue = []
+            self._reverse = {}
+            self._event.clear()
+            return entries
+        return [self.pop() for _ in range(limit)]
+
     def remove(self, item):
         """Remove an item from the queue. Raise a KeyError if not present.
 
@@ -332,6 +436,35 @@ class PriorityQueue:
 
         return entry
 
+    def remove_many(self, items):
+        """Remove from the queue those of the items that are present.
+
+        Equivalent to calling remove on each of them (ignoring the
+        missing ones), but if the items are many with respect to the
+        size of the queue, the heap is rebuilt in linear time instead.
+
+        items ([QueueItem]): the items to remove.
+
+        return ([QueueEntry]): the entries removed.
+
+        """
+        to_remove = set(item for item in items if item in self._reverse)
+        if len(to_remove) * 4 < len(self._queue):
+            return [self.remove(item) for item in to_remove]
+
+        removed = []
+        kept = []
+        for entry in self._queue:
+            if entry.item in to_remove:
+                removed.append(entry)
+            else:
+                kept.append(entry)
+        self._queue = kept
+        self._heapify()
+        if self.empty():
+            self._event.clear()
+        return removed
+
     def set_priority(self, item, priority):
         """Change the priority of an item inside the queue. Raises an
         exception if the item is not in the queue.
@@ -377,6 +510,386 @@ class PriorityQueue:
                 for entry in self._queue]
 
 
+class FairPriorityQueue:
+
+    """A priority queue sharing each priority level among flows.
+
+    It offers the same interface as PriorityQueue, but the items with
+    the same priority are not extracted purely in timestamp order:
+    each item belongs to a flow, identified by a pair (group, owner)
+    (for ES, contest and participation), and flows take turns with
+    deficit round-robin at two levels. Within a priority level, each
+    group in turn gets up to quantum extractions, which its owners
+    share in the same way; within a flow, items are extracted in
+    (timestamp, index) order. Hence an owner with many items cannot
+    delay by more than one round the items of the other owners, nor
+    a group those of the other groups.
+
+    Each flow is stored in its own PriorityQueue, so push, pop and
+    remove take logarithmic time in the size of the flow, plus
+    constant time for the rotation of the flows.
+
+    The queue also keeps, for each flow, statistics on the time its
+    items waited in the queue.
+
+    """
+
+    def __init__(self, flow_of, quantum=10):
+        """Create a fair priority queue.
+
+        flow_of (function): called with an item, returns its flow, a
+            pair (group, owner) of hashable values.
+        quantum (int): number of items extracted from a flow (and
+            from a group) before moving to the next one.
+
+        """
+        self._flow_of = flow_of
+        self._quantum = max(quantum, 1)
+
+        # For each priority level with items, the groups in the order
+        # of their turns, and for each group its owners in the same
+        # order. Type: {int: OrderedDict({object: OrderedDict({object:
+        # None})})}.
+        self._rounds = {}
+
+        # The items of each flow. Type: {(int, object, object):
+        # PriorityQueue}.
+        self._flows = {}
+
+        # Extractions left in the current turn of each group, with key
+        # (priority, group), and of each flow, with key (priority,
+        # group, owner).
+        self._deficits = {}
+
+        # Flow key and monotonic time of push of each item.
+        self._location = {}
+        self._pushed_at = {}
+
+        # Event to signal that there are items in the queue.
+        self._event = Event()
+
+        # Number of items extracted, and total and maximum time (in
+        # seconds) they waited, for each flow. Type: {(object,
+        # object): [int, float, float]}.
+        self._waits = {}
+
+    def __len__(self):
+        return len(self._location)
+
+    def __contains__(self, item):
+        """Implement the 'in' operator for an item in the queue.
+
+        item (QueueItem): an item to search.
+
+        return (bool): True if item is in the queue.
+
+        """
+        return item in self._location
+
+    def _verify(self):
+        """Make sure that the internal state of the queue is consistent.
+
+        This is used only for testing.
+
+        """
+        if len(self._location) != sum(len(flow)
+                                      for flow in self._flows.values()):
+            return False
+        if self.empty() != (len(self._rounds) == 0):
+            return False
+        if self._event.isSet() == self.empty():
+            return False
+        for item, key in self._location.items():
+            if item not in self._flows[key] or item not in self._pushed_at:
+                return False
+        for key, flow in self._flows.items():
+            priority, group, owner = key
+            if len(flow) == 0 or not flow._verify():
+                return False
+            if owner not in self._rounds[priority][group]:
+                return False
+            if self._deficits[key] <= 0 \
+                    or self._deficits[(priority, group)] <= 0:
+                return False
+        return True
+
+    def _head(self):
+        """Return the key of the flow whose turn it is.
+
+        return ((int, object, object)): the key of the flow.
+
+        raise (LookupError): on empty queue.
+
+        """
+        if len(self._rounds) == 0:
+            raise LookupError("Empty queue.")
+        priority = min(self._rounds)
+        groups = self._rounds[priority]
+        group = next(iter(groups))
+        owner = next(iter(groups[group]))
+        return priority, group, owner
+
+    def _add_flow(self, key):
+        """Create an empty flow, whose turn comes after the others'.
+
+        key ((int, object, object)): the key of the flow.
+
+        """
+        priority, group, owner = key
+        groups = self._rounds.setdefault(priority, OrderedDict())
+        if group not in groups:
+            groups[group] = OrderedDict()
+            self._deficits[(priority, group)] = self._quantum
+        groups[group][owner] = None
+        self._deficits[key] = self._quantum
+        self._flows[key] = PriorityQueue()
+
+    def _discard_flow(self, key):
+        """Delete an empty flow (and its group, if now empty).
+
+        key ((int, object, object)): the key of the flow.
+
+        """
+        priority, group, owner = key
+        del self._flows[key]
+        del self._deficits[key]
+        groups = self._rounds[priority]
+        del groups[group][owner]
+        if len(groups[group]) == 0:
+            del groups[group]
+            del self._deficits[(priority, group)]
+            if len(groups) == 0:
+                del self._rounds[priority]
+
+    def push(self, item, priority=None, timestamp=None):
+        """Push an item in the queue. If timestamp is not specified,
+        uses the current time.
+
+        item (QueueItem): the item to add to the queue.
+        priority (int|None): the priority of the item, or None for
+            medium priority.
+        timestamp (datetime|None): the time of the submission, or None
+            to use now.
+
+        return (bool): false if the element was already in the queue
+            and was not pushed again, true otherwise.
+
+        """
+        if item in self._location:
+            return False
+
+        if priority is None:
+            priority = PriorityQueue.PRIORITY_MEDIUM
+        if timestamp is None:
+            timestamp = make_datetime()
+
+        group, owner = self._flow_of(item)
+        key = (priority, group, owner)
+        if key not in self._flows:
+            self._add_flow(key)
+        self._flows[key].push(item, priority, timestamp)
+        self._location[item] = key
+        self._pushed_at.setdefault(item, monotonic_time())
+
+        # Signal to listener greenlets that there might be something.
+        self._event.set()
+
+        return True
+
+    def push_many(self, entries):
+        """Push several items in the queue.
+
+        entries ([(QueueItem, int|None, datetime|None)]): the items to
+            push, with their priority and timestamp (see push).
+
+        return (int): the number of items pushed.
+
+        """
+        return sum(1 for item, priority, timestamp in entries
+                   if self.push(item, priority, timestamp))
+
+    def top(self, wait=False):
+        """Return the first element in the queue without extracting it.
+
+        wait (bool): if True, block until an element is present.
+
+        return (QueueEntry): first element in the queue.
+
+        raise (LookupError): on empty queue if wait was false.
+
+        """
+        while wait and self.empty():
+            self._event.wait()
+        return self._flows[self._head()].top()
+
+    def pop(self, wait=False):
+        """Extract (and return) the first element in the queue.
+
+        wait (bool): if True, block until an element is present.
+
+        return (QueueEntry): first element in the queue.
+
+        raise (LookupError): on empty queue, if wait was false.
+
+        """
+        while wait and self.empty():
+            self._event.wait()
+        key = self._head()
+        priority, group, owner = key
+        top = self._flows[key].pop()
+        del self._location[top.item]
+
+        waited = monotonic_time() - self._pushed_at.pop(top.item)
+        stats = self._waits.setdefault((group, owner), [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += waited
+        stats[2] = max(stats[2], waited)
+
+        # Move to the next flow and group if their turn is over.
+        self._deficits[key] -= 1
+        self._deficits[(priority, group)] -= 1
+        groups = self._rounds[priority]
+        if len(self._flows[key]) == 0:
+            self._discard_flow(key)
+        elif self._deficits[key] == 0:
+            groups[group].move_to_end(owner)
+            self._deficits[key] = self._quantum
+        if group in groups and self._deficits[(priority, group)] == 0:
+            groups.move_to_end(group)
+            self._deficits[(priority, group)] = self._quantum
+
+        if self.empty():
+            # Signal that there is nothing left for listeners.
+            self._event.clear()
+        return top
+
+    def pop_many(self, limit=None, wait=False):
+        """Extract (and return) the first elements in the queue.
+
+        limit (int|None): the maximum number of elements to extract,
+            or None to extract all of them.
+        wait (bool): if True, block until an element is present.
+
+        return ([QueueEntry]): the first elements in the queue, in
+            order; empty if the queue is empty and wait was false.
+
+        """
+        if wait:
+            self.top(wait=True)
+        if limit is None:
+            limit = len(self)
+        return [self.pop() for _ in range(min(limit, len(self)))]
+
+    def remove(self, item):
+        """Remove an item from the queue. Raise a KeyError if not present.
+
+        item (QueueItem): the item to remove.
+
+        return (QueueEntry): the complete entry removed.
+
+        raise (KeyError): if item not present.
+
+        """
+        key = self._location.pop(item)
+        del self._pushed_at[item]
+        entry = self._flows[key].remove(item)
+        if len(self._flows[key]) == 0:
+            self._discard_flow(key)
+
+        if self.empty():
+            self._event.clear()
+
+        return entry
+
+    def remove_many(self, items):
+        """Remove from the queue those of the items that are present.
+
+        items ([QueueItem]): the items to remove.
+
+        return ([QueueEntry]): the entries removed.
+
+        """
+        return [self.remove(item) for item in set(items)
+                if item in self._location]
+
+    def set_priority(self, item, priority):
+        """Change the priority of an item inside the queue. Raises an
+        exception if the item is not in the queue.
+
+        item (QueueItem): the item whose priority needs to change.
+        priority (int): the new priority.
+
+        raise (LookupError): if item not present.
+
+        """
+        pushed_at = self._pushed_at[item]
+        entry = self.remove(item)
+        self._pushed_at[item] = pushed_at
+        self.push(item, priority, entry.timestamp)
+
+    def length(self):
+        """Return the number of elements in the queue.
+
+        return (int): length of the queue
+
+        """
+        return len(self._location)
+
+    def empty(self):
+        """Return if the queue is empty.
+
+        return (bool): is the queue empty?
+
+        """
+        return self.length() == 0
+
+    def get_status(self):
+        """Return the content of the queue. Note that the order may be not
+        correct, but the first element is the one at the top.
+
+        return ([QueueEntry]): a list of entries containing the
+            representation of the item, the priority and the
+            timestamp.
+
+        """
+        entries = []
+        if not self.empty():
+            head = self._head()
+            entries += self._flows[head].get_status()
+            for key, flow in self._flows.items():
+                if key != head:
+                    entries += flow.get_status()
+        return entries
+
+    def get_wait_status(self):
+        """Return statistics on the time the items waited in the queue.
+
+        return ([dict]): for each flow that had or has items in the
+            queue, its group and owner, the number of items in the
+            queue and extracted, and the average and maximum time (in
+            seconds) the latter waited.
+
+        """
+        queued = {}
+        for (_, group, owner), flow in self._flows.items():
+            queued[(group, owner)] = queued.get((group, owner), 0) \
+                + len(flow)
+        result = []
+        for flow in set(queued) | set(self._waits):
+            extracted, total_wait, max_wait = \
+                self._waits.get(flow, (0, 0.0, 0.0))
+            result.append({
+                "group": flow[0],
+                "owner": flow[1],
+                "queued": queued.get(flow, 0),
+                "extracted": extracted,
+                "average_wait": total_wait / extracted
+                if extracted > 0 else 0.0,
+                "max_wait": max_wait,
+            })
+        return result
+
+
 # Fake objects for testing follow.
 
 
@@ -20,7 +20,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import functools
-import json
 import logging
 import socket
 import traceback
@@ -32,12 +31,21 @@ import gevent.event
 import gevent.lock
 import gevent.socket
 
-from cms import Address, get_service_address
+from cms import Address, config, get_service_address
+from .rpccodec import CODECS, FRAME_HEADER, JSONCodec, PROTOCOL_VERSION, \
+    decode_frame_payload, encode_frame, get_codec
 
 
 logger = logging.getLogger(__name__)
 
 
+# The pseudo-method a client calls, as first request, to propose the
+# framed protocol to the server (see RemoteServiceClient.negotiate).
+# Servers not supporting it reply with an error, like for any other
+# missing method, and the connection stays on the JSON lines protocol.
+PROTOCOL_METHOD = "__protocol"
+
+
 class RPCError(Exception):
     """Generic error during RPC communication."""
     pass
@@ -72,10 +80,17 @@ class RemoteServiceBase:
     When the state changes the on_connect or on_disconnect handlers
     will be fired.
 
+    Messages are exchanged either as JSON lines (the original protocol,
+    used by default) or, if both ends support it and agree on it at the
+    beginning of the connection, as binary frames (see rpccodec).
+
     """
     # Incoming messages larger than 1 MiB are dropped to avoid DOS
     # attacks. XXX Check that this size is sensible.
     MAX_MESSAGE_SIZE = 1024 * 1024
+    # The same for frames (also once decompressed); they can be larger
+    # as they are not scanned looking for the end of the message.
+    MAX_FRAME_SIZE = 64 * 1024 * 1024
 
     def __init__(self, remote_address):
         """Prepare to handle a connection with the given remote address.
@@ -98,6 +113,11 @@ class RemoteServiceBase:
         self._read_lock = gevent.lock.RLock()
         self._write_lock = gevent.lock.RLock()
 
+        # Whether the connection uses frames, and the codec of the
+        # messages.
+        self._framed = False
+        self._codec = JSONCodec
+
     @property
     def connected(self):
         """Return whether we're connected to the other endpoint.
@@ -149,8 +169,17 @@ class RemoteServiceBase:
             raise RuntimeError("Already connected.")
 
         self._socket = sock
+        # Each message is sent with a single write: do not delay it
+        # waiting for the acknowledgement of the previous one.
+        try:
+            self._socket.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as error:
+            logger.debug("Couldn't disable Nagle's algorithm: %s.", error)
         self._reader = self._socket.makefile('rb')
         self._writer = self._socket.makefile('wb')
+        self._framed = False
+        self._codec = JSONCodec
         self._connection_event.set()
         # IPv4 addresses have two elements (host and port), IPv6 ones
         # have 4 elements (host, port, flowinfo and scopeid). We will
@@ -209,11 +238,51 @@ class RemoteServiceBase:
             self.finalize(reason=reason)
         return True
 
+    def _use_framing(self, codec):
+        """Switch the connection to the framed protocol.
+
+        Must be called while holding the write lock, and before
+        reading or writing any frame.
+
+        codec (type): the codec of the messages (see rpccodec).
+
+        """
+        self._framed = True
+        self._codec = codec
+        logger.debug("Using framed protocol with codec %s with %s.",
+                     codec.name, self._repr_remote())
+
+    def _encode(self, message):
+        """Encode a message with the codec of the connection.
+
+        message (object): the message.
+
+        return (bytes): the encoded message.
+
+        raise (TypeError|ValueError): if encoding fails.
+
+        """
+        return self._codec.encode(message)
+
+    def _decode(self, data):
+        """Decode a message with the codec of the connection.
+
+        data (bytes): the encoded message.
+
+        return (object): the message.
+
+        raise (ValueError): if decoding fails.
+
+        """
+        return self._codec.decode(data)
+
     def _read(self):
         """Receive a message from the socket.
 
-        Read from the socket until a "\\r\\n" is found. That is what we
-        consider a "message" in the communication protocol.
+        With the JSON lines protocol, read from the socket until a
+        "\\r\\n" is found. That is what we consider a "message" in the
+        communication protocol. With the framed protocol, read a frame
+        and decompress its payload if needed.
 
         return (bytes): the retrieved message.
 
@@ -227,17 +296,10 @@ class RemoteServiceBase:
             with self._read_lock:
                 if not self.connected:
                     raise OSError("Not connected.")
-                data = self._reader.readline(self.MAX_MESSAGE_SIZE)
-                # If there weren't a "\r\n" between the last message
-                # and the EOF we would have a false positive here.
-                # Luckily there is one.
-                if len(data) > 0 and not data.endswith(b"\r\n"):
-                    logger.error(
-                        "The client sent a message larger than %d bytes (that "
-                        "is MAX_MESSAGE_SIZE). Consider raising that value if "
-                        "the message seemed legit.", self.MAX_MESSAGE_SIZE)
-                    self.finalize("Client misbehaving.")
-                    raise OSError("Message too long.")
+                if self._framed:
+                    data = self._read_frame()
+                else:
+                    data = self._read_line()
         except OSError as error:
             if self.connected:
                 logger.warning("Failed reading from socket: %s.", error)
@@ -250,10 +312,65 @@ class RemoteServiceBase:
 
         return data
 
+    def _read_line(self):
+        """Read a message of the JSON lines protocol.
+
+        return (bytes): the message, with the trailing "\\r\\n".
+
+        raise (OSError): if reading fails.
+
+        """
+        data = self._reader.readline(self.MAX_MESSAGE_SIZE)
+        # If there weren't a "\r\n" between the last message
+        # and the EOF we would have a false positive here.
+        # Luckily there is one.
+        if len(data) > 0 and not data.endswith(b"\r\n"):
+            logger.error(
+                "The client sent a message larger than %d bytes (that "
+                "is MAX_MESSAGE_SIZE). Consider raising that value if "
+                "the message seemed legit.", self.MAX_MESSAGE_SIZE)
+            self.finalize("Client misbehaving.")
+            raise OSError("Message too long.")
+        return data
+
+    def _read_frame(self):
+        """Read a message of the framed protocol.
+
+        return (bytes): the (decompressed) payload of the frame, or
+            an empty bytes if the connection has been closed.
+
+        raise (OSError): if reading fails.
+
+        """
+        header = self._reader.read(FRAME_HEADER.size)
+        if len(header) == 0:
+            return b""
+        if len(header) < FRAME_HEADER.size:
+            raise OSError("Connection closed in the middle of a frame.")
+        flags, length = FRAME_HEADER.unpack(header)
+        if length > self.MAX_FRAME_SIZE:
+            logger.error(
+                "The client sent a frame larger than %d bytes (that is "
+                "MAX_FRAME_SIZE). Consider raising that value if the "
+                "message seemed legit.", self.MAX_FRAME_SIZE)
+            self.finalize("Client misbehaving.")
+            raise OSError("Message too long.")
+        payload = self._reader.read(length)
+        if len(payload) < length:
+            raise OSError("Connection closed in the middle of a frame.")
+        try:
+            return decode_frame_payload(flags, payload, self.MAX_FRAME_SIZE)
+        except ValueError as error:
+            logger.error("The client sent an invalid frame: %s", error)
+            self.finalize("Client misbehaving.")
+            raise OSError("Invalid frame.")
+
     def _write(self, data):
         """Send a message to the socket.
 
-        Automatically append "\\r\\n" to make it a correct message.
+        With the JSON lines protocol, automatically append "\\r\\n" to
+        make it a correct message; with the framed protocol, put it in
+        a frame, compressing it if it is large enough.
 
         data (bytes): the message to transmit.
 
@@ -263,12 +380,18 @@ class RemoteServiceBase:
         if not self.connected:
             raise OSError("Not connected.")
 
-        if len(data + b'\r\n') > self.MAX_MESSAGE_SIZE:
+        if self._framed:
+            size, max_size, max_size_name = \
+                len(data), self.MAX_FRAME_SIZE, "MAX_FRAME_SIZE"
+        else:
+            size, max_size, max_size_name = \
+                len(data + b'\r\n'), self.MAX_MESSAGE_SIZE, "MAX_MESSAGE_SIZE"
+        if size > max_size:
             logger.error(
                 "A message wasn't sent to %r because it was larger than %d "
-                "bytes (that is MAX_MESSAGE_SIZE). Consider raising that "
-                "value if the message seemed legit.", self._repr_remote(),
-                self.MAX_MESSAGE_SIZE)
+                "bytes (that is %s). Consider raising that value if the "
+                "message seemed legit.", self._repr_remote(), max_size,
+                max_size_name)
             # No need to call finalize.
             raise OSError("Message too long.")
 
@@ -276,8 +399,13 @@ class RemoteServiceBase:
             with self._write_lock:
                 if not self.connected:
                     raise OSError("Not connected.")
+                if self._framed:
+                    data = encode_frame(data,
+                                        config.rpc_compression_min_size)
+                else:
+                    data += b'\r\n'
                 # Does the same as self._socket.sendall.
-                self._writer.write(data + b'\r\n')
+                self._writer.write(data)
                 self._writer.flush()
         except OSError as error:
             self.finalize("Write failed.")
@@ -331,6 +459,9 @@ class RemoteServiceServer(RemoteServiceBase):
         it's therefore advisable to spawn a greenlet to call it.
 
         """
+        # The first message may be the proposal of the client to
+        # switch to the framed protocol.
+        negotiating = config.rpc_framing
         while True:
             try:
                 data = self._read()
@@ -341,12 +472,67 @@ class RemoteServiceServer(RemoteServiceBase):
                 self.finalize("Connection closed.")
                 break
 
+            if negotiating:
+                negotiating = False
+                if self.negotiate(data):
+                    continue
+
             gevent.spawn(self.process_data, data)
 
+    def negotiate(self, data):
+        """Answer to a proposal of the client to use frames.
+
+        The proposal is a request for PROTOCOL_METHOD, with the
+        protocol versions and codecs supported by the client as data.
+        The answer has as data the version and codec chosen by the
+        server, or None to keep the JSON lines protocol. It is sent
+        as a JSON line, and the server uses frames for all the
+        following messages (in both directions).
+
+        data (bytes): the first message read from the socket.
+
+        return (bool): whether the message was a proposal (and has
+            been answered); if not, it has to be processed as a
+            normal request.
+
+        """
+        try:
+            request = JSONCodec.decode(data)
+        except ValueError:
+            return False
+        if not isinstance(request, dict) \
+                or request.get("__method") != PROTOCOL_METHOD:
+            return False
+
+        proposal = request.get("__data")
+        codec = None
+        if isinstance(proposal, dict) \
+                and isinstance(proposal.get("versions"), list) \
+                and PROTOCOL_VERSION in proposal["versions"] \
+                and isinstance(proposal.get("codecs"), list):
+            codec = get_codec(proposal["codecs"])
+
+        response = {"__id": request.get("__id"),
+                    "__data": None,
+                    "__error": None}
+        if codec is not None:
+            response["__data"] = {"version": PROTOCOL_VERSION,
+                                  "codec": codec.name}
+
+        with self._write_lock:
+            try:
+                self._write(JSONCodec.encode(response))
+            except OSError:
+                # Log messages have already been produced.
+                return True
+            if codec is not None:
+                self._use_framing(codec)
+        return True
+
     def process_data(self, data):
         """Handle the message.
 
-        JSON-decode it and forward it to process_incoming_request
+        Decode it and forward it to process_incoming_request
         (unconditionally!).
 
         data (bytes): the message read from the socket.
@@ -354,7 +540,7 @@ class RemoteServiceServer(RemoteServiceBase):
         """
         # Decode the incoming data.
         try:
-            message = json.loads(data.decode('utf-8'))
+            message = self._decode(data)
         except ValueError:
             self.disconnect("Bad request received")
             logger.warning("Cannot parse incoming message, discarding.")
@@ -405,19 +591,20 @@ class RemoteServiceServer(RemoteServiceBase):
                         (error.__class__.__name__, error,
                          traceback.format_exc())
 
-        # Encode it.
-        try:
-            data = json.dumps(response).encode('utf-8')
-        except (TypeError, ValueError):
-            logger.warning("JSON encoding failed.", exc_info=True)
-            return
+        # Encode and send it, without letting the protocol change in
+        # between.
+        with self._write_lock:
+            try:
+                data = self._encode(response)
+            except (TypeError, ValueError):
+                logger.warning("Encoding failed.", exc_info=True)
+                return
 
-        # Send it.
-        try:
-            self._write(data)
-        except OSError:
-            # Log messages have already been produced.
-            return
+            try:
+                self._write(data)
+            except OSError:
+                # Log messages have already been produced.
+                return
 
 
 class RemoteServiceClient(RemoteServiceBase):
@@ -523,6 +710,9 @@ class RemoteServiceClient(RemoteServiceBase):
         it's therefore advisable to spawn a greenlet to call it.
 
         """
+        if config.rpc_framing and not self.negotiate():
+            return
+
         while True:
             try:
                 data = self._read()
@@ -535,10 +725,56 @@ class RemoteServiceClient(RemoteServiceBase):
 
             gevent.spawn(self.process_data, data)
 
+    def negotiate(self):
+        """Propose to the server to use frames.
+
+        Send the proposal (see RemoteServiceServer.negotiate) and wait
+        for the answer, keeping the other greenlets from sending
+        requests in the meantime. If the server does not support the
+        framed protocol (for example, it runs an older version) the
+        connection keeps using JSON lines.
+
+        return (bool): whether the connection is still open.
+
+        """
+        request = {"__id": uuid.uuid4().hex,
+                   "__method": PROTOCOL_METHOD,
+                   "__data": {"versions": [PROTOCOL_VERSION],
+                              "codecs": list(CODECS)}}
+
+        with self._write_lock:
+            try:
+                self._write(JSONCodec.encode(request))
+                data = self._read()
+            except OSError:
+                return False
+
+            if len(data) == 0:
+                self.finalize("Connection closed.")
+                return False
+
+            codec = None
+            try:
+                response = JSONCodec.decode(data)
+                answer = response["__data"]
+                if answer is not None \
+                        and answer["version"] == PROTOCOL_VERSION:
+                    codec = CODECS[answer["codec"]]
+            except (ValueError, LookupError, TypeError):
+                logger.warning("Invalid answer to the protocol proposal "
+                               "from %s, ignoring.", self._repr_remote())
+
+            if codec is not None:
+                self._use_framing(codec)
+            else:
+                logger.debug("Using JSON lines protocol with %s.",
+                             self._repr_remote())
+        return True
+
     def process_data(self, data):
         """Handle the message.
 
-        JSON-decode it and forward it to process_incoming_response
+        Decode it and forward it to process_incoming_response
         (unconditionally!).
 
         data (bytes): the message read from the socket.
@@ -546,7 +782,7 @@ class RemoteServiceClient(RemoteServiceBase):
         """
         # Decode the incoming data.
         try:
-            message = json.loads(data.decode('utf-8'))
+            message = self._decode(data)
         except ValueError:
             self.disconnect("Bad response received")
             logger.warning("Cannot parse incoming message, discarding.")
@@ -609,20 +845,21 @@ class RemoteServiceClient(RemoteServiceBase):
 
         result = gevent.event.AsyncResult()
 
-        # Encode it.
-        try:
-            data = json.dumps(request).encode('utf-8')
-        except (TypeError, ValueError):
-            logger.error("JSON encoding failed.", exc_info=True)
-            result.set_exception(RPCError("JSON encoding failed."))
-            return result
+        # Encode and send it, without letting the protocol change in
+        # between.
+        with self._write_lock:
+            try:
+                data = self._encode(request)
+            except (TypeError, ValueError):
+                logger.error("Encoding failed.", exc_info=True)
+                result.set_exception(RPCError("Encoding failed."))
+                return result
 
-        # Send it.
-        try:
-            self._write(data)
-        except OSError:
-            result.set_exception(RPCError("Write failed."))
-            return result
+            try:
+                self._write(data)
+            except OSError:
+                result.set_exception(RPCError("Write failed."))
+                return result
 
         # Store it.
         self.pending_outgoing_requests[id_] = request
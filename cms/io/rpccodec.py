@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Serialization of the RPC messages, and the binary framing used
+when both ends of a connection support it.
+
+The original protocol sends each message as a line of JSON terminated
+by "\\r\\n". Once a connection is established, a client can propose
+to switch to protocol version 2 (see rpc.py): each message is then
+sent as a frame, made of a header (one byte of flags and four bytes
+with the length of the payload, big-endian) followed by the payload,
+encoded by the codec agreed by the two ends and possibly compressed
+with zlib.
+
+"""
+
+import json
+import struct
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+__all__ = [
+    "CODECS", "FRAME_COMPRESSED", "FRAME_HEADER", "PROTOCOL_VERSION",
+    "JSONCodec", "OrjsonCodec", "decode_frame_payload", "encode_frame",
+    "get_codec",
+]
+
+
+# The version of the framed protocol; version 1 is the JSON lines one.
+PROTOCOL_VERSION = 2
+
+# Flags and payload length.
+FRAME_HEADER = struct.Struct("!BI")
+# The payload is compressed with zlib.
+FRAME_COMPRESSED = 0x01
+
+# Compression level for zlib; the lowest one, as messages are mostly
+# sent between hosts on a fast network.
+COMPRESSION_LEVEL = 1
+
+
+class JSONCodec:
+    """Encode messages as JSON, with the standard library.
+
+    This is the encoding of the original protocol, and it is always
+    available.
+
+    """
+
+    name = "json"
+
+    @staticmethod
+    def encode(message):
+        """Encode a message.
+
+        message (object): a JSON-serializable object.
+
+        return (bytes): the encoded message.
+
+        raise (TypeError|ValueError): if the message cannot be
+            encoded.
+
+        """
+        return json.dumps(message).encode('utf-8')
+
+    @staticmethod
+    def decode(data):
+        """Decode a message.
+
+        data (bytes): the encoded message.
+
+        return (object): the message.
+
+        raise (ValueError): if the data is not a valid message.
+
+        """
+        return json.loads(data.decode('utf-8'))
+
+
+class OrjsonCodec:
+    """Encode messages as JSON, with orjson (if installed).
+
+    The data model is the same as the one of JSONCodec (in particular,
+    non-string keys are converted to strings and datetimes are not
+    accepted), so services see exactly the same values; but encoding
+    and decoding are several times faster.
+
+    """
+
+    name = "orjson"
+
+    if orjson is not None:
+        _OPTIONS = orjson.OPT_NON_STR_KEYS \
+            | orjson.OPT_PASSTHROUGH_DATETIME \
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    @staticmethod
+    def encode(message):
+        """See JSONCodec.encode."""
+        # orjson.JSONEncodeError is a TypeError.
+        return orjson.dumps(message, option=OrjsonCodec._OPTIONS)
+
+    @staticmethod
+    def decode(data):
+        """See JSONCodec.decode."""
+        # orjson.JSONDecodeError is a ValueError.
+        return orjson.loads(data)
+
+
+# The codecs available in this installation, by name, the preferred
+# ones first.
+CODECS = {codec.name: codec
+          for codec in [OrjsonCodec, JSONCodec]
+          if codec is not OrjsonCodec or orjson is not None}
+
+
+def get_codec(names):
+    """Return the first of the given codecs that is available.
+
+    names ([str]): the names of the codecs supported by the other end
+        of the connection, the preferred ones first.
+
+    return (type|None): the codec, or None if no codec is available.
+
+    """
+    for name in names:
+        if name in CODECS:
+            return CODECS[name]
+    return None
+
+
+def encode_frame(payload, compression_min_size=None):
+    """Build a frame of the protocol version 2.
+
+    payload (bytes): the encoded message.
+    compression_min_size (int|None): the size from which payloads are
+        compressed (if this makes them smaller); None to never
+        compress them.
+
+    return (bytes): the header and the (possibly compressed) payload.
+
+    """
+    flags = 0
+    if compression_min_size is not None \
+            and len(payload) >= compression_min_size:
+        compressed = zlib.compress(payload, COMPRESSION_LEVEL)
+        if len(compressed) < len(payload):
+            flags |= FRAME_COMPRESSED
+            payload = compressed
+    return FRAME_HEADER.pack(flags, len(payload)) + payload
+
+
+def decode_frame_payload(flags, payload, max_size):
+    """Return the encoded message from the payload of a frame.
+
+    flags (int): the flags in the header of the frame.
+    payload (bytes): the payload of the frame.
+    max_size (int): the maximum size of the decompressed payload.
+
+    return (bytes): the encoded message.
+
+    raise (ValueError): if the payload cannot be decompressed, or is
+        larger than max_size once decompressed.
+
+    """
+    if not flags & FRAME_COMPRESSED:
+        return payload
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(payload, max_size)
+    except zlib.error as error:
+        raise ValueError("Invalid compressed payload: %s." % error)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("Compressed payload too long or truncated.")
+    return data
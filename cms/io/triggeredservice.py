@@ -95,6 +95,17 @@ class Executor(metaclass=ABCMeta):
         """
         return self._operation_queue.push(item, priority, timestamp)
 
+    def enqueue_many(self, entries):
+        """Add several items to the queue.
+
+        entries ([(QueueItem, int|None, datetime|None)]): the items to
+            add, with their priority and timestamp (see enqueue).
+
+        return (int): the number of items successfully enqueued.
+
+        """
+        return self._operation_queue.push_many(entries)
+
     def dequeue(self, item):
         """Remove an item from the queue.
 
@@ -103,6 +114,17 @@ class Executor(metaclass=ABCMeta):
         """
         self._operation_queue.remove(item)
 
+    def dequeue_many(self, items):
+        """Remove from the queue those of the items that are present.
+
+        items ([QueueItem]): the items to remove.
+
+        return ([QueueItem]): the items removed.
+
+        """
+        return [entry.item
+                for entry in self._operation_queue.remove_many(items)]
+
     def run(self):
         """Monitor the queue, and dispatch operations when available.
 
@@ -118,10 +140,8 @@ class Executor(metaclass=ABCMeta):
             to_execute = [self._operation_queue.pop(wait=True)]
             if self._batch_executions:
                 max_operations = self.max_operations_per_batch()
-                while not self._operation_queue.empty() and (
-                        max_operations == 0 or
-                        len(to_execute) < max_operations):
-                    to_execute.append(self._operation_queue.pop())
+                to_execute += self._operation_queue.pop_many(
+                    max_operations - 1 if max_operations > 0 else None)
 
             assert len(to_execute) > 0, "Expected at least one element."
             if self._batch_executions:
@@ -213,6 +233,9 @@ class TriggeredService(Service):
 
     """
 
+    # One periodic sweep every this many is a full one.
+    FULL_SWEEP_INTERVAL = 10
+
     def __init__(self, shard):
         """Initialize the sweeper loop.
 
@@ -227,6 +250,21 @@ class TriggeredService(Service):
         self._sweeper_event = Event()
         self._sweeper_started = False
         self._sweeper_timeout = None
+        # Whether the next sweep must be a full one; the first one
+        # always is.
+        self._sweeper_full = True
+        # Number of incremental sweeps since the last full one.
+        self._sweeper_incremental = 0
+
+        # Statistics on the sweeps.
+        self._sweeper_stats = {
+            "full_sweeps": 0,
+            "incremental_sweeps": 0,
+            "last_sweep_full": None,
+            "last_sweep_duration": None,
+            "last_sweep_recovered": None,
+            "total_recovered": 0,
+        }
 
     def add_executor(self, executor):
         """Add an executor for the service.
@@ -264,6 +302,23 @@ class TriggeredService(Service):
                 ret += 1
         return ret
 
+    def enqueue_many(self, operations):
+        """Add several operations to the queue of each executor.
+
+        operations ([(QueueItem, int|None, datetime|None)]): the
+            operations to enqueue, with their priority and timestamp
+            (see enqueue).
+
+        return (int): the number of operations added, summed over the
+            executors.
+
+        """
+        operations = list(operations)
+        ret = 0
+        for executor in self._executors:
+            ret += executor.enqueue_many(operations)
+        return ret
+
     def dequeue(self, operation):
         """Remove an operation from the queue of each executor.
 
@@ -273,6 +328,17 @@ class TriggeredService(Service):
         for executor in self._executors:
             executor.dequeue(operation)
 
+    def dequeue_many(self, operations):
+        """Remove several operations from the queue of each executor,
+        ignoring those not in it.
+
+        operations ([QueueItem]): the operations to dequeue.
+
+        """
+        operations = list(operations)
+        for executor in self._executors:
+            executor.dequeue_many(operations)
+
     def start_sweeper(self, timeout):
         """Start sweeper loop with given timeout.
 
@@ -302,6 +368,11 @@ class TriggeredService(Service):
         possible: immediately, if no sweeper is running, or as soon as
         the current one terminates.
 
+        The first sweep and those requested through the RPC are full
+        sweeps, the periodic ones are incremental, except one every
+        FULL_SWEEP_INTERVAL, as a safety net for the changes that did
+        not request a full sweep.
+
         Any error during the sweep is sent to the logger and then
         suppressed, because the loop must go on.
 
@@ -309,9 +380,14 @@ class TriggeredService(Service):
         while True:
             self._sweeper_start = monotonic_time()
             self._sweeper_event.clear()
+            full = self._sweeper_full \
+                or self._sweeper_incremental + 1 >= self.FULL_SWEEP_INTERVAL
+            self._sweeper_full = False
+            self._sweeper_incremental = \
+                0 if full else self._sweeper_incremental + 1
 
             try:
-                self._sweep()
+                self._sweep(full)
             except Exception:
                 logger.error("Unexpected error when searching for missed "
                              "operations.", exc_info=True)
@@ -320,13 +396,31 @@ class TriggeredService(Service):
                                          self._sweeper_timeout -
                                          monotonic_time(), 0))
 
-    def _sweep(self):
-        """Check for missed operations."""
-        logger.info("Start looking for missing operations.")
+    def _sweep(self, full=True):
+        """Check for missed operations.
+
+        full (bool): whether to look for all missed operations, or
+            only for those that could have been missed since the
+            previous sweep.
+
+        """
+        sweep_type = "full" if full else "incremental"
+        logger.info("Start looking for missing operations (%s sweep).",
+                    sweep_type)
         start_time = time.time()
-        counter = self._missing_operations()
-        logger.info("Found %d missed operation(s) in %d ms.",
-                    counter, (time.time() - start_time) * 1000)
+        if full:
+            counter = self._missing_operations()
+        else:
+            counter = self._missing_operations_incremental()
+        duration = time.time() - start_time
+        logger.info("Found %d missed operation(s) in %d ms (%s sweep).",
+                    counter, duration * 1000, sweep_type)
+
+        self._sweeper_stats["%s_sweeps" % sweep_type] += 1
+        self._sweeper_stats["last_sweep_full"] = full
+        self._sweeper_stats["last_sweep_duration"] = duration
+        self._sweeper_stats["last_sweep_recovered"] = counter
+        self._sweeper_stats["total_recovered"] += counter
 
     def _missing_operations(self):
         """Enqueue missed operations, and return their number.
@@ -339,11 +433,36 @@ class TriggeredService(Service):
         """
         return 0
 
+    def _missing_operations_incremental(self):
+        """Enqueue operations missed since the previous sweep.
+
+        Services for which a full search is expensive can override
+        this to look only at what changed recently; by default, this
+        is the same as _missing_operations.
+
+        return (int): the number of operations enqueued.
+
+        """
+        return self._missing_operations()
+
     @rpc_method
     def search_operations_not_done(self):
-        """Make the sweeper loop fire the sweeper as soon as possible."""
+        """Make the sweeper loop fire a full sweep as soon as possible."""
+        self._sweeper_full = True
         self._sweeper_event.set()
 
+    @rpc_method
+    def sweeper_status(self):
+        """Return statistics on the sweeps.
+
+        return (dict): number of full and incremental sweeps, type,
+            duration (in seconds) and number of recovered operations
+            of the last sweep, and total number of recovered
+            operations.
+
+        """
+        return dict(self._sweeper_stats)
+
     @rpc_method
     def queue_status(self):
         """Return the status of the queues.
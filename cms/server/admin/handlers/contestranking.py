@@ -32,7 +32,7 @@ import io
 from sqlalchemy.orm import joinedload
 
 from cms.db import Contest
-from cms.grading.scoring import task_score
+from cms.grading.scoring import get_task_scores
 from .base import BaseHandler, require_permission
 
 
@@ -45,15 +45,15 @@ class RankingHandler(BaseHandler):
         # This validates the contest id.
         self.safe_get_item(Contest, contest_id)
 
-        # This massive joined load gets all the information which we will need
-        # to generating the rankings.
+        # The scores are stored in the database (and computed from the
+        # submissions only when they are not), so we just need the users.
         self.contest = self.sql_session.query(Contest)\
             .filter(Contest.id == contest_id)\
             .options(joinedload('participations'))\
-            .options(joinedload('participations.submissions'))\
-            .options(joinedload('participations.submissions.token'))\
-            .options(joinedload('participations.submissions.results'))\
+            .options(joinedload('participations.user'))\
+            .options(joinedload('participations.team'))\
             .first()
+        scores = get_task_scores(self.sql_session, self.contest)
 
         # Preprocess participations: get data about teams, scores
         show_teams = False
@@ -64,7 +64,8 @@ class RankingHandler(BaseHandler):
             total_score = 0.0
             partial = False
             for task in self.contest.tasks:
-                t_score, t_partial = task_score(p, task, rounded=True)
+                t_score, t_partial, _, _ = scores[(p.id, task.id)]
+                t_score = round(t_score, task.score_precision)
                 p.scores.append((t_score, t_partial))
                 total_score += t_score
                 partial = partial or t_partial
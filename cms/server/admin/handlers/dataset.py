@@ -36,7 +36,9 @@ import tornado.web
 
 from cms.db import Dataset, Manager, Message, Participation, \
     Session, Submission, Task, Testcase
-from cms.grading.scoring import compute_changes_for_dataset
+from cms.grading.scoretypes import invalidate_score_type_cache
+from cms.grading.scoring import check_task_scores, \
+    compute_changes_for_dataset
 from cmscommon.datetime import make_datetime
 from cmscommon.importers import import_testcases_from_zipfile
 from .base import BaseHandler, require_permission
@@ -163,6 +165,9 @@ class CloneDatasetHandler(BaseHandler):
             task.active_dataset = dataset
 
         if self.try_commit():
+            # The submissions need to be judged on the new dataset if
+            # it is active.
+            self.service.evaluation_service.search_operations_not_done()
             self.redirect(self.url("task", task_id))
         else:
             self.redirect(fallback_page)
@@ -233,8 +238,8 @@ class DeleteDatasetHandler(BaseHandler):
         self.sql_session.delete(dataset)
 
         if self.try_commit():
+            invalidate_score_type_cache(int(dataset_id))
             # self.service.scoring_service.reinitialize()
-            pass
         self.redirect(self.url("task", task.id))
 
 
@@ -274,6 +279,9 @@ class ActivateDatasetHandler(BaseHandler):
         task = dataset.task
 
         task.active_dataset = dataset
+        # Store the scores on the new dataset.
+        if task.contest is not None:
+            check_task_scores(self.sql_session, task.contest, task, fix=True)
 
         if self.try_commit():
             self.service.proxy_service.dataset_updated(
@@ -380,6 +388,8 @@ class AddManagerHandler(BaseHandler):
         self.sql_session.add(manager)
 
         if self.try_commit():
+            # The submissions waiting for the manager can be judged.
+            self.service.evaluation_service.search_operations_not_done()
             self.redirect(self.url("task", task.id))
         else:
             self.redirect(fallback_page)
@@ -471,8 +481,11 @@ class AddTestcaseHandler(BaseHandler):
         self.sql_session.add(testcase)
 
         if self.try_commit():
+            invalidate_score_type_cache(dataset.id)
             # max_score and/or extra_headers might have changed.
             self.service.proxy_service.reinitialize()
+            # The submissions need to be evaluated on the new testcase.
+            self.service.evaluation_service.search_operations_not_done()
             self.redirect(self.url("task", task.id))
         else:
             self.redirect(fallback_page)
@@ -538,7 +551,10 @@ class AddTestcasesHandler(BaseHandler):
 
         self.service.add_notification(
             make_datetime(), successful_subject, successful_text)
+        invalidate_score_type_cache(int(dataset_id))
         self.service.proxy_service.reinitialize()
+        # The submissions need to be evaluated on the new testcases.
+        self.service.evaluation_service.search_operations_not_done()
         self.redirect(self.url("task", task.id))
 
 
@@ -560,6 +576,7 @@ class DeleteTestcaseHandler(BaseHandler):
         self.sql_session.delete(testcase)
 
         if self.try_commit():
+            invalidate_score_type_cache(int(dataset_id))
             # max_score and/or extra_headers might have changed.
             self.service.proxy_service.reinitialize()
         self.write("./%d" % task_id)
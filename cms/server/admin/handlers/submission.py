@@ -30,6 +30,7 @@ import logging
 
 from cms.db import Dataset, File, Submission
 from cms.grading.languagemanager import get_language
+from cms.grading.scoring import update_task_scores
 from cmscommon.datetime import make_datetime
 from .base import BaseHandler, FileHandler, require_permission
 
@@ -123,6 +124,9 @@ class SubmissionOfficialStatusHandler(BaseHandler):
         should_make_official = self.get_argument("official", "yes") == "yes"
 
         submission.official = should_make_official
+        update_task_scores(
+            self.sql_session,
+            [(submission.participation_id, submission.task_id)])
         if self.try_commit():
             logger.info("Submission '%s' by user %s in contest %s has "
                         "been made %s",
@@ -31,7 +31,10 @@ import traceback
 
 import tornado.web
 
-from cms.db import Attachment, Dataset, Session, Statement, Submission, Task
+from cms.db import Attachment, Dataset, Evaluation, Session, Statement, \
+    Submission, SubmissionResult, Task
+from cms.grading.scoretypes import invalidate_score_type_cache
+from cms.grading.scoring import check_task_scores, invalidate_task_scores
 from cmscommon.datetime import make_datetime
 from .base import BaseHandler, SimpleHandler, require_permission
 
@@ -116,6 +119,7 @@ class TaskHandler(BaseHandler):
     @require_permission(BaseHandler.PERMISSION_ALL)
     def post(self, task_id):
         task = self.safe_get_item(Task, task_id)
+        score_mode = task.score_mode
 
         try:
             attrs = task.get_attrs()
@@ -166,7 +170,10 @@ class TaskHandler(BaseHandler):
             self.redirect(self.url("task", task_id))
             return
 
+        reevaluate = False
         for dataset in task.datasets:
+            old_score_type = (dataset.score_type,
+                              dataset.score_type_parameters)
             try:
                 attrs = dataset.get_attrs()
 
@@ -200,12 +207,46 @@ class TaskHandler(BaseHandler):
                 self.redirect(self.url("task", task_id))
                 return
 
+            if (dataset.score_type, dataset.score_type_parameters) \
+                    != old_score_type:
+                reevaluate = self._invalidate_skipped_evaluations(dataset) \
+                    or reevaluate
+
+        if task.score_mode != score_mode and task.contest is not None:
+            check_task_scores(self.sql_session, task.contest, task, fix=True)
+
         if self.try_commit():
+            for dataset in task.datasets:
+                invalidate_score_type_cache(dataset.id)
             # Update the task and score on RWS.
             self.service.proxy_service.dataset_updated(
                 task_id=task.id)
+            if reevaluate:
+                self.service.evaluation_service.search_operations_not_done()
         self.redirect(self.url("task", task_id))
 
+    def _invalidate_skipped_evaluations(self, dataset):
+        """Invalidate the evaluations of a dataset skipped for its old
+        score type, which might be needed for the new one.
+
+        dataset (Dataset): the dataset whose score type changed.
+
+        return (bool): whether some evaluations were invalidated.
+
+        """
+        submission_results = self.sql_session.query(SubmissionResult)\
+            .filter(SubmissionResult.dataset_id == dataset.id)\
+            .filter(SubmissionResult.evaluations.any(
+                Evaluation.outcome.is_(None)))\
+            .all()
+        for submission_result in submission_results:
+            submission_result.invalidate_skipped_evaluations()
+        if dataset is dataset.task.active_dataset:
+            invalidate_task_scores(self.sql_session, set(
+                (sr.submission.participation_id, dataset.task_id)
+                for sr in submission_results))
+        return len(submission_results) > 0
+
 
 class AddStatementHandler(BaseHandler):
     """Add a statement to a task.
@@ -38,7 +38,7 @@ from sqlalchemy.orm import joinedload
 from cms import config, FEEDBACK_LEVEL_FULL
 from cms.db import Submission, SubmissionResult
 from cms.grading.languagemanager import get_language
-from cms.grading.scoring import task_score
+from cms.grading.scoring import update_task_scores
 from cms.server import multi_contest
 from cms.server.contest.submission import get_submission_count, \
     UnacceptableSubmission, accept_submission
@@ -82,7 +82,14 @@ class SubmitHandler(ContestHandler):
                 self.sql_session, self.service.file_cacher, self.current_user,
                 task, self.timestamp, self.request.files,
                 self.get_argument("language", None), official)
+            if official:
+                update_task_scores(self.sql_session,
+                                   [(self.current_user.id, task.id)])
             self.sql_session.commit()
+            # Do not wait for the notification, the user is going to
+            # look at the score right away.
+            self.service.task_score_cache.invalidate(
+                [(self.current_user.id, task.id)])
         except UnacceptableSubmission as e:
             logger.info("Sent error: `%s' - `%s'", e.subject, e.formatted_text)
             self.notify_error(e.subject, e.text, e.text_params)
@@ -123,12 +130,11 @@ class TaskSubmissionsHandler(ContestHandler):
             .options(joinedload(Submission.results))\
             .all()
 
-        public_score, is_public_score_partial = task_score(
-            participation, task, public=True, rounded=True)
-        tokened_score, is_tokened_score_partial = task_score(
-            participation, task, only_tokened=True, rounded=True)
-        # These two should be the same, anyway.
-        is_score_partial = is_public_score_partial or is_tokened_score_partial
+        score = self.service.task_score_cache.get(
+            self.sql_session, participation, task)
+        public_score = round(score.public_score, task.score_precision)
+        tokened_score = round(score.tokened_score, task.score_precision)
+        is_score_partial = score.partial
 
         submissions_left_contest = None
         if self.contest.max_submission_number is not None:
@@ -194,20 +200,13 @@ class SubmissionStatusHandler(ContestHandler):
             "task_is_score_partial" as partial info is the same for both.
 
         """
-        # Just to preload all information required to compute the task score.
-        self.sql_session.query(Submission)\
-            .filter(Submission.participation == participation)\
-            .filter(Submission.task == task)\
-            .options(joinedload(Submission.token))\
-            .options(joinedload(Submission.results))\
-            .all()
-        data["task_public_score"], public_score_is_partial = \
-            task_score(participation, task, public=True, rounded=True)
-        data["task_tokened_score"], tokened_score_is_partial = \
-            task_score(participation, task, only_tokened=True, rounded=True)
-        # These two should be the same, anyway.
-        data["task_score_is_partial"] = \
-            public_score_is_partial or tokened_score_is_partial
+        score = self.service.task_score_cache.get(
+            self.sql_session, participation, task)
+        data["task_public_score"] = \
+            round(score.public_score, task.score_precision)
+        data["task_tokened_score"] = \
+            round(score.tokened_score, task.score_precision)
+        data["task_score_is_partial"] = score.partial
 
         score_type = task.active_dataset.score_type_object
         data["task_public_score_message"] = score_type.format_score(
@@ -378,7 +377,12 @@ class UseTokenHandler(ContestHandler):
 
         try:
             accept_token(self.sql_session, submission, self.timestamp)
+            update_task_scores(
+                self.sql_session,
+                [(submission.participation_id, submission.task_id)])
             self.sql_session.commit()
+            self.service.task_score_cache.invalidate(
+                [(submission.participation_id, submission.task_id)])
         except UnacceptableToken as e:
             self.notify_error(e.subject, e.text)
         except TokenAlreadyPlayed as e:
@@ -49,6 +49,7 @@ from cmscommon.binary import hex_to_bin
 from .handlers import HANDLERS
 from .handlers.base import ContestListHandler
 from .handlers.main import MainHandler
+from .taskscorecache import TaskScoreCache
 
 
 logger = logging.getLogger(__name__)
@@ -131,6 +132,11 @@ class ContestWebServer(WebService):
             ServiceCoord("PrintingService", 0),
             must_be_present=printing_enabled)
 
+        # The scores of the users on the tasks, invalidated by the
+        # notifications of their changes.
+        self.task_score_cache = TaskScoreCache()
+        self.task_score_cache.start()
+
     def add_notification(self, username, timestamp, subject, text, level):
         """Store a new notification to send to a user at the first
         opportunity (i.e., at the first request fot db notifications).
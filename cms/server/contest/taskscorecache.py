@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A cache of the scores of the users on the tasks, for CWS.
+
+The task submissions page and the polls of the status of the
+submissions show the score of the user on the task. The cache keeps
+them in memory, so that they are read from the database only after
+they change.
+
+The services changing the scores notify it (see
+cms.grading.scoring.TASK_SCORES_CHANNEL) on commit; each cache listens
+to the notifications on a dedicated connection and is used only while
+it is connected, since it would miss the notifications otherwise.
+
+"""
+
+import logging
+import socket
+from collections import OrderedDict
+
+import gevent
+from gevent.socket import wait_read
+
+from cms.db import custom_psycopg2_connection
+from cms.grading.scoring import TASK_SCORES_CHANNEL, get_task_score, \
+    parse_task_scores_notification
+
+
+logger = logging.getLogger(__name__)
+
+
+class TaskScoreCache:
+    """Scores of the participations on the tasks, kept up to date by
+    the notifications of the changes.
+
+    """
+
+    # Seconds to wait before connecting again after a failure.
+    RECONNECT_DELAY = 5.0
+    # Seconds without notifications after which the connection is
+    # checked.
+    KEEPALIVE_INTERVAL = 60.0
+
+    def __init__(self, max_size=100_000):
+        """Initialization.
+
+        max_size (int): maximum number of scores kept; the least
+            recently used ones are discarded first.
+
+        """
+        self.max_size = max_size
+        # The scores with the id of the dataset they refer to, by
+        # participation and task id.
+        # Type: OrderedDict((int, int), (int, TaskScore))
+        self._scores = OrderedDict()
+        # Incremented at each invalidation, so that scores read from
+        # the database while a notification arrived are not stored.
+        self._version = 0
+        # Whether notifications are received, i.e., whether the cache
+        # can be used.
+        self._listening = False
+        self._greenlet = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        """Start listening to the notifications in the background."""
+        if self._greenlet is None:
+            self._greenlet = gevent.spawn(self._run)
+
+    def stop(self):
+        """Stop listening to the notifications."""
+        if self._greenlet is not None:
+            self._greenlet.kill()
+            self._greenlet = None
+        self._listening = False
+        self.invalidate()
+
+    def get(self, session, participation, task):
+        """Return the score of a participation on a task.
+
+        session (Session): the session to use if the score is not
+            cached.
+        participation (Participation): the participation.
+        task (Task): the task.
+
+        return (TaskScore): the score (see get_task_score), on the
+            active dataset of the task.
+
+        """
+        key = (participation.id, task.id)
+        dataset_id = task.active_dataset_id
+        if self._listening:
+            entry = self._scores.get(key)
+            if entry is not None and entry[0] == dataset_id:
+                self._scores.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        self.misses += 1
+        version = self._version
+        score = get_task_score(session, participation, task)
+        if self._listening and version == self._version:
+            self._scores[key] = (dataset_id, score)
+            self._scores.move_to_end(key)
+            if len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+        return score
+
+    def invalidate(self, pairs=None):
+        """Discard some scores.
+
+        pairs ({(int, int)}|None): the participation and task ids of
+            the scores, or None to discard all of them.
+
+        """
+        self._version += 1
+        if pairs is None:
+            self._scores.clear()
+        else:
+            for pair in pairs:
+                self._scores.pop(pair, None)
+
+    def _receive(self, payload):
+        """Process a notification of changed scores.
+
+        payload (str): the payload of the notification.
+
+        """
+        try:
+            pairs = parse_task_scores_notification(payload)
+        except ValueError:
+            logger.error("Invalid notification of changed scores: %r.",
+                         payload)
+            pairs = None
+        self.invalidate(pairs)
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as error:
+                logger.warning("Not receiving the notifications of changed "
+                               "scores, cache disabled: %s.", error)
+            self._listening = False
+            self.invalidate()
+            gevent.sleep(self.RECONNECT_DELAY)
+
+    def _listen(self):
+        """Receive the notifications until the connection fails."""
+        conn = custom_psycopg2_connection()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute("LISTEN %s" % TASK_SCORES_CHANNEL)
+            # Scores may have changed while not listening.
+            self.invalidate()
+            self._listening = True
+            logger.info("Receiving the notifications of changed scores.")
+            while True:
+                try:
+                    wait_read(conn.fileno(), timeout=self.KEEPALIVE_INTERVAL)
+                except socket.timeout:
+                    # Fails if the connection was lost silently.
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                conn.poll()
+                while len(conn.notifies) > 0:
+                    self._receive(conn.notifies.pop(0).payload)
+        finally:
+            self._listening = False
+            conn.close()
@@ -31,25 +31,30 @@ the current ranking.
 """
 
 import logging
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
 from datetime import timedelta
 from functools import wraps
 
 import gevent.lock
-from sqlalchemy import func
+from sqlalchemy import func, inspect
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
-from cms import ServiceCoord, get_service_shards
+from cms import ServiceCoord, config, get_service_shards
 from cms.db import SessionGen, Digest, Dataset, Evaluation, Submission, \
-    SubmissionResult, Testcase, UserTest, UserTestResult, get_submissions, \
+    SubmissionResult, Task, UserTest, UserTestResult, get_submissions, \
     get_submission_results, get_datasets_to_judge
-from cms.grading.Job import JobGroup
-from cms.io import Executor, TriggeredService, rpc_method
+from cms.grading.Job import Job, JobGroup
+from cms.grading.scoring import invalidate_task_scores
+from cms.io import Executor, FairPriorityQueue, TriggeredService, \
+    rpc_method
 from .esoperations import ESOperation, get_relevant_operations, \
     get_submissions_operations, get_user_tests_operations, \
     submission_get_operations, submission_to_evaluate, \
     user_test_get_operations
+from .evaluationcache import EvaluationResultCache
 from .flushingdict import FlushingDict
+from .subtaskpolicy import SubtaskEvaluationPolicy
 from .workerpool import WorkerPool
 
 
@@ -72,6 +77,12 @@ class EvaluationExecutor(Executor):
         self.evaluation_service = evaluation_service
         self.pool = WorkerPool(self.evaluation_service)
 
+        # Share the queue among contests and participations.
+        if config.evaluation_fair_share_quantum > 0:
+            self._operation_queue = FairPriorityQueue(
+                self.evaluation_service.operation_flow,
+                config.evaluation_fair_share_quantum)
+
         # List of QueueItem (ESOperation) we have extracted from the
         # queue, but not yet finished to execute.
         self._currently_executing = []
@@ -101,13 +112,17 @@ class EvaluationExecutor(Executor):
         """Return the maximum number of operations per batch.
 
         We derive the number from the length of the queue divided by
-        the number of workers, with a cap at MAX_OPERATIONS_PER_BATCH.
+        the number of execution slots of all workers, with a cap at
+        MAX_OPERATIONS_PER_BATCH, and then scale it by the number of
+        slots of the largest worker, so that workers running several
+        jobs at the same time receive enough of them.
 
         """
-        # TODO: len(self.pool) is the total number of workers,
-        # included those that are disabled.
-        ratio = len(self._operation_queue) // len(self.pool) + 1
-        ret = min(max(ratio, 1), EvaluationExecutor.MAX_OPERATIONS_PER_BATCH)
+        # TODO: the total capacity includes the workers that are
+        # disabled.
+        ratio = len(self._operation_queue) // self.pool.total_capacity() + 1
+        ret = min(max(ratio, 1), EvaluationExecutor.MAX_OPERATIONS_PER_BATCH) \
+            * self.pool.max_capacity()
         logger.info("Ratio is %d, executing %d operations together.",
                     ratio, ret)
         return ret
@@ -132,6 +147,8 @@ class EvaluationExecutor(Executor):
                 # re-enqueue it.
                 operation.side_data = (entry.priority, entry.timestamp)
                 self._currently_executing.append(operation)
+            if self.evaluation_service.evaluation_cache.enabled:
+                self._fill_from_cache()
         while len(self._currently_executing) > 0:
             self.pool.wait_for_workers()
             with self._current_execution_lock:
@@ -142,6 +159,43 @@ class EvaluationExecutor(Executor):
                     self._currently_executing = []
                     break
 
+    def _fill_from_cache(self):
+        """Resolve the evaluations with a cached result.
+
+        The evaluations among the operations currently executing whose
+        result is in the evaluation cache are removed from the list of
+        operations to give to the workers, and their results are
+        passed directly to the service as if a worker had computed
+        them.
+
+        """
+        cache = self.evaluation_service.evaluation_cache
+        hits = []
+        with SessionGen() as session:
+            for operation in self._currently_executing:
+                if operation.type_ != ESOperation.EVALUATION:
+                    continue
+                submission = Submission.get_from_id(
+                    operation.object_id, session)
+                dataset = Dataset.get_from_id(operation.dataset_id, session)
+                if submission is None or dataset is None:
+                    continue
+                try:
+                    job = Job.from_operation(operation, submission, dataset)
+                except Exception:
+                    logger.warning("Could not build job for %s to look it "
+                                   "up in the evaluation cache.", operation,
+                                   exc_info=True)
+                    continue
+                if cache.fill(job):
+                    hits.append((operation, job))
+
+        for operation, job in hits:
+            logger.info("`%s' served from the evaluation cache.", operation)
+            self.evaluation_service.result_cache.add(
+                operation, Result(job, True))
+            self._currently_executing.remove(operation)
+
     def dequeue(self, operation):
         """Remove an item from the queue.
 
@@ -161,6 +215,30 @@ class EvaluationExecutor(Executor):
                         return
             raise
 
+    def dequeue_many(self, operations):
+        """Remove from the queue those of the operations that are in it.
+
+        As dequeue, this also removes the operations already extracted
+        but not yet executed.
+
+        operations ([ESOperation]): the operations to remove.
+
+        return ([ESOperation]): the operations removed.
+
+        """
+        removed = super().dequeue_many(operations)
+        missing = set(operations) - set(removed)
+        if len(missing) > 0:
+            with self._current_execution_lock:
+                extracted = [operation
+                             for operation in self._currently_executing
+                             if operation in missing]
+                self._currently_executing = [
+                    operation for operation in self._currently_executing
+                    if operation not in missing]
+            removed += extracted
+        return removed
+
 
 def with_post_finish_lock(func):
     """Decorator for locking on self.post_finish_lock.
@@ -211,6 +289,9 @@ class EvaluationService(TriggeredService):
     RESULT_CACHE_SIZE = 100
     # The maximum time since the last result before processing.
     MAX_FLUSHING_TIME_SECONDS = 2
+    # How many contests and participations of submissions and user
+    # tests we remember, for the fair share of the queue.
+    OPERATION_FLOWS_SIZE = 100_000
 
     def __init__(self, shard, contest_id=None):
         super().__init__(shard)
@@ -224,6 +305,22 @@ class EvaluationService(TriggeredService):
             EvaluationService.MAX_FLUSHING_TIME_SECONDS,
             self.write_results)
 
+        # Cache of the evaluation results, to avoid evaluating again
+        # the same executables on the same testcases.
+        self.evaluation_cache = EvaluationResultCache(
+            config.evaluation_cache_policy, config.evaluation_cache_size)
+
+        # Order of the evaluations of the submissions of datasets with
+        # subtasks, and which of them to skip.
+        self.subtask_policy = SubtaskEvaluationPolicy(
+            config.evaluation_subtask_policy)
+
+        # Contest and participation of the submissions and user tests
+        # with operations in the queue, by operation type (submission
+        # or user test) and object id; used only with a fair share
+        # queue. Type: OrderedDict({(bool, int): (int, int)}).
+        self._operation_flows = OrderedDict()
+
         # This lock is used to avoid inserting in the queue (which
         # itself is already thread-safe) an operation which is already
         # being processed. Such operation might be in one of the
@@ -250,6 +347,10 @@ class EvaluationService(TriggeredService):
         self.scoring_service = self.connect_to(
             ServiceCoord("ScoringService", 0))
 
+        # Maximum submission and user test ids at the beginning of the
+        # latest (up to) two sweeps, used by the incremental sweeps.
+        self._sweep_watermarks = deque(maxlen=2)
+
         self.add_executor(EvaluationExecutor(self))
         self.start_sweeper(117.0)
 
@@ -270,12 +371,16 @@ class EvaluationService(TriggeredService):
         return (int): the number of actually enqueued operations.
 
         """
+        self._set_operation_flow(False, submission.id,
+                                 submission.task.contest_id,
+                                 submission.participation_id)
         new_operations = 0
         for dataset in get_datasets_to_judge(submission.task):
             submission_result = submission.get_result(dataset)
             number_of_operations = 0
             for operation, priority, timestamp in submission_get_operations(
-                    submission_result, submission, dataset):
+                    submission_result, submission, dataset,
+                    self.subtask_policy.order_testcases):
                 number_of_operations += 1
                 if self.enqueue(operation, priority, timestamp):
                     new_operations += 1
@@ -301,6 +406,9 @@ class EvaluationService(TriggeredService):
         return (int): the number of actually enqueued operations.
 
         """
+        self._set_operation_flow(True, user_test.id,
+                                 user_test.task.contest_id,
+                                 user_test.participation_id)
         new_operations = 0
         for dataset in get_datasets_to_judge(user_test.task):
             for operation, priority, timestamp in user_test_get_operations(
@@ -310,6 +418,84 @@ class EvaluationService(TriggeredService):
 
         return new_operations
 
+    def _set_operation_flow(self, user_test, object_id, contest_id,
+                            participation_id):
+        """Remember the contest and participation of an object.
+
+        user_test (bool): whether the object is a user test (or a
+            submission).
+        object_id (int): the id of the object.
+        contest_id (int): the id of its contest.
+        participation_id (int): the id of its participation.
+
+        """
+        if config.evaluation_fair_share_quantum <= 0:
+            return
+        key = (user_test, object_id)
+        self._operation_flows[key] = (contest_id, participation_id)
+        self._operation_flows.move_to_end(key)
+        while len(self._operation_flows) > \
+                EvaluationService.OPERATION_FLOWS_SIZE:
+            self._operation_flows.popitem(last=False)
+
+    def _load_operation_flows(self, session, operations):
+        """Read from the DB the contest and participation of the
+        objects of some operations.
+
+        session (Session): the DB session to use.
+        operations ([ESOperation]): the operations.
+
+        """
+        if config.evaluation_fair_share_quantum <= 0:
+            return
+        submission_ids = set()
+        user_test_ids = set()
+        for operation in operations:
+            user_test = operation.type_ in [
+                ESOperation.USER_TEST_COMPILATION,
+                ESOperation.USER_TEST_EVALUATION]
+            if (user_test, operation.object_id) in self._operation_flows:
+                continue
+            if user_test:
+                user_test_ids.add(operation.object_id)
+            else:
+                submission_ids.add(operation.object_id)
+
+        if len(submission_ids) > 0:
+            for object_id, contest_id, participation_id in session\
+                    .query(Submission.id, Task.contest_id,
+                           Submission.participation_id)\
+                    .join(Submission.task)\
+                    .filter(Submission.id.in_(submission_ids)).all():
+                self._set_operation_flow(
+                    False, object_id, contest_id, participation_id)
+        if len(user_test_ids) > 0:
+            for object_id, contest_id, participation_id in session\
+                    .query(UserTest.id, Task.contest_id,
+                           UserTest.participation_id)\
+                    .join(UserTest.task)\
+                    .filter(UserTest.id.in_(user_test_ids)).all():
+                self._set_operation_flow(
+                    True, object_id, contest_id, participation_id)
+
+    def operation_flow(self, operation):
+        """Return the flow of an operation in the fair share queue.
+
+        operation (ESOperation): the operation.
+
+        return ((int|None, int|None)): the ids of the contest and of
+            the participation of the submission or user test of the
+            operation (None if they cannot be found).
+
+        """
+        key = (operation.type_ in [ESOperation.USER_TEST_COMPILATION,
+                                   ESOperation.USER_TEST_EVALUATION],
+               operation.object_id)
+        if key not in self._operation_flows:
+            with SessionGen() as session:
+                self._load_operation_flows(session, [operation])
+        return self._operation_flows.get(key, (None, None))
+
     @with_post_finish_lock
     def _missing_operations(self):
         """Look in the database for submissions that have not been compiled or
@@ -317,19 +503,52 @@ class EvaluationService(TriggeredService):
         the queue.
 
         """
-        counter = 0
+        return self._enqueue_missing_operations(full=True)
+
+    @with_post_finish_lock
+    def _missing_operations_incremental(self):
+        """Like _missing_operations, but only look at recent submissions.
+
+        Operations for older submissions are enqueued when their
+        results are written, so they can only be missed if ES is
+        restarted, and in that case the first sweep is a full one.
+
+        """
+        return self._enqueue_missing_operations(full=False)
+
+    def _enqueue_missing_operations(self, full):
+        """Enqueue the missing operations for (some) submissions.
+
+        full (bool): whether to look at all submissions and user
+            tests, or only at those after the watermark, that is
+            after the maximum ids read at the beginning of the
+            previous sweep. Leaving a sweep of margin lets us catch
+            rows committed out of id order.
+
+        return (int): the number of operations enqueued.
+
+        """
+        if full or len(self._sweep_watermarks) == 0:
+            min_submission_id, min_user_test_id = None, None
+        else:
+            min_submission_id, min_user_test_id = self._sweep_watermarks[0]
+
         with SessionGen() as session:
+            max_ids = (session.query(func.max(Submission.id)).scalar(),
+                       session.query(func.max(UserTest.id)).scalar())
 
-            for operation, timestamp, priority in \
-                    get_submissions_operations(session, self.contest_id):
-                if self.enqueue(operation, timestamp, priority):
-                    counter += 1
+            operations = get_submissions_operations(
+                session, self.contest_id, min_submission_id)
+            operations += get_user_tests_operations(
+                session, self.contest_id, min_user_test_id)
+            self._load_operation_flows(
+                session, [operation for operation, _, _ in operations])
 
-            for operation, timestamp, priority in \
-                    get_user_tests_operations(session, self.contest_id):
-                if self.enqueue(operation, timestamp, priority):
-                    counter += 1
+            counter = self.enqueue_many(operations)
 
+        if full:
+            self._sweep_watermarks.clear()
+        self._sweep_watermarks.append(max_ids)
         return counter
 
     @rpc_method
@@ -343,6 +562,56 @@ class EvaluationService(TriggeredService):
         """
         return self.get_executor().pool.get_status()
 
+    @rpc_method
+    def workers_affinity_status(self):
+        """Return the statistics on the affinity of the batches sent to
+        the workers.
+
+        returns (dict): see WorkerPool.get_affinity_status.
+
+        """
+        return self.get_executor().pool.get_affinity_status()
+
+    @rpc_method
+    def queue_wait_status(self):
+        """Return the time the operations of each participation waited
+        in the queue.
+
+        returns ([dict]): for each participation, the ids of it and of
+            its contest, the number of operations queued and
+            extracted, and the average and maximum time (in seconds)
+            the latter waited; empty if the queue is not shared
+            fairly (see evaluation_fair_share_quantum).
+
+        """
+        queue = self.get_executor()._operation_queue
+        if not isinstance(queue, FairPriorityQueue):
+            return []
+        result = []
+        for status in queue.get_wait_status():
+            status["contest_id"] = status.pop("group")
+            status["participation_id"] = status.pop("owner")
+            result.append(status)
+        return result
+
+    @rpc_method
+    def evaluation_cache_status(self):
+        """Return the statistics of the evaluation result cache.
+
+        returns (dict): see EvaluationResultCache.get_status.
+
+        """
+        return self.evaluation_cache.get_status()
+
+    @rpc_method
+    def subtask_policy_status(self):
+        """Return the statistics of the evaluation subtask policy.
+
+        returns (dict): see SubtaskEvaluationPolicy.get_status.
+
+        """
+        return self.subtask_policy.get_status()
+
     def check_workers_timeout(self):
         """We ask WorkerPool for the unresponsive workers, and we put
         again their operations in the queue.
@@ -389,6 +658,26 @@ class EvaluationService(TriggeredService):
         # enqueue() returns the number of successful pushes.
         return super().enqueue(operation, priority, timestamp) > 0
 
+    def enqueue_many(self, operations):
+        """Push several operations in the queue.
+
+        As enqueue, but skipping the checks and heap updates for each
+        operation, which matters for the large numbers of operations
+        found by the sweeper.
+
+        operations ([(ESOperation, int, datetime)]): the operations,
+            with their priority and timestamp.
+
+        return (int): the number of operations pushed.
+
+        """
+        executor = self.get_executor()
+        return super().enqueue_many(
+            (operation, priority, timestamp)
+            for operation, priority, timestamp in operations
+            if operation not in executor
+            and operation not in self.result_cache)
+
     @with_post_finish_lock
     def action_finished(self, data, shard, error=None):
         """Callback from a worker, to signal that is finished some
@@ -465,6 +754,14 @@ class EvaluationService(TriggeredService):
             by_object_and_type[t].append((operation, result))
 
         with SessionGen() as session:
+            # Load all the objects we need with a few queries; the
+            # get_from_id calls below will then find them in the
+            # identity map, as long as we keep a reference to them.
+            prefetched = self._prefetch_objects(  # noqa
+                session, by_object_and_type.keys())
+
+            # Successful evaluations, to be inserted in bulk.
+            new_evaluations = []
             for key, operation_results in by_object_and_type.items():
                 type_, object_id, dataset_id = key
 
@@ -490,27 +787,55 @@ class EvaluationService(TriggeredService):
                         continue
                     object_result = object_.get_result_or_create(dataset)
 
+                if type_ == ESOperation.EVALUATION \
+                        and inspect(object_result).persistent:
+                    others = []
+                    for operation, result in operation_results:
+                        if result.job_success:
+                            new_evaluations.append(
+                                (object_result, operation, result))
+                            self.subtask_policy.record(
+                                dataset, operation.testcase_codename,
+                                result.job.outcome)
+                        else:
+                            others.append((operation, result))
+                    operation_results = others
+
                 self.write_results_one_object_and_type(
                     session, object_result, operation_results)
 
+            # Number of evaluations in the DB for each submission
+            # result we are evaluating, updated in memory as we insert.
+            evaluated_keys = [(object_id, dataset_id)
+                              for type_, object_id, dataset_id
+                              in by_object_and_type.keys()
+                              if type_ == ESOperation.EVALUATION]
+            num_evaluations = self._count_evaluations(session, evaluated_keys)
+            if self.write_evaluations_bulk(session, new_evaluations):
+                for object_result, _, _ in new_evaluations:
+                    num_evaluations[(object_result.submission_id,
+                                     object_result.dataset_id)] += 1
+            else:
+                num_evaluations = self._count_evaluations(
+                    session, evaluated_keys)
+
             logger.info("Committing evaluations...")
             session.commit()
 
-            num_testcases_per_dataset = dict()
-            for type_, object_id, dataset_id in by_object_and_type.keys():
-                if type_ == ESOperation.EVALUATION:
-                    if dataset_id not in num_testcases_per_dataset:
-                        num_testcases_per_dataset[dataset_id] = session\
-                            .query(func.count(Testcase.id))\
-                            .filter(Testcase.dataset_id == dataset_id).scalar()
-                    num_evaluations = session\
-                        .query(func.count(Evaluation.id)) \
-                        .filter(Evaluation.dataset_id == dataset_id) \
-                        .filter(Evaluation.submission_id == object_id).scalar()
-                    if num_evaluations == num_testcases_per_dataset[dataset_id]:
-                        submission_result = SubmissionResult.get_from_id(
-                            (object_id, dataset_id), session)
-                        submission_result.set_evaluation_outcome()
+            if self.subtask_policy.skipping:
+                self.write_skipped_evaluations(
+                    session, evaluated_keys, num_evaluations)
+                session.commit()
+
+            for object_id, dataset_id in evaluated_keys:
+                dataset = Dataset.get_from_id(dataset_id, session)
+                if dataset is None:
+                    continue
+                if num_evaluations[(object_id, dataset_id)] \
+                        == len(dataset.testcases):
+                    submission_result = SubmissionResult.get_from_id(
+                        (object_id, dataset_id), session)
+                    submission_result.set_evaluation_outcome()
 
             logger.info("Committing evaluation outcomes...")
             session.commit()
@@ -538,6 +863,190 @@ class EvaluationService(TriggeredService):
 
         logger.info("Done")
 
+    def write_skipped_evaluations(self, session, keys, num_evaluations):
+        """Write the evaluations that the subtask policy skips.
+
+        For each submission result still missing some evaluations,
+        the testcases that cannot change the score anymore (because
+        all their subtasks have already been failed) get an
+        evaluation without outcome, and their operations are removed
+        from the queue or ignored by the workers.
+
+        session (Session): the DB session to use.
+        keys ([(int, int)]): submission and dataset ids of the
+            submission results with new evaluations.
+        num_evaluations ({(int, int): int}): number of evaluations in
+            the DB for each key, updated with the ones written.
+
+        """
+        for object_id, dataset_id in keys:
+            dataset = Dataset.get_from_id(dataset_id, session)
+            if dataset is None \
+                    or num_evaluations[(object_id, dataset_id)] \
+                    >= len(dataset.testcases):
+                continue
+            submission_result = SubmissionResult.get_from_id(
+                (object_id, dataset_id), session)
+            if submission_result is None:
+                continue
+
+            evaluated = dict((evaluation.codename, evaluation.outcome)
+                             for evaluation in submission_result.evaluations)
+            outcomes = dict((codename, outcome)
+                            for codename, outcome in evaluated.items()
+                            if outcome is not None)
+            to_skip = []
+            for codename in self.subtask_policy.testcases_to_skip(
+                    dataset, outcomes):
+                operation = ESOperation(ESOperation.EVALUATION,
+                                        object_id, dataset_id, codename)
+                # A result already received will be written anyway.
+                if codename in evaluated or operation in self.result_cache:
+                    continue
+                to_skip.append(operation)
+            if len(to_skip) == 0:
+                continue
+
+            logger.info("Skipping %d evaluations of submission %d(%d), "
+                        "whose subtasks were already failed.",
+                        len(to_skip), object_id, dataset_id)
+            try:
+                with session.begin_nested():
+                    for operation in to_skip:
+                        session.add(Evaluation(
+                            submission_result=submission_result,
+                            testcase=dataset.testcases[
+                                operation.testcase_codename],
+                            text=SubtaskEvaluationPolicy.SKIPPED_TEXT))
+            except IntegrityError:
+                logger.warning("Integrity error while writing skipped "
+                               "evaluations.", exc_info=True)
+                continue
+
+            num_evaluations[(object_id, dataset_id)] += len(to_skip)
+            self.subtask_policy.skipped += len(to_skip)
+            self.dequeue_many(to_skip)
+            for operation in to_skip:
+                try:
+                    self.get_executor().pool.ignore_operation(operation)
+                except LookupError:
+                    pass
+
+    @staticmethod
+    def _prefetch_objects(session, keys):
+        """Load from the DB all the objects needed to write results.
+
+        session (Session): the DB session to use.
+        keys ([(str, int, int)]): the type, object id and dataset id
+            of the operations whose results are being written.
+
+        return ([Base]): the loaded objects; the caller needs to keep
+            a reference to them for them to stay in the identity map.
+
+        """
+        dataset_ids = set(dataset_id for _, _, dataset_id in keys)
+        submission_ids = set(
+            object_id for type_, object_id, _ in keys
+            if type_ in [ESOperation.COMPILATION, ESOperation.EVALUATION])
+        user_test_ids = set(
+            object_id for type_, object_id, _ in keys
+            if type_ in [ESOperation.USER_TEST_COMPILATION,
+                         ESOperation.USER_TEST_EVALUATION])
+
+        objects = []
+        if len(dataset_ids) == 0:
+            return objects
+        objects += session.query(Dataset)\
+            .filter(Dataset.id.in_(dataset_ids))\
+            .options(joinedload(Dataset.testcases)).all()
+        if len(submission_ids) > 0:
+            objects += session.query(Submission)\
+                .filter(Submission.id.in_(submission_ids)).all()
+            objects += session.query(SubmissionResult)\
+                .filter(SubmissionResult.submission_id.in_(submission_ids))\
+                .filter(SubmissionResult.dataset_id.in_(dataset_ids)).all()
+        if len(user_test_ids) > 0:
+            objects += session.query(UserTest)\
+                .filter(UserTest.id.in_(user_test_ids)).all()
+            objects += session.query(UserTestResult)\
+                .filter(UserTestResult.user_test_id.in_(user_test_ids))\
+                .filter(UserTestResult.dataset_id.in_(dataset_ids)).all()
+        return objects
+
+    @staticmethod
+    def _count_evaluations(session, keys):
+        """Count the evaluations in the DB of some submission results.
+
+        session (Session): the DB session to use.
+        keys ([(int, int)]): submission and dataset ids of the
+            submission results.
+
+        return ({(int, int): int}): for each key, the number of
+            evaluations (0 for missing keys).
+
+        """
+        counts = defaultdict(int)
+        if len(keys) == 0:
+            return counts
+        rows = session\
+            .query(Evaluation.submission_id, Evaluation.dataset_id,
+                   func.count(Evaluation.id))\
+            .filter(Evaluation.submission_id.in_(
+                set(submission_id for submission_id, _ in keys)))\
+            .filter(Evaluation.dataset_id.in_(
+                set(dataset_id for _, dataset_id in keys)))\
+            .group_by(Evaluation.submission_id, Evaluation.dataset_id)\
+            .all()
+        for submission_id, dataset_id, count in rows:
+            counts[(submission_id, dataset_id)] = count
+        return counts
+
+    def write_evaluations_bulk(self, session, new_evaluations):
+        """Write to the DB successful evaluations with a single insert.
+
+        If the insert fails because of an integrity error (e.g., an
+        evaluation was already present), fall back to writing the
+        evaluations one by one, skipping those that fail.
+
+        session (Session): the DB session to use.
+        new_evaluations ([(SubmissionResult, ESOperation, Result)]):
+            the successful evaluations to write.
+
+        return (bool): True if the bulk insert succeeded, False if we
+            had to fall back to the row by row insert.
+
+        """
+        if len(new_evaluations) == 0:
+            return True
+
+        logger.info("Writing %d evaluations to db.", len(new_evaluations))
+        try:
+            with session.begin_nested():
+                session.execute(
+                    Evaluation.__table__.insert(),
+                    [result.job.to_evaluation_mapping(object_result)
+                     for object_result, _, result in new_evaluations])
+        except IntegrityError:
+            logger.warning("Integrity error while inserting evaluations in "
+                           "bulk, inserting them one by one.", exc_info=True)
+        except Exception:
+            # Probably a poisonous result; the row by row path will
+            # isolate it and write the others (see issue #888).
+            logger.error("Unexpected exception while inserting evaluations "
+                         "in bulk, inserting them one by one.", exc_info=True)
+        else:
+            for _, _, result in new_evaluations:
+                self.evaluation_cache.store(result.job)
+            return True
+
+        by_object_result = defaultdict(list)
+        for object_result, operation, result in new_evaluations:
+            by_object_result[object_result].append((operation, result))
+        for object_result, operation_results in by_object_result.items():
+            self.write_results_one_object_and_type(
+                session, object_result, operation_results)
+        return False
+
     def write_results_one_object_and_type(
             self, session, object_result, operation_results):
         """Write to the DB the results for one object and type.
@@ -588,6 +1097,7 @@ class EvaluationService(TriggeredService):
         elif operation.type_ == ESOperation.EVALUATION:
             if result.job_success:
                 result.job.to_submission(object_result)
+                self.evaluation_cache.store(result.job)
             else:
                 if result.job.plus is not None and \
                    result.job.plus.get("tombstone") is True:
@@ -895,11 +1405,8 @@ class EvaluationService(TriggeredService):
             # the workers involved in those operations).
             operations = get_relevant_operations(
                 level, submissions, dataset_id)
+            self.dequeue_many(operations)
             for operation in operations:
-                try:
-                    self.dequeue(operation)
-                except KeyError:
-                    pass  # Ok, the operation wasn't in the queue.
                 try:
                     self.get_executor().pool.ignore_operation(operation)
                 except LookupError:
@@ -931,6 +1438,12 @@ class EvaluationService(TriggeredService):
                 elif level == "evaluation":
                     submission_result.invalidate_evaluation()
 
+            # The scores of the users on the tasks will be computed
+            # from the submissions until they are scored again.
+            invalidate_task_scores(
+                session, set((submission.participation_id, submission.task_id)
+                             for submission in submissions))
+
             # Finally, we re-enqueue the operations for the
             # submissions.
             for submission in submissions:
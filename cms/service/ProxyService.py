@@ -37,10 +37,12 @@ import gevent.queue
 import requests
 import requests.exceptions
 from sqlalchemy import not_
+from sqlalchemy.orm import joinedload
 
 from cms import config
 from cms.db import SessionGen, Contest, Participation, Task, Submission, \
     get_submissions
+from cms.grading.scoretypes import invalidate_score_type_cache
 from cms.io import Executor, QueueItem, TriggeredService, rpc_method
 from cmscommon.datetime import make_timestamp
 
@@ -439,6 +441,8 @@ class ProxyService(TriggeredService):
 
         """
         logger.info("Reinitializing rankings.")
+        # The score types of the datasets might have changed too.
+        invalidate_score_type_cache()
         self.initialize()
 
     @rpc_method
@@ -461,21 +465,60 @@ class ProxyService(TriggeredService):
                              "unexistent submission id %s.", submission_id)
                 raise KeyError("Submission not found.")
 
-            if submission.participation.hidden:
-                logger.info("[submission_scored] Score for submission %d "
-                            "not sent because the participation is hidden.",
-                            submission_id)
-                return
+            self._send_score(submission, "submission_scored")
 
-            if not submission.official:
-                logger.info("[submission_scored] Score for submission %d "
-                            "not sent because the submission is not official.",
-                            submission_id)
-                return
+    @rpc_method
+    def submissions_scored(self, submission_ids):
+        """Notice that some submissions have been scored.
 
-            # Update RWS.
-            for operation in self.operations_for_score(submission):
-                self.enqueue(operation)
+        The same as submission_scored, for many submissions at once
+        (loaded from the database with a single query). Usually called
+        by ScoringService after scoring a batch of submission results.
+
+        submission_ids ([int]): the ids of the submissions that
+            changed.
+
+        """
+        with SessionGen() as session:
+            submissions = {
+                submission.id: submission
+                for submission in session.query(Submission)
+                .filter(Submission.id.in_(submission_ids))
+                .options(joinedload(Submission.participation)
+                         .joinedload(Participation.user))
+                .options(joinedload(Submission.task))
+                .options(joinedload(Submission.results)).all()}
+
+            for submission_id in submission_ids:
+                submission = submissions.get(submission_id)
+                if submission is None:
+                    logger.error("[submissions_scored] Received score "
+                                 "request for unexistent submission id %s.",
+                                 submission_id)
+                    continue
+                self._send_score(submission, "submissions_scored")
+
+    def _send_score(self, submission, method):
+        """Send the score of a submission to the rankings, if needed.
+
+        submission (Submission): the submission that has been scored.
+        method (str): the name of the RPC method that was called (for
+            log messages).
+
+        """
+        if submission.participation.hidden:
+            logger.info("[%s] Score for submission %d not sent because the "
+                        "participation is hidden.", method, submission.id)
+            return
+
+        if not submission.official:
+            logger.info("[%s] Score for submission %d not sent because the "
+                        "submission is not official.", method, submission.id)
+            return
+
+        # Update RWS.
+        for operation in self.operations_for_score(submission):
+            self.enqueue(operation)
 
     @rpc_method
     def submission_tokened(self, submission_id):
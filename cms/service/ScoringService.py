@@ -26,9 +26,14 @@
 """
 
 import logging
+from collections import defaultdict
+
+from sqlalchemy.orm import joinedload, subqueryload
 
 from cms import ServiceCoord, config
-from cms.db import SessionGen, Submission, Dataset, get_submission_results
+from cms.db import SessionGen, Submission, SubmissionResult, Dataset, \
+    get_submission_results
+from cms.grading.scoring import invalidate_task_scores, update_task_scores
 from cms.io import Executor, TriggeredService, rpc_method
 from cmscommon.datetime import make_datetime
 from .scoringoperations import ScoringOperation, get_operations
@@ -39,77 +44,192 @@ logger = logging.getLogger(__name__)
 
 class ScoringExecutor(Executor):
     def __init__(self, proxy_service):
-        super().__init__()
+        super().__init__(batch_executions=True)
         self.proxy_service = proxy_service
 
-    def execute(self, entry):
-        """Assign a score to a submission result.
+    def max_operations_per_batch(self):
+        """See Executor.max_operations_per_batch."""
+        return config.scoring_batch_size
+
+    def execute(self, entries):
+        """Assign a score to some submission results.
+
+        This is the core of ScoringService: here we retrieve the
+        results from the database, check if they are in the correct
+        status, instantiate their ScoreType, compute their score, store
+        them back in the database and tell ProxyService to update RWS
+        if needed.
 
-        This is the core of ScoringService: here we retrieve the result
-        from the database, check if it is in the correct status,
-        instantiate its ScoreType, compute its score, store it back in
-        the database and tell ProxyService to update RWS if needed.
+        All the operations are done in a single transaction; errors in
+        an operation are logged and do not affect the others. If the
+        transaction fails, each operation is retried in its own.
 
-        entry (QueueEntry): entry containing the operation to perform.
+        entries ([QueueEntry]): entries containing the operations to
+            perform.
 
         """
-        operation = entry.item
+        operations = [entry.item for entry in entries]
+        try:
+            to_notify = self._score(operations)
+        except Exception:
+            if len(operations) == 1:
+                raise
+            logger.warning("Failed to score %d submission results at once, "
+                           "scoring them one by one.", len(operations),
+                           exc_info=True)
+            to_notify = []
+            for operation in operations:
+                try:
+                    to_notify += self._score([operation])
+                except Exception:
+                    logger.error(
+                        "Unexpected error when executing operation `%s'.",
+                        operation, exc_info=True)
+
+        # Update RWS.
+        if len(to_notify) > 0:
+            self.proxy_service.submissions_scored(submission_ids=to_notify)
+
+    @staticmethod
+    def _load_results(operations, session):
+        """Load the submission results of some operations.
+
+        Submission results are loaded, for each dataset, with a single
+        query, together with their submissions and evaluations. The
+        datasets are loaded with their testcases.
+
+        operations ([ScoringOperation]): the operations.
+        session (Session): the session to use.
+
+        return ({(int, int): SubmissionResult}): the submission results
+            found, by submission and dataset id.
+
+        """
+        submission_ids = defaultdict(set)
+        for operation in operations:
+            submission_ids[operation.dataset_id].add(operation.submission_id)
+
+        session.query(Dataset)\
+            .filter(Dataset.id.in_(submission_ids.keys()))\
+            .options(joinedload(Dataset.task))\
+            .options(subqueryload(Dataset.testcases)).all()
+
+        results = dict()
+        for dataset_id, ids in submission_ids.items():
+            for submission_result in session.query(SubmissionResult)\
+                    .filter(SubmissionResult.dataset_id == dataset_id)\
+                    .filter(SubmissionResult.submission_id.in_(ids))\
+                    .options(joinedload(SubmissionResult.submission))\
+                    .options(subqueryload(SubmissionResult.evaluations))\
+                    .all():
+                results[(submission_result.submission_id,
+                         submission_result.dataset_id)] = submission_result
+        return results
+
+    def _score(self, operations):
+        """Score the submission results of some operations.
+
+        operations ([ScoringOperation]): the operations.
+
+        return ([int]): the ids of the submissions scored on the active
+            dataset of their task, whose score is to be sent to RWS.
+
+        raise (Exception): if the transaction fails.
+
+        """
+        to_notify = []
         with SessionGen() as session:
-            # Obtain submission.
-            submission = Submission.get_from_id(operation.submission_id,
-                                                session)
-            if submission is None:
+            results = self._load_results(operations, session)
+            for operation in operations:
+                try:
+                    if self._score_one(operation, results, session):
+                        to_notify.append(operation.submission_id)
+                except Exception:
+                    logger.error(
+                        "Unexpected error when executing operation `%s'.",
+                        operation, exc_info=True)
+
+            # Update the scores of the users on the tasks, without
+            # losing the scores of the results if this fails.
+            pairs = set()
+            for submission_id in to_notify:
+                submission = Submission.get_from_id(submission_id, session)
+                pairs.add((submission.participation_id, submission.task_id))
+            try:
+                with session.begin_nested():
+                    update_task_scores(session, pairs)
+            except Exception:
+                logger.error("Failed to update the task scores of %d "
+                             "users.", len(pairs), exc_info=True)
+                invalidate_task_scores(session, pairs)
+
+            # Store them.
+            session.commit()
+
+        return to_notify
+
+    @staticmethod
+    def _score_one(operation, results, session):
+        """Assign a score to a submission result.
+
+        operation (ScoringOperation): the operation to perform.
+        results ({(int, int): SubmissionResult}): the submission
+            results loaded for the batch.
+        session (Session): the session to use.
+
+        return (bool): whether the result has been scored and is on
+            the active dataset of its task.
+
+        raise (ValueError): if the submission result cannot be scored.
+
+        """
+        submission_result = results.get(
+            (operation.submission_id, operation.dataset_id))
+
+        if submission_result is None:
+            if Submission.get_from_id(operation.submission_id,
+                                      session) is None:
                 raise ValueError("Submission %d not found in the database." %
                                  operation.submission_id)
-
-            # Obtain dataset.
-            dataset = Dataset.get_from_id(operation.dataset_id, session)
-            if dataset is None:
+            if Dataset.get_from_id(operation.dataset_id, session) is None:
                 raise ValueError("Dataset %d not found in the database." %
                                  operation.dataset_id)
-
-            # Obtain submission result.
-            submission_result = submission.get_result(dataset)
-
             # It means it was not even compiled (for some reason).
-            if submission_result is None:
-                raise ValueError("Submission result %d(%d) was not found." %
+            raise ValueError("Submission result %d(%d) was not found." %
+                             (operation.submission_id, operation.dataset_id))
+
+        submission = submission_result.submission
+        dataset = submission_result.dataset
+
+        # Check if it's ready to be scored.
+        if not submission_result.needs_scoring():
+            if submission_result.scored():
+                logger.info("Submission result %d(%d) is already scored.",
+                            operation.submission_id, operation.dataset_id)
+                return False
+            else:
+                raise ValueError("The state of the submission result "
+                                 "%d(%d) doesn't allow scoring." %
                                  (operation.submission_id,
                                   operation.dataset_id))
 
-            # Check if it's ready to be scored.
-            if not submission_result.needs_scoring():
-                if submission_result.scored():
-                    logger.info("Submission result %d(%d) is already scored.",
-                                operation.submission_id, operation.dataset_id)
-                    return
-                else:
-                    raise ValueError("The state of the submission result "
-                                     "%d(%d) doesn't allow scoring." %
-                                     (operation.submission_id,
-                                      operation.dataset_id))
-
-            # Instantiate the score type.
-            score_type = dataset.score_type_object
-
-            # Compute score and fill it in the database.
-            submission_result.score, \
-                submission_result.score_details, \
-                submission_result.public_score, \
-                submission_result.public_score_details, \
-                submission_result.ranking_score_details = \
-                score_type.compute_score(submission_result)
-
-            # Store it.
-            session.commit()
+        # Instantiate the score type.
+        score_type = dataset.score_type_object
+
+        # Compute score and fill it in the database.
+        submission_result.score, \
+            submission_result.score_details, \
+            submission_result.public_score, \
+            submission_result.public_score_details, \
+            submission_result.ranking_score_details = \
+            score_type.compute_score(submission_result)
 
-            # If dataset is the active one, update RWS.
-            if dataset is submission.task.active_dataset:
-                logger.info(
-                    "Submission scored %.1f seconds after submission",
-                    (make_datetime() - submission.timestamp).total_seconds())
-                self.proxy_service.submission_scored(
-                    submission_id=submission.id)
+        if dataset.id != dataset.task.active_dataset_id:
+            return False
+        logger.info(
+            "Submission scored %.1f seconds after submission",
+            (make_datetime() - submission.timestamp).total_seconds())
+        return True
 
 
 class ScoringService(TriggeredService):
@@ -202,6 +322,7 @@ class ScoringService(TriggeredService):
         # been invalidated (and committed to the database). Therefore
         # we temporarily save them somewhere else.
         temp_queue = list()
+        pairs = set()
 
         with SessionGen() as session:
             submission_results = \
@@ -218,6 +339,12 @@ class ScoringService(TriggeredService):
                     temp_queue.append((
                         ScoringOperation(sr.submission_id, sr.dataset_id),
                         sr.submission.timestamp))
+                    pairs.add((sr.submission.participation_id,
+                               sr.submission.task_id))
+
+            # The scores of the users on the tasks will be computed
+            # from the submissions until they are scored again.
+            invalidate_task_scores(session, pairs)
 
             session.commit()
 
@@ -25,15 +25,24 @@
 """
 
 import logging
+import os
 import time
+from collections import deque
 
-import gevent.lock
+import gevent
+import gevent.event
 
+from cms import ConfigError, config
 from cms.db import SessionGen, Contest, enumerate_files
 from cms.db.filecacher import FileCacher, TombstoneError
 from cms.grading import JobException
 from cms.grading.Job import CompilationJob, EvaluationJob, JobGroup
+from cms.grading.Sandbox import ExecutionSlot, set_execution_slot
+from cms.grading.compilationcache import CompilationCache
+from cms.grading.sandboxpool import SandboxPool
 from cms.grading.tasktypes import get_task_type
+from cms.grading.tasktypes.util import CheckerSandboxes, \
+    set_checker_sandboxes, set_compilation_cache, set_sandbox_pool
 from cms.io import Service, rpc_method
 
 
@@ -51,11 +60,42 @@ class Worker(Service):
     JOB_TYPE_COMPILATION = "compile"
     JOB_TYPE_EVALUATION = "evaluate"
 
-    def __init__(self, shard, fake_worker_time=None):
+    def __init__(self, shard, fake_worker_time=None, prefetch_depth=None,
+                 slots=None):
         Service.__init__(self, shard)
         self.file_cacher = FileCacher(self)
 
-        self.work_lock = gevent.lock.RLock()
+        # The jobs of a group are executed concurrently, in up to this
+        # many sandboxes, all sharing the file cacher.
+        self.slots = slots if slots is not None else config.worker_slots
+        if self.slots > config.max_worker_slots:
+            raise ConfigError("Worker with %d execution slots, but "
+                              "max_worker_slots is %d in cms.conf." %
+                              (self.slots, config.max_worker_slots))
+        self._slots = self._create_slots(self.slots)
+
+        # Sandboxes initialized in advance, started with the service.
+        self.sandbox_pool = None
+        if config.sandbox_pool_size > 0:
+            self.sandbox_pool = SandboxPool(
+                self.file_cacher, config.sandbox_pool_size,
+                self._slots if len(self._slots) > 0 else None)
+
+        # Results of the compilations, reused for identical ones.
+        self.compilation_cache = None
+        if config.compilation_cache_size > 0:
+            self.compilation_cache = CompilationCache(
+                config.compilation_cache_size)
+
+        # Whether a job group is executing.
+        self._busy = False
+        # Number of job groups that can wait for their turn (preparing
+        # their files in the meantime) while another one executes.
+        self.prefetch_depth = prefetch_depth \
+            if prefetch_depth is not None else config.worker_prefetch_depth
+        # The events of the job groups waiting, in order of arrival;
+        # each is set when the group can start (see _start_next_group).
+        self._waiting = deque()
         self._last_end_time = None
         self._total_free_time = 0
         self._total_busy_time = 0
@@ -63,6 +103,36 @@ class Worker(Service):
 
         self._fake_worker_time = fake_worker_time
 
+    def run(self):
+        """Start the sandbox pool and run the service.
+
+        return (bool): True if successful.
+
+        """
+        set_compilation_cache(self.compilation_cache)
+        if self.sandbox_pool is not None:
+            set_sandbox_pool(self.sandbox_pool)
+            self.sandbox_pool.start()
+        try:
+            return super().run()
+        finally:
+            set_compilation_cache(None)
+            if self.sandbox_pool is not None:
+                set_sandbox_pool(None)
+                self.sandbox_pool.stop()
+
+    @rpc_method
+    def compilation_cache_status(self):
+        """RPC to retrieve the statistics of the compilation cache.
+
+        return ({}|None): see CompilationCache.get_status, or None if
+            there is no cache.
+
+        """
+        if self.compilation_cache is None:
+            return None
+        return self.compilation_cache.get_status()
+
     @rpc_method
     def precache_files(self, contest_id):
         """RPC to ask the worker to precache of files in the contest.
@@ -89,10 +159,65 @@ class Worker(Service):
 
         logger.info("Precaching finished.")
 
+    @staticmethod
+    def _create_slots(num_slots):
+        """Create the execution slots of a Worker.
+
+        Each slot is pinned to one of the CPU cores the Worker can run
+        on (or to the ones in config.worker_slot_cpus).
+
+        num_slots (int): number of slots.
+
+        return ([ExecutionSlot]): the slots (empty if just one, since
+            in that case jobs are run one after the other as usual).
+
+        """
+        if num_slots <= 1:
+            return []
+        cpus = config.worker_slot_cpus
+        if cpus is None:
+            cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < num_slots:
+            logger.warning("Only %d CPU cores for %d execution slots.",
+                           len(cpus), num_slots)
+        return [ExecutionSlot(index, num_slots, cpus[index % len(cpus)])
+                for index in range(num_slots)]
+
+    @rpc_method
+    def execution_slots(self):
+        """RPC to retrieve the number of jobs the worker can execute at
+        the same time.
+
+        return (int): the number of execution slots.
+
+        """
+        return max(self.slots, 1)
+
+    @rpc_method
+    def file_cacher_status(self):
+        """RPC to retrieve the statistics of the local file cache.
+
+        return ({}): see FileCacher.get_status.
+
+        """
+        return self.file_cacher.get_status()
+
+    @rpc_method
+    def sandbox_pool_status(self):
+        """RPC to retrieve the statistics of the pool of sandboxes.
+
+        return ({}|None): see SandboxPool.get_status, or None if there
+            is no pool.
+
+        """
+        if self.sandbox_pool is None:
+            return None
+        return self.sandbox_pool.get_status()
+
     @rpc_method
     def execute_job_group(self, job_group_dict):
         """Receive a group of jobs in a list format and executes them one by
-        one.
+        one (or, with several execution slots, some at the same time).
 
         job_group_dict ({}): a JobGroup exported to dict.
 
@@ -103,28 +228,42 @@ class Worker(Service):
         start_time = time.time()
         job_group = JobGroup.import_from_dict(job_group_dict)
 
-        if self.work_lock.acquire(False):
+        acquired = False
+        if not self._busy:
+            self._busy = True
+            acquired = True
+        elif len(self._waiting) < self.prefetch_depth:
+            # Another group is executing: we take our place in the
+            # queue, so that the groups are executed in the order they
+            # arrived, and get ready while we wait for our turn.
+            turn = gevent.event.Event()
+            self._waiting.append(turn)
+            try:
+                logger.info("Job group queued, prefetching its files.")
+                self._prefetch_files(job_group)
+                turn.wait()
+            except BaseException:
+                if turn.is_set():
+                    self._start_next_group()
+                else:
+                    self._waiting.remove(turn)
+                raise
+            acquired = True
+            start_time = time.time()
+
+        if acquired:
+            checker_sandboxes = None
+            if config.reuse_checker_sandbox:
+                checker_sandboxes = CheckerSandboxes(self.file_cacher)
+                set_checker_sandboxes(checker_sandboxes)
             try:
                 logger.info("Starting job group.")
-                for job in job_group.jobs:
-                    logger.info("Starting job.",
-                                extra={"operation": job.info})
-
-                    job.shard = self.shard
-
-                    if self._fake_worker_time is None:
-                        task_type = get_task_type(job.task_type,
-                                                  job.task_type_parameters)
-                        try:
-                            task_type.execute_job(job, self.file_cacher)
-                        except TombstoneError:
-                            job.success = False
-                            job.plus = {"tombstone": True}
-                    else:
-                        self._fake_work(job)
-
-                    logger.info("Finished job.",
-                                extra={"operation": job.info})
+                runs = self._split_in_runs(job_group.jobs)
+                if len(self._slots) > 0:
+                    self._execute_runs_in_slots(runs)
+                else:
+                    for run in runs:
+                        self._execute_run(run)
 
                 logger.info("Finished job group.")
                 return job_group.export_to_dict()
@@ -135,18 +274,183 @@ class Worker(Service):
                 raise JobException(err_msg)
 
             finally:
+                if checker_sandboxes is not None:
+                    set_checker_sandboxes(None)
+                    checker_sandboxes.close()
                 self._finalize(start_time)
-                self.work_lock.release()
+                self._start_next_group()
 
         else:
-            err_msg = "Request received, but declined because of acquired " \
-                "lock (Worker is busy executing another job, this should " \
-                "not happen: check if there are more than one ES running, " \
-                "or for bugs in ES."
+            err_msg = "Request received, but declined because the " \
+                "Worker is busy (executing another job and has " \
+                "%d more queued), this should not happen: check if there " \
+                "are more than one ES running, or for bugs in ES." \
+                % len(self._waiting)
             logger.warning(err_msg)
             self._finalize(start_time)
             raise JobException(err_msg)
 
+    def _start_next_group(self):
+        """Pass the turn to the first job group waiting, if any, at
+        the end of the execution of a group.
+
+        """
+        if len(self._waiting) > 0:
+            self._waiting.popleft().set()
+        else:
+            self._busy = False
+
+    def _execute_job(self, job):
+        """Execute a job, filling it with the results.
+
+        job (Job): the job to execute.
+
+        """
+        logger.info("Starting job.",
+                    extra={"operation": job.info})
+
+        job.shard = self.shard
+
+        if self._fake_worker_time is None:
+            task_type = get_task_type(job.task_type,
+                                      job.task_type_parameters)
+            try:
+                task_type.execute_job(job, self.file_cacher)
+            except TombstoneError:
+                job.success = False
+                job.plus = {"tombstone": True}
+        else:
+            self._fake_work(job)
+
+        logger.info("Finished job.",
+                    extra={"operation": job.info})
+
+    @staticmethod
+    def _split_in_runs(jobs):
+        """Split the jobs of a group in runs to execute together.
+
+        A run is made of consecutive evaluation jobs of the same
+        submission (that is, with the same task type, language and
+        executables), up to config.evaluation_run_size of them; any
+        other job is a run by itself.
+
+        jobs ([Job]): the jobs of a group.
+
+        return ([[Job]]): the runs, in the same order as the jobs.
+
+        """
+        runs = []
+        for job in jobs:
+            if len(runs) > 0 and len(runs[-1]) < config.evaluation_run_size:
+                last = runs[-1][-1]
+                if isinstance(job, EvaluationJob) \
+                        and isinstance(last, EvaluationJob) \
+                        and job.task_type == last.task_type \
+                        and job.task_type_parameters \
+                        == last.task_type_parameters \
+                        and job.language == last.language \
+                        and Worker._executable_digests(job) \
+                        == Worker._executable_digests(last):
+                    runs[-1].append(job)
+                    continue
+            runs.append([job])
+        return runs
+
+    @staticmethod
+    def _executable_digests(job):
+        return dict((filename, executable.digest)
+                    for filename, executable in job.executables.items())
+
+    def _execute_run(self, jobs):
+        """Execute a run of jobs (see _split_in_runs), filling them
+        with the results.
+
+        jobs ([Job]): the jobs to execute.
+
+        """
+        if len(jobs) == 1:
+            self._execute_job(jobs[0])
+            return
+
+        logger.info("Starting run of %d jobs.", len(jobs),
+                    extra={"operation": jobs[0].info})
+
+        for job in jobs:
+            job.shard = self.shard
+
+        if self._fake_worker_time is None:
+            task_type = get_task_type(jobs[0].task_type,
+                                      jobs[0].task_type_parameters)
+            try:
+                task_type.evaluate_many(jobs, self.file_cacher)
+            except TombstoneError:
+                for job in jobs:
+                    if job.success is None:
+                        job.success = False
+                        job.plus = {"tombstone": True}
+        else:
+            for job in jobs:
+                self._fake_work(job)
+
+        logger.info("Finished run of %d jobs.", len(jobs),
+                    extra={"operation": jobs[-1].info})
+
+    def _execute_runs_in_slots(self, runs):
+        """Execute runs of jobs concurrently, one per execution slot.
+
+        Each slot takes the next run still to execute until there are
+        none left. If a job fails, the slots stop taking new runs.
+
+        runs ([[Job]]): the runs to execute.
+
+        raise (Exception): the first exception raised by a job.
+
+        """
+        pending = iter(runs)
+        failed = []
+
+        def run_slot(slot):
+            set_execution_slot(slot)
+            for run in pending:
+                if failed:
+                    break
+                try:
+                    self._execute_run(run)
+                except Exception as error:
+                    failed.append(error)
+                    break
+
+        greenlets = [gevent.spawn(run_slot, slot)
+                     for slot in self._slots[:len(runs)]]
+        gevent.joinall(greenlets)
+        if failed:
+            raise failed[0]
+
+    def _prefetch_files(self, job_group):
+        """Load in the local cache the files needed by a job group.
+
+        Errors are ignored: they will be met again, and handled, when
+        executing the jobs.
+
+        job_group (JobGroup): the job group to be executed.
+
+        """
+        digests = set()
+        for job in job_group.jobs:
+            for files in (job.files, job.managers, job.executables):
+                digests.update(file_.digest for file_ in files.values())
+            if isinstance(job, EvaluationJob):
+                digests.update(digest for digest in (job.input, job.output)
+                               if digest is not None)
+        for digest in digests:
+            try:
+                self.file_cacher.load(digest, if_needed=True)
+            except (KeyError, TombstoneError):
+                pass
+            except Exception:
+                logger.warning("Could not prefetch file %s.", digest,
+                               exc_info=True)
+
     def _fake_work(self, job):
         """Fill the job with fake success data after waiting for some time."""
         time.sleep(self._fake_worker_time)
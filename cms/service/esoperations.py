@@ -148,13 +148,17 @@ def user_test_to_evaluate(user_test_result):
         r.evaluation_tries < MAX_USER_TEST_EVALUATION_TRIES
 
 
-def submission_get_operations(submission_result, submission, dataset):
+def submission_get_operations(submission_result, submission, dataset,
+                              order_testcases=None):
     """Generate all operations originating from a submission for a given
     dataset.
 
     submission_result (SubmissionResult|None): a submission result.
     submission (Submission): the submission for submission_result.
     dataset (Dataset): the dataset for submission_result.
+    order_testcases (function|None): if given, called with the dataset
+        and the codenames of the testcases to evaluate, returns them in
+        the order in which their operations are generated.
 
     yield (ESOperation, int, datetime): an iterator providing triplets
         consisting of a ESOperation for a certain operation to
@@ -187,15 +191,18 @@ def submission_get_operations(submission_result, submission, dataset):
         evaluated_testcase_ids = set(
             evaluation.testcase_id
             for evaluation in submission_result.evaluations)
-        for testcase_codename in dataset.testcases.keys():
-            testcase_id = dataset.testcases[testcase_codename].id
-            if testcase_id not in evaluated_testcase_ids:
-                yield ESOperation(ESOperation.EVALUATION,
-                                  submission.id,
-                                  dataset.id,
-                                  testcase_codename), \
-                    priority, \
-                    submission.timestamp
+        testcase_codenames = [
+            codename for codename, testcase in dataset.testcases.items()
+            if testcase.id not in evaluated_testcase_ids]
+        if order_testcases is not None:
+            testcase_codenames = order_testcases(dataset, testcase_codenames)
+        for testcase_codename in testcase_codenames:
+            yield ESOperation(ESOperation.EVALUATION,
+                              submission.id,
+                              dataset.id,
+                              testcase_codename), \
+                priority, \
+                submission.timestamp
 
 
 def user_test_get_operations(user_test, dataset):
@@ -283,12 +290,15 @@ def get_relevant_operations(level, submissions, dataset_id=None):
     return operations
 
 
-def get_submissions_operations(session, contest_id=None):
+def get_submissions_operations(session, contest_id=None,
+                               min_submission_id=None):
     """Return all the operations to do for submissions in the contest.
 
     session (Session): the database session to use.
     contest_id (int|None): the contest for which we want the operations.
         If none, get operations for any contest.
+    min_submission_id (int|None): if given, only look at submissions
+        with an id greater than this.
 
     return ([ESOperation, float, int]): a list of operation, timestamp
         and priority.
@@ -300,6 +310,8 @@ def get_submissions_operations(session, contest_id=None):
         contest_filter = literal(True)
     else:
         contest_filter = Task.contest_id == contest_id
+    if min_submission_id is not None:
+        contest_filter &= Submission.id > min_submission_id
 
     # Retrieve the compilation operations for all submissions without
     # the corresponding result for a dataset to judge. Since we have
@@ -390,12 +402,15 @@ def get_submissions_operations(session, contest_id=None):
     return operations
 
 
-def get_user_tests_operations(session, contest_id=None):
+def get_user_tests_operations(session, contest_id=None,
+                              min_user_test_id=None):
     """Return all the operations to do for user tests in the contest.
 
     session (Session): the database session to use.
     contest_id (int|None): the contest for which we want the operations.
         If none, get operations for any contest.
+    min_user_test_id (int|None): if given, only look at user tests
+        with an id greater than this.
 
     return ([ESOperation, float, int]): a list of operation, timestamp
         and priority.
@@ -407,6 +422,8 @@ def get_user_tests_operations(session, contest_id=None):
         contest_filter = literal(True)
     else:
         contest_filter = Task.contest_id == contest_id
+    if min_user_test_id is not None:
+        contest_filter &= UserTest.id > min_user_test_id
 
     # Retrieve the compilation operations for all user tests without
     # the corresponding result for a dataset to judge. Since we have
@@ -496,12 +513,20 @@ class ESOperation(QueueItem):
     USER_TEST_COMPILATION = "compile_test"
     USER_TEST_EVALUATION = "evaluate_test"
 
+    # ES can have a very large number of operations in the queue.
+    __slots__ = ("type_", "object_id", "dataset_id", "testcase_codename",
+                 "side_data", "_hash")
+
     # Testcase codename is only needed for EVALUATION type of operation
     def __init__(self, type_, object_id, dataset_id, testcase_codename=None):
         self.type_ = type_
         self.object_id = object_id
         self.dataset_id = dataset_id
         self.testcase_codename = testcase_codename
+        # Operations are used as keys of large dicts, and their fields
+        # never change.
+        self._hash = hash((self.type_, self.object_id, self.dataset_id,
+                           self.testcase_codename))
 
     @staticmethod
     def from_dict(d):
@@ -522,8 +547,7 @@ class ESOperation(QueueItem):
             and self.testcase_codename == other.testcase_codename
 
     def __hash__(self):
-        return hash((self.type_, self.object_id, self.dataset_id,
-                     self.testcase_codename))
+        return self._hash
 
     def __str__(self):
         if self.type_ == ESOperation.EVALUATION:
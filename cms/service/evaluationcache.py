@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A content-addressed cache of evaluation results, used by ES to
+avoid sending to the workers evaluations whose result is already
+known (for example, after a dataset clone or a mass invalidation).
+
+"""
+
+import json
+import logging
+from collections import OrderedDict
+
+from cms.grading.Sandbox import Sandbox
+
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationResultCache:
+    """A bounded LRU cache from evaluation inputs to evaluation results.
+
+    The key of an entry is built from everything that can influence
+    the outcome of an evaluation: task type and parameters, language,
+    the digests of submitted files (graded directly by task types like
+    OutputOnly), executables and managers (the latter include the
+    checker, if any), the digests of input and correct output, and the
+    limits. The value is what the worker fills in an EvaluationJob.
+
+    The cache supports three policies:
+    - POLICY_OFF: never store nor reuse anything;
+    - POLICY_EXACT: reuse every successful result;
+    - POLICY_NON_TIMING: reuse only results that do not depend on
+      timing, that is, results that were not a timeout and whose
+      execution time was far from the time limit.
+
+    """
+
+    POLICY_OFF = "off"
+    POLICY_EXACT = "exact"
+    POLICY_NON_TIMING = "non_timing"
+    POLICIES = [POLICY_OFF, POLICY_EXACT, POLICY_NON_TIMING]
+
+    # With POLICY_NON_TIMING, a result is stored only if the execution
+    # time was at most this fraction of the time limit.
+    NON_TIMING_MAX_TIME_FRACTION = 0.5
+
+    def __init__(self, policy=POLICY_OFF, max_size=100000):
+        """Create the cache.
+
+        policy (str): one of the POLICY_* constants.
+        max_size (int): maximum number of entries; when the cache is
+            full, the least recently used entry is evicted.
+
+        raise (ValueError): if the policy is not recognized.
+
+        """
+        if policy not in EvaluationResultCache.POLICIES:
+            raise ValueError("Unknown evaluation cache policy `%s'." % policy)
+        self.policy = policy
+        self.max_size = max_size
+
+        # Type: {tuple: (str, [object], dict, int|None)}
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        """Return whether the cache stores and reuses results."""
+        return self.policy != EvaluationResultCache.POLICY_OFF
+
+    @staticmethod
+    def key_for_job(job):
+        """Return the cache key for an evaluation job.
+
+        job (EvaluationJob): the job to compute the key of.
+
+        return (tuple): a hashable key.
+
+        """
+        return (
+            job.task_type,
+            json.dumps(job.task_type_parameters, sort_keys=True),
+            job.language,
+            tuple(sorted((filename, file_.digest)
+                         for filename, file_ in job.files.items())),
+            tuple(sorted((filename, executable.digest)
+                         for filename, executable in job.executables.items())),
+            tuple(sorted((filename, manager.digest)
+                         for filename, manager in job.managers.items())),
+            job.input,
+            job.output,
+            job.time_limit,
+            job.memory_limit,
+        )
+
+    def _is_cacheable(self, job):
+        """Return whether the result in the job can be stored.
+
+        job (EvaluationJob): a job filled by a worker.
+
+        return (bool): whether the policy allows storing the result.
+
+        """
+        if not self.enabled or not job.success or job.outcome is None \
+                or job.only_execution or job.get_output:
+            return False
+        if self.policy == EvaluationResultCache.POLICY_NON_TIMING:
+            plus = job.plus or {}
+            if plus.get("exit_status") in [Sandbox.EXIT_TIMEOUT,
+                                           Sandbox.EXIT_TIMEOUT_WALL]:
+                return False
+            execution_time = plus.get("execution_time")
+            if job.time_limit is not None and (
+                    execution_time is None or
+                    execution_time > self.NON_TIMING_MAX_TIME_FRACTION
+                    * job.time_limit):
+                return False
+        return True
+
+    def store(self, job):
+        """Store the result of an evaluation job, if allowed.
+
+        job (EvaluationJob): a job filled by a worker.
+
+        return (bool): whether the result was stored.
+
+        """
+        if not self._is_cacheable(job):
+            return False
+        key = EvaluationResultCache.key_for_job(job)
+        self._entries[key] = (job.outcome, job.text, job.plus, job.shard)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return True
+
+    def fill(self, job):
+        """Fill an evaluation job with a cached result, if present.
+
+        job (EvaluationJob): a job as created by ES, not yet executed.
+
+        return (bool): whether the job was filled from the cache.
+
+        """
+        if not self.enabled or job.only_execution or job.get_output:
+            return False
+        key = EvaluationResultCache.key_for_job(job)
+        try:
+            outcome, text, plus, shard = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return False
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        job.success = True
+        job.outcome = outcome
+        job.text = text
+        job.plus = dict(plus) if plus is not None else None
+        job.shard = shard
+        return True
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        self._entries.clear()
+
+    def get_status(self):
+        """Return statistics on the cache usage.
+
+        return (dict): policy, size and counters of the cache.
+
+        """
+        return {
+            "policy": self.policy,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A policy used by ES to evaluate first the testcases that are most
+likely to fail their subtasks, and to skip the testcases whose
+subtasks are already failed, for datasets with a group score type
+(GroupMin, GroupMul, GroupThreshold).
+
+"""
+
+import json
+import logging
+from collections import defaultdict
+
+from cms.grading.scoretypes import ScoreTypeGroup
+
+
+logger = logging.getLogger(__name__)
+
+
+# Dummy function to mark translatable string.
+def N_(message):
+    return message
+
+
+class SubtaskEvaluationPolicy:
+    """Decide the order of the evaluations of a submission, and which
+    of them are not needed.
+
+    For each testcase, the policy counts how many evaluations it
+    received and how many of them failed a subtask containing it (see
+    ScoreTypeGroup.fails_subtask); the testcases failing most often
+    are evaluated first.
+
+    The policy supports three modes:
+    - POLICY_OFF: evaluate all testcases, in the order of the dataset;
+    - POLICY_ORDER: evaluate all testcases, those failing most often
+      first;
+    - POLICY_SKIP: as POLICY_ORDER, but do not evaluate the testcases
+      whose subtasks have all already been failed (see
+      ScoreTypeGroup.testcases_to_skip).
+
+    """
+
+    POLICY_OFF = "off"
+    POLICY_ORDER = "order"
+    POLICY_SKIP = "skip"
+    POLICIES = [POLICY_OFF, POLICY_ORDER, POLICY_SKIP]
+
+    # Text of the evaluations of the skipped testcases.
+    SKIPPED_TEXT = [N_("Not evaluated, as its subtasks were already failed")]
+
+    def __init__(self, policy=POLICY_OFF):
+        """Create the policy.
+
+        policy (str): one of the POLICY_* constants.
+
+        raise (ValueError): if the policy is not recognized.
+
+        """
+        if policy not in SubtaskEvaluationPolicy.POLICIES:
+            raise ValueError(
+                "Unknown evaluation subtask policy `%s'." % policy)
+        self.policy = policy
+
+        # Score type and subtask parameters of each testcase, for
+        # each dataset. Type: {int: (tuple, ScoreTypeGroup|None,
+        # {str: [list]})}.
+        self._subtasks = dict()
+        # Number of evaluations and of failures of each testcase.
+        # Type: {(int, str): int}.
+        self._evaluations = defaultdict(int)
+        self._failures = defaultdict(int)
+
+        self.skipped = 0
+
+    @property
+    def enabled(self):
+        """Return whether the policy changes the evaluation order."""
+        return self.policy != SubtaskEvaluationPolicy.POLICY_OFF
+
+    @property
+    def skipping(self):
+        """Return whether the policy skips unneeded evaluations."""
+        return self.policy == SubtaskEvaluationPolicy.POLICY_SKIP
+
+    def _get_subtasks(self, dataset):
+        """Return the score type of a dataset and its subtasks.
+
+        dataset (Dataset): the dataset.
+
+        return ((ScoreTypeGroup|None, {str: [list]})): the score type
+            object of the dataset (None if it is not a group score
+            type or it is not valid), and for each testcase the
+            parameters of the subtasks containing it.
+
+        """
+        key = (dataset.score_type,
+               json.dumps(dataset.score_type_parameters, sort_keys=True),
+               tuple(dataset.testcases.keys()))
+        try:
+            cached_key, score_type, subtasks = self._subtasks[dataset.id]
+        except KeyError:
+            pass
+        else:
+            if cached_key == key:
+                return score_type, subtasks
+
+        score_type = None
+        subtasks = dict()
+        try:
+            score_type = dataset.score_type_object
+            if not isinstance(score_type, ScoreTypeGroup):
+                score_type = None
+            else:
+                targets = score_type.retrieve_target_testcases()
+                for target, parameter in zip(targets, score_type.parameters):
+                    for codename in target:
+                        subtasks.setdefault(codename, []).append(parameter)
+        except Exception as error:
+            logger.warning("Cannot read the subtasks of dataset %d: %r.",
+                           dataset.id, error)
+            score_type = None
+            subtasks = dict()
+
+        self._subtasks[dataset.id] = (key, score_type, subtasks)
+        return score_type, subtasks
+
+    def _failure_rate(self, dataset_id, codename):
+        """Return the (smoothed) fraction of failures of a testcase.
+
+        dataset_id (int): the id of the dataset.
+        codename (str): the codename of the testcase.
+
+        return (float): the failures over the evaluations plus one, so
+            that testcases never evaluated have rate 0.
+
+        """
+        key = (dataset_id, codename)
+        return self._failures[key] / (self._evaluations[key] + 1)
+
+    def order_testcases(self, dataset, codenames):
+        """Sort the testcases to evaluate for a submission.
+
+        dataset (Dataset): the dataset of the testcases.
+        codenames ([str]): the codenames of the testcases to evaluate,
+            in the order of the dataset.
+
+        return ([str]): the same codenames, those failing most often
+            first (the order is preserved among testcases with the
+            same rate); unchanged if the policy is off or the dataset
+            does not have a group score type.
+
+        """
+        if not self.enabled:
+            return codenames
+        score_type, _ = self._get_subtasks(dataset)
+        if score_type is None:
+            return codenames
+        return sorted(codenames,
+                      key=lambda codename: -self._failure_rate(
+                          dataset.id, codename))
+
+    def record(self, dataset, codename, outcome):
+        """Record the outcome of an evaluation.
+
+        dataset (Dataset): the dataset of the testcase.
+        codename (str): the codename of the testcase.
+        outcome (str|float|None): the outcome of the evaluation.
+
+        """
+        if not self.enabled or outcome is None:
+            return
+        score_type, subtasks = self._get_subtasks(dataset)
+        if score_type is None:
+            return
+        key = (dataset.id, codename)
+        self._evaluations[key] += 1
+        outcome = float(outcome)
+        if any(score_type.fails_subtask(outcome, parameter)
+               for parameter in subtasks.get(codename, [])):
+            self._failures[key] += 1
+
+    def testcases_to_skip(self, dataset, outcomes):
+        """Return the testcases that do not need to be evaluated.
+
+        dataset (Dataset): the dataset of the submission result.
+        outcomes ({str: str|float}): the outcomes of the testcases
+            evaluated so far, by codename.
+
+        return ({str}): the codenames of the testcases, not in
+            outcomes, that cannot change the score; empty if the
+            policy does not skip or the dataset does not have a group
+            score type.
+
+        """
+        if not self.skipping:
+            return set()
+        score_type, _ = self._get_subtasks(dataset)
+        if score_type is None:
+            return set()
+        try:
+            return score_type.testcases_to_skip(
+                {codename: float(outcome)
+                 for codename, outcome in outcomes.items()})
+        except Exception as error:
+            logger.warning("Cannot compute the testcases to skip for "
+                           "dataset %d: %r.", dataset.id, error)
+            return set()
+
+    def get_status(self):
+        """Return statistics on the policy.
+
+        return (dict): policy, number of testcases with statistics and
+            number of evaluations skipped.
+
+        """
+        return {
+            "policy": self.policy,
+            "testcases": len(self._evaluations),
+            "skipped": self.skipped,
+        }
@@ -27,13 +27,17 @@
 
 import logging
 import random
+import time
+from collections import OrderedDict, deque
 from datetime import timedelta
 
 import gevent.lock
 from gevent.event import Event
 
+from cms import config
 from cms.db import SessionGen
 from cms.grading.Job import JobGroup
+from cms.service.esoperations import ESOperation
 from cmscommon.datetime import make_datetime, make_timestamp
 
 
@@ -52,6 +56,13 @@ class WorkerPool:
     # Seconds after which we declare a worker stale.
     WORKER_TIMEOUT = timedelta(seconds=600)
 
+    # Number of affinity keys remembered for each worker.
+    AFFINITY_HISTORY_SIZE = 256
+    # Weights of a match on the same submission (or user test) and on
+    # the same dataset when ranking the workers for a batch.
+    AFFINITY_OBJECT_WEIGHT = 2
+    AFFINITY_DATASET_WEIGHT = 1
+
     def __init__(self, service):
         """service (Service): the EvaluationService using this
         WorkerPool.
@@ -70,6 +81,10 @@ class WorkerPool:
         # list of operations to ignore in the next batch of results.
         # Type: {int: [ESOperation]}
         self._operations = {}
+        # The batches sent to a busy worker, waiting to be executed
+        # after the current one (at most config.worker_prefetch_depth).
+        # Type: {int: deque([[ESOperation]])}
+        self._queued = {}
         # Type: {int: [ESOperation]}
         self._operations_to_ignore = {}
         # Type: {int: Datetime|None}
@@ -78,6 +93,10 @@ class WorkerPool:
         self._schedule_disabling = {}
         # Type: {int: bool}
         self._ignore = {}
+        # Number of jobs each worker can execute at the same time, as
+        # advertised when it connects.
+        # Type: {int: int}
+        self._capacity = {}
 
         # TODO: given the number of pieces data associated to each
         # worker, this class could be simplified by creating a new
@@ -101,6 +120,23 @@ class WorkerPool:
         # set does not mean that there is a worker available.
         self._workers_available_event = Event()
 
+        # The affinity keys (see _affinity_keys) of the operations
+        # recently assigned to each worker, least recent first, used to
+        # send a batch where its executables and testcases are likely
+        # to be already cached.
+        # Type: {int: OrderedDict}
+        self._recent_keys = {}
+        # The batch for which we are waiting for a busy worker with
+        # affinity, the monotonic time when we started waiting, and
+        # the time after which we give up and pick any idle worker.
+        self._affinity_waiting_for = None
+        self._affinity_wait_start = None
+        self._affinity_deadline = None
+        # Statistics on the dispatched batches.
+        self._dispatched = 0
+        self._dispatched_affine = 0
+        self._dispatched_after_wait = 0
+
     def __len__(self):
         return len(self._worker)
 
@@ -136,9 +172,60 @@ class WorkerPool:
             for operation in operations:
                 self._operations_reverse[operation] = shard
 
+    def _queue_operations(self, shard, operations):
+        """Assigns new operations to a busy worker, to be executed
+        after the current ones.
+
+        shard (int): shard of the worker.
+        operations ([ESOperation]) operations to assign to the worker.
+
+        """
+        if not isinstance(self._operations[shard], list):
+            raise ValueError("Shard %s is not doing an operation.", shard)
+        with self._operation_lock:
+            self._queued[shard].append(operations)
+            for operation in operations:
+                self._operations_reverse[operation] = shard
+
+    def _drop_queued(self, shard):
+        """Forget the operations queued on a worker.
+
+        shard (int): the worker from which to remove operations.
+
+        """
+        with self._operation_lock:
+            for operations in self._queued[shard]:
+                for operation in operations:
+                    del self._operations_reverse[operation]
+            self._queued[shard].clear()
+
+    def _pending_operations(self, shard):
+        """Return the operations assigned to a worker, both in execution
+        and queued.
+
+        shard (int): the worker.
+
+        return ([ESOperation]): the operations.
+
+        """
+        pending = []
+        if isinstance(self._operations[shard], list):
+            pending += self._operations[shard]
+        for operations in self._queued[shard]:
+            pending += operations
+        return pending
+
     def wait_for_workers(self):
-        """Wait until a worker might be available."""
-        self._workers_available_event.wait()
+        """Wait until a worker might be available.
+
+        If we are holding a batch back for a busy worker with affinity,
+        wait at most until we would give up on it.
+
+        """
+        timeout = None
+        if self._affinity_deadline is not None:
+            timeout = max(self._affinity_deadline - time.monotonic(), 0)
+        self._workers_available_event.wait(timeout)
 
     def add_worker(self, worker_coord):
         """Add a new worker to the worker pool.
@@ -154,10 +241,13 @@ class WorkerPool:
 
         # And we fill all data.
         self._operations[shard] = WorkerPool.WORKER_INACTIVE
+        self._queued[shard] = deque()
         self._operations_to_ignore[shard] = []
         self._start_time[shard] = None
         self._schedule_disabling[shard] = False
         self._ignore[shard] = False
+        self._capacity[shard] = 1
+        self._recent_keys[shard] = OrderedDict()
         self._workers_available_event.set()
         logger.debug("Worker %s added.", shard)
 
@@ -176,6 +266,8 @@ class WorkerPool:
             self._worker[shard].precache_files(
                 contest_id=self._service.contest_id
             )
+        self._worker[shard].execution_slots(
+            callback=self._on_execution_slots, plus=shard)
         # We don't requeue the operation, because a connection lost
         # does not invalidate a potential result given by the worker
         # (as the problem was the connection and not the machine on
@@ -183,11 +275,56 @@ class WorkerPool:
         # so we wake up the consumers.
         self._workers_available_event.set()
 
+    def _on_execution_slots(self, data, shard, error=None):
+        """Callback receiving the capacity of a worker.
+
+        data (int): the number of execution slots of the worker.
+        shard (int): the worker.
+
+        """
+        if error is not None:
+            logger.warning("Could not get the capacity of worker %s: %s.",
+                           shard, error)
+            return
+        self._capacity[shard] = max(data, 1)
+        logger.info("Worker %s has %d execution slots.",
+                    shard, self._capacity[shard])
+
+    def max_capacity(self):
+        """Return the largest capacity amongst the enabled workers.
+
+        return (int): the maximum number of jobs a worker can execute
+            at the same time.
+
+        """
+        return max((capacity for shard, capacity in self._capacity.items()
+                    if self._operations[shard] != WorkerPool.WORKER_DISABLED),
+                   default=1)
+
+    def total_capacity(self):
+        """Return the number of jobs all workers can execute at the same
+        time.
+
+        return (int): the sum of the capacities of all workers.
+
+        """
+        return sum(self._capacity.values())
+
     def acquire_worker(self, operations):
         """Tries to assign an operation to an available worker. If no workers
         are available then this returns None, otherwise this returns
         the chosen worker.
 
+        If no worker is available, the operations can be queued on a
+        busy worker, which prepares them while finishing the current
+        ones (see config.worker_prefetch_depth).
+
+        Workers that recently handled the same submissions or datasets
+        are preferred (see find_affine_worker). If none of them is
+        available but one is busy, the batch is held back for up to
+        config.worker_affinity_wait_s seconds (returning None) before
+        being sent to a random available worker.
+
         operations ([ESOperation]): the operations to assign to a worker.
 
         return (int|None): None if no workers are available, the worker
@@ -196,18 +333,30 @@ class WorkerPool:
         """
         # We look for an available worker.
         try:
-            shard = self.find_worker(WorkerPool.WORKER_INACTIVE,
-                                     require_connection=True,
-                                     random_worker=True)
+            shard, affine = self.find_affine_worker(operations)
         except LookupError:
             self._workers_available_event.clear()
             return None
 
-        # Then we fill the info for future memory.
-        self._add_operations(shard, operations)
+        waited = self._affinity_waiting_for is operations
+        self._affinity_waiting_for = None
+        self._affinity_wait_start = None
+        self._affinity_deadline = None
+        self._dispatched += 1
+        if affine:
+            self._dispatched_affine += 1
+            if waited:
+                self._dispatched_after_wait += 1
+        self._remember_keys(shard, operations)
 
-        logger.debug("Worker %s acquired.", shard)
-        self._start_time[shard] = make_datetime()
+        # Then we fill the info for future memory.
+        if self._operations[shard] == WorkerPool.WORKER_INACTIVE:
+            self._add_operations(shard, operations)
+            logger.debug("Worker %s acquired.", shard)
+            self._start_time[shard] = make_datetime()
+        else:
+            self._queue_operations(shard, operations)
+            logger.debug("Operations queued on worker %s.", shard)
 
         with SessionGen() as session:
             job_group_dict = \
@@ -228,7 +377,9 @@ class WorkerPool:
 
         Note: if the worker is scheduled to be disabled, then we
         disable it, and notify the ES to discard the outcome obtained
-        by the worker.
+        by the worker. Otherwise, the first of the queued batches of
+        operations (if any) becomes the one in execution: the worker
+        executes them in order.
 
         shard (int): the worker to release.
 
@@ -249,18 +400,35 @@ class WorkerPool:
 
         ret = self._ignore[shard]
         with self._operation_lock:
-            to_ignore = self._operations_to_ignore[shard]
-            self._operations_to_ignore[shard] = []
+            # Operations to ignore in the queued batches are kept for
+            # when their results arrive.
+            finished = self._operations[shard]
+            to_ignore = []
+            to_ignore_later = []
+            for operation in self._operations_to_ignore[shard]:
+                if operation in finished:
+                    to_ignore.append(operation)
+                else:
+                    to_ignore_later.append(operation)
+            self._operations_to_ignore[shard] = to_ignore_later
         self._start_time[shard] = None
         self._ignore[shard] = False
         if self._schedule_disabling[shard]:
+            self._drop_queued(shard)
             self._remove_operations(shard, WorkerPool.WORKER_DISABLED)
             self._schedule_disabling[shard] = False
             logger.info("Worker %s released and disabled.", shard)
         else:
             self._remove_operations(shard, WorkerPool.WORKER_INACTIVE)
+            if len(self._queued[shard]) > 0:
+                with self._operation_lock:
+                    self._operations[shard] = self._queued[shard].popleft()
+                self._start_time[shard] = make_datetime()
+                logger.debug("Worker %s released, starting queued "
+                             "operations.", shard)
+            else:
+                logger.debug("Worker %s released.", shard)
             self._workers_available_event.set()
-            logger.debug("Worker %s released.", shard)
         if ret is False and to_ignore != []:
             return to_ignore
         else:
@@ -298,6 +466,145 @@ class WorkerPool:
         else:
             return random.choice(pool)
 
+    @staticmethod
+    def _affinity_keys(operations):
+        """Return the keys describing what a worker caches to execute
+        the operations.
+
+        A worker that compiled or evaluated a submission on a dataset
+        has its executables in its cache, and one that did anything on
+        a dataset has its managers and testcases.
+
+        operations ([ESOperation]): the operations.
+
+        return ({tuple: int}): the affinity keys, with their weights.
+
+        """
+        keys = {}
+        for operation in operations:
+            if operation.type_ in (ESOperation.COMPILATION,
+                                   ESOperation.EVALUATION):
+                object_key = ("submission", operation.object_id,
+                              operation.dataset_id)
+            else:
+                object_key = ("user_test", operation.object_id,
+                              operation.dataset_id)
+            keys[object_key] = WorkerPool.AFFINITY_OBJECT_WEIGHT
+            keys[("dataset", operation.dataset_id)] = \
+                WorkerPool.AFFINITY_DATASET_WEIGHT
+        return keys
+
+    def _affinity_score(self, shard, keys):
+        """Return how much of the cache needed by a batch the worker
+        is likely to have.
+
+        shard (int): the worker.
+        keys ({tuple: int}): the affinity keys of the batch.
+
+        return (int): the sum of the weights of the keys recently seen
+            by the worker.
+
+        """
+        recent = self._recent_keys[shard]
+        return sum(weight for key, weight in keys.items() if key in recent)
+
+    def _remember_keys(self, shard, operations):
+        """Record the affinity keys of a batch assigned to a worker.
+
+        shard (int): the worker.
+        operations ([ESOperation]): the operations assigned to it.
+
+        """
+        recent = self._recent_keys[shard]
+        for key in self._affinity_keys(operations):
+            recent[key] = True
+            recent.move_to_end(key)
+        while len(recent) > WorkerPool.AFFINITY_HISTORY_SIZE:
+            recent.popitem(last=False)
+
+    def find_affine_worker(self, operations):
+        """Choose the available worker to execute a batch.
+
+        The available worker with the highest affinity score is chosen
+        (at random amongst those with the same score). If no available
+        worker has any affinity but a busy one has, we prefer to wait
+        for it, unless we have already been waiting for more than
+        config.worker_affinity_wait_s seconds for this batch. If no
+        worker is available, we choose in the same way amongst the busy
+        workers that can queue more operations.
+
+        operations ([ESOperation]): the operations to assign.
+
+        return ((int, bool)): the shard of the chosen worker, and
+            whether it had affinity with the batch.
+
+        raise (LookupError): if there is no available worker, or if we
+            want to wait for a busy one.
+
+        """
+        keys = self._affinity_keys(operations)
+        prefetch_depth = config.worker_prefetch_depth
+        best_score = 0
+        best = []
+        busy_affine = False
+        queue_best_score = 0
+        queue_best = []
+        for shard, worker_operation in self._operations.items():
+            if not self._worker[shard].connected \
+                    or worker_operation == WorkerPool.WORKER_DISABLED \
+                    or self._schedule_disabling[shard]:
+                continue
+            score = self._affinity_score(shard, keys)
+            if worker_operation != WorkerPool.WORKER_INACTIVE:
+                busy_affine = busy_affine or score > 0
+                if self._ignore[shard] \
+                        or len(self._queued[shard]) >= prefetch_depth:
+                    continue
+                if score > queue_best_score:
+                    queue_best_score = score
+                    queue_best = [shard]
+                elif score == queue_best_score:
+                    queue_best.append(shard)
+            elif score > best_score:
+                best_score = score
+                best = [shard]
+            elif score == best_score:
+                best.append(shard)
+
+        if best == []:
+            if queue_best == []:
+                raise LookupError("No available worker.")
+            return random.choice(queue_best), queue_best_score > 0
+        if best_score > 0:
+            return random.choice(best), True
+
+        wait = config.worker_affinity_wait_s
+        if busy_affine and wait is not None and wait > 0:
+            now = time.monotonic()
+            if self._affinity_waiting_for is not operations:
+                self._affinity_waiting_for = operations
+                self._affinity_wait_start = now
+                self._affinity_deadline = now + wait
+            if now < self._affinity_deadline:
+                raise LookupError("Waiting for a worker with affinity.")
+        return random.choice(best), False
+
+    def get_affinity_status(self):
+        """Return statistics on the affinity of the dispatched batches.
+
+        return (dict): the number of dispatched batches, of those sent
+            to a worker with affinity (and of those after waiting for
+            it), and the ratio of affine batches.
+
+        """
+        return {
+            "dispatched": self._dispatched,
+            "affine": self._dispatched_affine,
+            "affine_after_wait": self._dispatched_after_wait,
+            "affinity_ratio": (self._dispatched_affine / self._dispatched
+                               if self._dispatched > 0 else None),
+        }
+
     def ignore_operation(self, operation):
         """Mark the operation to be ignored.
 
@@ -335,6 +642,10 @@ class WorkerPool:
                                for operation in self._operations[shard]]
                 if isinstance(self._operations[shard], list)
                 else self._operations[shard],
+                'capacity': self._capacity[shard],
+                'queued_operations': [operation.to_dict()
+                                      for operations in self._queued[shard]
+                                      for operation in operations],
                 'start_time': s_time}
         return result
 
@@ -365,10 +676,11 @@ class WorkerPool:
                                WorkerPool.WORKER_DISABLED)
                     assert is_busy
 
-                    # We return the operation so ES can do what it needs.
+                    # We return the operations (including the queued
+                    # ones) so ES can do what it needs.
                     if not self._ignore[shard] and \
                             isinstance(self._operations[shard], list):
-                        for operation in self._operations[shard]:
+                        for operation in self._pending_operations(shard):
                             if operation not in \
                                     self._operations_to_ignore[shard]:
                                 lost_operations.append(operation)
@@ -411,7 +723,7 @@ class WorkerPool:
             if not self._ignore[shard]:
                 to_ignore = self._operations_to_ignore[shard]
                 if isinstance(self._operations[shard], list):
-                    for operation in self._operations[shard]:
+                    for operation in self._pending_operations(shard):
                         if operation not in to_ignore:
                             lost_operations.append(operation)
 
@@ -459,7 +771,8 @@ class WorkerPool:
                         WorkerPool.WORKER_DISABLED,
                         WorkerPool.WORKER_INACTIVE]:
                 if not self._ignore[shard]:
-                    lost_operations += self._operations[shard]
+                    lost_operations += self._pending_operations(shard)
+                self._drop_queued(shard)
                 self.release_worker(shard)
 
         return lost_operations
@@ -29,6 +29,7 @@ from cms.db import File, Participation, SessionGen, Submission, Task, User, \
     ask_for_contest
 from cms.db.filecacher import FileCacher
 from cms.grading.languagemanager import filename_to_language
+from cms.grading.scoring import update_task_scores
 from cms.io import RemoteServiceClient
 from cmscommon.datetime import make_datetime
 
@@ -139,6 +140,7 @@ def add_submission(contest_id, username, task_name, timestamp, files):
         for filename, digest in file_digests.items():
             session.add(File(filename, digest, submission=submission))
         session.add(submission)
+        update_task_scores(session, [(participation.id, task.id)])
         session.commit()
         maybe_send_notification(submission.id)
 
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This script compares the scores of the users on the tasks stored in
+the database with the ones computed from their submissions and, if
+required, stores all of them again, computed from scratch (e.g., after
+importing a contest).
+
+"""
+
+import argparse
+import logging
+import sys
+
+from cms.db import Contest, SessionGen, ask_for_contest
+from cms.grading.scoring import check_task_scores
+
+
+logger = logging.getLogger(__name__)
+
+
+def check(contest_id, fix):
+    with SessionGen() as session:
+        contest = Contest.get_from_id(contest_id, session)
+        if contest is None:
+            logger.error("Contest %d not found.", contest_id)
+            return False
+
+        wrong, missing = check_task_scores(session, contest, fix=fix)
+        for participation_id, task_id in wrong:
+            logger.warning("Wrong score stored for participation %d on "
+                           "task %d.", participation_id, task_id)
+        logger.info("%d wrong scores stored, %d not stored.",
+                    len(wrong), len(missing))
+
+        if fix:
+            session.commit()
+            logger.info("All the scores have been stored again.")
+        return len(wrong) == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the scores of the users stored in the database.")
+    parser.add_argument("-c", "--contest-id", action="store", type=int,
+                        help="id of the contest")
+    parser.add_argument("-f", "--fix", action="store_true",
+                        help="store again all the scores, computed from "
+                        "the submissions")
+    args = parser.parse_args()
+
+    if args.contest_id is None:
+        args.contest_id = ask_for_contest()
+
+    success = check(args.contest_id, args.fix)
+    return 0 if success or args.fix else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,14 +26,18 @@ import sys
 from cms import utf8_decoder
 from cms.db import Participation, SessionGen, Submission, Task, User, \
     ask_for_contest
+from cms.grading.scoring import update_task_scores
 
 
 def ask_and_remove(session, submissions):
     ans = input("This will delete %d submissions. Are you sure? [y/N] "
                 % len(submissions)).strip().lower()
     if ans in ["y", "yes"]:
+        pairs = set((submission.participation_id, submission.task_id)
+                    for submission in submissions)
         for submission in submissions:
             session.delete(submission)
+        update_task_scores(session, pairs)
         session.commit()
         print("Deleted.")
     else:
@@ -43,7 +43,7 @@ from cms.db import SessionGen, Contest, ask_for_contest, Submission, \
     Participation, get_submissions
 from cms.db.filecacher import FileCacher
 from cms.grading import languagemanager
-from cms.grading.scoring import task_score
+from cms.grading.scoring import get_task_scores
 
 
 logger = logging.getLogger(__name__)
@@ -161,7 +161,9 @@ class SpoolExporter:
                                  "wt", encoding="utf-8") as res2_file:
                         total = 0.0
                         for evaluation in result.evaluations:
-                            outcome = float(evaluation.outcome)
+                            # Skipped evaluations have no outcome.
+                            outcome = float(evaluation.outcome) \
+                                if evaluation.outcome is not None else 0.0
                             total += outcome
                             line = (
                                 "Executing on file with codename '%s' %s (%.4f)"
@@ -191,12 +193,15 @@ class SpoolExporter:
                            if not participation.hidden))
             for task in self.contest.tasks)
 
+        all_task_scores = get_task_scores(self.contest.sa_session,
+                                          self.contest)
         is_partial = False
         for task in self.contest.tasks:
             for participation in self.contest.participations:
                 if participation.hidden:
                     continue
-                score, partial = task_score(participation, task)
+                score, partial, _, _ = \
+                    all_task_scores[(participation.id, task.id)]
                 is_partial = is_partial or partial
                 task_scores[task.id][participation.user.username] = score
                 scores[participation.user.username] += score
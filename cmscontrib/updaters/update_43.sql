@@ -0,0 +1,16 @@
+begin;
+
+create table participation_task_scores (
+    participation_id integer not null references participations(id) on update cascade on delete cascade,
+    task_id integer not null references tasks(id) on update cascade on delete cascade,
+    dataset_id integer not null references datasets(id) on update cascade on delete cascade,
+    score double precision not null,
+    public_score double precision not null,
+    tokened_score double precision not null,
+    partial boolean not null,
+    primary key (participation_id, task_id)
+);
+create index ix_participation_task_scores_task_id on participation_task_scores (task_id);
+create index ix_participation_task_scores_dataset_id on participation_task_scores (dataset_id);
+
+rollback; -- change this to: commit;
@@ -21,7 +21,6 @@
 
 import heapq
 import logging
-from itertools import zip_longest
 
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
@@ -34,30 +33,62 @@ class NumberSet:
     """A fast data structure on numbers.
 
     It supports:
-    - inserting a value
-    - removing a value
-    - querying the maximum value
+    - inserting a value, in O(log n)
+    - removing a value, in O(1)
+    - querying the maximum value, in amortized O(log n)
 
     It can hold the same value multiple times.
 
-    This data structure could be implemented with a binary tree, but
-    at the moment we're actually using a standard python list.
+    The multiplicities of the values are kept in a dict, and the
+    distinct values in a binary heap (of their opposites, as heapq
+    gives the minimum). Removed values are left in the heap and
+    discarded when they reach its top.
 
     """
     def __init__(self):
-        self._impl = list()
+        # The number of times each value is in the set.
+        self._counts = dict()
+        self._len = 0
+        # The opposites of the values in the heap (which may not be
+        # in the set anymore) and, to push each of them only once,
+        # the values themselves.
+        self._heap = list()
+        self._in_heap = set()
+
+    def __len__(self):
+        return self._len
 
     def insert(self, val):
-        self._impl.append(val)
+        self._counts[val] = self._counts.get(val, 0) + 1
+        self._len += 1
+        if val not in self._in_heap:
+            self._in_heap.add(val)
+            heapq.heappush(self._heap, -val)
 
     def remove(self, val):
-        self._impl.remove(val)
+        count = self._counts.get(val, 0)
+        if count == 0:
+            raise ValueError("NumberSet.remove(x): x not in set")
+        if count == 1:
+            del self._counts[val]
+        else:
+            self._counts[val] = count - 1
+        self._len -= 1
+
+    def maximum(self, default=None):
+        """Return the maximum value, or default if the set is empty."""
+        while len(self._heap) > 0 and -self._heap[0] not in self._counts:
+            self._in_heap.discard(-heapq.heappop(self._heap))
+        return -self._heap[0] if len(self._heap) > 0 else default
 
     def query(self):
-        return max(self._impl + [0.0])
+        return max(self.maximum(0.0), 0.0)
 
     def clear(self):
-        del self._impl[:]
+        self._counts.clear()
+        self._len = 0
+        del self._heap[:]
+        self._in_heap.clear()
 
 
 class Score:
@@ -75,6 +106,12 @@ class Score:
     # but cms assures that the order in which the subchanges have to
     # be processed is the ascending order of their keys (actually,
     # this is enforced only for subchanges with the same time).
+
+    # Minimum number of changes between two checkpoints; they are also
+    # at least as many as the submissions, so that the checkpoints do
+    # not take more memory than the changes.
+    CHECKPOINT_INTERVAL = 32
+
     def __init__(self, score_mode):
         # The submissions in their current status.
         self._submissions = dict()
@@ -85,6 +122,13 @@ class Score:
         # The set of the scores of the currently released submissions.
         self._released = NumberSet()
 
+        # Only for SCORE_MODE_MAX, the set of the scores of all the
+        # submissions and, only for SCORE_MODE_MAX_SUBTASK, the sets of
+        # their scores on each subtask (there are as many as the
+        # subtasks of the submission with the most of them).
+        self._scores = NumberSet()
+        self._subtask_scores = list()
+
         # The last submitted submission (with at least one subchange).
         self._last = None
 
@@ -92,6 +136,23 @@ class Score:
         # object).
         self._history = list()
 
+        # For each change applied (they are the first ones of
+        # _changes), the state it overwrote, as a tuple (submission
+        # key, score, token, extra, last submission, length of the
+        # history), so that the last changes can be undone.
+        self._undo = list()
+
+        # The state after applying some of the changes, as tuples
+        # (number of changes applied, length of the history, last
+        # submission, {key: (score, token, extra)}). A change in the
+        # middle of the list requires to apply again only the changes
+        # after it (undoing them first) or after the checkpoint before
+        # it, whichever is faster. After the score mode changes, the
+        # history does not match the one computed from scratch, so
+        # neither is used until it is reset.
+        self._checkpoints = list()
+        self._replayable = True
+
         self._score_mode = score_mode
 
     def append_change(self, change):
@@ -100,31 +161,35 @@ class Score:
         # it's the last. Compute the new score and, if it changed,
         # append it to the history.
         s_id = change.submission
-        if self._submissions[s_id].token:
-            self._released.remove(self._submissions[s_id].score)
+        submission = self._submissions[s_id]
+        self._undo.append((s_id, submission.score, submission.token,
+                           submission.extra, self._last,
+                           len(self._history)))
+        self._remove_scores(submission)
+        if submission.token:
+            self._released.remove(submission.score)
         if change.score is not None:
-            self._submissions[s_id].score = change.score
+            submission.score = change.score
         if change.token is not None:
-            self._submissions[s_id].token = change.token
+            submission.token = change.token
         if change.extra is not None:
-            self._submissions[s_id].extra = change.extra
-        if self._submissions[s_id].token:
-            self._released.insert(self._submissions[s_id].score)
+            submission.extra = change.extra
+        self._add_scores(submission)
+        if submission.token:
+            self._released.insert(submission.score)
         if change.score is not None and \
-                (self._last is None or
-                 self._submissions[s_id].time > self._last.time):
-            self._last = self._submissions[s_id]
+                (self._last is None or submission.time > self._last.time):
+            self._last = submission
 
         if self._score_mode == SCORE_MODE_MAX:
-            score = max((submission.score
-                         for submission in self._submissions.values()),
-                        default=0.0)
+            score = self._scores.maximum(0.0)
         elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
-            scores_by_submission = (map(float, s.extra or [s.score])
-                                    for s in self._submissions.values())
-            scores_by_subtask = zip_longest(*scores_by_submission,
-                                            fillvalue=0.0)
-            score = float(sum(max(s) for s in scores_by_subtask))
+            # The submissions without a score on a subtask count as 0.
+            count = len(self._submissions)
+            score = float(sum(
+                scores.maximum() if len(scores) == count
+                else max(scores.maximum(), 0.0)
+                for scores in self._subtask_scores))
         elif self._score_mode == SCORE_MODE_MAX_TOKENED_LAST:
             score = max(self._released.query(),
                         self._last.score if self._last is not None else 0.0)
@@ -134,29 +199,133 @@ class Score:
         if score != self.get_score():
             self._history.append((change.time, score))
 
+        if self._replayable:
+            last_checkpoint = self._checkpoints[-1][0] \
+                if len(self._checkpoints) > 0 else 0
+            if len(self._undo) - last_checkpoint >= \
+                    max(self.CHECKPOINT_INTERVAL, len(self._submissions)):
+                self._checkpoints.append((
+                    len(self._undo), len(self._history), self._last,
+                    dict((key, (sub.score, sub.token, sub.extra))
+                         for key, sub in self._submissions.items())))
+
     def get_score(self):
         return self._history[-1][1] if len(self._history) > 0 else 0.0
 
+    def _add_scores(self, submission):
+        # Add the current scores of the submission to the sets.
+        if self._score_mode == SCORE_MODE_MAX:
+            self._scores.insert(submission.score)
+        elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
+            for i, score in enumerate(map(float, submission.extra
+                                          or [submission.score])):
+                if i == len(self._subtask_scores):
+                    self._subtask_scores.append(NumberSet())
+                self._subtask_scores[i].insert(score)
+
+    def _remove_scores(self, submission):
+        # Remove the current scores of the submission from the sets.
+        if self._score_mode == SCORE_MODE_MAX:
+            self._scores.remove(submission.score)
+        elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
+            for i, score in enumerate(map(float, submission.extra
+                                          or [submission.score])):
+                self._subtask_scores[i].remove(score)
+            while len(self._subtask_scores) > 0 \
+                    and len(self._subtask_scores[-1]) == 0:
+                self._subtask_scores.pop()
+
+    def _reset_scores(self):
+        # Fill the sets again with the current scores of all the
+        # submissions.
+        self._scores.clear()
+        del self._subtask_scores[:]
+        for submission in self._submissions.values():
+            self._add_scores(submission)
+
     def reset_history(self):
         # Delete everything except the submissions and the subchanges.
         self._last = None
         self._released.clear()
         del self._history[:]
+        del self._undo[:]
+        del self._checkpoints[:]
+        self._replayable = True
 
         # Reset the submissions at their default value.
         for sub in self._submissions.values():
             sub.score = 0.0
             sub.token = False
             sub.extra = list()
+        self._reset_scores()
 
         # Append each change, one at a time.
         for change in self._changes:
             self.append_change(change)
 
+    def replay_history(self, index):
+        # Apply again the changes starting from the given position in
+        # the list (the first one that is new or different), after
+        # bringing the state back to before it (undoing the following
+        # changes), or to the last checkpoint before it (restoring it
+        # costs about as much as applying a change for each
+        # submission), or to the beginning.
+        if not self._replayable:
+            self.reset_history()
+            return
+        while len(self._checkpoints) > 0 and \
+                self._checkpoints[-1][0] > index:
+            self._checkpoints.pop()
+        last_checkpoint = self._checkpoints[-1][0] \
+            if len(self._checkpoints) > 0 else 0
+
+        if len(self._undo) - index <= \
+                index - last_checkpoint + len(self._submissions):
+            self._undo_changes(index)
+        elif len(self._checkpoints) > 0:
+            self._restore_checkpoint()
+        else:
+            self.reset_history()
+            return
+
+        for change in self._changes[len(self._undo):]:
+            self.append_change(change)
+
+    def _undo_changes(self, index):
+        # Undo the changes applied after the given position.
+        while len(self._undo) > index:
+            s_id, score, token, extra, self._last, history_len = \
+                self._undo.pop()
+            sub = self._submissions[s_id]
+            self._remove_scores(sub)
+            if sub.token:
+                self._released.remove(sub.score)
+            sub.score, sub.token, sub.extra = score, token, extra
+            self._add_scores(sub)
+            if sub.token:
+                self._released.insert(sub.score)
+            del self._history[history_len:]
+
+    def _restore_checkpoint(self):
+        # Bring the state back to the last checkpoint.
+        applied, history_len, self._last, states = self._checkpoints[-1]
+        del self._undo[applied:]
+        del self._history[history_len:]
+
+        # The submissions created after the checkpoint had no changes
+        # before it.
+        self._released.clear()
+        for key, sub in self._submissions.items():
+            sub.score, sub.token, sub.extra = \
+                states.get(key, (0.0, False, list()))
+            if sub.token:
+                self._released.insert(sub.score)
+        self._reset_scores()
+
     def create_subchange(self, key, subchange):
         # Insert the subchange at the right position inside the
         # (sorted) list and call the appropriate method (append_change
-        # or reset_history)
+        # or replay_history)
         if len(self._changes) == 0 or \
                 subchange.time > self._changes[-1].time or \
                 (subchange.time == self._changes[-1].time and
@@ -164,37 +333,45 @@ class Score:
             self._changes.append(subchange)
             self.append_change(subchange)
         else:
-            for idx, val in enumerate(self._changes):
-                if subchange.time < val.time or \
-                   (subchange.time == val.time and subchange.key < val.key):
-                    self._changes.insert(idx, subchange)
-                    break
-            self.reset_history()
-            logger.info("Reset history for user '%s' and task '%s' after "
+            # Look for the position from the end, since the subchanges
+            # usually arrive just a bit late.
+            idx = len(self._changes)
+            while idx > 0 and \
+                    (subchange.time < self._changes[idx - 1].time or
+                     (subchange.time == self._changes[idx - 1].time and
+                      subchange.key < self._changes[idx - 1].key)):
+                idx -= 1
+            self._changes.insert(idx, subchange)
+            self.replay_history(idx)
+            logger.info("Replayed history for user '%s' and task '%s' after "
                         "creating subchange '%s' for submission '%s'",
                         self._submissions[subchange.submission].user,
                         self._submissions[subchange.submission].task,
                         key, subchange.submission)
 
     def update_subchange(self, key, subchange):
-        # Update the subchange inside the (sorted) list and,
-        # regardless of its position in that list, reset the history.
+        # Update the subchange inside the (sorted) list, keeping its
+        # position, and replay the history from there.
+        index = len(self._changes)
         for i in range(len(self._changes)):
             if self._changes[i].key == key:
                 self._changes[i] = subchange
-        self.reset_history()
-        logger.info("Reset history for user '%s' and task '%s' after "
+                index = min(index, i)
+        self.replay_history(index)
+        logger.info("Replayed history for user '%s' and task '%s' after "
                     "creating subchange '%s' for submission '%s'",
                     self._submissions[subchange.submission].user,
                     self._submissions[subchange.submission].task,
                     key, subchange.submission)
 
     def delete_subchange(self, key):
-        # Delete the subchange from the (sorted) list and reset the
-        # history.
+        # Delete the subchange from the (sorted) list and replay the
+        # history from its position.
+        index = next((i for i, c in enumerate(self._changes) if c.key == key),
+                     len(self._changes))
         self._changes = [c for c in self._changes if c.key != key]
-        self.reset_history()
-        logger.info("Reset history after deleting subchange '%s'", key)
+        self.replay_history(index)
+        logger.info("Replayed history after deleting subchange '%s'", key)
 
     def create_submission(self, key, submission):
         # A new submission never triggers an update in the history,
@@ -203,6 +380,7 @@ class Score:
         submission.token = False
         submission.extra = list()
         self._submissions[key] = submission
+        self._add_scores(submission)
 
     def update_submission(self, key, submission):
         # An updated submission may cause an update in history because
@@ -222,7 +400,11 @@ class Score:
             self.reset_history()
 
     def update_score_mode(self, score_mode):
-        self._score_mode = score_mode
+        if score_mode != self._score_mode:
+            self._score_mode = score_mode
+            self._reset_scores()
+            del self._checkpoints[:]
+            self._replayable = False
 
 
 class ScoringStore:
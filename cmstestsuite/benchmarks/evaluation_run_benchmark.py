@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the evaluation of many small testcases.
+
+Evaluates a trivial Python solution (copying the input to the output)
+on a number of small testcases with the Batch task type, first with a
+sandbox for each testcase (as the Worker does by default), then in
+runs sharing a sandbox (see evaluation_run_size). Uses the sandbox
+implementation in the configuration (which for isolate needs it to be
+installed), and a file cacher backed by a temporary directory.
+
+"""
+
+import gevent.monkey
+gevent.monkey.patch_all()  # noqa
+
+import argparse
+import io
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+from cms.db import Executable
+from cms.db.filecacher import FileCacher
+from cms.grading.Job import EvaluationJob
+from cms.grading.tasktypes.Batch import Batch
+
+
+logger = logging.getLogger(__name__)
+
+
+LANGUAGE = "Python 3 / CPython"
+PARAMETERS = ["alone", ["", ""], "diff"]
+SOLUTION = b"import sys\nsys.stdout.write(sys.stdin.read())\n"
+
+
+def make_executable():
+    """Return the content of the executable of the solution.
+
+    return (bytes): a zip archive runnable by the Python interpreter.
+
+    """
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr("__main__.py", SOLUTION)
+    return buf.getvalue()
+
+
+def make_jobs(file_cacher, testcases, size):
+    """Return the evaluation jobs of the solution on random testcases.
+
+    file_cacher (FileCacher): where to store the files.
+    testcases (int): number of testcases.
+    size (int): size of each testcase, in bytes.
+
+    return ([EvaluationJob]): the jobs.
+
+    """
+    executable_digest = file_cacher.put_file_content(
+        make_executable(), "Benchmark executable")
+    jobs = []
+    for i in range(testcases):
+        content = b"".join(b"%d\n" % random.randrange(10 ** 6)
+                           for _ in range(size // 7 + 1))
+        digest = file_cacher.put_file_content(content, "Testcase %d" % i)
+        jobs.append(EvaluationJob(
+            task_type="Batch", task_type_parameters=PARAMETERS,
+            language=LANGUAGE,
+            executables={"sol": Executable("sol", executable_digest)},
+            input=digest, output=digest, time_limit=1.0,
+            memory_limit=256 * 1024 * 1024, info="testcase %d" % i))
+    return jobs
+
+
+def measure(file_cacher, jobs, run_size):
+    """Evaluate the jobs and return the time it took.
+
+    file_cacher (FileCacher): the file cacher with the files.
+    jobs ([EvaluationJob]): the jobs to evaluate.
+    run_size (int): number of jobs to evaluate in the same sandbox
+        (1 to call evaluate on each job).
+
+    return (float): the time, in seconds.
+
+    raise (AssertionError): if an evaluation did not succeed.
+
+    """
+    task_type = Batch(PARAMETERS)
+    start = time.monotonic()
+    if run_size <= 1:
+        for job in jobs:
+            task_type.evaluate(job, file_cacher)
+    else:
+        for i in range(0, len(jobs), run_size):
+            task_type.evaluate_many(jobs[i:i + run_size], file_cacher)
+    elapsed = time.monotonic() - start
+    for job in jobs:
+        assert job.success and job.outcome == "1.0", \
+            "Unexpected result for %s: %s." % (job.info, job.text)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the evaluation of many small testcases.")
+    parser.add_argument(
+        "-n", "--testcases", action="store", type=int, default=200,
+        help="number of testcases (default 200)")
+    parser.add_argument(
+        "-s", "--size", action="store", type=int, default=4096,
+        help="size of each testcase in bytes (default 4096)")
+    parser.add_argument(
+        "-r", "--run-size", action="store", type=int, default=25,
+        help="number of testcases sharing a sandbox (default 25)")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        file_cacher = FileCacher(path=os.path.join(path, "storage"))
+        single = measure(
+            file_cacher, make_jobs(file_cacher, args.testcases, args.size), 1)
+        runs = measure(
+            file_cacher, make_jobs(file_cacher, args.testcases, args.size),
+            args.run_size)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    logger.info("One sandbox per testcase: %.2f ms per testcase.",
+                1000 * single / args.testcases)
+    logger.info("Runs of %d testcases: %.2f ms per testcase (%.1fx).",
+                args.run_size, 1000 * runs / args.testcases, single / runs)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
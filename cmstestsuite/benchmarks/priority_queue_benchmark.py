@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the priority queue of the triggered services.
+
+For each size, fills a queue with ES evaluation operations (as the
+sweeper does), then measures membership tests, removals and
+extractions in batches (as the executor of ES does), one item at a
+time and with the bulk methods. Also reports the memory used by the
+queue, as measured by tracemalloc.
+
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+import tracemalloc
+
+from cms.io import PriorityQueue
+from cms.service.esoperations import ESOperation
+from cmscommon.datetime import make_datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+# Operations extracted at a time, as EvaluationExecutor does at most.
+BATCH_SIZE = 25
+
+
+def make_entries(size):
+    """Return evaluation operations with random priority and timestamp.
+
+    size (int): the number of operations.
+
+    return ([(ESOperation, int, datetime)]): the operations (for
+        submissions with 100 testcases), with their priority and
+        timestamp, in random order as returned by the sweeper.
+
+    """
+    entries = [(ESOperation(ESOperation.EVALUATION, i // 100, 1,
+                            "%03d" % (i % 100)),
+                random.choice([PriorityQueue.PRIORITY_MEDIUM,
+                               PriorityQueue.PRIORITY_LOW]),
+                make_datetime(1_500_000_000 + i // 100))
+               for i in range(size)]
+    random.shuffle(entries)
+    return entries
+
+
+def timed(function, *args):
+    """Call a function and return the time it took.
+
+    return (float): the time, in seconds.
+
+    """
+    start = time.monotonic()
+    function(*args)
+    return time.monotonic() - start
+
+
+def push_one_by_one(queue, entries):
+    for item, priority, timestamp in entries:
+        queue.push(item, priority, timestamp)
+
+
+def contains(queue, items):
+    for item in items:
+        assert item in queue
+
+
+def remove_one_by_one(queue, items):
+    for item in items:
+        queue.remove(item)
+
+
+def pop_one_by_one(queue, batches):
+    for _ in range(batches):
+        for _ in range(BATCH_SIZE):
+            queue.pop()
+
+
+def pop_in_batches(queue, batches):
+    for _ in range(batches):
+        queue.pop_many(BATCH_SIZE)
+
+
+def measure(size):
+    """Run the benchmark on a queue of the given size.
+
+    size (int): the number of entries.
+
+    """
+    entries = make_entries(size)
+    sample = [item for item, _, _ in random.sample(entries, size // 10)]
+    batches = size // 10 // BATCH_SIZE
+
+    tracemalloc.start()
+    queue = PriorityQueue()
+    queue.push_many(entries)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    queue = PriorityQueue()
+    push_many = timed(queue.push_many, entries)
+    single = PriorityQueue()
+    push_single = timed(push_one_by_one, single, entries)
+    contains_time = timed(contains, queue, sample)
+    remove_many = timed(queue.remove_many, sample)
+    remove_single = timed(remove_one_by_one, single, sample)
+    pop_many = timed(pop_in_batches, queue, batches)
+    pop_single = timed(pop_one_by_one, single, batches)
+
+    logger.info("%d entries, %.0f bytes per entry.", size, memory / size)
+    logger.info("  push:     %8.3f s one by one, %8.3f s with push_many.",
+                push_single, push_many)
+    logger.info("  contains: %8.3f us per lookup.",
+                1_000_000 * contains_time / len(sample))
+    logger.info("  remove:   %8.3f s one by one, %8.3f s with remove_many "
+                "(%d entries).", remove_single, remove_many, len(sample))
+    logger.info("  pop:      %8.3f s one by one, %8.3f s with pop_many "
+                "(%d batches of %d).", pop_single, pop_many, batches,
+                BATCH_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the priority queue of triggered services.")
+    parser.add_argument(
+        "-s", "--sizes", action="store", type=int, nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="numbers of entries (default 10^4, 10^5, 10^6)")
+    args = parser.parse_args()
+
+    random.seed(0)
+    for size in args.sizes:
+        measure(size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the computation of the scores in RWS.
+
+Generates a contest (submissions with their score and maybe a token,
+with the subchanges that ProxyService sends) and, for each score mode:
+- loads it into a ScoringStore, as RWS does at startup, with the
+  subchanges in order of time;
+- optionally, sends the subchanges one submission after the other
+  (score and token) instead, as ProxyService does when reinitialized,
+  so that many of them arrive after later ones;
+- rejudges some submissions, in order, updating their score
+  subchanges (which are in the middle of the history).
+Reports the time per subchange and the number of score changes in the
+global history.
+
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+
+import cmsranking.Logger  # noqa
+from cmsranking.Scoring import ScoringStore
+from cmsranking.Store import Store
+from cmsranking.Subchange import Subchange
+from cmsranking.Submission import Submission
+from cmsranking.Task import Task
+from cmscommon.constants import \
+    SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
+
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between two submissions of a user on a task.
+SUBMISSION_INTERVAL = 60
+# Fraction of the submissions with a token, and maximum delay of the
+# token after the submission, in seconds.
+TOKEN_PROBABILITY = 0.5
+MAX_TOKEN_DELAY = 3600
+
+
+def make_entity(entity, key, data):
+    item = entity()
+    item.set(data)
+    item.key = key
+    return item
+
+
+def make_score_subchange(submission_key, when, subtasks):
+    extra = [random.choice([0.0, 100.0 / subtasks])
+             for _ in range(subtasks)]
+    return {"submission": submission_key, "time": when,
+            "score": sum(extra), "extra": ["%g" % e for e in extra]}
+
+
+def make_contest(score_mode, users, tasks, subchanges, subtasks):
+    """Return the data of a random contest.
+
+    score_mode (str): the score mode of all the tasks.
+    users (int): the number of users.
+    tasks (int): the number of tasks.
+    subchanges (int): the total number of subchanges (about).
+    subtasks (int): the number of subtasks of each task.
+
+    return ({str: Task}, {str: Submission}, [Subchange]): the tasks
+        and the submissions, by key, and the subchanges, in the order
+        in which ProxyService sends them when reinitialized.
+
+    """
+    task_entities = dict()
+    for t in range(tasks):
+        task_entities["t%d" % t] = make_entity(Task, "t%d" % t, {
+            "name": "Task %d" % t, "short_name": "t%d" % t, "contest": "c",
+            "max_score": 100.0, "score_precision": 0,
+            "extra_headers": ["Subtask %d" % i for i in range(subtasks)],
+            "order": t, "score_mode": score_mode})
+
+    pairs = [("u%d" % u, "t%d" % t)
+             for u in range(users) for t in range(tasks)]
+    submissions = dict()
+    changes = list()
+    i = 0
+    while len(changes) < subchanges:
+        user, task = pairs[i % len(pairs)]
+        when = 1_500_000_000 + (i // len(pairs)) * SUBMISSION_INTERVAL
+        key = "%d" % i
+        submissions[key] = make_entity(
+            Submission, key, {"user": user, "task": task, "time": when})
+        # Keys as generated by ProxyService.
+        changes.append(make_entity(
+            Subchange, "%d%ss" % (when, key),
+            make_score_subchange(key, when, subtasks)))
+        if random.random() < TOKEN_PROBABILITY:
+            token_time = when + random.randint(1, MAX_TOKEN_DELAY)
+            changes.append(make_entity(
+                Subchange, "%d%st" % (token_time, key),
+                {"submission": key, "time": token_time, "token": True}))
+        i += 1
+    return task_entities, submissions, changes
+
+
+def measure(score_mode, users, tasks, subchanges, subtasks, by_submission,
+            rejudged):
+    """Run the benchmark for a score mode.
+
+    score_mode (str): the score mode of the tasks.
+    users (int): the number of users.
+    tasks (int): the number of tasks.
+    subchanges (int): the number of subchanges.
+    subtasks (int): the number of subtasks of each task.
+    by_submission (bool): whether the subchanges arrive one submission
+        after the other instead of in order of time.
+    rejudged (float): the fraction of submissions to rejudge.
+
+    """
+    random.seed(0)
+    task_entities, submissions, changes = make_contest(
+        score_mode, users, tasks, subchanges, subtasks)
+
+    stores = dict()
+    stores["subchange"] = Store(Subchange, None, stores)
+    stores["submission"] = Store(Submission, None, stores)
+    stores["task"] = Store(Task, None, stores)
+    stores["task"]._store.update(task_entities)
+    stores["submission"]._store.update(submissions)
+    scoring = ScoringStore(stores)
+
+    start = time.monotonic()
+    if by_submission:
+        scoring.init_store()
+        for change in changes:
+            stores["subchange"]._store[change.key] = change
+            scoring.create_subchange(change.key, change)
+    else:
+        stores["subchange"]._store.update(
+            (change.key, change) for change in changes)
+        scoring.init_store()
+    elapsed = time.monotonic() - start
+    history = sum(1 for _ in scoring.get_global_history())
+    logger.info("%-16s %s: %d subchanges in %.3f s (%.2f us each), "
+                "%d score changes.", score_mode,
+                "by submission" if by_submission else "in order",
+                len(changes), elapsed, 1_000_000 * elapsed / len(changes),
+                history)
+
+    rejudge = [change for change in changes
+               if change.score is not None and random.random() < rejudged]
+    start = time.monotonic()
+    for old_change in rejudge:
+        change = make_entity(Subchange, old_change.key, make_score_subchange(
+            old_change.submission, old_change.time, subtasks))
+        stores["subchange"]._store[change.key] = change
+        scoring.update_subchange(change.key, old_change, change)
+    elapsed = time.monotonic() - start
+    history = sum(1 for _ in scoring.get_global_history())
+    logger.info("%-16s rejudge: %d subchanges in %.3f s (%.2f us each), "
+                "%d score changes.", score_mode, len(rejudge), elapsed,
+                1_000_000 * elapsed / max(1, len(rejudge)), history)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the computation of the scores in RWS.")
+    parser.add_argument(
+        "-n", "--subchanges", action="store", type=int, default=200_000,
+        help="number of subchanges (default 200000)")
+    parser.add_argument(
+        "-u", "--users", action="store", type=int, default=100,
+        help="number of users (default 100)")
+    parser.add_argument(
+        "-t", "--tasks", action="store", type=int, default=5,
+        help="number of tasks (default 5)")
+    parser.add_argument(
+        "-s", "--subtasks", action="store", type=int, default=5,
+        help="number of subtasks of each task (default 5)")
+    parser.add_argument(
+        "-b", "--by-submission", action="store_true",
+        help="send the subchanges one submission after the other")
+    parser.add_argument(
+        "-r", "--rejudged", action="store", type=float, default=0.01,
+        help="fraction of submissions to rejudge (default 0.01)")
+    args = parser.parse_args()
+
+    for score_mode in [SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK,
+                       SCORE_MODE_MAX_TOKENED_LAST]:
+        measure(score_mode, args.users, args.tasks, args.subchanges,
+                args.subtasks, args.by_submission, args.rejudged)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
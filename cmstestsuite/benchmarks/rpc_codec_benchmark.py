@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the encodings of the RPC messages.
+
+Encodes and decodes the largest messages exchanged by ES and the
+Workers (a group of evaluation jobs, sent to a Worker and back with
+the results, also in the format of older versions, without shared
+blocks) and the response to queue_status, with the JSON lines
+protocol and with frames for each available codec, with and without
+compression. Reports the time per message and its size on the wire.
+
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+
+from cms.db import Executable, File, Manager
+from cms.grading.Job import EvaluationJob, JobGroup
+from cms.io import PriorityQueue
+from cms.io.rpccodec import CODECS, FRAME_HEADER, JSONCodec, \
+    decode_frame_payload, encode_frame
+from cms.service.esoperations import ESOperation
+from cmscommon.datetime import make_datetime
+from cmscommon.digest import bytes_digest
+
+
+logger = logging.getLogger(__name__)
+
+
+# Jobs in a group, as sent by EvaluationExecutor at most.
+JOBS_PER_GROUP = 25
+
+
+def digest(*args):
+    return bytes_digest(repr(args).encode("utf-8"))
+
+
+def make_job_group(with_results, shared=True):
+    """Return the message sending a group of jobs to a Worker.
+
+    with_results (bool): whether to fill the results, as in the
+        response of the Worker.
+    shared (bool): whether to export the group with the data common
+        to the jobs in shared blocks (as JobGroup.export_to_dict
+        does), or with all the data in each job (as older versions
+        did).
+
+    return (dict): the request (or response) of execute_job_group for
+        the evaluation of a submission of a Batch task with grader
+        (in C++ and Java), on JOBS_PER_GROUP testcases.
+
+    """
+    jobs = []
+    for i in range(JOBS_PER_GROUP):
+        codename = "%03d" % i
+        job = EvaluationJob(
+            operation=ESOperation(ESOperation.EVALUATION, 1234, 56,
+                                  codename),
+            task_type="Batch",
+            task_type_parameters=["grader", ["input.txt", "output.txt"],
+                                  "comparator"],
+            language="C++17 / g++",
+            info="evaluate submission 1234 on testcase %s" % codename,
+            files={"task.%l": File("task.%l", digest("file"))},
+            managers={name: Manager(name, digest(name))
+                      for name in ["checker", "grader.cpp", "grader.java",
+                                   "task.h", "task.java", "stub.cpp"]},
+            executables={"task": Executable("task", digest("task"))},
+            input=digest("input", i),
+            output=digest("output", i),
+            time_limit=1.0,
+            memory_limit=256 * 1024 * 1024)
+        if with_results:
+            job.success = True
+            job.outcome = "1.0"
+            job.text = ["Output is correct"]
+            job.plus = {"execution_time": 0.123,
+                        "execution_wall_clock_time": 0.234,
+                        "execution_memory": 12_345_678,
+                        "exit_status": "ok",
+                        "tombstone": None}
+            job.sandboxes = ["/tmp/cms-sandbox-%d" % i]
+        jobs.append(job)
+    if shared:
+        job_group_dict = JobGroup(jobs).export_to_dict()
+    else:
+        job_group_dict = {"jobs": [job.export_to_dict() for job in jobs]}
+    return {"__id": "0123456789abcdef0123456789abcdef",
+            "__method": "execute_job_group",
+            "__data": {"job_group_dict": job_group_dict}}
+
+
+def make_queue_status(size):
+    """Return the response to queue_status of a busy ES.
+
+    size (int): the number of submissions in the queue.
+
+    return (dict): the response, with an entry for each submission.
+
+    """
+    queue = PriorityQueue()
+    for i in range(size):
+        queue.push(ESOperation(ESOperation.EVALUATION, i, 56, "000"),
+                   random.choice([PriorityQueue.PRIORITY_MEDIUM,
+                                  PriorityQueue.PRIORITY_LOW]),
+                   make_datetime(1_500_000_000 + i))
+    entries = queue.get_status()
+    for entry in entries:
+        entry["item"]["multiplicity"] = random.randint(1, 100)
+    return {"__id": "0123456789abcdef0123456789abcdef",
+            "__data": entries,
+            "__error": None}
+
+
+def timed(repetitions, function, *args):
+    """Return the average time of some calls to a function.
+
+    return (float): the time per call, in seconds.
+
+    """
+    start = time.monotonic()
+    for _ in range(repetitions):
+        function(*args)
+    return (time.monotonic() - start) / repetitions
+
+
+def encode_line(message):
+    return JSONCodec.encode(message) + b"\r\n"
+
+
+def decode_line(data):
+    return JSONCodec.decode(data)
+
+
+def make_frame_functions(codec, compression_min_size):
+    def encode(message):
+        return encode_frame(codec.encode(message), compression_min_size)
+
+    def decode(frame):
+        flags, _ = FRAME_HEADER.unpack(frame[:FRAME_HEADER.size])
+        return codec.decode(decode_frame_payload(
+            flags, frame[FRAME_HEADER.size:], len(frame) * 1000))
+
+    return encode, decode
+
+
+def measure(name, message, repetitions):
+    """Run the benchmark on a message.
+
+    name (str): the description of the message.
+    message (object): the message.
+    repetitions (int): how many times to encode and decode it.
+
+    """
+    protocols = [("json lines", encode_line, decode_line)]
+    for codec in CODECS.values():
+        protocols.append(("%s frame" % codec.name,)
+                         + make_frame_functions(codec, None))
+        protocols.append(("%s frame+zlib" % codec.name,)
+                         + make_frame_functions(codec, 0))
+
+    logger.info("%s:", name)
+    for protocol, encode, decode in protocols:
+        data = encode(message)
+        assert decode(data) == decode_line(encode_line(message))
+        encode_time = timed(repetitions, encode, message)
+        decode_time = timed(repetitions, decode, data)
+        logger.info("  %-20s %9d bytes, encode %8.3f ms, decode %8.3f ms.",
+                    protocol, len(data), 1000 * encode_time,
+                    1000 * decode_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the encodings of the RPC messages.")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=100,
+        help="times each message is encoded and decoded (default 100)")
+    parser.add_argument(
+        "-q", "--queue-size", action="store", type=int, default=10_000,
+        help="submissions in the queue for queue_status (default 10^4)")
+    args = parser.parse_args()
+
+    random.seed(0)
+    measure("execute_job_group request (without shared blocks)",
+            make_job_group(False, shared=False), args.repetitions)
+    measure("execute_job_group request", make_job_group(False),
+            args.repetitions)
+    measure("execute_job_group response", make_job_group(True),
+            args.repetitions)
+    measure("queue_status response (%d submissions)" % args.queue_size,
+            make_queue_status(args.queue_size),
+            max(1, args.repetitions // 10))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the creation and deletion of sandboxes.
+
+Measures the latency of create_sandbox and delete_sandbox, as seen by a
+task type, without and with a pool of sandboxes initialized in
+advance. Uses the sandbox implementation in the configuration (which
+for isolate needs it to be installed).
+
+"""
+
+import gevent.monkey
+gevent.monkey.patch_all()  # noqa
+
+import argparse
+import logging
+import statistics
+import sys
+import time
+
+import gevent
+
+from cms.db.filecacher import FileCacher
+from cms.grading.sandboxpool import SandboxPool
+from cms.grading.tasktypes.util import create_sandbox, delete_sandbox, \
+    set_sandbox_pool
+
+
+logger = logging.getLogger(__name__)
+
+
+def measure(file_cacher, iterations, work_time):
+    """Create, use and delete a number of sandboxes.
+
+    file_cacher (FileCacher): the file cacher of the sandboxes.
+    iterations (int): number of sandboxes.
+    work_time (float): seconds each sandbox is "used" for.
+
+    return (([float], [float])): the latencies of each creation and
+        deletion, in seconds.
+
+    """
+    create_times = []
+    delete_times = []
+    for _ in range(iterations):
+        start = time.monotonic()
+        sandbox = create_sandbox(file_cacher, "benchmark")
+        create_times.append(time.monotonic() - start)
+        gevent.sleep(work_time)
+        start = time.monotonic()
+        delete_sandbox(sandbox)
+        delete_times.append(time.monotonic() - start)
+    return create_times, delete_times
+
+
+def report(label, create_times, delete_times):
+    logger.info("%s: create %.2f ms (median %.2f ms), "
+                "delete %.2f ms (median %.2f ms).", label,
+                1000 * statistics.mean(create_times),
+                1000 * statistics.median(create_times),
+                1000 * statistics.mean(delete_times),
+                1000 * statistics.median(delete_times))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the setup latency of sandboxes.")
+    parser.add_argument(
+        "-n", "--iterations", action="store", type=int, default=100,
+        help="number of sandboxes to create (default 100)")
+    parser.add_argument(
+        "-w", "--work-time", action="store", type=float, default=0.05,
+        help="seconds each sandbox is kept in use (default 0.05)")
+    parser.add_argument(
+        "-s", "--pool-size", action="store", type=int, default=2,
+        help="number of sandboxes in the pool (default 2)")
+    args = parser.parse_args()
+
+    file_cacher = FileCacher()
+
+    report("Without pool", *measure(file_cacher, args.iterations,
+                                    args.work_time))
+
+    pool = SandboxPool(file_cacher, args.pool_size)
+    set_sandbox_pool(pool)
+    pool.start()
+    try:
+        # Give the pool the time to initialize its sandboxes.
+        while pool.get_status()["ready"] < args.pool_size:
+            gevent.sleep(0.01)
+        report("With pool", *measure(file_cacher, args.iterations,
+                                     args.work_time))
+        logger.info("Pool status: %s.", pool.get_status())
+    finally:
+        set_sandbox_pool(None)
+        pool.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
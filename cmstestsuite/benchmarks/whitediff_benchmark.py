@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the white-diff comparator.
+
+Compares files on disk, as eval_output does, for a few shapes of
+outputs: many short lines, a single huge line, identical files and
+files equal up to whitespaces. Reports the throughput of the current
+algorithm and of the original line-based one.
+
+"""
+
+import argparse
+import logging
+import random
+import sys
+import tempfile
+import time
+
+from cms.grading.steps import _WHITES, _white_diff
+
+
+logger = logging.getLogger(__name__)
+
+
+def _line_based_canonicalize(string):
+    for char in _WHITES[1:]:
+        string = string.replace(char, _WHITES[0])
+    return _WHITES[0].join([x for x in string.split(_WHITES[0])
+                            if len(x) > 0])
+
+
+def line_based_white_diff(output, res):
+    """The original line-based white diff, for comparison."""
+    while True:
+        lout = output.readline()
+        lres = res.readline()
+        if len(lres) == 0 and len(lout) == 0:
+            return True
+        if len(lout) == 0:
+            while len(lres) > 0:
+                if _line_based_canonicalize(lres) != b"":
+                    return False
+                lres = res.readline()
+            return True
+        if len(lres) == 0:
+            while len(lout) > 0:
+                if _line_based_canonicalize(lout) != b"":
+                    return False
+                lout = output.readline()
+            return True
+        if _line_based_canonicalize(lout) != _line_based_canonicalize(lres):
+            return False
+
+
+def make_tokens(size, seed):
+    """Return random numbers separated by spaces, about size bytes."""
+    rng = random.Random(seed)
+    tokens = []
+    length = 0
+    while length < size:
+        token = b"%d" % rng.randint(0, 10 ** 9)
+        tokens.append(token)
+        length += len(token) + 1
+    return tokens
+
+
+def make_cases(size):
+    """Return the pairs of contents to compare.
+
+    size (int): the approximate size of each content, in bytes.
+
+    return ([(str, bytes, bytes)]): name and the two contents.
+
+    """
+    tokens = make_tokens(size, 0)
+    lines = b"\n".join(b" ".join(tokens[i:i + 10])
+                       for i in range(0, len(tokens), 10)) + b"\n"
+    spaced = b"\r\n".join(b"  ".join(tokens[i:i + 10]) + b"\t"
+                          for i in range(0, len(tokens), 10)) + b"\n\n"
+    huge_line = b" ".join(tokens) + b"\n"
+    return [
+        ("identical lines", lines, lines),
+        ("whitespace-equivalent lines", lines, spaced),
+        ("identical huge line", huge_line, huge_line),
+        ("whitespace-equivalent huge line", huge_line,
+         huge_line.replace(b" ", b"\t ")),
+    ]
+
+
+def measure(function, path1, path2, repetitions):
+    """Return the best time of a comparison of two files, in seconds."""
+    best = None
+    for _ in range(repetitions):
+        with open(path1, "rb") as f1, open(path2, "rb") as f2:
+            start = time.monotonic()
+            result = function(f1, f2)
+            elapsed = time.monotonic() - start
+        assert result
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the white-diff comparator.")
+    parser.add_argument(
+        "-s", "--size", action="store", type=int, default=32,
+        help="size of the outputs in MiB (default 32)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=3,
+        help="number of comparisons for each case (default 3)")
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    with tempfile.TemporaryDirectory() as directory:
+        for name, content1, content2 in make_cases(size):
+            path1 = "%s/output" % directory
+            path2 = "%s/correct" % directory
+            with open(path1, "wb") as f:
+                f.write(content1)
+            with open(path2, "wb") as f:
+                f.write(content2)
+            megabytes = (len(content1) + len(content2)) / (1024 * 1024)
+            old = measure(line_based_white_diff, path1, path2,
+                          args.repetitions)
+            new = measure(_white_diff, path1, path2, args.repetitions)
+            logger.info("%s: line-based %.1f MiB/s, chunked %.1f MiB/s.",
+                        name, megabytes / old, megabytes / new)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
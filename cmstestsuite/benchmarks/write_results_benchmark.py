@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of EvaluationService.write_results.
+
+Flushes a number of synthetic evaluation results to the testing
+database (the one used by the unit tests, which is dropped and
+recreated), as ES does when its result cache is full.
+
+"""
+
+import argparse
+import logging
+import sys
+import time
+from unittest.mock import Mock
+
+import gevent.lock
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.db import Session, drop_db, init_db
+from cms.grading.Job import EvaluationJob
+from cms.service.EvaluationService import EvaluationService, Result
+from cms.service.evaluationcache import EvaluationResultCache
+from cms.service.esoperations import ESOperation
+from cms.service.subtaskpolicy import SubtaskEvaluationPolicy
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteResultsBenchmark(DatabaseMixin):
+
+    def __init__(self, num_submissions, num_testcases):
+        self.num_submissions = num_submissions
+        self.num_testcases = num_testcases
+
+    def set_up(self):
+        drop_db()
+        init_db()
+        self.session = Session()
+
+        contest = self.add_contest()
+        participation = self.add_participation(contest=contest)
+        task = self.add_task(contest=contest)
+        self.dataset = self.add_dataset(task=task)
+        task.active_dataset = self.dataset
+        self.testcases = [self.add_testcase(self.dataset)
+                          for _ in range(self.num_testcases)]
+        self.submission_ids = []
+        for _ in range(self.num_submissions):
+            submission, _ = self.add_submission_with_results(
+                task, participation, compilation_outcome="ok")
+            self.session.flush()
+            self.submission_ids.append(submission.id)
+        self.session.commit()
+
+        self.service = EvaluationService.__new__(EvaluationService)
+        self.service.post_finish_lock = gevent.lock.RLock()
+        self.service.evaluation_cache = EvaluationResultCache()
+        self.service.subtask_policy = SubtaskEvaluationPolicy()
+        self.service.evaluation_ended = Mock()
+
+    def tear_down(self):
+        self.session.close()
+        drop_db()
+
+    def results(self):
+        items = []
+        for submission_id in self.submission_ids:
+            for testcase in self.testcases:
+                operation = ESOperation(ESOperation.EVALUATION,
+                                        submission_id, self.dataset.id,
+                                        testcase.codename)
+                job = EvaluationJob(
+                    operation=operation, success=True, outcome="1.0",
+                    text=["Output is correct"], shard=0,
+                    plus={"execution_time": 0.1,
+                          "execution_wall_clock_time": 0.2,
+                          "execution_memory": 1024 * 1024,
+                          "exit_status": "ok"})
+                items.append((operation, Result(job, True)))
+        return items
+
+    def run(self):
+        items = self.results()
+        start = time.monotonic()
+        self.service.write_results(items)
+        elapsed = time.monotonic() - start
+        logger.info("Wrote %d results in %.3f s (%.0f results/s).",
+                    len(items), elapsed, len(items) / elapsed)
+        logger.info("Submission results finalized: %d.",
+                    self.service.evaluation_ended.call_count)
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the DB writes of EvaluationService.")
+    parser.add_argument(
+        "-s", "--submissions", action="store", type=int, default=100,
+        help="number of submissions (default 100)")
+    parser.add_argument(
+        "-t", "--testcases", action="store", type=int, default=100,
+        help="number of testcases per submission (default 100)")
+    args = parser.parse_args()
+
+    benchmark = WriteResultsBenchmark(args.submissions, args.testcases)
+    benchmark.set_up()
+    try:
+        benchmark.run()
+    finally:
+        benchmark.tear_down()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the computation of the scores in RWS."""
+
+import random
+import unittest
+from itertools import zip_longest
+from unittest.mock import patch
+
+from cmsranking.Scoring import NumberSet, Score
+from cmsranking.Subchange import Subchange
+from cmsranking.Submission import Submission
+from cmscommon.constants import \
+    SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
+
+
+SCORE_MODES = [SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK,
+               SCORE_MODE_MAX_TOKENED_LAST]
+
+
+def make_submission(key, time):
+    submission = Submission()
+    submission.set({"user": "u", "task": "t", "time": time})
+    submission.key = key
+    return submission
+
+
+def make_subchange(key, data):
+    subchange = Subchange()
+    subchange.set(data)
+    subchange.key = key
+    return subchange
+
+
+def make_contest(rand, submissions, subchanges):
+    """Return random submissions of a user on a task, and subchanges.
+
+    rand (Random): the source of randomness.
+    submissions (int): the number of submissions.
+    subchanges (int): the number of subchanges.
+
+    return (({str: int}, [Subchange])): the times of the submissions,
+        by key, and the subchanges, in random order.
+
+    """
+    times = dict(("s%d" % i, 10 * i) for i in range(submissions))
+    changes = list()
+    for i in range(subchanges):
+        submission = rand.choice(list(times))
+        data = {"submission": submission,
+                "time": times[submission] + rand.randint(0, 30)}
+        if rand.random() < 0.8:
+            # Few distinct values, to have ties.
+            extra = [rand.choice([0.0, 10.0, 25.0])
+                     for _ in range(rand.randint(0, 3))]
+            data["score"] = sum(extra) if extra else rand.choice([0.0, 5.0])
+            data["extra"] = ["%g" % e for e in extra]
+        if rand.random() < 0.3:
+            data["token"] = rand.random() < 0.8
+        changes.append(make_subchange("c%03d" % i, data))
+    return times, changes
+
+
+def expected_history(times, changes, score_mode):
+    """Return the history of a score, computed from scratch.
+
+    times ({str: int}): the times of the submissions, by key.
+    changes ([Subchange]): the subchanges, in any order.
+    score_mode (str): the score mode.
+
+    return ([(int, float)]): the times and the values of the changes
+        of the score.
+
+    """
+    scores = dict((key, 0.0) for key in times)
+    tokens = dict((key, False) for key in times)
+    extras = dict((key, []) for key in times)
+    last = None
+    history = list()
+    for change in sorted(changes, key=lambda c: (c.time, c.key)):
+        key = change.submission
+        if change.score is not None:
+            scores[key] = change.score
+            if last is None or times[key] > times[last]:
+                last = key
+        if change.token is not None:
+            tokens[key] = change.token
+        if change.extra is not None:
+            extras[key] = change.extra
+
+        if score_mode == SCORE_MODE_MAX:
+            score = max(scores.values())
+        elif score_mode == SCORE_MODE_MAX_SUBTASK:
+            score = float(sum(max(subtask) for subtask in zip_longest(
+                *(map(float, extras[key] or [scores[key]]) for key in times),
+                fillvalue=0.0)))
+        else:
+            score = max([scores[key] for key in times if tokens[key]]
+                        + [0.0, scores[last] if last is not None else 0.0])
+
+        if score != (history[-1][1] if len(history) > 0 else 0.0):
+            history.append((change.time, score))
+    return history
+
+
+class TestNumberSet(unittest.TestCase):
+
+    def test_random(self):
+        rand = random.Random(0)
+        number_set = NumberSet()
+        values = list()
+        for _ in range(2000):
+            if len(values) > 0 and rand.random() < 0.45:
+                value = rand.choice(values)
+                values.remove(value)
+                number_set.remove(value)
+            else:
+                value = float(rand.randint(-5, 20))
+                values.append(value)
+                number_set.insert(value)
+            self.assertEqual(len(number_set), len(values))
+            self.assertEqual(number_set.query(), max(values + [0.0]))
+            self.assertEqual(number_set.maximum(),
+                             max(values) if values else None)
+
+    def test_remove_missing(self):
+        number_set = NumberSet()
+        number_set.insert(1.0)
+        number_set.remove(1.0)
+        with self.assertRaises(ValueError):
+            number_set.remove(1.0)
+
+    def test_clear(self):
+        number_set = NumberSet()
+        number_set.insert(3.0)
+        number_set.insert(3.0)
+        number_set.clear()
+        self.assertEqual(len(number_set), 0)
+        self.assertEqual(number_set.query(), 0.0)
+        number_set.insert(2.0)
+        self.assertEqual(number_set.query(), 2.0)
+
+
+class TestScore(unittest.TestCase):
+
+    def make_score(self, score_mode, times):
+        score = Score(score_mode)
+        for key, time in times.items():
+            score.create_submission(key, make_submission(key, time))
+        return score
+
+    def test_in_order(self):
+        rand = random.Random(1)
+        for score_mode in SCORE_MODES:
+            for _ in range(20):
+                times, changes = make_contest(rand, 8, 40)
+                changes.sort(key=lambda c: (c.time, c.key))
+                score = self.make_score(score_mode, times)
+                for change in changes:
+                    score.create_subchange(change.key, change)
+                self.assertEqual(
+                    score._history,
+                    expected_history(times, changes, score_mode))
+
+    def test_subtasks(self):
+        times = {"s0": 0, "s1": 10}
+        changes = [
+            make_subchange("c0", {"submission": "s0", "time": 1,
+                                  "score": 30.0, "extra": ["10", "20"]}),
+            make_subchange("c1", {"submission": "s1", "time": 11,
+                                  "score": 30.0,
+                                  "extra": ["20", "0", "10"]}),
+            # A rejudging lowers the best score on the first subtask.
+            make_subchange("c2", {"submission": "s1", "time": 12,
+                                  "score": 10.0,
+                                  "extra": ["0", "0", "10"]}),
+        ]
+        score = self.make_score(SCORE_MODE_MAX_SUBTASK, times)
+        for change in changes:
+            score.create_subchange(change.key, change)
+        self.assertEqual(score._history, [(1, 30.0), (11, 50.0), (12, 40.0)])
+
+    def test_score_mode_changed(self):
+        rand = random.Random(2)
+        times, changes = make_contest(rand, 8, 40)
+        changes.sort(key=lambda c: (c.time, c.key))
+        score = self.make_score(SCORE_MODE_MAX, times)
+        for change in changes[:20]:
+            score.create_subchange(change.key, change)
+        score.update_score_mode(SCORE_MODE_MAX_SUBTASK)
+        score.reset_history()
+        self.assertEqual(
+            score._history,
+            expected_history(times, changes[:20], SCORE_MODE_MAX_SUBTASK))
+        for change in changes[20:]:
+            score.create_subchange(change.key, change)
+        self.assertEqual(
+            score._history,
+            expected_history(times, changes, SCORE_MODE_MAX_SUBTASK))
+
+
+class TestScoreCheckpoints(unittest.TestCase):
+    """Compare the history replayed from the checkpoints with the one
+    replayed from scratch after each operation.
+
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.rand = random.Random(3)
+
+    def make_scores(self, score_mode, times):
+        scores = list()
+        for _ in range(2):
+            score = Score(score_mode)
+            for key, time in times.items():
+                score.create_submission(key, make_submission(key, time))
+            scores.append(score)
+        return scores
+
+    def assertSameHistory(self, score, reference):
+        reference.reset_history()
+        self.assertEqual(score._history, reference._history)
+        self.assertEqual(score.get_score(), reference.get_score())
+
+    def run_random(self, score_mode, interval):
+        times, changes = make_contest(self.rand, 10, 80)
+        with patch.object(Score, "CHECKPOINT_INTERVAL", interval):
+            score, reference = self.make_scores(score_mode, times)
+            created = list()
+            for change in changes:
+                for target in [score, reference]:
+                    target.create_subchange(change.key, change)
+                created.append(change)
+                self.assertSameHistory(score, reference)
+
+                if self.rand.random() < 0.1:
+                    # Change score, token or details, but not the time.
+                    old = self.rand.choice(created)
+                    data = old.get()
+                    data["score"] = self.rand.choice([0.0, 10.0, 25.0])
+                    data.pop("extra", None)
+                    new = make_subchange(old.key, data)
+                    created[created.index(old)] = new
+                    for target in [score, reference]:
+                        target.update_subchange(new.key, new)
+                    self.assertSameHistory(score, reference)
+
+                if self.rand.random() < 0.05:
+                    old = self.rand.choice(created)
+                    created.remove(old)
+                    for target in [score, reference]:
+                        target.delete_subchange(old.key)
+                    self.assertSameHistory(score, reference)
+
+            self.assertEqual(score._history,
+                             expected_history(times, created, score_mode))
+
+    def test_random(self):
+        for score_mode in SCORE_MODES:
+            for interval in [1, 3, 32]:
+                for _ in range(5):
+                    self.run_random(score_mode, interval)
+
+    def test_submission_created_later(self):
+        for score_mode in SCORE_MODES:
+            times, changes = make_contest(self.rand, 6, 60)
+            new_changes = [c for c in changes if c.submission == "s5"]
+            changes = [c for c in changes if c.submission != "s5"]
+            del times["s5"]
+            with patch.object(Score, "CHECKPOINT_INTERVAL", 2):
+                score, reference = self.make_scores(score_mode, times)
+                for change in sorted(changes, key=lambda c: (c.time, c.key)):
+                    for target in [score, reference]:
+                        target.create_subchange(change.key, change)
+                # A submission in the middle of the history, whose
+                # subchanges arrive out of order.
+                times["s5"] = 45
+                for target in [score, reference]:
+                    target.create_submission("s5", make_submission("s5", 45))
+                for change in new_changes:
+                    change.time = 45 + change.time % 10
+                    for target in [score, reference]:
+                        target.create_subchange(change.key, change)
+                    self.assertSameHistory(score, reference)
+            self.assertEqual(
+                score._history,
+                expected_history(times, changes + new_changes, score_mode))
+
+    def test_score_mode_changed(self):
+        times, changes = make_contest(self.rand, 8, 60)
+        with patch.object(Score, "CHECKPOINT_INTERVAL", 2):
+            score, reference = self.make_scores(SCORE_MODE_MAX, times)
+            for change in changes[:30]:
+                for target in [score, reference]:
+                    target.create_subchange(change.key, change)
+            for target in [score, reference]:
+                target.update_score_mode(SCORE_MODE_MAX_TOKENED_LAST)
+            # The history is not computed again, the first change out
+            # of order resets it.
+            for change in changes[30:]:
+                for target in [score, reference]:
+                    target.create_subchange(change.key, change)
+                self.assertSameHistory(score, reference)
+
+
+if __name__ == "__main__":
+    unittest.main()
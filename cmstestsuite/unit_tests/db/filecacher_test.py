@@ -26,8 +26,12 @@
 import os
 import random
 import shutil
+import tempfile
 import unittest
 from io import BytesIO
+from unittest.mock import Mock, patch
+
+import gevent
 
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
@@ -382,5 +386,122 @@ class TestFileCacherFS(TestFileCacherBase, unittest.TestCase):
         shutil.rmtree("fs-storage", ignore_errors=True)
 
 
+class TestFileCacherBounded(unittest.TestCase):
+    """Tests for the size bound of the local cache of FileCacher."""
+
+    def setUp(self):
+        super().setUp()
+        self.file_cacher = FileCacher(path="fs-storage")
+        self.file_cacher.max_size = 1000
+        self.cache_base_path = self.file_cacher.file_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_base_path, ignore_errors=True)
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def cached(self, digest):
+        return os.path.exists(os.path.join(self.cache_base_path, digest))
+
+    def put(self, i, size=300):
+        digest = self.file_cacher.put_file_content(bytes([i]) * size)
+        # Make the LRU order deterministic.
+        os.utime(os.path.join(self.cache_base_path, digest), (i, i))
+        return digest
+
+    def test_eviction_lru(self):
+        digests = [self.put(i) for i in range(3)]
+        # Access the first file, which becomes the most recent.
+        self.file_cacher.get_file_content(digests[0])
+        digests.append(self.put(3))
+
+        self.assertTrue(self.cached(digests[0]))
+        self.assertFalse(self.cached(digests[1]))
+        self.assertTrue(self.cached(digests[2]))
+        self.assertTrue(self.cached(digests[3]))
+        self.assertEqual(self.file_cacher.evictions, 1)
+        self.assertEqual(self.file_cacher._update_usage(0), 900)
+
+        # Evicted files are still available from the backend.
+        self.assertEqual(self.file_cacher.get_file_content(digests[1]),
+                         bytes([1]) * 300)
+        self.assertEqual(self.file_cacher.misses, 1)
+
+    def test_pinned_not_evicted(self):
+        digests = [self.put(i) for i in range(3)]
+        with self.file_cacher.get_file(digests[0]) as fobj:
+            os.utime(os.path.join(self.cache_base_path, digests[0]), (0, 0))
+            self.put(3)
+            self.assertTrue(self.cached(digests[0]))
+            self.assertFalse(self.cached(digests[1]))
+            self.assertEqual(fobj.read(), bytes([0]) * 300)
+
+    def test_drop_accounting(self):
+        digest = self.put(0)
+        self.assertEqual(self.file_cacher._update_usage(0), 300)
+        self.file_cacher.drop(digest)
+        self.assertEqual(self.file_cacher._update_usage(0), 0)
+
+    def test_status(self):
+        digest = self.put(0)
+        self.file_cacher.get_file_content(digest)
+        status = self.file_cacher.get_status()
+        self.assertEqual(status["max_size"], 1000)
+        self.assertEqual(status["hits"], 1)
+        self.assertEqual(status["evictions"], 0)
+
+
+class TestFileCacherShared(unittest.TestCase):
+    """Tests for the cache shared among services on the same host."""
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        patcher = patch.multiple(
+            "cms.db.filecacher.config",
+            cache_dir=self.cache_dir, file_cacher_shared=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.file_cachers = []
+        for shard in range(2):
+            service = Mock()
+            service.name = "Worker"
+            service.shard = shard
+            self.file_cachers.append(FileCacher(service, path="fs-storage"))
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def test_same_directory(self):
+        self.assertTrue(self.file_cachers[0].shared)
+        self.assertEqual(self.file_cachers[0].file_dir,
+                         self.file_cachers[1].file_dir)
+
+    def test_single_flight(self):
+        content = os.urandom(10 * FileCacher.CHUNK_SIZE)
+        digest = self.file_cachers[0].put_file_content(content)
+        self.file_cachers[0].drop(digest)
+
+        get_file_calls = []
+        for file_cacher in self.file_cachers:
+            get_file = file_cacher.backend.get_file
+            file_cacher.backend.get_file = Mock(side_effect=get_file)
+            get_file_calls.append(file_cacher.backend.get_file)
+
+        greenlets = [gevent.spawn(file_cacher.get_file_content, digest)
+                     for file_cacher in self.file_cachers]
+        gevent.joinall(greenlets, raise_error=True)
+
+        for greenlet in greenlets:
+            self.assertEqual(greenlet.value, content)
+        self.assertEqual(
+            sum(get_file.call_count for get_file in get_file_calls), 1)
+        # No lock file is left behind.
+        self.assertEqual(
+            [name for name in os.listdir(self.file_cachers[0].file_dir)
+             if name.startswith("_lock")], [])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -19,10 +19,20 @@
 
 """Tests for general utility functions."""
 
+import errno
 import io
+import os
+import shutil
+import stat
+import tempfile
 import unittest
+from unittest.mock import Mock, patch
 
-from cms.grading.Sandbox import Truncator
+from cms.db.filecacher import FileCacher
+from cms.grading.Sandbox import ExecutionSlot, IsolateSandbox, \
+    StupidSandbox, Truncator, get_execution_slot, set_execution_slot
+from cmstestsuite.unit_tests.grading.steps.fakeisolatesandbox \
+    import FakeIsolateSandbox
 
 
 class TestTruncator(unittest.TestCase):
@@ -62,5 +72,203 @@ class TestTruncator(unittest.TestCase):
         self.perform_truncator_test(100, 40, 7)
 
 
+class TestExecutionSlot(unittest.TestCase):
+    """Test the box ids and CPUs of the sandboxes of execution slots."""
+    def setUp(self):
+        self.file_cacher = Mock()
+        self.file_cacher.service.shard = 1
+        self.addCleanup(set_execution_slot, None)
+        patcher = patch.dict(IsolateSandbox._boxes_in_use, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_slot(self):
+        self.assertIsNone(get_execution_slot())
+        sandbox = FakeIsolateSandbox(self.file_cacher)
+        self.assertGreaterEqual(sandbox.box_id, 20)
+        self.assertLess(sandbox.box_id, 30)
+        self.assertIsNone(sandbox.cpu)
+
+    @patch("cms.grading.Sandbox.config.max_worker_slots", 4)
+    def test_no_slot_max_slots(self):
+        # Shard 1 uses the first of the ranges of shards 4 to 7.
+        sandbox = FakeIsolateSandbox(self.file_cacher)
+        self.assertGreaterEqual(sandbox.box_id, 50)
+        self.assertLess(sandbox.box_id, 60)
+
+    @patch("cms.grading.Sandbox.config.max_worker_slots", 4)
+    def test_slots(self):
+        for num_slots in [2, 4]:
+            for index in range(num_slots):
+                slot = ExecutionSlot(index, num_slots, cpu=index + 8)
+                set_execution_slot(slot)
+                box_ids = [FakeIsolateSandbox(self.file_cacher).box_id
+                           for _ in range(12)]
+                # Shard 1 uses the ranges of shards 4 to 7, whatever
+                # the number of slots of its worker.
+                first = (1 * 4 + index + 1) * 10
+                self.assertEqual(box_ids,
+                                 [first + i % 10 for i in range(12)])
+                self.assertEqual(FakeIsolateSandbox(self.file_cacher).cpu,
+                                 index + 8)
+
+    def test_skip_in_use(self):
+        set_execution_slot(ExecutionSlot(0, 1))
+        # A sandbox kept for long, like the checker sandbox of a group.
+        kept = FakeIsolateSandbox(self.file_cacher)
+        self.assertEqual(kept.box_id, 20)
+        box_ids = []
+        for _ in range(12):
+            sandbox = FakeIsolateSandbox(self.file_cacher)
+            box_ids.append(sandbox.box_id)
+            sandbox.cleanup()
+        self.assertEqual(box_ids, list(range(21, 30)) + [21, 22, 23])
+
+        # After its cleanup, the box is given to new sandboxes again.
+        kept.cleanup()
+        self.assertEqual(
+            [FakeIsolateSandbox(self.file_cacher).box_id for _ in range(8)],
+            list(range(24, 30)) + [20, 21])
+
+
+class TestCreateFileFromStorage(unittest.TestCase):
+    """Test the ways of staging files from the cache in a sandbox."""
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.file_cacher = FileCacher(
+            path=os.path.join(self.base_dir, "storage"))
+        self.content = b"1 2 3\n" * 10000
+        self.digest = self.file_cacher.put_file_content(self.content, "")
+        self.sandbox = StupidSandbox(self.file_cacher, temp_dir=self.base_dir)
+        self.addCleanup(self.sandbox.cleanup, delete=True)
+        patcher = patch("cms.grading.Sandbox.config")
+        self.config = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stage(self, staging, path="input.txt", executable=False):
+        self.config.sandbox_file_staging = staging
+        self.sandbox.create_file_from_storage(path, self.digest, executable)
+        with self.sandbox.get_file(path) as f:
+            self.assertEqual(f.read(), self.content)
+        return os.stat(self.sandbox.relative_path(path))
+
+    def cache_stat(self):
+        return os.stat(os.path.join(self.file_cacher.file_dir, self.digest))
+
+    def test_copy(self):
+        st = self.stage("copy")
+        self.assertNotEqual(st.st_ino, self.cache_stat().st_ino)
+
+    def test_reflink(self):
+        st = self.stage("reflink", executable=True)
+        self.assertNotEqual(st.st_ino, self.cache_stat().st_ino)
+        self.assertTrue(st.st_mode & stat.S_IXOTH)
+
+    def test_reflink_fallback(self):
+        with patch("cms.grading.Sandbox.fcntl.ioctl",
+                   side_effect=OSError(errno.EOPNOTSUPP, "")), \
+                patch("cms.grading.Sandbox.os.copy_file_range",
+                      side_effect=OSError(errno.EXDEV, ""), create=True):
+            self.stage("reflink")
+
+    def test_hardlink(self):
+        st = self.stage("hardlink")
+        self.assertEqual(st.st_ino, self.cache_stat().st_ino)
+        self.assertEqual(stat.S_IMODE(st.st_mode), 0o444)
+        st = self.stage("hardlink", path="exe", executable=True)
+        self.assertEqual(stat.S_IMODE(st.st_mode), 0o555)
+
+    def test_hardlink_fallback(self):
+        with patch("cms.grading.Sandbox.os.link",
+                   side_effect=OSError(errno.EXDEV, "")):
+            st = self.stage("hardlink")
+        self.assertNotEqual(st.st_ino, self.cache_stat().st_ino)
+
+    def test_hardlink_existing(self):
+        self.sandbox.create_file_from_string("input.txt", b"")
+        self.config.sandbox_file_staging = "hardlink"
+        with self.assertRaises(OSError):
+            self.sandbox.create_file_from_storage("input.txt", self.digest)
+
+    def test_hardlink_permissions(self):
+        with patch("cms.grading.Sandbox.subprocess.call"):
+            sandbox = FakeIsolateSandbox(self.file_cacher,
+                                         temp_dir=self.base_dir)
+        self.config.sandbox_file_staging = "hardlink"
+        sandbox.create_file_from_storage("input.txt", self.digest)
+        sandbox.create_file_from_storage("output.txt", self.digest)
+
+        sandbox.allow_writing_all()
+        self.assertEqual(stat.S_IMODE(self.cache_stat().st_mode), 0o444)
+        sandbox.allow_writing_only(["output.txt"])
+        self.assertEqual(stat.S_IMODE(self.cache_stat().st_mode), 0o444)
+
+        # The file to write is not shared with the cache anymore.
+        input_st = os.stat(sandbox.relative_path("input.txt"))
+        output_st = os.stat(sandbox.relative_path("output.txt"))
+        self.assertEqual(input_st.st_ino, self.cache_stat().st_ino)
+        self.assertNotEqual(output_st.st_ino, self.cache_stat().st_ino)
+        self.assertEqual(stat.S_IMODE(output_st.st_mode), 0o722)
+        with open(sandbox.relative_path("output.txt"), "rb") as f:
+            self.assertEqual(f.read(), self.content)
+
+
+class TestReset(unittest.TestCase):
+    """Test bringing a sandbox back to the state of a new one."""
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+
+    def test_stupid(self):
+        sandbox = StupidSandbox(None, temp_dir=self.base_dir)
+        sandbox.create_file_from_string("exe", b"")
+        sandbox.create_file_from_string("output.txt", b"")
+        os.mkdir(sandbox.relative_path("state"))
+        sandbox.create_file_from_string("state/count", b"1")
+
+        sandbox.reset(keep=["exe"])
+
+        self.assertEqual(os.listdir(sandbox.relative_path("")), ["exe"])
+
+    def test_isolate(self):
+        with patch("cms.grading.Sandbox.subprocess.call") as call:
+            sandbox = FakeIsolateSandbox(None, temp_dir=self.base_dir)
+            sandbox.create_file_from_string("exe", b"")
+            sandbox.create_file_from_string("output.txt", b"")
+            with patch.object(sandbox, "_cleanup_isolate") as cleanup, \
+                    patch.object(sandbox, "initialize_isolate") as init:
+                sandbox.reset(keep=["exe"])
+
+        self.assertEqual(os.listdir(sandbox.relative_path("")), ["exe"])
+        # The box, where the sandboxed processes can write too, is
+        # created again, since its directory is not known.
+        cleanup.assert_called_once_with()
+        init.assert_called_once_with()
+        # No directory to make deletable.
+        call.assert_not_called()
+
+    def test_isolate_box_dir(self):
+        with patch("cms.grading.Sandbox.subprocess.call") as call:
+            sandbox = FakeIsolateSandbox(None, temp_dir=self.base_dir)
+            sandbox._box_dir = os.path.join(self.base_dir, "box")
+            os.mkdir(sandbox._box_dir)
+            os.mkdir(os.path.join(sandbox._box_dir, "state"))
+            with open(os.path.join(sandbox._box_dir, "count"), "wb"):
+                pass
+            sandbox.create_file_from_string("exe", b"")
+            sandbox.create_file_from_string("output.txt", b"")
+            with patch.object(sandbox, "_cleanup_isolate") as cleanup, \
+                    patch.object(sandbox, "initialize_isolate") as init:
+                sandbox.reset(keep=["exe"])
+
+        self.assertEqual(os.listdir(sandbox.relative_path("")), ["exe"])
+        # The files in the box are removed, without recreating it.
+        self.assertEqual(os.listdir(sandbox._box_dir), [])
+        cleanup.assert_not_called()
+        init.assert_not_called()
+        call.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the cache of compilation results.
+
+"""
+
+import unittest
+
+from cms.db import Executable
+from cms.grading.Job import CompilationJob
+from cms.grading.Sandbox import Sandbox
+from cms.grading.compilationcache import CompilationCache
+
+
+COMMANDS = [["/usr/bin/g++", "-o", "foo", "foo.cpp"]]
+
+
+def compiled_job(compilation_success=True,
+                 exit_status=Sandbox.EXIT_OK):
+    job = CompilationJob(language="C++17 / g++")
+    job.success = True
+    job.compilation_success = compilation_success
+    job.text = ["Compilation succeeded"]
+    job.plus = {"exit_status": exit_status, "execution_time": 0.5}
+    if compilation_success:
+        job.executables["foo"] = Executable("foo", "exe_digest")
+    return job
+
+
+class TestCompilationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = CompilationCache(max_size=2)
+        self.key = CompilationCache.key(
+            "C++17 / g++", COMMANDS, {"foo.cpp": "digest"})
+
+    def test_store_and_fill(self):
+        self.assertTrue(self.cache.store(self.key, compiled_job()))
+        job = CompilationJob(language="C++17 / g++")
+        self.assertTrue(self.cache.fill(self.key, job))
+        self.assertTrue(job.success)
+        self.assertTrue(job.compilation_success)
+        self.assertEqual(job.text, ["Compilation succeeded"])
+        self.assertEqual(job.plus["execution_time"], 0.5)
+        self.assertEqual(job.executables["foo"].digest, "exe_digest")
+        self.assertEqual(self.cache.get_status()["hits"], 1)
+
+    def test_key_depends_on_inputs(self):
+        self.cache.store(self.key, compiled_job())
+        for key in [
+                CompilationCache.key("C++17 / g++", COMMANDS,
+                                     {"foo.cpp": "other digest"}),
+                CompilationCache.key("C++17 / g++", COMMANDS,
+                                     {"foo.cpp": "digest", "foo.h": "h"}),
+                CompilationCache.key("C++17 / g++", [["g++", "foo.cpp"]],
+                                     {"foo.cpp": "digest"}),
+                CompilationCache.key("C11 / gcc", COMMANDS,
+                                     {"foo.cpp": "digest"})]:
+            self.assertFalse(self.cache.fill(
+                key, CompilationJob(language="C++17 / g++")))
+        self.assertEqual(self.cache.get_status()["misses"], 4)
+
+    def test_compilation_error_stored(self):
+        job = compiled_job(False, Sandbox.EXIT_NONZERO_RETURN)
+        self.assertTrue(self.cache.store(self.key, job))
+        job = CompilationJob(language="C++17 / g++")
+        self.assertTrue(self.cache.fill(self.key, job))
+        self.assertFalse(job.compilation_success)
+        self.assertEqual(job.executables, {})
+
+    def test_timeout_not_stored(self):
+        job = compiled_job(False, Sandbox.EXIT_TIMEOUT)
+        self.assertFalse(self.cache.store(self.key, job))
+        job = compiled_job()
+        job.success = False
+        self.assertFalse(self.cache.store(self.key, job))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_eviction(self):
+        keys = [CompilationCache.key("C++17 / g++", COMMANDS,
+                                     {"foo.cpp": str(i)}) for i in range(3)]
+        for key in keys:
+            self.cache.store(key, compiled_job())
+        self.assertEqual(len(self.cache), 2)
+        self.assertFalse(self.cache.fill(
+            keys[0], CompilationJob(language="C++17 / g++")))
+        self.assertEqual(self.cache.get_status()["evictions"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the export and import of jobs and job groups.
+
+"""
+
+import json
+import unittest
+import weakref
+from unittest.mock import MagicMock, patch
+
+from cms.db import Dataset, Executable, File, Manager, Submission
+from cms.grading.Job import CompilationJob, EvaluationJob, Job, JobGroup
+from cms.service.esoperations import ESOperation
+
+
+def evaluation_job(submission_id, codename):
+    return EvaluationJob(
+        operation=ESOperation(ESOperation.EVALUATION, submission_id, 1,
+                              codename),
+        task_type="Batch",
+        task_type_parameters=["alone", ["", ""], "diff"],
+        language="C++17 / g++",
+        files={"foo.%l": File("foo.%l", "f%d" % submission_id)},
+        managers={"checker": Manager("checker", "checker")},
+        executables={"foo": Executable("foo", "e%d" % submission_id)},
+        input="input" + codename,
+        output="output" + codename,
+        time_limit=1.0,
+        memory_limit=256 * 1024 * 1024,
+        info="evaluate submission %d on testcase %s" % (submission_id,
+                                                       codename))
+
+
+def exported(job):
+    """Return the export of a job as a JSON-serializable dict."""
+    return json.loads(json.dumps(job.export_to_dict()))
+
+
+class Loaded:
+    """An object loaded from the database."""
+    pass
+
+
+class TestJobGroup(unittest.TestCase):
+
+    def round_trip(self, jobs):
+        """Return a group of jobs exported and imported back.
+
+        return ((dict, JobGroup)): the exported group and the imported
+            one.
+
+        """
+        data = json.dumps(JobGroup(jobs).export_to_dict())
+        # Importing modifies the data.
+        return json.loads(data), JobGroup.import_from_dict(json.loads(data))
+
+    def test_shared_blocks(self):
+        jobs = [evaluation_job(1, "%03d" % i) for i in range(10)]
+        jobs.append(evaluation_job(2, "000"))
+        data, job_group = self.round_trip(jobs)
+
+        # The two submissions have a block each.
+        self.assertEqual(len(data["shared"]), 2)
+        self.assertEqual([job["shared"] for job in data["jobs"]],
+                         [0] * 10 + [1])
+        self.assertEqual(data["shared"][0]["executables"], {"foo": "e1"})
+        self.assertNotIn("input", data["shared"][0])
+        self.assertEqual(data["jobs"][3]["input"], "input003")
+        self.assertNotIn("managers", data["jobs"][3])
+
+        self.assertEqual([exported(job) for job in job_group.jobs],
+                         [exported(job) for job in jobs])
+
+    def test_objects_shared(self):
+        jobs = [evaluation_job(1, "000"), evaluation_job(1, "001")]
+        _, job_group = self.round_trip(jobs)
+        first, second = job_group.jobs
+
+        # Files and managers objects are shared, but not the dicts...
+        self.assertIs(first.files["foo.%l"], second.files["foo.%l"])
+        self.assertIs(first.managers["checker"], second.managers["checker"])
+        self.assertIsNot(first.files, second.files)
+        self.assertIsNot(first.managers, second.managers)
+        # ...while executables are converted for each job.
+        self.assertIsNot(first.executables["foo"],
+                         second.executables["foo"])
+        self.assertEqual(first.executables["foo"].digest, "e1")
+
+    def test_compilation_results(self):
+        jobs = [CompilationJob(
+            operation=ESOperation(ESOperation.COMPILATION, 1, dataset_id),
+            task_type="Batch", language="C++17 / g++",
+            files={"foo.%l": File("foo.%l", "f1")})
+            for dataset_id in [1, 2]]
+        jobs[0].executables["foo"] = Executable("foo", "e1")
+        data, job_group = self.round_trip(jobs)
+
+        self.assertEqual(len(data["shared"]), 2)
+        self.assertEqual(job_group.jobs[0].executables["foo"].digest, "e1")
+        self.assertEqual(job_group.jobs[1].executables, {})
+        self.assertEqual([exported(job) for job in job_group.jobs],
+                         [exported(job) for job in jobs])
+
+    def test_import_old_format(self):
+        jobs = [evaluation_job(1, "000"), evaluation_job(2, "000")]
+        data = json.loads(json.dumps(
+            {"jobs": [job.export_to_dict() for job in jobs]}))
+        job_group = JobGroup.import_from_dict(data)
+        self.assertEqual([exported(job) for job in job_group.jobs],
+                         [exported(job) for job in jobs])
+
+    def test_empty(self):
+        data, job_group = self.round_trip([])
+        self.assertEqual(data, {"shared": [], "jobs": []})
+        self.assertEqual(job_group.jobs, [])
+
+
+class TestFromOperations(unittest.TestCase):
+
+    def test_objects_kept(self):
+        # Each query loads a new object, referenced only by the caller.
+        loaded = []
+
+        def load():
+            object_ = Loaded()
+            loaded.append(weakref.ref(object_))
+            return [object_]
+
+        query = MagicMock()
+        query.filter.return_value = query
+        query.options.return_value = query
+        query.all.side_effect = load
+        session = MagicMock()
+        session.query.return_value = query
+
+        def get_from_id(id_, session):
+            # Still in the identity map, which holds them weakly.
+            self.assertTrue(all(ref() is not None for ref in loaded))
+
+        with patch.object(Submission, "get_from_id",
+                          side_effect=get_from_id) as get_submission, \
+                patch.object(Dataset, "get_from_id",
+                             side_effect=get_from_id), \
+                patch.object(Job, "from_operation"):
+            JobGroup.from_operations(
+                [ESOperation(ESOperation.EVALUATION, 1, 1, "000")], session)
+
+        get_submission.assert_called_once_with(1, session)
+        self.assertEqual(len(loaded), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
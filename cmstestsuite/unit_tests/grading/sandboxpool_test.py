@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the pool of sandboxes.
+
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+
+import gevent
+
+from cms.grading.Sandbox import ExecutionSlot, get_execution_slot, \
+    set_execution_slot
+from cms.grading.sandboxpool import SandboxPool
+from cms.grading.tasktypes.util import create_sandbox, delete_sandbox, \
+    set_sandbox_pool
+
+
+class FakeSandbox:
+    """Record the slot it was created in and its cleanups."""
+
+    def __init__(self, file_cacher, name=None):
+        self.file_cacher = file_cacher
+        self.name = name
+        self.slot = get_execution_slot()
+        self.cleanups = []
+
+    def cleanup(self, delete=False):
+        self.cleanups.append(delete)
+
+
+class TestSandboxPool(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch("cms.grading.sandboxpool.Sandbox", FakeSandbox)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.file_cacher = Mock()
+
+    def new_pool(self, size=2, slots=None):
+        pool = SandboxPool(self.file_cacher, size, slots)
+        pool.start()
+        self.addCleanup(pool.stop)
+        # Let the background greenlet fill the pool.
+        gevent.sleep(0)
+        return pool
+
+    def test_fill(self):
+        pool = self.new_pool()
+        self.assertEqual(pool.get_status()["ready"], 2)
+        sandbox = pool.acquire("evaluate")
+        self.assertIsInstance(sandbox, FakeSandbox)
+        self.assertEqual(sandbox.name, "evaluate")
+        self.assertEqual(pool.get_status()["ready"], 1)
+        gevent.sleep(0)
+        self.assertEqual(pool.get_status()["ready"], 2)
+        self.assertEqual(pool.hits, 1)
+
+    def test_miss(self):
+        pool = self.new_pool(size=1)
+        self.assertIsNotNone(pool.acquire("a"))
+        self.assertIsNone(pool.acquire("b"))
+        self.assertEqual(pool.misses, 1)
+
+    def test_release_cleans_up_in_background(self):
+        pool = self.new_pool()
+        sandbox = pool.acquire("evaluate")
+        pool.release(sandbox, delete=True)
+        self.assertEqual(sandbox.cleanups, [])
+        gevent.sleep(0)
+        self.assertEqual(sandbox.cleanups, [True])
+
+    def test_slots(self):
+        slots = [ExecutionSlot(0, 2), ExecutionSlot(1, 2)]
+        pool = self.new_pool(size=1, slots=slots)
+        self.addCleanup(set_execution_slot, None)
+        for slot in slots:
+            set_execution_slot(slot)
+            self.assertIs(pool.acquire("evaluate").slot, slot)
+        set_execution_slot(None)
+        self.assertIsNone(pool.acquire("evaluate"))
+
+    def test_stop(self):
+        pool = self.new_pool()
+        sandbox = pool.acquire("evaluate")
+        ready = list(pool._ready[None])
+        pool.release(sandbox, delete=False)
+        pool.stop()
+        self.assertEqual(sandbox.cleanups, [False])
+        for other in ready:
+            self.assertEqual(other.cleanups, [True])
+        self.assertEqual(pool.get_status()["ready"], 0)
+
+    def test_create_and_delete_sandbox(self):
+        pool = self.new_pool(size=1)
+        set_sandbox_pool(pool)
+        self.addCleanup(set_sandbox_pool, None)
+        sandbox = create_sandbox(self.file_cacher, "evaluate")
+        self.assertEqual(pool.hits, 1)
+        with patch("cms.grading.tasktypes.util.config") as config:
+            config.keep_sandbox = False
+            delete_sandbox(sandbox)
+        gevent.sleep(0)
+        self.assertEqual(sandbox.cleanups, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
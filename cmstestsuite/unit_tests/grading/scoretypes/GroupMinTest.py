@@ -157,6 +157,46 @@ class TestGroupMin(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(gmin.compute_score(sr),
                                 s2 + s3 * 0.1, 0.0, [0, s2, s3 * 0.1])
 
+    def test_compute_score_skipped(self):
+        s1, s2, s3 = 10.5, 30.5, 59
+        parameters = [[s1, "1_*"], [s2, "2_*"], [s3, "3_*"]]
+        gmin = GroupMin(parameters, self._public_testcases)
+        sr = self.get_submission_result(self._public_testcases)
+
+        # Skipped testcases in failed subtasks give no points.
+        self.set_outcome(sr, "2_0", 0.0)
+        self.set_outcome(sr, "2_1", None)
+        self.set_outcome(sr, "3_1", None)
+        self.set_outcome(sr, "3_0", None)
+        scores = gmin.compute_score(sr)
+        self.assertComputeScore(scores, s1, s1, [s1, 0, 0])
+        self.assertNotIn("outcome", scores[1][1]["testcases"][1])
+
+    def test_compute_score_skipped_subtasks_changed(self):
+        s1, s2 = 40, 60
+        gmin = GroupMin([[s1, "1_*"], [s2, "[23]_*"]], self._public_testcases)
+        sr = self.get_submission_result(self._public_testcases)
+
+        # Skipped with the old subtasks, where 2_0 failed 2_1; now the
+        # subtask containing it would pass without it.
+        self.set_outcome(sr, "2_0", 1.0)
+        self.set_outcome(sr, "2_1", None)
+        self.assertComputeScore(gmin.compute_score(sr), s1, s1, [s1, 0])
+
+    def test_testcases_to_skip(self):
+        parameters = [[10, "1_*"], [20, "2_*"], [30, "(2|3)_*"]]
+        gmin = GroupMin(parameters, self._public_testcases)
+
+        self.assertEqual(gmin.testcases_to_skip({}), set())
+        self.assertEqual(gmin.testcases_to_skip({"1_0": 0.5}), set())
+        self.assertEqual(gmin.testcases_to_skip({"1_0": 0.0}), {"1_1"})
+        self.assertEqual(gmin.testcases_to_skip({"2_0": 0.0}),
+                         {"2_1", "3_0", "3_1"})
+        # The testcases of the second subtask, not failed, are needed.
+        self.assertEqual(gmin.testcases_to_skip({"3_0": 0.0}), {"3_1"})
+        self.assertEqual(gmin.testcases_to_skip({"2_0": 0.0, "3_0": 1.0}),
+                         {"2_1", "3_1"})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -173,6 +173,19 @@ class TestGroupThreshold(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(st.compute_score(sr),
                                 s2, 0.0, [0, s2, 0])
 
+    def test_testcases_to_skip(self):
+        parameters = [[10, "1_*", 10], [20, "2_*", 20], [30, "3_*", 30]]
+        st = GroupThreshold(parameters, self._public_testcases)
+
+        # Outcomes up to the threshold do not fail the subtask.
+        self.assertEqual(st.testcases_to_skip({"1_0": 10, "2_0": 0.5}),
+                         set())
+        # Outcomes above the threshold, or not positive, do.
+        self.assertEqual(st.testcases_to_skip({"1_0": 10.5, "2_0": 0.0}),
+                         {"1_1", "2_1"})
+        self.assertEqual(st.testcases_to_skip({"3_0": 30.5, "3_1": 1}),
+                         set())
+
 
 if __name__ == "__main__":
     unittest.main()
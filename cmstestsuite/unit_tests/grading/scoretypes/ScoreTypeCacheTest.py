@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the cache of the score type objects."""
+
+import unittest
+from unittest.mock import patch
+
+from cms.grading.scoretypes import SCORE_TYPES, get_cached_score_type, \
+    invalidate_score_type_cache
+from cms.grading.scoretypes.GroupMin import GroupMin
+from cms.grading.scoretypes.GroupMul import GroupMul
+
+
+class TestScoreTypeCache(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Do not depend on the plugins installed.
+        patcher = patch.dict(SCORE_TYPES, {"GroupMin": GroupMin,
+                                           "GroupMul": GroupMul})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        invalidate_score_type_cache()
+        self.public_testcases = {"1_0": True, "1_1": True, "2_0": False}
+        self.parameters = [[40, "1_.*"], [60, "2_.*"]]
+
+    def tearDown(self):
+        invalidate_score_type_cache()
+        super().tearDown()
+
+    def get(self, dataset_id=1, name="GroupMin", parameters=None,
+            public_testcases=None):
+        return get_cached_score_type(
+            dataset_id, name,
+            parameters if parameters is not None else self.parameters,
+            public_testcases if public_testcases is not None
+            else self.public_testcases)
+
+    def test_reused(self):
+        score_type = self.get()
+        self.assertIsInstance(score_type, GroupMin)
+        # Equal (but not identical) arguments give the same object.
+        self.assertIs(self.get(parameters=[[40, "1_.*"], [60, "2_.*"]],
+                               public_testcases=dict(self.public_testcases)),
+                      score_type)
+        self.assertIsNot(self.get(dataset_id=2), score_type)
+
+    def test_changes(self):
+        score_type = self.get()
+        self.assertIsNot(self.get(name="GroupMul"), score_type)
+        self.assertIsNot(self.get(parameters=[[50, "1_.*"], [50, "2_.*"]]),
+                         score_type)
+        changed = self.get(public_testcases={"1_0": True, "1_1": True,
+                                             "2_0": True})
+        self.assertEqual(changed.max_public_score, 100)
+        # Only the last object of each dataset is kept.
+        self.assertIsNot(self.get(), score_type)
+
+    def test_invalidate(self):
+        score_type = self.get()
+        other = self.get(dataset_id=2)
+        invalidate_score_type_cache(1)
+        self.assertIsNot(self.get(), score_type)
+        self.assertIs(self.get(dataset_id=2), other)
+        invalidate_score_type_cache()
+        self.assertIsNot(self.get(dataset_id=2), other)
+
+    def test_invalid_not_cached(self):
+        with self.assertRaises(ValueError):
+            self.get(parameters=[[40, "3_.*"]])
+        score_type = self.get()
+        with self.assertRaises(ValueError):
+            self.get(parameters=[[40, "3_.*"]])
+        # The valid object is still there.
+        self.assertIs(self.get(), score_type)
+
+    def test_targets_computed_once(self):
+        score_type = self.get()
+        targets = score_type.retrieve_target_testcases()
+        self.assertEqual(targets, [["1_0", "1_1"], ["2_0"]])
+        self.assertIs(score_type.retrieve_target_testcases(), targets)
+
+
+if __name__ == "__main__":
+    unittest.main()
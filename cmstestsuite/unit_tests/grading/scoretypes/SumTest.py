@@ -78,6 +78,17 @@ class TestSum(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(st.compute_score(sr),
                                 testcase_score * 2.2, testcase_score * 0.2, [])
 
+    def test_compute_score_skipped(self):
+        testcase_score = 10.5
+        st = Sum(testcase_score, self._public_testcases)
+        sr = self.get_submission_result(self._public_testcases)
+
+        # Skipped with a previous (group) score type: no points.
+        self.set_outcome(sr, "1", None)
+        scores = st.compute_score(sr)
+        self.assertComputeScore(scores, testcase_score * 3, 0.0, [])
+        self.assertNotIn("outcome", scores[1][1])
+
 
 if __name__ == "__main__":
     unittest.main()
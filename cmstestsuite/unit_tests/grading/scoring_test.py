@@ -26,7 +26,10 @@ from datetime import timedelta
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.grading.scoring import task_score
+from cms.db import ParticipationTaskScore
+from cms.grading.scoring import TaskScore, check_task_scores, \
+    compute_task_scores, get_task_score, get_task_scores, \
+    invalidate_task_scores, task_score, update_task_scores
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 from cmscommon.datetime import make_datetime
@@ -382,5 +385,116 @@ class TestTaskScoreMax(TaskScoreMixin, unittest.TestCase):
         self.assertEqual(self.call(rounded=True), (44.44, False))
 
 
+class TestTaskScores(TaskScoreMixin, unittest.TestCase):
+    """Tests for the scores stored in ParticipationTaskScore."""
+
+    def setUp(self):
+        super().setUp()
+        self.task.score_mode = SCORE_MODE_MAX_TOKENED_LAST
+        self.contest = self.participation.contest
+        self.pair = (self.participation.id, self.task.id)
+
+    def add_results(self):
+        self.add_result(self.at(1), 44.4, tokened=True, public_score=4.4)
+        self.add_result(self.at(2), 66.6, tokened=False, public_score=66.6)
+        self.add_result(self.at(3), None, tokened=False)
+        self.session.flush()
+
+    def stored(self):
+        return self.session.query(ParticipationTaskScore)\
+            .filter(ParticipationTaskScore.participation_id
+                    == self.participation.id)\
+            .filter(ParticipationTaskScore.task_id == self.task.id)\
+            .first()
+
+    def test_compute_as_task_score(self):
+        self.add_results()
+        for score_mode in [SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK,
+                           SCORE_MODE_MAX_TOKENED_LAST]:
+            self.task.score_mode = score_mode
+            score, partial = self.call()
+            public_score, _ = self.call(public=True)
+            tokened_score, _ = self.call(only_tokened=True)
+            self.assertEqual(
+                compute_task_scores(self.session, [self.pair]),
+                {self.pair: TaskScore(score, partial, public_score,
+                                      tokened_score)})
+
+    def test_no_submissions(self):
+        self.assertEqual(
+            get_task_score(self.session, self.participation, self.task),
+            TaskScore(0.0, False, 0.0, 0.0))
+        self.assertIsNone(self.stored())
+
+    def test_update(self):
+        self.add_results()
+        update_task_scores(self.session, [self.pair])
+        stored = self.stored()
+        self.assertEqual(stored.dataset_id, self.task.active_dataset_id)
+        self.assertEqual(
+            (stored.score, stored.partial, stored.public_score,
+             stored.tokened_score),
+            (44.4, True, 4.4, 44.4))
+
+        # Stored scores are used...
+        stored.score = 10.0
+        self.session.flush()
+        self.assertEqual(
+            get_task_score(self.session, self.participation, self.task),
+            TaskScore(10.0, True, 4.4, 44.4))
+        self.assertEqual(get_task_scores(self.session, self.contest),
+                         {self.pair: TaskScore(10.0, True, 4.4, 44.4)})
+
+        # ...and updated.
+        update_task_scores(self.session, [self.pair])
+        self.session.expire_all()
+        self.assertEqual(self.stored().score, 44.4)
+
+    def test_stale(self):
+        self.add_results()
+        update_task_scores(self.session, [self.pair])
+        self.task.active_dataset = self.add_dataset(task=self.task)
+        self.session.flush()
+        # Nothing is scored on the new dataset.
+        self.assertEqual(
+            get_task_score(self.session, self.participation, self.task),
+            TaskScore(0.0, True, 0.0, 0.0))
+
+    def test_invalidate(self):
+        self.add_results()
+        update_task_scores(self.session, [self.pair])
+        invalidate_task_scores(self.session, [self.pair])
+        self.assertIsNone(self.stored())
+        self.assertEqual(
+            get_task_score(self.session, self.participation, self.task),
+            TaskScore(44.4, True, 4.4, 44.4))
+
+    def test_check(self):
+        self.add_results()
+        other = self.add_participation(contest=self.contest)
+        self.session.flush()
+        self.assertEqual(check_task_scores(self.session, self.contest),
+                         ([], [self.pair]))
+
+        update_task_scores(self.session, [self.pair])
+        self.stored().score = 10.0
+        self.session.flush()
+        self.assertEqual(check_task_scores(self.session, self.contest),
+                         ([self.pair], []))
+
+        self.assertEqual(
+            check_task_scores(self.session, self.contest, fix=True),
+            ([self.pair], []))
+        self.session.expire_all()
+        self.assertEqual(self.stored().score, 44.4)
+        self.assertEqual(check_task_scores(self.session, self.contest),
+                         ([], []))
+        # Users without submissions have no stored score.
+        self.assertEqual(
+            self.session.query(ParticipationTaskScore)
+            .filter(ParticipationTaskScore.participation_id == other.id)
+            .count(), 0)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -132,5 +132,8 @@ class FakeIsolateSandbox(IsolateSandbox):
     def initialize_isolate(self):
         pass
 
-    def cleanup(self):
+    def _cleanup_isolate(self):
+        pass
+
+    def _allow_deleting_home(self):
         pass
@@ -320,6 +320,33 @@ class TestCheckerStep(unittest.TestCase):
         self.assertEqual(ret, (False, None, None))
         self.assertLoggedError()
 
+    def test_staged(self):
+        self.mock_trusted_step.return_value = (True, True, {})
+        self.set_checker_output(b"0.123\n", b"Text.\n")
+        staged = {}
+
+        ret = checker_step(self.sandbox, "c_dig", "i_dig", "co_dig", "o",
+                           staged)
+
+        self.assertEqual(ret, (True, 0.123, ["Text."]))
+        self.assertEqual(staged, {
+            trusted.CHECKER_FILENAME: "c_dig",
+            trusted.CHECKER_INPUT_FILENAME: "i_dig",
+            trusted.CHECKER_CORRECT_OUTPUT_FILENAME: "co_dig",
+        })
+
+        # Running again, only the files that changed are copied.
+        self.file_cacher.get_file_to_fobj.reset_mock()
+        ret = checker_step(self.sandbox, "c_dig", "i_dig2", "co_dig2", "o",
+                           staged)
+
+        self.assertEqual(ret, (True, 0.123, ["Text."]))
+        self.assertCountEqual(
+            self.file_cacher.get_file_to_fobj.call_args_list,
+            [call("i_dig2", ANY), call("co_dig2", ANY)])
+        self.assertEqual(staged[trusted.CHECKER_INPUT_FILENAME], "i_dig2")
+        self.assertLoggedError(False)
+
     def test_invalid_checker_outcome(self):
         self.mock_trusted_step.return_value = (True, True, {})
         self.set_checker_output(b"A0.123\n", b"Text.\n")
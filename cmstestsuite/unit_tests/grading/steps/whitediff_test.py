@@ -18,6 +18,9 @@
 
 """Tests for whitediff.py."""
 
+import os
+import random
+import tempfile
 import unittest
 from io import BytesIO
 
@@ -67,6 +70,107 @@ class TestWhiteDiff(unittest.TestCase):
         self.assertFalse(self._diff("1 2", "1\n2"))
         self.assertFalse(self._diff("1\n\n2", "1\n2"))
 
+    def test_no_diff_files(self):
+        with tempfile.TemporaryFile() as f1, tempfile.TemporaryFile() as f2:
+            f1.write(b"1 2\n3\n")
+            f2.write(b"1 2\n3\n")
+            f1.seek(0)
+            f2.seek(0)
+            self.assertTrue(_white_diff(f1, f2))
+            f1.seek(0)
+            f2.seek(0, os.SEEK_END)
+            f2.write(b"\n")
+            f2.seek(0)
+            self.assertTrue(_white_diff(f1, f2))
+
+    def test_diff_files_same_size(self):
+        with tempfile.TemporaryFile() as f1, tempfile.TemporaryFile() as f2:
+            f1.write(b"1 2\n3\n")
+            f2.write(b"1 2\n4\n")
+            f1.seek(0)
+            f2.seek(0)
+            self.assertFalse(_white_diff(f1, f2))
+
+
+def _reference_canonicalize(string):
+    """Canonicalize a line as the original line-based algorithm."""
+    for char in _WHITES[1:]:
+        string = string.replace(char, _WHITES[0])
+    return _WHITES[0].join([x for x in string.split(_WHITES[0])
+                            if len(x) > 0])
+
+
+def _reference_white_diff(output, res):
+    """The original line-based algorithm, for comparison."""
+    while True:
+        lout = output.readline()
+        lres = res.readline()
+        if len(lres) == 0 and len(lout) == 0:
+            return True
+        if len(lout) == 0:
+            while len(lres) > 0:
+                if _reference_canonicalize(lres) != b"":
+                    return False
+                lres = res.readline()
+            return True
+        if len(lres) == 0:
+            while len(lout) > 0:
+                if _reference_canonicalize(lout) != b"":
+                    return False
+                lout = output.readline()
+            return True
+        if _reference_canonicalize(lout) != _reference_canonicalize(lres):
+            return False
+
+
+class TestWhiteDiffEquivalence(unittest.TestCase):
+    """Compare the chunked algorithm with the line-based one on random
+    inputs, with block sizes small enough to cut tokens and runs of
+    whitespaces.
+
+    """
+
+    ALPHABET = [b"a", b"b", b"1"] + _WHITES + [b"\n", b"\n"]
+
+    def setUp(self):
+        seed = int.from_bytes(os.urandom(4), "little")
+        self.random = random.Random(seed)
+        self.seed_message = "seed %d" % seed
+
+    def random_output(self):
+        length = self.random.randint(0, 30)
+        return b"".join(self.random.choice(self.ALPHABET)
+                        for _ in range(length))
+
+    def mutate(self, string):
+        """Return a string likely to be equivalent to the given one."""
+        result = []
+        for char in string:
+            char = bytes([char])
+            if char in _WHITES and char != b"\n":
+                char = self.random.choice(_WHITES[:2] + _WHITES[3:]) \
+                    * self.random.randint(1, 3)
+            result.append(char)
+        result.append(self.random.choice([b"", b"\n", b" \n\t\n"]))
+        return b"".join(result)
+
+    def check(self, s1, s2):
+        expected = _reference_white_diff(BytesIO(s1), BytesIO(s2))
+        for chunk_size in [1, 2, 3, 5, 64]:
+            self.assertEqual(
+                _white_diff(BytesIO(s1), BytesIO(s2), chunk_size),
+                expected,
+                "%r %r %d (%s)" % (s1, s2, chunk_size, self.seed_message))
+
+    def test_random(self):
+        for _ in range(500):
+            self.check(self.random_output(), self.random_output())
+
+    def test_random_similar(self):
+        for _ in range(500):
+            s1 = self.random_output()
+            self.check(s1, self.mutate(s1))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -23,7 +23,9 @@ from unittest.mock import MagicMock, call, ANY
 
 from cms.db import File, Manager, Executable
 from cms.grading.Job import CompilationJob, EvaluationJob
+from cms.grading.compilationcache import CompilationCache
 from cms.grading.tasktypes.Batch import Batch
+from cms.grading.tasktypes.util import set_compilation_cache
 from cmstestsuite.unit_tests.grading.tasktypes.tasktypetestutils import \
     COMPILATION_COMMAND_1, COMPILATION_COMMAND_2, EVALUATION_COMMAND_1, \
     LANG_1, LANG_2, OUTCOME, STATS_OK, STATS_RE, TEXT, \
@@ -271,6 +273,40 @@ class TestCompile(TaskTypeTestMixin, unittest.TestCase):
         self.compilation_step.assert_not_called()
         self.assertResultsInJob(job)
 
+    def test_cached(self):
+        set_compilation_cache(CompilationCache())
+        self.addCleanup(set_compilation_cache, None)
+        tt, job = self.prepare(["grader", ["", ""], "diff"],
+                               files={"foo.%l": FILE_FOO_L1},
+                               managers={"grader.l1": GRADER_L1,
+                                         "grader.l2": GRADER_L2})
+        sandbox = self.expect_sandbox()
+        sandbox.get_file_to_storage.return_value = "exe_digest"
+        tt.compile(job, self.file_cacher)
+
+        # The same sources with another irrelevant manager are not
+        # compiled again.
+        tt, job = self.prepare(["grader", ["", ""], "diff"],
+                               files={"foo.%l": FILE_FOO_L1},
+                               managers={"grader.l1": GRADER_L1})
+        tt.compile(job, self.file_cacher)
+
+        self.assertEqual(self.Sandbox.call_count, 1)
+        self.compilation_step.assert_called_once()
+        self.assertResultsInJob(job)
+        self.assertEqual(job.executables["foo"].digest, "exe_digest")
+
+        # A changed grader invalidates the result.
+        tt, job = self.prepare(["grader", ["", ""], "diff"],
+                               files={"foo.%l": FILE_FOO_L1},
+                               managers={"grader.l1": Manager(
+                                   digest="new digest", filename="grader.l1")})
+        sandbox = self.expect_sandbox()
+        sandbox.get_file_to_storage.return_value = "new exe_digest"
+        tt.compile(job, self.file_cacher)
+
+        self.assertEqual(self.compilation_step.call_count, 2)
+
 
 class TestEvaluate(TaskTypeTestMixin, unittest.TestCase):
     """Tests for evaluate().
@@ -519,6 +555,64 @@ class TestEvaluate(TaskTypeTestMixin, unittest.TestCase):
         self.assertResultsInJob(job)
         sandbox.cleanup.assert_called_once_with(delete=True)
 
+    def test_evaluate_many_shared_sandbox(self):
+        tt, job = self.prepare(["alone", ["", ""], "diff"], {"foo": EXE_FOO})
+        job2 = self.job({"foo": EXE_FOO})
+        job2.input = "digest of input 2"
+        sandbox = self.expect_sandbox()
+
+        tt.evaluate_many([job, job2], self.file_cacher)
+
+        # One sandbox, with the executable copied only once; everything
+        # else is removed before the second run.
+        self.Sandbox.assert_called_once_with(self.file_cacher, name="evaluate")
+        sandbox.create_file_from_storage.assert_has_calls([
+            call("foo", "digest of foo", executable=True),
+            call("input.txt", "digest of input"),
+            call("input.txt", "digest of input 2"),
+        ], any_order=True)
+        self.assertEqual(sandbox.create_file_from_storage.call_count, 3)
+        sandbox.reset.assert_called_once_with(keep=["foo"])
+        # Limits are applied to each run.
+        self.assertEqual(self.evaluation_step.call_count, 2)
+        for args in self.evaluation_step.call_args_list:
+            self.assertEqual(args[0][2:], (2.5, 123 * 1024 * 1024))
+        self.assertResultsInJob(job)
+        self.assertResultsInJob(job2)
+        sandbox.cleanup.assert_called_once_with(delete=True)
+
+    def test_evaluate_many_sandbox_failure(self):
+        tt, job = self.prepare(["alone", ["", ""], "diff"], {"foo": EXE_FOO})
+        job2 = self.job({"foo": EXE_FOO})
+        sandbox = self.expect_sandbox()
+        sandbox2 = self.expect_sandbox()
+        self.evaluation_step.side_effect = [
+            (False, None, None), (True, True, STATS_OK)]
+
+        tt.evaluate_many([job, job2], self.file_cacher)
+
+        # The failed sandbox is kept, and the second run has a new one.
+        self.assertFalse(job.success)
+        self.assertTrue(job2.success)
+        self.assertEqual(self.Sandbox.call_count, 2)
+        sandbox.cleanup.assert_called_once_with(delete=False)
+        sandbox2.cleanup.assert_called_once_with(delete=True)
+        sandbox2.create_file_from_storage.assert_any_call(
+            "foo", "digest of foo", executable=True)
+
+    def test_evaluate_many_exception(self):
+        tt, job = self.prepare(["alone", ["", ""], "diff"], {"foo": EXE_FOO})
+        job2 = self.job({"foo": EXE_FOO})
+        sandbox = self.expect_sandbox()
+        self.evaluation_step.side_effect = [
+            (True, True, STATS_OK), ValueError("boom")]
+
+        with self.assertRaises(ValueError):
+            tt.evaluate_many([job, job2], self.file_cacher)
+
+        # The shared sandbox is not leaked, but kept for inspection.
+        sandbox.cleanup.assert_called_once_with(delete=False)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -19,9 +19,14 @@
 """Tests for the utilities for task types."""
 
 import unittest
+from unittest.mock import MagicMock, patch
 
 from cms.grading import Language
-from cms.grading.tasktypes import is_manager_for_compilation
+from cms.grading.Job import EvaluationJob
+from cms.grading.Sandbox import ExecutionSlot, set_execution_slot
+from cms.grading.tasktypes import is_manager_for_compilation, eval_output
+from cms.grading.tasktypes.util import CheckerSandboxes, \
+    set_checker_sandboxes
 
 
 class TestLanguage(Language):
@@ -91,5 +96,113 @@ class TestIsManagerForCompilation(unittest.TestCase):
         self.assertIsNotForCompilation("test.srcext1.")
 
 
+class TestCheckerSandboxes(unittest.TestCase):
+    """Test the reuse of the sandbox of the checker in eval_output."""
+
+    def setUp(self):
+        super().setUp()
+        self.file_cacher = MagicMock()
+        self.sandboxes = []
+
+        def new_sandbox(file_cacher, name=None):
+            sandbox = MagicMock()
+            sandbox.file_exists.return_value = False
+            self.sandboxes.append(sandbox)
+            return sandbox
+
+        patcher = patch("cms.grading.tasktypes.util.create_sandbox",
+                        side_effect=new_sandbox)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.grading.tasktypes.util.delete_sandbox")
+        self.delete_sandbox = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.grading.tasktypes.util.checker_step")
+        self.checker_step = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.checker_step.return_value = (True, 1.0, ["ok"])
+
+        self.checker_sandboxes = CheckerSandboxes(self.file_cacher)
+        set_checker_sandboxes(self.checker_sandboxes)
+        self.addCleanup(set_checker_sandboxes, None)
+        self.addCleanup(set_execution_slot, None)
+
+    def check(self, job=None):
+        if job is None:
+            job = EvaluationJob(managers={"checker": MagicMock(digest="c")},
+                                input="i", output="o")
+        return eval_output(self.file_cacher, job, "checker",
+                           user_output_digest="u")
+
+    def test_reuse(self):
+        for _ in range(3):
+            self.assertEqual(self.check(), (True, 1.0, ["ok"]))
+        self.assertEqual(len(self.sandboxes), 1)
+        self.delete_sandbox.assert_not_called()
+        # The same files are passed to each run.
+        staged = self.checker_step.call_args_list[0][0][5]
+        for args in self.checker_step.call_args_list:
+            self.assertIs(args[0][0], self.sandboxes[0])
+            self.assertIs(args[0][5], staged)
+
+        self.checker_sandboxes.close()
+        self.delete_sandbox.assert_called_once_with(self.sandboxes[0], True)
+        self.assertEqual(self.checker_sandboxes.checks, 3)
+
+    def test_reuse_removes_other_files(self):
+        def stage(sandbox, checker_digest, input_digest, output_digest,
+                  user_output_filename, staged):
+            staged["checker"] = checker_digest
+            return True, 1.0, ["ok"]
+        self.checker_step.side_effect = stage
+
+        self.check()
+        self.check()
+        # Only the files staged for the checker survive between runs.
+        self.assertEqual(
+            [set(c[2]["keep"])
+             for c in self.sandboxes[0].remove_files.mock_calls],
+            [set(), {"checker"}])
+
+    def test_reuse_not_recorded_in_job(self):
+        job = EvaluationJob(managers={"checker": MagicMock(digest="c")},
+                            input="i", output="o")
+        self.check(job)
+        self.assertEqual(job.sandboxes, [])
+
+        self.checker_step.return_value = (False, None, None)
+        self.check(job)
+        self.assertEqual(job.sandboxes,
+                         [self.sandboxes[0].get_root_path.return_value])
+
+    def test_keep_sandbox_not_reused(self):
+        job = EvaluationJob(managers={"checker": MagicMock(digest="c")},
+                            input="i", output="o", keep_sandbox=True)
+        self.check()
+        self.check(job)
+        self.assertEqual(len(self.sandboxes), 2)
+        self.assertEqual(job.sandboxes,
+                         [self.sandboxes[1].get_root_path.return_value])
+        self.delete_sandbox.assert_called_once_with(
+            self.sandboxes[1], True, True)
+
+    def test_one_sandbox_per_slot(self):
+        slots = [ExecutionSlot(0, 2), ExecutionSlot(1, 2)]
+        for slot in slots + slots:
+            set_execution_slot(slot)
+            self.check()
+        self.assertEqual(len(self.sandboxes), 2)
+        self.checker_sandboxes.close()
+        self.assertEqual(self.delete_sandbox.call_count, 2)
+
+    def test_failure_not_reused(self):
+        self.checker_step.return_value = (False, None, None)
+        self.assertEqual(self.check(), (False, None, None))
+        self.delete_sandbox.assert_called_once_with(self.sandboxes[0], False)
+        self.checker_step.return_value = (True, 1.0, ["ok"])
+        self.check()
+        self.assertEqual(len(self.sandboxes), 2)
+
+
 if __name__ == "__main__":
     unittest.main()
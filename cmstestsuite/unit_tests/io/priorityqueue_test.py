@@ -26,7 +26,7 @@ import gevent
 import gevent.event
 import gevent.socket
 
-from cms.io import FakeQueueItem, PriorityQueue
+from cms.io import FairPriorityQueue, FakeQueueItem, PriorityQueue
 from cmscommon.datetime import make_datetime
 
 
@@ -175,6 +175,173 @@ class TestPriorityQueue(unittest.TestCase):
         self.assertFalse(self.item_b in self.queue)
         self.queue._verify()
 
+    def test_push_many(self):
+        """Test that pushing many items is as pushing them one by one."""
+        entries = [(FakeQueueItem(str(i)), i % 3, make_datetime(i % 7))
+                   for i in range(100)]
+        reference = PriorityQueue()
+        for item, priority, timestamp in entries:
+            reference.push(item, priority, timestamp)
+
+        # Few items on a large queue, then many on a small one.
+        self.assertEqual(self.queue.push_many(entries[:90]), 90)
+        self.assertEqual(self.queue.push_many(entries[85:]), 10)
+        self.assertTrue(self.queue._verify())
+        self.assertEqual(len(self.queue), 100)
+        while not reference.empty():
+            self.assertEqual(self.queue.pop().item, reference.pop().item)
+        self.assertTrue(self.queue._verify())
+
+        self.assertEqual(self.queue.push_many(entries[:10]), 10)
+        self.assertEqual(self.queue.push_many(entries[10:]), 90)
+        self.assertTrue(self.queue._verify())
+        self.assertEqual(self.queue.pop().item, FakeQueueItem("0"))
+
+    def test_pop_many(self):
+        """Test that items are extracted in order, some or all."""
+        self.assertEqual(self.queue.pop_many(3), [])
+        self.queue.push(self.item_a, PriorityQueue.PRIORITY_LOW)
+        self.queue.push(self.item_b, PriorityQueue.PRIORITY_MEDIUM,
+                        timestamp=make_datetime(10))
+        self.queue.push(self.item_c, PriorityQueue.PRIORITY_MEDIUM,
+                        timestamp=make_datetime(5))
+        self.queue.push(self.item_d, PriorityQueue.PRIORITY_HIGH)
+
+        self.assertEqual([entry.item for entry in self.queue.pop_many(2)],
+                         [self.item_d, self.item_c])
+        self.assertTrue(self.queue._verify())
+        self.assertEqual([entry.item for entry in self.queue.pop_many()],
+                         [self.item_b, self.item_a])
+        self.assertTrue(self.queue._verify())
+        self.assertTrue(self.queue.empty())
+
+    def test_pop_many_waiting(self):
+        """Test that pop_many with waiting blocks until there is an item."""
+        def waiting():
+            return self.queue.pop_many(5, wait=True)
+
+        greenlet = gevent.spawn(waiting)
+        gevent.sleep(0.01)
+        self.queue.push(self.item_a)
+        gevent.sleep(0.01)
+        self.assertTrue(greenlet.successful())
+        self.assertEqual([entry.item for entry in greenlet.value],
+                         [self.item_a])
+
+    def test_remove_many(self):
+        """Test that items get removed, few or many at a time."""
+        items = [FakeQueueItem(str(i)) for i in range(20)]
+        self.queue.push_many((item, None, make_datetime(i))
+                             for i, item in enumerate(items))
+
+        removed = self.queue.remove_many(items[3:5] + [self.item_a])
+        self.assertEqual(set(entry.item for entry in removed),
+                         set(items[3:5]))
+        self.assertTrue(self.queue._verify())
+
+        removed = self.queue.remove_many(items[5:])
+        self.assertEqual(len(removed), 15)
+        self.assertTrue(self.queue._verify())
+        self.assertEqual([entry.item for entry in self.queue.pop_many()],
+                         items[:3])
+
+
+class TestFairPriorityQueue(unittest.TestCase):
+
+    def setUp(self):
+        # Items are named <contest><participation><n>, e.g. "ab1".
+        self.queue = FairPriorityQueue(
+            lambda item: (str(item)[0], str(item)[1]), quantum=2)
+
+    def push_all(self, titles, priority=PriorityQueue.PRIORITY_MEDIUM):
+        for i, title in enumerate(titles):
+            self.assertTrue(self.queue.push(
+                FakeQueueItem(title), priority, make_datetime(i)))
+        self.assertTrue(self.queue._verify())
+
+    def pop_all(self):
+        titles = []
+        while not self.queue.empty():
+            self.assertEqual(self.queue.top().item, self.queue.top().item)
+            top = self.queue.top()
+            self.assertEqual(self.queue.pop().item, top.item)
+            titles.append(str(top.item))
+            self.assertTrue(self.queue._verify())
+        with self.assertRaises(LookupError):
+            self.queue.pop()
+        return titles
+
+    def test_round_robin_participations(self):
+        # One participation submitted first, many times.
+        self.push_all(["xa1", "xa2", "xa3", "xa4", "xa5", "xb1", "xc1"])
+        self.assertEqual(
+            self.pop_all(),
+            ["xa1", "xa2", "xb1", "xc1", "xa3", "xa4", "xa5"])
+
+    def test_round_robin_contests(self):
+        self.push_all(["xa1", "xa2", "xb1", "xb2", "xc1", "ya1", "ya2"])
+        self.assertEqual(
+            self.pop_all(),
+            ["xa1", "xa2", "ya1", "ya2", "xb1", "xb2", "xc1"])
+
+    def test_priority_first(self):
+        self.push_all(["xa1", "xa2", "xa3"], PriorityQueue.PRIORITY_LOW)
+        self.push_all(["xb1"], PriorityQueue.PRIORITY_LOW)
+        self.push_all(["ya1"], PriorityQueue.PRIORITY_HIGH)
+        self.assertEqual(self.pop_all(), ["ya1", "xa1", "xa2", "xb1", "xa3"])
+
+    def test_remove_and_set_priority(self):
+        self.push_all(["xa1", "xa2", "xb1", "xc1"])
+        self.assertFalse(self.queue.push(FakeQueueItem("xa1")))
+        self.assertIn(FakeQueueItem("xb1"), self.queue)
+
+        self.queue.remove(FakeQueueItem("xb1"))
+        self.assertNotIn(FakeQueueItem("xb1"), self.queue)
+        self.assertTrue(self.queue._verify())
+        with self.assertRaises(KeyError):
+            self.queue.remove(FakeQueueItem("xb1"))
+
+        self.queue.set_priority(FakeQueueItem("xc1"),
+                                PriorityQueue.PRIORITY_HIGH)
+        self.assertTrue(self.queue._verify())
+        self.assertEqual(len(self.queue), 3)
+        self.assertEqual(str(self.queue.get_status()[0]["item"]["_title"]),
+                         "xc1")
+        self.assertEqual(self.pop_all(), ["xc1", "xa1", "xa2"])
+
+    def test_pop_waiting(self):
+        def waiting():
+            return self.queue.pop(wait=True)
+
+        greenlet = gevent.spawn(waiting)
+        gevent.sleep(0.01)
+        self.push_all(["xa1"])
+        gevent.sleep(0.01)
+        self.assertTrue(greenlet.successful())
+        self.assertEqual(str(greenlet.value.item), "xa1")
+        self.assertTrue(self.queue._verify())
+
+    def test_many(self):
+        self.assertEqual(self.queue.push_many(
+            (FakeQueueItem(title), None, make_datetime(i))
+            for i, title in enumerate(["xa1", "xa2", "xa3", "xb1"])), 4)
+        self.assertEqual(len(self.queue.remove_many(
+            [FakeQueueItem("xa2"), FakeQueueItem("yb1")])), 1)
+        self.assertTrue(self.queue._verify())
+        self.assertEqual([str(entry.item) for entry in self.queue.pop_many()],
+                         ["xa1", "xa3", "xb1"])
+
+    def test_wait_status(self):
+        self.push_all(["xa1", "xa2", "xb1"])
+        self.queue.pop()
+        status = dict(((s["group"], s["owner"]), s)
+                      for s in self.queue.get_wait_status())
+        self.assertEqual(status[("x", "a")]["queued"], 1)
+        self.assertEqual(status[("x", "a")]["extracted"], 1)
+        self.assertGreaterEqual(status[("x", "a")]["max_wait"], 0.0)
+        self.assertEqual(status[("x", "b")]["queued"], 1)
+        self.assertEqual(status[("x", "b")]["extracted"], 0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -21,7 +21,9 @@
 
 """
 
+import json
 import unittest
+from datetime import datetime
 from unittest.mock import Mock, patch
 
 import gevent
@@ -29,9 +31,11 @@ import gevent.event
 import gevent.socket
 from gevent.server import StreamServer
 
-from cms import Address, ServiceCoord
+from cms import Address, ServiceCoord, config
 from cms.io import RPCError, rpc_method, RemoteServiceServer, \
     RemoteServiceClient
+from cms.io.rpccodec import CODECS, FRAME_COMPRESSED, FRAME_HEADER, \
+    JSONCodec, decode_frame_payload, encode_frame
 
 
 class MockService:
@@ -418,6 +422,122 @@ class TestRPC(unittest.TestCase):
         self.assertFalse(self.servers[0].connected)
         sock.close()
 
+    def assertEchoes(self, client, value):
+        result = client.echo(value=value)
+        result.wait()
+        self.assertTrue(result.successful())
+        self.assertEqual(result.value, value)
+
+    def test_framed_protocol(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        self.assertEchoes(client, {"foo": [1, 2.5, None, "bar"]})
+        self.assertTrue(client._framed)
+        self.assertTrue(self.servers[0]._framed)
+        self.assertIs(client._codec, next(iter(CODECS.values())))
+        self.assertIs(self.servers[0]._codec, client._codec)
+
+    def test_framed_protocol_disabled(self):
+        with patch.object(config, "rpc_framing", False):
+            client = self.get_client(ServiceCoord("Foo", 0))
+            self.assertEchoes(client, 42)
+        self.assertFalse(client._framed)
+        self.assertFalse(self.servers[0]._framed)
+
+    def test_framed_protocol_old_server(self):
+        # An old server treats the proposal as a call to a method that
+        # does not exist.
+        with patch.object(RemoteServiceServer, "negotiate",
+                          return_value=False):
+            client = self.get_client(ServiceCoord("Foo", 0))
+            self.assertEchoes(client, 42)
+        self.assertFalse(client._framed)
+        self.assertFalse(self.servers[0]._framed)
+
+    def test_framed_protocol_old_client(self):
+        with patch.object(RemoteServiceClient, "negotiate",
+                          return_value=True):
+            client = self.get_client(ServiceCoord("Foo", 0))
+            self.assertEchoes(client, 42)
+        self.assertFalse(client._framed)
+        self.assertFalse(self.servers[0]._framed)
+
+    def test_framed_protocol_common_codec(self):
+        with patch("cms.io.rpc.CODECS", {"json": JSONCodec}):
+            client = self.get_client(ServiceCoord("Foo", 0))
+            self.assertEchoes(client, 42)
+        self.assertIs(client._codec, JSONCodec)
+        self.assertIs(self.servers[0]._codec, JSONCodec)
+
+    def test_framed_large_message(self):
+        # Larger than MAX_MESSAGE_SIZE, sent compressed.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        self.assertEchoes(client, "x" * 2 * client.MAX_MESSAGE_SIZE)
+        self.assertTrue(client.connected)
+
+    def test_framed_large_message_uncompressed(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        with patch.object(config, "rpc_compression_min_size", None):
+            self.assertEchoes(client, "x" * 2 * client.MAX_MESSAGE_SIZE)
+
+    def test_send_invalid_frame(self):
+        sock = gevent.socket.create_connection((self.host, self.port))
+        reader = sock.makefile("rb")
+        sock.sendall(json.dumps({
+            "__id": "foo", "__method": "__protocol",
+            "__data": {"versions": [2], "codecs": ["json"]}})
+            .encode("utf-8") + b"\r\n")
+        self.assertEqual(json.loads(reader.readline())["__data"],
+                         {"version": 2, "codec": "json"})
+        sock.sendall(FRAME_HEADER.pack(FRAME_COMPRESSED, 3) + b"foo")
+        self.sleep()
+        # Frames that cannot be decompressed cause the connection to be
+        # closed.
+        self.assertFalse(self.servers[0].connected)
+        reader.close()
+        sock.close()
+
+
+class TestRPCCodec(unittest.TestCase):
+
+    def test_codecs(self):
+        message = {"__id": "foo", "__data": {1: [1.5, None, "\u00e8"]}}
+        for codec in CODECS.values():
+            data = codec.encode(message)
+            # Same data model as the original protocol.
+            self.assertEqual(json.loads(data.decode("utf-8")),
+                             {"__id": "foo",
+                              "__data": {"1": [1.5, None, "\u00e8"]}})
+            self.assertEqual(codec.decode(data),
+                             JSONCodec.decode(JSONCodec.encode(message)))
+            with self.assertRaises(TypeError):
+                codec.encode({"foo": datetime(2018, 1, 1)})
+            with self.assertRaises(ValueError):
+                codec.decode(b"{foo")
+
+    def test_frame_small(self):
+        frame = encode_frame(b"foo", 10)
+        self.assertEqual(frame, FRAME_HEADER.pack(0, 3) + b"foo")
+        self.assertEqual(decode_frame_payload(0, b"foo", 10), b"foo")
+
+    def test_frame_compressed(self):
+        payload = b"foo" * 1000
+        frame = encode_frame(payload, 10)
+        flags, length = FRAME_HEADER.unpack(frame[:FRAME_HEADER.size])
+        self.assertEqual(flags, FRAME_COMPRESSED)
+        self.assertEqual(length, len(frame) - FRAME_HEADER.size)
+        self.assertLess(length, len(payload))
+        self.assertEqual(
+            decode_frame_payload(flags, frame[FRAME_HEADER.size:], 3000),
+            payload)
+        # Decompressed payloads larger than the maximum are rejected.
+        with self.assertRaises(ValueError):
+            decode_frame_payload(flags, frame[FRAME_HEADER.size:], 2999)
+
+    def test_frame_compression_disabled(self):
+        payload = b"foo" * 1000
+        self.assertEqual(encode_frame(payload, None),
+                         FRAME_HEADER.pack(0, len(payload)) + payload)
+
 
 if __name__ == "__main__":
     unittest.main()
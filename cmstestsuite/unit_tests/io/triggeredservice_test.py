@@ -89,6 +89,20 @@ class FakeTriggeredService(TriggeredService):
         return counter
 
 
+class FakeIncrementalTriggeredService(FakeTriggeredService):
+    def __init__(self, shard, timeout):
+        super().__init__(shard, timeout)
+        self.sweeps = []
+
+    def _missing_operations(self):
+        self.sweeps.append("full")
+        return super()._missing_operations()
+
+    def _missing_operations_incremental(self):
+        self.sweeps.append("incremental")
+        return super()._missing_operations()
+
+
 class TestTriggeredService(unittest.TestCase):
 
     def setUp(self):
@@ -132,6 +146,42 @@ class TestTriggeredService(unittest.TestCase):
         for notifier in self.notifiers:
             self.assertEqual(notifier.get_notifications(), 2)
 
+    def test_sweeper_incremental(self):
+        """Test that only the first and the requested sweeps are full."""
+        self.get_service_address.return_value = Address('127.0.0.1', '12345')
+        self.service = FakeIncrementalTriggeredService(0, 0.1)
+        self.service.add_executor(FakeExecutor(self.notifiers[0]))
+        self.service.add_missing_operation(FakeQueueItem('op 0'))
+        self.service.start_sweeper(0.1)
+        gevent.sleep(0.15)
+        self.assertEqual(self.service.sweeps, ["full", "incremental"])
+
+        self.service.add_missing_operation(FakeQueueItem('op 1'))
+        self.service.search_operations_not_done()
+        gevent.sleep(0.01)
+        self.assertEqual(self.service.sweeps,
+                         ["full", "incremental", "full"])
+
+        status = self.service.sweeper_status()
+        self.assertEqual(status["full_sweeps"], 2)
+        self.assertEqual(status["incremental_sweeps"], 1)
+        self.assertTrue(status["last_sweep_full"])
+        self.assertEqual(status["last_sweep_recovered"], 1)
+        self.assertEqual(status["total_recovered"], 2)
+        self.assertEqual(self.notifiers[0].get_notifications(), 2)
+
+    def test_sweeper_periodic_full(self):
+        """Test that one periodic sweep every few is a full one."""
+        self.get_service_address.return_value = Address('127.0.0.1', '12345')
+        self.service = FakeIncrementalTriggeredService(0, 0.05)
+        self.service.FULL_SWEEP_INTERVAL = 3
+        self.service.add_executor(FakeExecutor(self.notifiers[0]))
+        self.service.start_sweeper(0.05)
+        gevent.sleep(0.5)
+        self.assertEqual(self.service.sweeps[:7],
+                         ["full", "incremental", "incremental", "full",
+                          "incremental", "incremental", "full"])
+
     def test_bad_executor(self):
         """Test that a slow executor does not block the others."""
         self.setUpService()
@@ -170,6 +220,20 @@ class TestTriggeredService(unittest.TestCase):
         # Just one call to the batch executor.
         self.assertEqual(batch_notifier.get_notifications(), 1)
 
+    def test_enqueue_dequeue_many(self):
+        """Test adding and removing several operations at once."""
+        self.setUpService()
+        batch_notifier = Notifier()
+        self.service.add_executor(FakeBatchExecutor(batch_notifier))
+        items = [FakeQueueItem("op %d" % i) for i in range(4)]
+        self.assertEqual(self.service.enqueue_many(
+            (item, None, None) for item in items), 3 * 4)
+        self.service.dequeue_many(items[1:3])
+        gevent.sleep(0.01)
+        for notifier in self.notifiers:
+            self.assertEqual(notifier.get_notifications(), 2)
+        self.assertEqual(batch_notifier.get_notifications(), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
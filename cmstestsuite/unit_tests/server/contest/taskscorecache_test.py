@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the cache of the task scores of CWS."""
+
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from cms.grading.scoring import TaskScore, parse_task_scores_notification
+from cms.server.contest.taskscorecache import TaskScoreCache
+
+
+class TestParseNotification(unittest.TestCase):
+
+    def test_pairs(self):
+        self.assertEqual(parse_task_scores_notification("1:2 3:4"),
+                         {(1, 2), (3, 4)})
+
+    def test_all(self):
+        self.assertIsNone(parse_task_scores_notification(""))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_task_scores_notification("1:2 3")
+
+
+class TestTaskScoreCache(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = TaskScoreCache(max_size=2)
+        # Simulate the connection for the notifications.
+        self.cache._listening = True
+        self.participation = SimpleNamespace(id=1)
+        self.tasks = [SimpleNamespace(id=i, active_dataset_id=10 * i)
+                      for i in range(3)]
+        self.computed = 0
+
+        patcher = patch("cms.server.contest.taskscorecache.get_task_score",
+                        side_effect=self.get_task_score)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_task_score(self, session, participation, task):
+        self.computed += 1
+        return TaskScore(float(self.computed), False, 0.0, 0.0)
+
+    def get(self, task_index=0):
+        return self.cache.get(None, self.participation,
+                              self.tasks[task_index]).score
+
+    def test_cached(self):
+        self.assertEqual(self.get(), 1.0)
+        self.assertEqual(self.get(), 1.0)
+        self.assertEqual(self.get(1), 2.0)
+        self.assertEqual(self.get(), 1.0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 2))
+
+    def test_invalidate(self):
+        self.get()
+        self.get(1)
+        self.cache._receive("1:0 2:1")
+        self.assertEqual(self.get(), 3.0)
+        self.assertEqual(self.get(1), 2.0)
+        self.cache._receive("")
+        self.assertEqual(self.get(1), 4.0)
+
+    def test_dataset_changed(self):
+        self.get()
+        self.tasks[0].active_dataset_id = 11
+        self.assertEqual(self.get(), 2.0)
+        self.assertEqual(self.get(), 2.0)
+
+    def test_not_listening(self):
+        self.cache._listening = False
+        self.assertEqual(self.get(), 1.0)
+        self.assertEqual(self.get(), 2.0)
+
+    def test_notification_during_read(self):
+        # A score read while a notification arrives may be stale.
+        def get_task_score(session, participation, task):
+            self.cache._receive("2:0")
+            return self.get_task_score(session, participation, task)
+
+        with patch("cms.server.contest.taskscorecache.get_task_score",
+                   side_effect=get_task_score):
+            self.assertEqual(self.get(), 1.0)
+        self.assertEqual(self.get(), 2.0)
+        self.assertEqual(self.get(), 2.0)
+
+    def test_least_recently_used_discarded(self):
+        self.get()
+        self.get(1)
+        self.get()
+        self.get(2)
+        self.assertEqual(self.get(), 1.0)
+        self.assertEqual(self.get(1), 4.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,6 +25,7 @@
 import gevent.monkey
 gevent.monkey.patch_all()  # noqa
 
+import json
 import unittest
 from unittest.mock import patch, PropertyMock
 
@@ -70,9 +71,8 @@ class TestProxyService(DatabaseMixin, unittest.TestCase):
                                                     team=self.team)
 
         self.new_sr_unscored()
-        self.new_sr_scored()
-        result = self.new_sr_scored()
-        self.add_token(submission=result.submission)
+        self.scored_results = [self.new_sr_scored(), self.new_sr_scored()]
+        self.add_token(submission=self.scored_results[1].submission)
 
         self.session.commit()
 
@@ -109,6 +109,26 @@ class TestProxyService(DatabaseMixin, unittest.TestCase):
         self.assertTrue(urls[4].endswith("submissions/"))
         self.assertTrue(urls[5].endswith("subchanges/"))
 
+    def test_submissions_scored(self):
+        """Test that the scores of many submissions are sent at once."""
+        service = ProxyService(0, self.contest.id)
+        gevent.sleep(0.1)
+        self.requests_put.reset_mock()
+
+        submission_ids = [result.submission_id
+                          for result in self.scored_results]
+        # Unexistent submissions are ignored.
+        service.submissions_scored(submission_ids + [max(submission_ids) + 1])
+        gevent.sleep(0.1)
+
+        calls = self.requests_put.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(calls[0][0][0].endswith("submissions/"))
+        self.assertCountEqual(
+            json.loads(calls[0][0][1]).keys(),
+            ["%d" % submission_id for submission_id in submission_ids])
+        self.assertTrue(calls[1][0][0].endswith("subchanges/"))
+
 
 if __name__ == "__main__":
     unittest.main()
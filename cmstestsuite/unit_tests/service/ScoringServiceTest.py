@@ -27,14 +27,16 @@ import gevent.monkey
 gevent.monkey.patch_all()  # noqa
 
 import unittest
-from unittest.mock import patch, PropertyMock
+from unittest.mock import Mock, patch, PropertyMock
 
 import gevent
 
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
+from cms.db import ParticipationTaskScore
 from cms.service.ScoringService import ScoringService
+from cms.service.scoringoperations import ScoringOperation
 from cmstestsuite.unit_tests.testidgenerator import unique_long_id, \
     unique_unicode_id
 
@@ -61,9 +63,11 @@ class TestScoringService(DatabaseMixin, unittest.TestCase):
         self.call_args.append((sr.submission_id, sr.dataset_id))
         return self.score_info
 
-    def new_sr_to_score(self):
+    def new_sr_to_score(self, active=False):
         task = self.add_task(contest=self.contest)
         dataset = self.add_dataset(task=task)
+        if active:
+            task.active_dataset = dataset
         submission = self.add_submission(task=task)
         result = self.add_submission_result(
             compilation_outcome="ok", evaluation_outcome="ok",
@@ -136,6 +140,88 @@ class TestScoringService(DatabaseMixin, unittest.TestCase):
         # Asserts that compute_score was called.
         self.score_type.compute_score.assert_not_called()
 
+    def test_new_evaluation_batch(self):
+        """Many submissions are scored together and notified at once.
+
+        """
+        srs = [self.new_sr_to_score(active=True) for _ in range(3)]
+        sr_inactive = self.new_sr_to_score()
+        self.session.commit()
+
+        service = ScoringService(0)
+        service.get_executor().proxy_service = Mock()
+        for sr in srs + [sr_inactive]:
+            service.new_evaluation(sr.submission_id, sr.dataset_id)
+
+        gevent.sleep(0.1)  # Needed to trigger the score loop.
+
+        self.assertCountEqual(self.call_args,
+                              [(sr.submission_id, sr.dataset_id)
+                               for sr in srs + [sr_inactive]])
+        # Only the results on active datasets are sent to the rankings.
+        proxy_service = service.get_executor().proxy_service
+        proxy_service.submissions_scored.assert_called_once()
+        self.assertCountEqual(
+            proxy_service.submissions_scored.call_args[1]["submission_ids"],
+            [sr.submission_id for sr in srs])
+
+    def test_new_evaluation_batch_errors(self):
+        """Errors in some submissions do not affect the others.
+
+        """
+        sr_a = self.new_sr_to_score()
+        sr_not_evaluated = self.new_sr_to_score()
+        sr_not_evaluated.evaluation_outcome = None
+        sr_b = self.new_sr_to_score()
+        self.session.commit()
+
+        service = ScoringService(0)
+        service.new_evaluation(sr_a.submission_id, sr_a.dataset_id)
+        service.new_evaluation(sr_not_evaluated.submission_id,
+                               sr_not_evaluated.dataset_id)
+        # A submission result that does not exist.
+        service.enqueue(ScoringOperation(sr_a.submission_id,
+                                         sr_b.dataset_id))
+        service.new_evaluation(sr_b.submission_id, sr_b.dataset_id)
+
+        gevent.sleep(0.1)  # Needed to trigger the score loop.
+
+        self.assertCountEqual(self.call_args,
+                              [(sr_a.submission_id, sr_a.dataset_id),
+                               (sr_b.submission_id, sr_b.dataset_id)])
+        for sr in [sr_a, sr_b]:
+            self.session.expire(sr)
+            self.assertEqual(sr.score, self.score_info[0])
+        self.session.expire(sr_not_evaluated)
+        self.assertIsNone(sr_not_evaluated.score)
+
+    # Testing invalidate_submission.
+
+    def test_invalidate_submission(self):
+        """The score and the stored score of the user on the task are
+        invalidated.
+
+        """
+        sr = self.new_sr_scored()
+        submission = sr.submission
+        self.session.add(ParticipationTaskScore(
+            participation=submission.participation, task=submission.task,
+            dataset=sr.dataset, score=100.0, partial=False,
+            public_score=50.0, tokened_score=0.0))
+        self.session.commit()
+
+        service = ScoringService(0)
+        with patch.object(service, "enqueue") as enqueue:
+            service.invalidate_submission(submission_id=sr.submission_id)
+
+        enqueue.assert_called_once()
+        self.session.expire_all()
+        self.assertIsNone(sr.score)
+        self.assertEqual(
+            self.session.query(ParticipationTaskScore)
+            .filter(ParticipationTaskScore.task_id == submission.task_id)
+            .count(), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
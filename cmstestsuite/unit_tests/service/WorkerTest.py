@@ -22,13 +22,15 @@
 """
 
 import unittest
-from unittest.mock import Mock, call
+from unittest.mock import Mock, call, patch
 
 import gevent
 
 import cms.service.Worker
+from cms import ConfigError, config
 from cms.grading import JobException
 from cms.grading.Job import JobGroup, EvaluationJob
+from cms.grading.Sandbox import get_execution_slot
 from cms.service.Worker import Worker
 from cms.service.esoperations import ESOperation
 from cmstestsuite.unit_tests.testidgenerator import \
@@ -134,6 +136,8 @@ class TestWorker(unittest.TestCase):
         because of the lock.
 
         """
+        # Without prefetching, no job group can wait for the lock.
+        self.service.prefetch_depth = 0
         # Because of how gevent works, the interval here can be very small.
         task_type = FakeTaskType([0.01])
         cms.service.Worker.get_task_type = Mock(return_value=task_type)
@@ -159,6 +163,123 @@ class TestWorker(unittest.TestCase):
                          cms.service.Worker.get_task_type.mock_calls)
         cms.service.Worker.get_task_type.assert_has_calls(calls_a)
 
+    def test_execute_job_group_prefetched(self):
+        """Executes a long job, then another one that waits for it after
+        prefetching its files, and a third one that should fail because
+        the queue is full.
+
+        """
+        self.service.prefetch_depth = 1
+        self.service.file_cacher = Mock()
+        task_type = FakeTaskType([0.01, True])
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        jobs_a, calls_a = TestWorker.new_jobs(1, prefix="a")
+        jobs_b, calls_b = TestWorker.new_jobs(1, prefix="b")
+        jobs_b[0].input = "input_digest"
+        jobs_c, calls_c = TestWorker.new_jobs(1, prefix="c")
+
+        def call_with(job):
+            return JobGroup.import_from_dict(self.service.execute_job_group(
+                JobGroup([job]).export_to_dict()))
+
+        first_greenlet = gevent.spawn(call_with, jobs_a[0])
+        gevent.sleep(0)  # To ensure we call jobgroup_a first.
+        second_greenlet = gevent.spawn(call_with, jobs_b[0])
+        gevent.sleep(0)
+
+        with self.assertRaises(JobException):
+            call_with(jobs_c[0])
+
+        first_greenlet.get()
+        self.assertTrue(second_greenlet.get().jobs[0].success)
+        self.service.file_cacher.load.assert_called_once_with(
+            "input_digest", if_needed=True)
+        cms.service.Worker.get_task_type.assert_has_calls(calls_a + calls_b)
+        self.assertNotIn(calls_c[0],
+                         cms.service.Worker.get_task_type.mock_calls)
+
+    def test_execute_job_group_queued_in_order(self):
+        """Executes a long job, then two that wait for it: the first
+        one takes longer to prefetch its files, but still executes
+        before the second one.
+
+        """
+        self.service.prefetch_depth = 2
+        self.service.file_cacher = Mock()
+        self.service.file_cacher.load.side_effect = \
+            lambda digest, if_needed: gevent.sleep(0.05)
+        task_type = FakeTaskType([0.01, True, True])
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        jobs, calls = TestWorker.new_jobs(3)
+        jobs[1].input = "input_digest"
+
+        def call_with(job):
+            return JobGroup.import_from_dict(self.service.execute_job_group(
+                JobGroup([job]).export_to_dict()))
+
+        greenlets = []
+        for job in jobs:
+            greenlets.append(gevent.spawn(call_with, job))
+            gevent.sleep(0)
+
+        for greenlet in greenlets:
+            self.assertTrue(greenlet.get().jobs[0].success)
+        cms.service.Worker.get_task_type.assert_has_calls(calls)
+        self.assertFalse(self.service._busy)
+
+    def test_execute_job_group_slots(self):
+        """Executes a job group in three execution slots.
+
+        """
+        with patch.object(config, "max_worker_slots", 4):
+            self.service = Worker(0, slots=3)
+        n_jobs = 7
+        jobs, calls = TestWorker.new_jobs(n_jobs)
+        task_type = FakeTaskType([0.01] * n_jobs)
+        slots = []
+
+        def execute_job(job, file_cacher):
+            slots.append(get_execution_slot().index)
+            FakeTaskType.execute_job(task_type, job, file_cacher)
+
+        task_type.execute_job = execute_job
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        self.assertEqual(self.service.execution_slots(), 3)
+        job_group = JobGroup.import_from_dict(self.service.execute_job_group(
+            JobGroup(jobs).export_to_dict()))
+
+        self.assertTrue(all(job.success for job in job_group.jobs))
+        self.assertEqual(task_type.call_count, n_jobs)
+        self.assertEqual(sorted(slots[:3]), [0, 1, 2])
+        cms.service.Worker.get_task_type.assert_has_calls(
+            calls, any_order=True)
+
+    def test_execute_job_group_slots_exception(self):
+        """Executes a job group in two execution slots, with a failure.
+
+        """
+        with patch.object(config, "max_worker_slots", 2):
+            self.service = Worker(0, slots=2)
+        jobs, unused_calls = TestWorker.new_jobs(5)
+        task_type = FakeTaskType([0.01, Exception(), True, True, True])
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        with self.assertRaises(JobException):
+            self.service.execute_job_group(JobGroup(jobs).export_to_dict())
+        # The slots stop taking jobs after the failure.
+        self.assertEqual(task_type.call_count, 2)
+
+    def test_too_many_slots(self):
+        """A worker cannot have more slots than max_worker_slots.
+
+        """
+        with patch.object(config, "max_worker_slots", 2):
+            with self.assertRaises(ConfigError):
+                Worker(0, slots=3)
+
     def test_execute_job_failure_releases_lock(self):
         """After a failure, the worker should be able to accept another job.
 
@@ -188,6 +309,25 @@ class TestWorker(unittest.TestCase):
         cms.service.Worker.get_task_type.assert_has_calls(calls_b)
         self.assertEquals(task_type_b.call_count, n_jobs_b)
 
+    def test_execute_job_group_runs(self):
+        """Executes a job group in runs sharing a sandbox.
+
+        """
+        jobs, unused_calls = TestWorker.new_jobs(5)
+        for job in jobs[:3]:
+            job.task_type_parameters = "same_parameters"
+        task_type = FakeTaskType([True] * 5)
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        with patch.object(config, "evaluation_run_size", 2):
+            job_group = JobGroup.import_from_dict(
+                self.service.execute_job_group(
+                    JobGroup(jobs).export_to_dict()))
+
+        self.assertTrue(all(job.success for job in job_group.jobs))
+        self.assertEqual(task_type.run_sizes, [2])
+        self.assertEqual(task_type.call_count, 5)
+
     def test_execute_job_group_success(self):
         """Executes two successful job groups.
 
@@ -288,6 +428,7 @@ class FakeTaskType:
         self.execute_results = execute_results
         self.index = 0
         self.call_count = 0
+        self.run_sizes = []
 
     def execute_job(self, job, file_cacher):
         self.call_count += 1
@@ -304,6 +445,11 @@ class FakeTaskType:
             job.success = True
             gevent.sleep(result)
 
+    def evaluate_many(self, jobs, file_cacher):
+        self.run_sizes.append(len(jobs))
+        for job in jobs:
+            self.execute_job(job, file_cacher)
+
     def set_results(self, results):
         self.execute_results = results
 
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the evaluation result cache.
+
+"""
+
+import unittest
+
+from cms.db import Executable, File, Manager
+from cms.grading.Job import EvaluationJob
+from cms.service.evaluationcache import EvaluationResultCache
+
+
+def new_job(executable="exe", checker="chk", input_="in", output="out",
+            time_limit=1.0, memory_limit=256):
+    return EvaluationJob(
+        task_type="Batch",
+        task_type_parameters=["alone", ["", ""], "comparator"],
+        language="C++17 / g++",
+        managers={"checker": Manager("checker", checker)},
+        executables={"sol": Executable("sol", executable)},
+        input=input_, output=output,
+        time_limit=time_limit, memory_limit=memory_limit)
+
+
+def fill_result(job, outcome="1.0", execution_time=0.1,
+                exit_status="ok"):
+    job.success = True
+    job.outcome = outcome
+    job.text = ["Output is correct"]
+    job.plus = {"execution_time": execution_time,
+                "execution_wall_clock_time": execution_time,
+                "execution_memory": 1024,
+                "exit_status": exit_status}
+    job.shard = 3
+    return job
+
+
+class TestEvaluationResultCache(unittest.TestCase):
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            EvaluationResultCache("sometimes")
+
+    def test_off(self):
+        cache = EvaluationResultCache(EvaluationResultCache.POLICY_OFF)
+        self.assertFalse(cache.store(fill_result(new_job())))
+        self.assertFalse(cache.fill(new_job()))
+        self.assertEqual(len(cache), 0)
+
+    def test_exact_hit(self):
+        cache = EvaluationResultCache(EvaluationResultCache.POLICY_EXACT)
+        self.assertTrue(cache.store(fill_result(new_job(), outcome="0.5")))
+
+        job = new_job()
+        self.assertTrue(cache.fill(job))
+        self.assertTrue(job.success)
+        self.assertEqual(job.outcome, "0.5")
+        self.assertEqual(job.text, ["Output is correct"])
+        self.assertEqual(job.plus["execution_memory"], 1024)
+        self.assertEqual(job.shard, 3)
+        self.assertEqual(cache.hits, 1)
+
+    def test_key_components(self):
+        cache = EvaluationResultCache(EvaluationResultCache.POLICY_EXACT)
+        cache.store(fill_result(new_job()))
+
+        for job in [new_job(executable="exe2"), new_job(checker="chk2"),
+                    new_job(input_="in2"), new_job(output="out2"),
+                    new_job(time_limit=2.0), new_job(memory_limit=512)]:
+            self.assertFalse(cache.fill(job))
+        self.assertEqual(cache.misses, 6)
+
+    def test_output_only(self):
+        # OutputOnly has no executables and grades the submitted files.
+        def new_output_only_job(digest):
+            return EvaluationJob(
+                task_type="OutputOnly", task_type_parameters=["diff"],
+                files={"output_001.txt": File("output_001.txt", digest)},
+                input="in", output="out")
+
+        cache = EvaluationResultCache(EvaluationResultCache.POLICY_EXACT)
+        cache.store(fill_result(new_output_only_job("right"), outcome="1.0"))
+
+        job = new_output_only_job("wrong")
+        self.assertFalse(cache.fill(job))
+        self.assertIsNone(job.outcome)
+        self.assertTrue(cache.fill(new_output_only_job("right")))
+
+    def test_failures_not_stored(self):
+        cache = EvaluationResultCache(EvaluationResultCache.POLICY_EXACT)
+        job = new_job()
+        job.success = False
+        self.assertFalse(cache.store(job))
+
+        job = fill_result(new_job())
+        job.only_execution = True
+        self.assertFalse(cache.store(job))
+
+    def test_non_timing(self):
+        cache = EvaluationResultCache(EvaluationResultCache.POLICY_NON_TIMING)
+        self.assertFalse(cache.store(fill_result(
+            new_job(), exit_status="timeout", execution_time=1.0)))
+        self.assertFalse(cache.store(fill_result(
+            new_job(), execution_time=0.9)))
+        self.assertTrue(cache.store(fill_result(
+            new_job(), execution_time=0.2)))
+
+    def test_eviction(self):
+        cache = EvaluationResultCache(EvaluationResultCache.POLICY_EXACT,
+                                      max_size=2)
+        cache.store(fill_result(new_job(input_="a")))
+        cache.store(fill_result(new_job(input_="b")))
+        # Touch "a", so that "b" is the least recently used.
+        self.assertTrue(cache.fill(new_job(input_="a")))
+        cache.store(fill_result(new_job(input_="c")))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertTrue(cache.fill(new_job(input_="a")))
+        self.assertFalse(cache.fill(new_job(input_="b")))
+        self.assertTrue(cache.fill(new_job(input_="c")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the evaluation subtask policy.
+
+"""
+
+import unittest
+from unittest.mock import Mock
+
+from cms.grading.scoretypes.GroupMin import GroupMin
+from cms.grading.scoretypes.Sum import Sum
+from cms.service.subtaskpolicy import SubtaskEvaluationPolicy
+
+
+CODENAMES = ["1_0", "1_1", "2_0", "2_1"]
+
+
+def new_dataset(score_type="GroupMin",
+                parameters=((10, "1_*"), (20, "2_*"))):
+    dataset = Mock()
+    dataset.id = 1
+    dataset.score_type = score_type
+    dataset.score_type_parameters = [list(p) for p in parameters] \
+        if score_type == "GroupMin" else parameters
+    dataset.testcases = dict((codename, Mock()) for codename in CODENAMES)
+    public_testcases = dict((codename, True) for codename in CODENAMES)
+    if score_type == "GroupMin":
+        dataset.score_type_object = GroupMin(
+            dataset.score_type_parameters, public_testcases)
+    else:
+        dataset.score_type_object = Sum(
+            dataset.score_type_parameters, public_testcases)
+    return dataset
+
+
+class TestSubtaskEvaluationPolicy(unittest.TestCase):
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            SubtaskEvaluationPolicy("sometimes")
+
+    def test_off(self):
+        policy = SubtaskEvaluationPolicy(SubtaskEvaluationPolicy.POLICY_OFF)
+        dataset = new_dataset()
+        policy.record(dataset, "2_1", "0.0")
+        self.assertEqual(policy.order_testcases(dataset, CODENAMES),
+                         CODENAMES)
+        self.assertEqual(policy.testcases_to_skip(dataset, {"1_0": "0.0"}),
+                         set())
+
+    def test_order(self):
+        policy = SubtaskEvaluationPolicy(SubtaskEvaluationPolicy.POLICY_ORDER)
+        dataset = new_dataset()
+
+        # No statistics yet: dataset order.
+        self.assertEqual(policy.order_testcases(dataset, CODENAMES),
+                         CODENAMES)
+
+        policy.record(dataset, "2_1", "0.0")
+        policy.record(dataset, "2_1", "0.0")
+        policy.record(dataset, "1_1", "0.0")
+        policy.record(dataset, "1_1", "1.0")
+        policy.record(dataset, "1_0", "1.0")
+        self.assertEqual(policy.order_testcases(dataset, CODENAMES),
+                         ["2_1", "1_1", "1_0", "2_0"])
+        self.assertEqual(policy.order_testcases(dataset, ["2_0", "1_1"]),
+                         ["1_1", "2_0"])
+
+        # Ordering never skips.
+        self.assertEqual(policy.testcases_to_skip(dataset, {"1_0": "0.0"}),
+                         set())
+
+    def test_order_not_group(self):
+        policy = SubtaskEvaluationPolicy(SubtaskEvaluationPolicy.POLICY_SKIP)
+        dataset = new_dataset("Sum", 10)
+        policy.record(dataset, "2_1", "0.0")
+        self.assertEqual(policy.order_testcases(dataset, CODENAMES),
+                         CODENAMES)
+        self.assertEqual(policy.testcases_to_skip(dataset, {"1_0": "0.0"}),
+                         set())
+
+    def test_skip(self):
+        policy = SubtaskEvaluationPolicy(SubtaskEvaluationPolicy.POLICY_SKIP)
+        dataset = new_dataset()
+        self.assertEqual(policy.testcases_to_skip(dataset, {"1_0": "1.0"}),
+                         set())
+        self.assertEqual(policy.testcases_to_skip(dataset, {"1_0": "0.0"}),
+                         {"1_1"})
+        self.assertEqual(
+            policy.testcases_to_skip(dataset, {"1_0": "0.0", "2_1": 0.0}),
+            {"1_1", "2_0"})
+
+    def test_parameters_changed(self):
+        policy = SubtaskEvaluationPolicy(SubtaskEvaluationPolicy.POLICY_SKIP)
+        dataset = new_dataset()
+        self.assertEqual(policy.testcases_to_skip(dataset, {"1_0": "0.0"}),
+                         {"1_1"})
+
+        # A single subtask with all testcases.
+        other = new_dataset(parameters=((30, ".*"),))
+        self.assertEqual(policy.testcases_to_skip(other, {"1_0": "0.0"}),
+                         {"1_1", "2_0", "2_1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
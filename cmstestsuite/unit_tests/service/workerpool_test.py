@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the worker pool of EvaluationService.
+
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+
+from cms import ServiceCoord
+from cms.service.esoperations import ESOperation
+from cms.service.workerpool import WorkerPool
+
+
+def evaluation(submission_id, dataset_id, codename="000"):
+    return ESOperation(ESOperation.EVALUATION,
+                       submission_id, dataset_id, codename)
+
+
+class TestWorkerPoolAffinity(unittest.TestCase):
+
+    def setUp(self):
+        self.service = Mock()
+        self.service.connect_to.side_effect = \
+            lambda coord, on_connect: Mock(connected=True)
+        self.pool = WorkerPool(self.service)
+        for shard in range(3):
+            self.pool.add_worker(ServiceCoord("Worker", shard))
+
+        patcher = patch("cms.service.workerpool.JobGroup")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.service.workerpool.SessionGen")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.service.workerpool.config")
+        self.config = patcher.start()
+        self.config.worker_affinity_wait_s = 0
+        self.config.worker_prefetch_depth = 0
+        self.addCleanup(patcher.stop)
+
+    def test_prefers_same_submission(self):
+        first = self.pool.acquire_worker([evaluation(1, 10, "000")])
+        # Give the other workers some history on another dataset.
+        others = [self.pool.acquire_worker([evaluation(2, 20, codename)])
+                  for codename in ["000", "001"]]
+        self.assertNotIn(first, others)
+        for shard in [first] + others:
+            self.pool.release_worker(shard)
+
+        for codename in ["001", "002", "003"]:
+            shard = self.pool.acquire_worker([evaluation(1, 10, codename)])
+            self.assertEqual(shard, first)
+            self.pool.release_worker(shard)
+
+        status = self.pool.get_affinity_status()
+        self.assertEqual(status["dispatched"], 6)
+        self.assertEqual(status["affine"], 3)
+        self.assertAlmostEqual(status["affinity_ratio"], 3 / 6)
+
+    def test_prefers_same_dataset(self):
+        first = self.pool.acquire_worker([evaluation(1, 10)])
+        self.pool.release_worker(first)
+        shard = self.pool.acquire_worker([evaluation(2, 10)])
+        self.assertEqual(shard, first)
+
+    def test_falls_back_without_wait(self):
+        first = self.pool.acquire_worker([evaluation(1, 10)])
+        second = self.pool.acquire_worker([evaluation(1, 10, "001")])
+        self.assertIsNotNone(second)
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.pool.get_affinity_status()["affine"], 0)
+
+    def test_waits_for_busy_affine_worker(self):
+        self.config.worker_affinity_wait_s = 60
+        first = self.pool.acquire_worker([evaluation(1, 10)])
+        batch = [evaluation(1, 10, "001")]
+        # Other workers are idle, but the batch is held back.
+        self.assertIsNone(self.pool.acquire_worker(batch))
+        self.assertIsNone(self.pool.acquire_worker(batch))
+        self.pool.release_worker(first)
+        self.assertEqual(self.pool.acquire_worker(batch), first)
+        status = self.pool.get_affinity_status()
+        self.assertEqual(status["affine_after_wait"], 1)
+
+    def test_wait_expires(self):
+        self.config.worker_affinity_wait_s = 60
+        first = self.pool.acquire_worker([evaluation(1, 10)])
+        batch = [evaluation(1, 10, "001")]
+        with patch("cms.service.workerpool.time.monotonic") as monotonic:
+            monotonic.return_value = 1000.0
+            self.assertIsNone(self.pool.acquire_worker(batch))
+            monotonic.return_value = 1061.0
+            second = self.pool.acquire_worker(batch)
+        self.assertIsNotNone(second)
+        self.assertNotEqual(second, first)
+
+    def test_no_wait_without_affine_worker(self):
+        self.config.worker_affinity_wait_s = 60
+        self.pool.acquire_worker([evaluation(1, 10)])
+        self.assertIsNotNone(self.pool.acquire_worker([evaluation(2, 20)]))
+
+    def test_disabled_worker_not_chosen(self):
+        first = self.pool.acquire_worker([evaluation(1, 10)])
+        self.pool.release_worker(first)
+        self.pool.disable_worker(first)
+        shard = self.pool.acquire_worker([evaluation(1, 10, "001")])
+        self.assertNotEqual(shard, first)
+
+
+class TestWorkerPoolPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.service = Mock()
+        self.service.connect_to.side_effect = \
+            lambda coord, on_connect: Mock(connected=True)
+        self.pool = WorkerPool(self.service)
+        self.pool.add_worker(ServiceCoord("Worker", 0))
+
+        patcher = patch("cms.service.workerpool.JobGroup")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.service.workerpool.SessionGen")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.service.workerpool.config")
+        self.config = patcher.start()
+        self.config.worker_affinity_wait_s = 0
+        self.config.worker_prefetch_depth = 1
+        self.addCleanup(patcher.stop)
+
+        self.first = [evaluation(1, 10, "000"), evaluation(1, 10, "001")]
+        self.second = [evaluation(2, 10, "000")]
+
+    def test_queue(self):
+        self.assertEqual(self.pool.acquire_worker(self.first), 0)
+        self.assertEqual(self.pool.acquire_worker(self.second), 0)
+        # The queue is full.
+        self.assertIsNone(self.pool.acquire_worker([evaluation(3, 10)]))
+        for operation in self.first + self.second:
+            self.assertIn(operation, self.pool)
+        self.assertEqual(self.service.connect_to.return_value
+                         .execute_job_group.call_count, 0)
+
+        self.assertFalse(self.pool.release_worker(0))
+        for operation in self.first:
+            self.assertNotIn(operation, self.pool)
+        self.assertIn(self.second[0], self.pool)
+        status = self.pool.get_status()["0"]
+        self.assertEqual(len(status["operations"]), 1)
+        self.assertIsNotNone(status["start_time"])
+
+        self.assertFalse(self.pool.release_worker(0))
+        self.assertNotIn(self.second[0], self.pool)
+        self.assertEqual(self.pool.get_status()["0"]["operations"],
+                         WorkerPool.WORKER_INACTIVE)
+
+    def test_ignore_queued_operation(self):
+        self.pool.acquire_worker(self.first)
+        self.pool.acquire_worker(self.second)
+        self.pool.ignore_operation(self.second[0])
+        self.assertFalse(self.pool.release_worker(0))
+        self.assertEqual(self.pool.release_worker(0), self.second)
+
+    def test_disable_returns_queued(self):
+        self.pool.acquire_worker(self.first)
+        self.pool.acquire_worker(self.second)
+        lost = self.pool.disable_worker(0)
+        self.assertCountEqual(lost, self.first + self.second)
+        for operation in self.first + self.second:
+            self.assertNotIn(operation, self.pool)
+        # Late results are ignored.
+        self.assertTrue(self.pool.release_worker(0))
+
+    def test_timeout_returns_queued(self):
+        self.pool.acquire_worker(self.first)
+        self.pool.acquire_worker(self.second)
+        with patch("cms.service.workerpool.make_datetime") as now:
+            now.return_value = self.pool._start_time[0] \
+                + 2 * WorkerPool.WORKER_TIMEOUT
+            lost = self.pool.check_timeouts()
+        self.assertCountEqual(lost, self.first + self.second)
+        self.assertNotIn(self.second[0], self.pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
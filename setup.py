@@ -150,6 +150,7 @@ setup(
             "cmsAddTeam=cmscontrib.AddTeam:main",
             "cmsAddTestcases=cmscontrib.AddTestcases:main",
             "cmsAddUser=cmscontrib.AddUser:main",
+            "cmsCheckTaskScores=cmscontrib.CheckTaskScores:main",
             "cmsCleanFiles=cmscontrib.CleanFiles:main",
             "cmsDumpExporter=cmscontrib.DumpExporter:main",
             "cmsDumpImporter=cmscontrib.DumpImporter:main",